@@ -0,0 +1,480 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Benchmarks for the processor and client hot paths.
+
+Covers payload parsing, in the binary and the legacy text format, state
+(de)serialization, the handler's apply() on places holding 10 to 100k
+shipments under an add/remove/transfer mix and for transfer_many,
+transaction construction and signing, getcount aggregation, and the
+startup time of the CLI.  Nothing talks to a
+validator: apply() runs against the local stand-in and the client
+against an in-process REST API answering from a dict.
+
+Results are written as JSON, and can be compared with an earlier run:
+
+    python3 benchmarks/run_benchmarks.py --output baseline.json
+    python3 benchmarks/run_benchmarks.py --baseline baseline.json
+
+The comparison exits with status 1 when any benchmark got slower than
+the baseline by more than --threshold.  benchmarks/baseline.json is the
+reference run kept with the code; its meta section names the Python and
+machine it was taken on, and timings only compare on a like machine.
+Regenerate it with --output when a change is meant to move the numbers.
+'''
+
+import argparse
+import base64
+import bisect
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_ROOT, 'pyprocessor'))
+sys.path.insert(0, os.path.join(_ROOT, 'pyclient'))
+
+# pylint: disable=wrong-import-position
+from sawtooth_signing import create_context
+from sawtooth_signing import CryptoFactory
+
+from processor.local_context import DictStore
+from processor.local_context import LocalValidator
+from processor.replay import make_transaction
+from processor.shipment_payload import ShipmentPayload
+from processor.shipment_state import NAMESPACE
+from processor.shipment_state import PATH_CHUNK_HOPS
+from processor.shipment_state import decode_record
+from processor.shipment_state import encode_item_total
+from processor.shipment_state import encode_path_chunk
+from processor.shipment_state import encode_place_index
+from processor.shipment_state import encode_shipment
+from processor.shipment_state import make_item_total_address
+from processor.shipment_state import make_place_index_address
+from processor.shipment_state import make_shipment_address
+from processor.shipment_state import view_record
+from processor.shipment_tp import ShipmentTransactionHandler
+
+from client import shipment_batch
+from client.shipment_client import ShipmentClient
+
+DEFAULT_MIN_TIME = 0.5
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_SIZES = [10, 1000, 100000]
+
+ITEM_COUNTS = [1, 10, 100]
+
+# Transactions applied per place size.
+APPLY_TRANSACTIONS = 600
+
+# Shipments moved by one transfer_many, and the times they are moved.
+BULK_SHIPMENTS = 100
+BULK_ROUNDS = 20
+
+# Runs of each startup benchmark, each in a new interpreter.
+STARTUP_RUNS = 10
+
+# Runs the CLI with the REST API on a closed port, so a query does all
+# of its work up to the first request and then fails right away.
+_CLI_SCRIPT = '''
+import sys
+sys.path.insert(0, {!r})
+from client import shipment_cli
+shipment_cli.DEFAULT_URL = 'http://127.0.0.1:9'
+shipment_cli.main_wrapper()
+'''.format(os.path.join(_ROOT, 'pyclient'))
+
+
+def measure(function, minTime=DEFAULT_MIN_TIME, maxIterations=None):
+    '''Call function repeatedly and return timing statistics.'''
+    clock = time.perf_counter
+    function()
+    samples = []
+    deadline = clock() + minTime
+    while clock() < deadline and \
+            (maxIterations is None or len(samples) < maxIterations):
+        before = clock()
+        function()
+        samples.append(clock() - before)
+    return summarize(samples)
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        'iterations': len(ordered),
+        'mean_us': total / len(ordered) * 1e6,
+        'p50_us': ordered[len(ordered) // 2] * 1e6,
+        'p99_us': ordered[min(len(ordered) - 1,
+                              len(ordered) * 99 // 100)] * 1e6,
+        'ops_per_sec': len(ordered) / total if total else 0.0,
+    }
+
+
+def _new_signer(factory):
+    return factory.new_signer(factory.context.new_random_private_key())
+
+
+def _items(count):
+    return [('item{}'.format(number), number + 1) for number in range(count)]
+
+
+def bench_payloads(results, args):
+    for count in ITEM_COUNTS:
+        data = ShipmentPayload('add', shipment_id='S1', place='Depot',
+                               items=_items(count)).to_bytes()
+        stats = measure(lambda: ShipmentPayload.from_bytes(data),
+                        args.min_time)
+        stats['bytes'] = len(data)
+        results['payload.parse.add[items={}]'.format(count)] = stats
+    # The comma separated text of older clients, still accepted.
+    flat = [str(value) for pair in _items(10) for value in pair]
+    legacy = 'add,S1,10,{},Depot'.format(flat).encode()
+    stats = measure(lambda: ShipmentPayload.from_bytes(legacy),
+                    args.min_time)
+    stats['bytes'] = len(legacy)
+    results['payload.parse.legacy_add[items=10]'] = stats
+
+
+def bench_state_codec(results, args):
+    for count in ITEM_COUNTS:
+        shipment = {'id': 'S1', 'path': 'Farm->Depot',
+                    'items': dict(_items(count))}
+        data = encode_shipment(shipment)
+        results['state.shipment.encode[items={}]'.format(count)] = measure(
+            lambda: encode_shipment(shipment), args.min_time)
+        results['state.shipment.decode[items={}]'.format(count)] = measure(
+            lambda: decode_record(data), args.min_time)
+    for size in args.sizes:
+        index = {'place': 'Depot',
+                 'shipments': sorted('S{}'.format(n) for n in range(size))}
+        data = encode_place_index(index)
+        probe = 'S{}'.format(size // 2)
+        results['state.index.encode[shipments={}]'.format(size)] = measure(
+            lambda: encode_place_index(index), args.min_time)
+        results['state.index.contains[shipments={}]'.format(size)] = measure(
+            lambda: probe in view_record(data), args.min_time)
+    # A transfer rewrites at most one full chunk of the path.
+    chunk = {'id': 'S1', 'hops': [('Depot{}'.format(n % 8), 1700000000 + n)
+                                  for n in range(PATH_CHUNK_HOPS)]}
+    data = encode_path_chunk(chunk)
+    results['state.path_chunk.encode[hops={}]'.format(PATH_CHUNK_HOPS)] = \
+        measure(lambda: encode_path_chunk(chunk), args.min_time)
+    results['state.path_chunk.decode[hops={}]'.format(PATH_CHUNK_HOPS)] = \
+        measure(lambda: decode_record(data), args.min_time)
+
+
+def _preload(store, public_key, place, shipmentIDs, items):
+    '''Write a place holding the given shipments straight into the store.'''
+    writes = {make_place_index_address(public_key): encode_place_index(
+        {'place': place, 'shipments': sorted(shipmentIDs)})}
+    for shipmentID in shipmentIDs:
+        writes[make_shipment_address(public_key, shipmentID)] = \
+            encode_shipment({'id': shipmentID, 'path': place,
+                             'items': dict(items)})
+    for item, count in items.items():
+        total = count * len(shipmentIDs)
+        writes[make_item_total_address(public_key, item)] = \
+            encode_item_total(item, total)
+        writes[make_item_total_address(None, item)] = \
+            encode_item_total(item, total)
+    store.commit(writes)
+
+
+def bench_apply(results, args):
+    factory = CryptoFactory(create_context('secp256k1'))
+    rng = random.Random(args.seed)
+    handler = ShipmentTransactionHandler(NAMESPACE)
+    for size in args.sizes:
+        signers = [_new_signer(factory), _new_signer(factory)]
+        keys = [signer.get_public_key().as_hex() for signer in signers]
+        store = DictStore()
+        shipmentIDs = ['S{}'.format(n) for n in range(size)]
+        _preload(store, keys[0], 'Depot',
+                 shipmentIDs, {'apple': 10**6, 'pear': 10**6})
+        validator = LocalValidator(handler, store)
+
+        holders = dict.fromkeys(shipmentIDs, 0)
+        transactions = []
+        for _ in range(APPLY_TRANSACTIONS):
+            shipmentID = rng.choice(shipmentIDs)
+            holder = holders[shipmentID]
+            draw = rng.random()
+            if draw < 0.5:
+                payload = ShipmentPayload(
+                    'add', shipment_id=shipmentID, place='Depot',
+                    items=[('apple', 1)])
+            elif draw < 0.8:
+                payload = ShipmentPayload(
+                    'remove', shipment_id=shipmentID, items=[('pear', 1)])
+            else:
+                holders[shipmentID] = 1 - holder
+                payload = ShipmentPayload(
+                    'transfer', shipment_id=shipmentID,
+                    place_to='Store{}'.format(1 - holder),
+                    to_key=keys[1 - holder])
+            transactions.append((payload.action, make_transaction(
+                signers[holder], keys[holder], payload)))
+
+        samples = {}
+        clock = time.perf_counter
+        for action, transaction in transactions:
+            before = clock()
+            validator.apply(transaction)
+            samples.setdefault(action, []).append(clock() - before)
+        for action, values in list(samples.items()):
+            samples.setdefault('mix', []).extend(values)
+        for action, values in samples.items():
+            results['apply.{}[shipments={}]'.format(action, size)] = \
+                summarize(values)
+
+        # The same shipments moved back and forth between the two places
+        # by one transaction at a time.
+        store = DictStore()
+        _preload(store, keys[0], 'Depot',
+                 shipmentIDs, {'apple': 10**6, 'pear': 10**6})
+        validator = LocalValidator(handler, store)
+        moved = shipmentIDs[:BULK_SHIPMENTS]
+        values = []
+        for round_ in range(BULK_ROUNDS):
+            holder = round_ % 2
+            payload = ShipmentPayload('transfer_many', transfers=[
+                (shipmentID, 'Store{}'.format(1 - holder), keys[1 - holder])
+                for shipmentID in moved])
+            transaction = make_transaction(signers[holder], keys[holder],
+                                           payload)
+            before = clock()
+            validator.apply(transaction)
+            values.append(clock() - before)
+        results['apply.transfer_many[shipments={},moved={}]'.format(
+            size, len(moved))] = summarize(values)
+
+
+class _Response(object):
+
+    def __init__(self, status_code, text, reason='OK'):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = reason
+        self.text = text
+
+
+class LocalRestApi(object):
+    '''Session stand-in answering REST API requests from a dict of state.'''
+
+    PAGE_SIZE = 100
+
+    def __init__(self, state):
+        self._state = state
+        self._addresses = sorted(state)
+
+    def get(self, url, headers=None, timeout=None):
+        suffix = url.split('/', 3)[3]
+        if suffix.startswith('state/'):
+            data = self._state.get(suffix[len('state/'):])
+            if data is None:
+                return _Response(404, '', 'Not Found')
+            return _Response(200, json.dumps(
+                {'data': base64.b64encode(data).decode()}))
+        query = dict(part.split('=') for part in suffix.split('?')[1].split('&'))
+        prefix = query['address']
+        first = bisect.bisect_left(self._addresses, prefix)
+        last = bisect.bisect_left(self._addresses, prefix + 'g')
+        matching = self._addresses[first:last]
+        start = int(query.get('start', 0))
+        page = matching[start:start + self.PAGE_SIZE]
+        body = {'data': [{'address': address,
+                          'data': base64.b64encode(
+                              self._state[address]).decode()}
+                         for address in page],
+                'paging': {}}
+        if start + self.PAGE_SIZE < len(matching):
+            body['paging']['next_position'] = str(start + self.PAGE_SIZE)
+        return _Response(200, json.dumps(body))
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return _Response(202, json.dumps(
+            {'link': 'http://localhost/batch_statuses?id=0'}))
+
+
+def bench_client(results, args):
+    factory = CryptoFactory(create_context('secp256k1'))
+    privateKey = factory.context.new_random_private_key()
+    signer = factory.new_signer(privateKey)
+    publicKey = signer.get_public_key().as_hex()
+    keyDir = tempfile.mkdtemp()
+    try:
+        keyFile = os.path.join(keyDir, 'bench.priv')
+        with open(keyFile, 'w') as fd:
+            fd.write(privateKey.as_hex())
+
+        items = _items(10)
+        results['client.make_transaction[items=10]'] = measure(
+            lambda: shipment_batch.make_transaction(
+                signer, publicKey, 'add', 'S1', items, 'Depot'),
+            args.min_time)
+
+        state = {}
+        for name, count in _items(1000):
+            state[make_item_total_address(publicKey, name)] = \
+                encode_item_total(name, count)
+        client = ShipmentClient('localhost', keyFile,
+                                session=LocalRestApi(state))
+        flat = [str(value) for pair in items for value in pair]
+        results['client.add_item[items=10]'] = measure(
+            lambda: client.add_item('S1', 10, flat, 'Depot'), args.min_time)
+        results['client.getcount.item'] = measure(
+            lambda: client.get_item_count('item500'), args.min_time)
+        results['client.getcount.top[items=1000]'] = measure(
+            lambda: client.get_top_items(10), args.min_time)
+    finally:
+        shutil.rmtree(keyDir)
+
+
+def _time_process(command, env):
+    samples = []
+    for _ in range(STARTUP_RUNS):
+        before = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - before)
+    return summarize(samples)
+
+
+def bench_startup(results, args):
+    factory = CryptoFactory(create_context('secp256k1'))
+    privateKey = factory.context.new_random_private_key()
+    home = tempfile.mkdtemp()
+    try:
+        keyDir = os.path.join(home, '.sawtooth', 'keys')
+        os.makedirs(keyDir)
+        with open(os.path.join(keyDir, 'bench.pub'), 'w') as fd:
+            fd.write(factory.context.get_public_key(privateKey).as_hex())
+        env = dict(os.environ, HOME=home)
+
+        # The interpreter alone, to tell the CLI's share apart.
+        results['startup.python'] = _time_process(
+            [sys.executable, '-c', 'pass'], env)
+        results['startup.cli.help'] = _time_process(
+            [sys.executable, '-c', _CLI_SCRIPT, '--help'], env)
+        results['startup.cli.path'] = _time_process(
+            [sys.executable, '-c', _CLI_SCRIPT, 'path', 'S1', 'bench'], env)
+    finally:
+        shutil.rmtree(home)
+
+
+SUITES = [
+    ('payload', bench_payloads),
+    ('state', bench_state_codec),
+    ('apply', bench_apply),
+    ('client', bench_client),
+    ('startup', bench_startup),
+]
+
+
+def compare(results, baseline, threshold):
+    '''Return (name, baseline mean, mean, ratio, regressed) per benchmark.'''
+    rows = []
+    for name, stats in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = stats['mean_us'] / base['mean_us']
+        rows.append((name, base['mean_us'], stats['mean_us'], ratio,
+                     ratio > 1 + threshold))
+    return rows
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Runs the shipment benchmarks and writes the results '
+        'as JSON.')
+    parser.add_argument(
+        '--output', metavar='FILE',
+        help='write the results to FILE instead of stdout')
+    parser.add_argument(
+        '--baseline', metavar='FILE',
+        help='compare the results with an earlier run')
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='slowdown of the mean tolerated against the baseline '
+        '(default {})'.format(DEFAULT_THRESHOLD))
+    parser.add_argument(
+        '--suite', action='append', choices=[name for name, _ in SUITES],
+        help='run only this suite (may be repeated)')
+    parser.add_argument(
+        '--sizes', type=lambda value: [int(n) for n in value.split(',')],
+        default=DEFAULT_SIZES,
+        help='shipments per place, comma separated (default {})'.format(
+            ','.join(str(size) for size in DEFAULT_SIZES)))
+    parser.add_argument(
+        '--min-time', type=float, default=DEFAULT_MIN_TIME,
+        help='seconds spent on each micro benchmark')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='random seed of the apply workloads')
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    results = {}
+    for name, suite in SUITES:
+        if args.suite is None or name in args.suite:
+            suite(results, args)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'timestamp': int(time.time()),
+            'sizes': args.sizes,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fd:
+            fd.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)['results']
+        regressions = 0
+        for name, base, mean, ratio, regressed in compare(
+                results, baseline, args.threshold):
+            regressions += regressed
+            print('{:<45} {:>12.1f} {:>12.1f} {:>7.2f}x{}'.format(
+                name, base, mean, ratio, '  REGRESSION' if regressed else ''),
+                file=sys.stderr)
+        if regressions:
+            print('{} benchmark(s) slower than the baseline'.format(
+                regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
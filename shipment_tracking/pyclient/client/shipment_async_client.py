@@ -0,0 +1,360 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+This AsyncShipmentClient class interfaces with Sawtooth through the REST
+API using asyncio.
+
+All requests of a client share one aiohttp connection pool, and the number
+of requests in flight is bounded, so a single process can keep thousands
+of submissions and state reads going at once:
+
+    async with AsyncShipmentClient(url, keyFile) as client:
+        await asyncio.gather(*(client.add_item(...) for ...))
+'''
+
+import asyncio
+import base64
+import json
+
+import aiohttp
+
+from client.shipment_batch import DEFAULT_MAX_BATCHES_PER_LIST
+from client.shipment_batch import ShipmentBatchBuilder
+from client.shipment_client import DEFAULT_MAX_RETRIES
+from client.shipment_client import DEFAULT_TIMEOUT
+from client.shipment_client import StateNotFoundError
+from client.shipment_client import decode_state_page
+from client.shipment_client import load_signer
+from client.shipment_client import make_url
+from client.shipment_client import read_public_key
+from client.shipment_client import state_page_suffix
+from client.shipment_dependencies import DependencyTracker
+from client.shipment_keys import public_key_hex
+from client.shipment_payload import pair_items
+from client.shipment_state import decode_record
+from client.shipment_state import make_shipment_address
+from client.shipment_state import make_shipment_prefix
+from client.shipment_status import DEFAULT_MAX_IDS_PER_REQUEST
+from client.shipment_status import DEFAULT_POLL_INTERVAL
+from client.shipment_status import DEFAULT_TRACK_TIMEOUT
+from client.shipment_status import FINAL_STATUSES
+from client.shipment_status import UNKNOWN
+from client.shipment_status import Backpressure
+from client.shipment_status import BatchStatus
+from client.shipment_status import QueueFullError
+from client.shipment_status import parse_batch_ids
+from client.shipment_status import parse_batch_statuses
+from client.shipment_validation import check_remove
+from client.shipment_validation import check_transfer
+
+# Connections kept open to the REST API by one client.
+DEFAULT_MAX_CONNECTIONS = 100
+
+# Requests allowed to wait on the REST API at once; the rest queue up.
+DEFAULT_MAX_IN_FLIGHT = 1000
+
+
+class AsyncShipmentClient(object):
+    '''Asynchronous counterpart of ShipmentClient.
+
+    The operations mirror ShipmentClient and return the REST API response
+    text.  The client must be closed, or used as an async context manager,
+    to release its connections.  As with ShipmentClient, operations on the
+    same shipment depend on each other, so they apply in the order they
+    were made even though their BatchLists are posted concurrently.  A
+    background task polls the status of the batches posted and releases
+    them from the DependencyTracker of the client once they are final, or
+    after DEFAULT_TRACK_TIMEOUT seconds.
+
+    remove_item(), transfer() and transfer_many() check the rules of the
+    transaction processor first, as ShipmentClient does, against state
+    read for the purpose.  A shipment with operations of this client in
+    flight is left to the processor, since state does not show them yet.
+    '''
+
+    def __init__(self, baseUrl, keyFile=None,
+                 maxConnections=DEFAULT_MAX_CONNECTIONS,
+                 maxInFlight=DEFAULT_MAX_IN_FLIGHT,
+                 timeout=DEFAULT_TIMEOUT, dependencies=None):
+        self._baseUrl = baseUrl
+        self._dependencies = dependencies if dependencies is not None else \
+            DependencyTracker()
+        # Batch id -> loop time it is given up on, until released.
+        self._unreleased = {}
+        self._releaser = None
+        self._maxConnections = maxConnections
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._inFlight = asyncio.Semaphore(maxInFlight)
+        self._backpressure = Backpressure()
+        self._session = None
+
+        if keyFile is None:
+            self._signer = None
+            return
+
+        self._signer = load_signer(keyFile)
+        self._publicKey = public_key_hex(self._signer)
+        self._shipmentPrefix = make_shipment_prefix(self._publicKey)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._releaser is not None:
+            self._releaser.cancel()
+            self._releaser = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def add_item(self, shipmentID, N, items, placeName):
+        return await self._wrap_and_send(
+            "add", shipmentID, pair_items(N, items), placeName)
+
+    async def remove_item(self, shipmentID, N, items, validate=True):
+        items = pair_items(N, items)
+        if validate and self._settled(shipmentID):
+            check_remove(await self.get_shipment(shipmentID), shipmentID,
+                         items)
+        return await self._wrap_and_send("remove", shipmentID, items)
+
+    async def transfer(self, shipmentID, placeTo, placeToKey, validate=True):
+        publicKey = read_public_key(placeToKey)
+        if validate and self._settled(shipmentID):
+            await self._check_transfers([(shipmentID, publicKey)])
+        return await self._wrap_and_send(
+            "transfer", shipmentID, placeTo, publicKey)
+
+    async def migrate(self):
+        return await self._wrap_and_send("migrate")
+
+    async def add_many(self, shipments, placeName):
+        return await self._wrap_and_send("add_many", shipments, placeName)
+
+    async def transfer_many(self, transfers, validate=True):
+        publicKeys = {}
+        for _, _, placeToKey in transfers:
+            if placeToKey not in publicKeys:
+                publicKeys[placeToKey] = read_public_key(placeToKey)
+        if validate:
+            await self._check_transfers([
+                (shipmentID, publicKeys[placeToKey])
+                for shipmentID, _, placeToKey in transfers
+                if self._settled(shipmentID)])
+        return await self._wrap_and_send("transfer_many", [
+            (shipmentID, placeTo, publicKeys[placeToKey])
+            for shipmentID, placeTo, placeToKey in transfers])
+
+    def _settled(self, shipmentID):
+        '''Whether no operation of this client on a shipment is in flight.'''
+        return not self._dependencies.dependencies(
+            [make_shipment_address(self._publicKey, shipmentID)])
+
+    async def _check_transfers(self, transfers):
+        '''Raise ValidationError unless each (shipmentID, placeToPublicKey)
+           transfer passes check_transfer(), reading the shipments at both
+           places concurrently.'''
+        shipments = await asyncio.gather(*(
+            self._shipment_at(key, shipmentID)
+            for shipmentID, placeToPublicKey in transfers
+            for key in (self._publicKey, placeToPublicKey)))
+        for position, (shipmentID, placeToPublicKey) in enumerate(transfers):
+            check_transfer(shipments[2 * position], shipmentID,
+                           self._publicKey, placeToPublicKey,
+                           shipments[2 * position + 1])
+
+    async def get_shipment(self, shipmentID):
+        '''Return one shipment of the place, or None if it does not hold it.'''
+        return await self._shipment_at(self._publicKey, shipmentID)
+
+    async def _shipment_at(self, publicKey, shipmentID):
+        try:
+            text = await self._send_to_restapi("state/{}".format(
+                make_shipment_address(publicKey, shipmentID)))
+        except StateNotFoundError:
+            return None
+        shipment = decode_record(base64.b64decode(json.loads(text)["data"]))
+        if shipment['id'] != shipmentID:
+            return None
+        return shipment
+
+    async def get_data(self):
+        '''Return every shipment held by the place, keyed by shipment ID.'''
+        data = {}
+        suffix = state_page_suffix(self._shipmentPrefix)
+        while suffix is not None:
+            shipments, position = decode_state_page(
+                await self._send_to_restapi(suffix))
+            for shipment in shipments:
+                data[shipment['id']] = shipment
+            suffix = None if position is None else \
+                state_page_suffix(self._shipmentPrefix, position)
+        return data
+
+    def batch(self, maxBatchesPerList=DEFAULT_MAX_BATCHES_PER_LIST):
+        '''Return a batch builder that uses this client's key as batcher.'''
+        return ShipmentBatchBuilder(self._signer, maxBatchesPerList,
+                                    self._dependencies)
+
+    async def send_batches(self, builder):
+        '''POST every BatchList of the builder concurrently.'''
+        return await asyncio.gather(*(
+            self._send_tracked(batchList) for batchList in builder.build()))
+
+    async def _send_tracked(self, batchList):
+        try:
+            response = await self._send_batch_list(
+                batchList.SerializeToString())
+        except BaseException:
+            # Later operations must not wait on what was not posted.
+            self._dependencies.forget(
+                txn.header_signature
+                for batch in batchList.batches
+                for txn in batch.transactions)
+            raise
+        self._watch(parse_batch_ids(response))
+        return response
+
+    def _watch(self, batchIds):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + DEFAULT_TRACK_TIMEOUT
+        for batchId in batchIds:
+            self._unreleased[batchId] = deadline
+        if self._releaser is None or self._releaser.done():
+            self._releaser = loop.create_task(self._release_loop())
+
+    async def _release_loop(self):
+        '''Release the batches posted once they are final or given up on.'''
+        loop = asyncio.get_running_loop()
+        while self._unreleased:
+            batchIds = list(self._unreleased)
+            chunks = [batchIds[start:start + DEFAULT_MAX_IDS_PER_REQUEST]
+                      for start in range(0, len(batchIds),
+                                         DEFAULT_MAX_IDS_PER_REQUEST)]
+            results = await asyncio.gather(
+                *(self.get_batch_statuses(chunk) for chunk in chunks),
+                return_exceptions=True)
+            done = [batchStatus.id for result in results
+                    # Transient REST errors: try again on the next round.
+                    if not isinstance(result, BaseException)
+                    for batchStatus in result
+                    if batchStatus.status in FINAL_STATUSES]
+            now = loop.time()
+            done.extend(batchId for batchId, deadline in
+                        self._unreleased.items() if deadline < now)
+            for batchId in done:
+                self._unreleased.pop(batchId, None)
+            self._dependencies.release(done)
+            if self._unreleased:
+                await asyncio.sleep(DEFAULT_POLL_INTERVAL)
+
+    async def get_batch_statuses(self, batchIds):
+        '''Return the BatchStatus of each batch, in one request.'''
+        return parse_batch_statuses(await self._send_to_restapi(
+            "batch_statuses", json.dumps(batchIds), 'application/json'))
+
+    async def wait_for_batches(self, responses, timeout=None,
+                               pollInterval=DEFAULT_POLL_INTERVAL):
+        '''Poll until the batches of the given responses are final.
+
+           Returns a BatchStatus per batch; batches still undecided after
+           timeout seconds are reported with their last status.
+        '''
+        batchIds = [batchId for response in responses
+                    for batchId in parse_batch_ids(response)]
+        statuses = {batchId: BatchStatus(batchId, UNKNOWN, [])
+                    for batchId in batchIds}
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            openIds = [batchId for batchId, batchStatus in statuses.items()
+                        if batchStatus.status not in FINAL_STATUSES]
+            if not openIds or \
+                    (deadline is not None and loop.time() >= deadline):
+                self._dependencies.release(
+                    batchId for batchId, batchStatus in statuses.items()
+                    if batchStatus.status in FINAL_STATUSES)
+                return [statuses[batchId] for batchId in batchIds]
+            chunks = [openIds[start:start + DEFAULT_MAX_IDS_PER_REQUEST]
+                      for start in range(0, len(openIds),
+                                         DEFAULT_MAX_IDS_PER_REQUEST)]
+            for chunk in await asyncio.gather(
+                    *(self.get_batch_statuses(chunk) for chunk in chunks)):
+                for batchStatus in chunk:
+                    statuses[batchStatus.id] = batchStatus
+            await asyncio.sleep(pollInterval)
+
+    async def _send_batch_list(self, data):
+        for _ in range(DEFAULT_MAX_RETRIES):
+            if self._backpressure.delay:
+                await asyncio.sleep(self._backpressure.delay)
+            try:
+                response = await self._send_to_restapi(
+                    "batches", data, 'application/octet-stream')
+            except QueueFullError:
+                self._backpressure.on_queue_full()
+                continue
+            self._backpressure.on_accepted()
+            return response
+        raise QueueFullError('Validator queue still full after {} attempts'
+                             .format(DEFAULT_MAX_RETRIES))
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._maxConnections),
+                timeout=self._timeout)
+        return self._session
+
+    async def _send_to_restapi(self, suffix, data=None, contentType=None):
+        '''Send a REST command to the Validator via the REST API.'''
+        url = make_url(self._baseUrl, suffix)
+
+        headers = {}
+
+        if contentType is not None:
+            headers['Content-Type'] = contentType
+
+        session = self._get_session()
+        async with self._inFlight:
+            try:
+                if data is not None:
+                    request = session.post(url, headers=headers, data=data)
+                else:
+                    request = session.get(url, headers=headers)
+                async with request as result:
+                    text = await result.text()
+                    if result.status == 429:
+                        raise QueueFullError(
+                            "Error 429: {}".format(result.reason))
+                    if result.status == 404 and suffix.startswith("state/"):
+                        raise StateNotFoundError(
+                            "Error 404: {}".format(result.reason))
+                    if result.status >= 400:
+                        raise Exception("Error {}: {}".format(
+                            result.status, result.reason))
+            except aiohttp.ClientConnectionError as err:
+                raise Exception(
+                    'Failed to connect to {}: {}'.format(url, str(err)))
+            except asyncio.TimeoutError:
+                raise Exception('Timed out waiting for {}'.format(url))
+
+        return text
+
+    async def _wrap_and_send(self, action, *values):
+        builder = self.batch()
+        builder.append(None, action, *values)
+        return (await self.send_batches(builder))[0]
@@ -0,0 +1,291 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Batch builder for the shipment transaction family.
+
+Collects many operations, possibly signed by several places, and packs
+them into BatchLists so that one POST to /batches carries many
+transactions.  Given a DependencyTracker, each transaction depends on the
+transactions in flight on the same shipments, so operations may be
+posted back to back and still apply in order.
+'''
+
+import contextlib
+import hashlib
+import random
+
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+from sawtooth_sdk.protobuf.transaction_pb2 import Transaction
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+from sawtooth_sdk.protobuf.batch_pb2 import BatchHeader
+from sawtooth_sdk.protobuf.batch_pb2 import Batch
+
+from client.shipment_keys import public_key_hex
+from client.shipment_payload import encode_add
+from client.shipment_payload import encode_add_many
+from client.shipment_payload import encode_migrate
+from client.shipment_payload import encode_remove
+from client.shipment_payload import encode_transfer
+from client.shipment_payload import encode_transfer_many
+from client.shipment_state import FAMILY_NAME
+from client.shipment_state import make_global_item_total_prefix
+from client.shipment_state import make_item_total_address
+from client.shipment_state import make_item_total_prefix
+from client.shipment_state import make_legacy_address
+from client.shipment_state import make_path_prefix
+from client.shipment_state import make_path_root_address
+from client.shipment_state import make_place_index_address
+from client.shipment_state import make_shipment_address
+from client.shipment_state import make_shipment_prefix
+
+FAMILY_VERSION = '1.0'
+
+DEFAULT_MAX_BATCHES_PER_LIST = 100
+
+_ENCODERS = {
+    'add': encode_add,
+    'remove': encode_remove,
+    'transfer': encode_transfer,
+    'migrate': encode_migrate,
+    'add_many': encode_add_many,
+    'transfer_many': encode_transfer_many,
+}
+
+
+def operation_addresses(action, publicKey, *values):
+    '''Return the state addresses an operation signed by publicKey touches.
+
+    values are the operation arguments in payload order; the same list is
+    used as both the inputs and the outputs of the transaction.
+    '''
+    if "add" == action:
+        return [make_place_index_address(publicKey),
+                make_shipment_address(publicKey, values[0]),
+                make_path_prefix(values[0])] + \
+            _item_total_addresses(publicKey, values[1])
+    if "remove" == action:
+        return [make_shipment_address(publicKey, values[0])] + \
+            _item_total_addresses(publicKey, values[1])
+    if "transfer" == action:
+        # The items moved are only known from state, so the item totals
+        # of both places are declared by prefix, as is the path.
+        return [make_place_index_address(publicKey),
+                make_shipment_address(publicKey, values[0]),
+                make_item_total_prefix(publicKey),
+                make_place_index_address(values[2]),
+                make_shipment_address(values[2], values[0]),
+                make_item_total_prefix(values[2]),
+                make_path_prefix(values[0])]
+    if "migrate" == action:
+        return [make_legacy_address(publicKey),
+                make_place_index_address(publicKey),
+                make_shipment_prefix(publicKey),
+                make_item_total_prefix(publicKey),
+                make_global_item_total_prefix()]
+    if "add_many" == action:
+        addresses = [make_place_index_address(publicKey)]
+        for shipmentID, _ in values[0]:
+            addresses.append(make_shipment_address(publicKey, shipmentID))
+            addresses.append(make_path_prefix(shipmentID))
+        return addresses + _item_total_addresses(
+            publicKey, [item for _, items in values[0] for item in items])
+    if "transfer_many" == action:
+        addresses = [make_place_index_address(publicKey),
+                     make_item_total_prefix(publicKey)]
+        for placeToKey in dict.fromkeys(
+                placeToKey for _, _, placeToKey in values[0]):
+            addresses.append(make_place_index_address(placeToKey))
+            addresses.append(make_item_total_prefix(placeToKey))
+        for shipmentID, _, placeToKey in values[0]:
+            addresses.append(make_shipment_address(publicKey, shipmentID))
+            addresses.append(make_shipment_address(placeToKey, shipmentID))
+            addresses.append(make_path_prefix(shipmentID))
+        return addresses
+    raise Exception('Invalid action: {}'.format(action))
+
+
+def ordering_keys(action, publicKey, *values):
+    '''Return the addresses fixing the order of an operation.
+
+    These are the shipments it reads and writes, or every shipment of the
+    place for migrate.  Adds and transfers also take the root entry of
+    the path of the shipment ID, as they may start a path and the root
+    numbers paths in the order they start.  The item totals an operation
+    also writes are sums whose outcome does not depend on order; the
+    validator still serializes the writes, but transactions are not made
+    to depend on each other for them, so an invalid transaction only
+    holds back the operations on its own shipments.  add_many and
+    transfer_many take the keys of an add or transfer per shipment.
+    '''
+    if "add" == action:
+        return [make_shipment_address(publicKey, values[0]),
+                make_path_root_address(values[0])]
+    if "remove" == action:
+        return [make_shipment_address(publicKey, values[0])]
+    if "transfer" == action:
+        return [make_shipment_address(publicKey, values[0]),
+                make_shipment_address(values[2], values[0]),
+                make_path_root_address(values[0])]
+    if "migrate" == action:
+        return [make_legacy_address(publicKey),
+                make_shipment_prefix(publicKey)]
+    if "add_many" == action:
+        return [key for shipmentID, items in values[0]
+                for key in ordering_keys("add", publicKey, shipmentID,
+                                         items, values[1])]
+    if "transfer_many" == action:
+        return [key for transfer in values[0]
+                for key in ordering_keys("transfer", publicKey, *transfer)]
+    raise Exception('Invalid action: {}'.format(action))
+
+
+def _item_total_addresses(publicKey, items):
+    names = sorted(set(item for item, _ in items))
+    return [make_item_total_address(publicKey, item) for item in names] + \
+        [make_item_total_address(None, item) for item in names]
+
+
+def make_transaction(signer, batcherPublicKey, action, *values,
+                     dependencies=()):
+    '''Encode, address and sign a single shipment transaction.
+
+       dependencies are the ids of the transactions it must follow.
+    '''
+    publicKey = public_key_hex(signer)
+    payload = _ENCODERS[action](*values)
+    addresses = operation_addresses(action, publicKey, *values)
+
+    header = TransactionHeader(
+        signer_public_key=publicKey,
+        family_name=FAMILY_NAME,
+        family_version=FAMILY_VERSION,
+        inputs=addresses,
+        outputs=addresses,
+        dependencies=list(dependencies),
+        payload_sha512=hashlib.sha512(payload).hexdigest(),
+        batcher_public_key=batcherPublicKey,
+        nonce=random.random().hex()
+    ).SerializeToString()
+
+    return Transaction(header=header, payload=payload,
+                       header_signature=signer.sign(header))
+
+
+def make_batch(batcherSigner, transactions):
+    '''Sign a batch holding the transactions, committed all or none.'''
+    header = BatchHeader(
+        signer_public_key=public_key_hex(batcherSigner),
+        transaction_ids=[txn.header_signature for txn in transactions]
+    ).SerializeToString()
+    return Batch(
+        header=header,
+        transactions=transactions,
+        header_signature=batcherSigner.sign(header))
+
+
+class ShipmentBatchBuilder(object):
+    '''Collect shipment operations and pack them into BatchLists.
+
+    Each operation becomes its own batch, so one failing transaction does
+    not take the others with it.  Operations added inside an atomic()
+    block share a single batch instead: they are committed together or
+    not at all.  Operations are signed by the given signer, or by the
+    batcher when none is given.  With dependencies, a DependencyTracker,
+    each operation is made to follow the operations on its shipments
+    signed before it.
+    '''
+
+    def __init__(self, batcherSigner,
+                 maxBatchesPerList=DEFAULT_MAX_BATCHES_PER_LIST,
+                 dependencies=None):
+        if maxBatchesPerList < 1:
+            raise Exception('maxBatchesPerList must be at least 1')
+        self._batcherSigner = batcherSigner
+        self._batcherPublicKey = public_key_hex(batcherSigner)
+        self._maxBatchesPerList = maxBatchesPerList
+        self._dependencies = dependencies
+        self._groups = []
+        self._atomicGroup = None
+
+    def __len__(self):
+        '''Number of transactions waiting to be built.'''
+        return sum(len(group) for group in self._groups)
+
+    def add_item(self, shipmentID, items, placeName, signer=None):
+        self.append(signer, "add", shipmentID, items, placeName)
+
+    def remove_item(self, shipmentID, items, signer=None):
+        self.append(signer, "remove", shipmentID, items)
+
+    def transfer(self, shipmentID, placeTo, placeToPublicKey, signer=None):
+        self.append(signer, "transfer", shipmentID, placeTo, placeToPublicKey)
+
+    def migrate(self, signer=None):
+        self.append(signer, "migrate")
+
+    def add_many(self, shipments, placeName, signer=None):
+        self.append(signer, "add_many", shipments, placeName)
+
+    def transfer_many(self, transfers, signer=None):
+        self.append(signer, "transfer_many", transfers)
+
+    def append(self, signer, action, *values):
+        '''Sign one operation and queue it for the next build().'''
+        signer = signer or self._batcherSigner
+        if self._dependencies is None:
+            transaction = make_transaction(
+                signer, self._batcherPublicKey, action, *values)
+        else:
+            keys = ordering_keys(action, public_key_hex(signer), *values)
+            transaction = make_transaction(
+                signer, self._batcherPublicKey, action, *values,
+                dependencies=self._dependencies.dependencies(keys))
+            self._dependencies.record(transaction.header_signature, keys)
+        if self._atomicGroup is not None:
+            self._atomicGroup.append(transaction)
+        else:
+            self._groups.append([transaction])
+
+    @contextlib.contextmanager
+    def atomic(self):
+        '''Put every operation added in the block into one batch.'''
+        if self._atomicGroup is not None:
+            raise Exception('atomic() blocks cannot be nested')
+        self._atomicGroup = []
+        try:
+            yield self
+            if self._atomicGroup:
+                self._groups.append(self._atomicGroup)
+        except BaseException:
+            if self._dependencies is not None:
+                # The group is dropped: nothing may wait on it.
+                self._dependencies.forget(
+                    [txn.header_signature for txn in self._atomicGroup])
+            raise
+        finally:
+            self._atomicGroup = None
+
+    def build(self):
+        '''Return the queued operations as BatchLists and start over.'''
+        batches = [self._make_batch(group) for group in self._groups]
+        self._groups = []
+        return [BatchList(batches=batches[start:start + self._maxBatchesPerList])
+                for start in range(0, len(batches), self._maxBatchesPerList)]
+
+    def _make_batch(self, transactions):
+        batch = make_batch(self._batcherSigner, transactions)
+        if self._dependencies is not None:
+            self._dependencies.add_batch(
+                batch.header_signature,
+                [txn.header_signature for txn in transactions])
+        return batch
@@ -0,0 +1,104 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Read-through cache of decoded state for ShipmentClient.
+
+Entries are keyed by what was read and the id of the chain head it was
+read at, so an entry can never be served once a new block is committed.
+The head itself is looked up with a cheap /blocks?limit=1 request at
+most once per headTtl seconds; reads in between cost neither a request
+nor a decode:
+
+    client = ShipmentClient(url, keyFile, cache=StateCache())
+'''
+
+import collections
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_HEAD_TTL = 1.0
+
+
+class StateCache(object):
+    '''LRU of decoded records keyed by (key, head block id).
+
+    An entry weighs one per record it holds, and the least recently used
+    entries are evicted once the total weight exceeds maxEntries.
+    Cached records are shared between callers and must not be modified.
+    '''
+
+    def __init__(self, maxEntries=DEFAULT_MAX_ENTRIES,
+                 headTtl=DEFAULT_HEAD_TTL):
+        self._maxEntries = maxEntries
+        self._headTtl = headTtl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._weight = 0
+        self._head = None
+        self._headCheckedAt = None
+        self.hits = 0
+        self.misses = 0
+
+    def head(self, fetchHead):
+        '''Return the current head id, calling fetchHead() when it is due.'''
+        now = time.monotonic()
+        with self._lock:
+            if self._headCheckedAt is not None and \
+                    now - self._headCheckedAt < self._headTtl:
+                return self._head
+        head = fetchHead()
+        with self._lock:
+            if head != self._head:
+                # Entries of older heads can never be hit again.
+                self._entries.clear()
+                self._weight = 0
+                self._head = head
+            self._headCheckedAt = now
+        return head
+
+    def invalidate(self):
+        '''Check the head again on the next read.'''
+        with self._lock:
+            self._headCheckedAt = None
+
+    def get(self, key, head):
+        '''Return (True, value) for a cached entry, else (False, None).'''
+        with self._lock:
+            entry = self._entries.get((key, head))
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end((key, head))
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, head, value, weight=1):
+        with self._lock:
+            if head != self._head or weight > self._maxEntries:
+                return
+            old = self._entries.pop((key, head), None)
+            if old is not None:
+                self._weight -= old[1]
+            self._entries[(key, head)] = (value, weight)
+            self._weight += weight
+            while self._weight > self._maxEntries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._weight -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+            self._head = None
+            self._headCheckedAt = None
@@ -20,22 +20,36 @@ to process.
 ''' 
 
 import argparse
-import getpass
+import datetime
 import logging
 import os
 import sys
+import threading
 import traceback
-import pkg_resources
 
-from colorlog import ColoredFormatter
-
-from client.shipment_client import ShipmentClient
+# Scripts call the CLI once per operation, so startup time counts: the
+# modules behind a subcommand (requests, protobuf, signing, zmq, sqlite)
+# are imported by the do_* function running it, never to build the
+# parser.  Option defaults kept in those modules are filled in there.
 
 DISTRIBUTION_NAME = 'shipment'
 
 DEFAULT_URL = 'http://rest-api:8008'
 
+# Seconds --wait gives the validator when no value is given.
+DEFAULT_WAIT = 60
+
+# Subcommands answered by a running "shipment daemon" when there is one.
+FORWARDED_COMMANDS = ('add', 'remove', 'transfer', 'getcount', 'path')
+
+# Clients kept by the daemon, one per place, or None when every command
+# makes its own.
+_clients = None
+_clientsLock = threading.Lock()
+
 def create_console_handler(verbose_level):
+    from colorlog import ColoredFormatter
+
     clog = logging.StreamHandler()
     formatter = ColoredFormatter(
         "%(log_color)s[%(asctime)s %(levelname)-8s%(module)s]%(reset)s "
@@ -59,6 +73,15 @@ def setup_loggers(verbose_level):
     logger.setLevel(logging.DEBUG)
     logger.addHandler(create_console_handler(verbose_level))
     
+def add_wait_argument(parser):
+    parser.add_argument('--wait', type=float, nargs='?', const=DEFAULT_WAIT,
+                        metavar='SECONDS',
+                        help='wait until the validator commits or rejects the operation')
+
+def add_view_argument(parser):
+    parser.add_argument('--view', type=str, metavar='FILE',
+                        help='answer from the local view kept by "subscribe --db FILE"')
+
 def add_shipment_parser(subparser,parent_parser):
     parser = subparser.add_parser(
         'add',
@@ -70,6 +93,7 @@ def add_shipment_parser(subparser,parent_parser):
     # parser.add_argument('itemName', type=str, help='item to be added')
     # parser.add_argument('itemCount', type=str, help='count to be added')
     parser.add_argument('items', nargs='*', help='item names followed by their corresponding counts')
+    add_wait_argument(parser)
 
 def remove_items_shipment_parser(subparser,parent_parser):
     parser = subparser.add_parser(
@@ -82,18 +106,106 @@ def remove_items_shipment_parser(subparser,parent_parser):
     # parser.add_argument('itemName', type=str, help='item to be removed')
     # parser.add_argument('itemCount', type=str, help='count to be removed')
     parser.add_argument('items', nargs='*', help='item names followed by their corresponding counts')
+    add_wait_argument(parser)
 
 def item_count_parser(subparsers,parent_parser):
-    parser = subparsers.add_parser('getcount',help='shows count of items of specified type at a particular place',parents=[parent_parser])
-    parser.add_argument('itemName',type=str,help='the name of the item')
-    parser.add_argument('placeName',type=str,help='the name of the place')
+    parser = subparsers.add_parser('getcount',help='shows count of items of specified type at a particular place',
+                                   description='getcount ITEM PLACE shows the count at one place, '
+                                   'getcount ITEM --all across all places, '
+                                   'getcount --top N [PLACE] the N most stocked items',
+                                   parents=[parent_parser])
+    parser.add_argument('itemName',type=str,nargs='?',help='the name of the item')
+    parser.add_argument('placeName',type=str,nargs='?',help='the name of the place')
+    parser.add_argument('--all',action='store_true',help='count the item across all places')
+    parser.add_argument('--top',type=int,metavar='N',help='list the N items with the highest counts')
+    add_view_argument(parser)
 
 def shipment_path_parser(subparsers,parent_parser):
     parser = subparsers.add_parser('path',help='shows path of the shipment',parents=[parent_parser])
     parser.add_argument('shipmentID',type=str,help='the ID of the shipment')
     parser.add_argument('placeName',type=str,help='the name of the place') 
+    parser.add_argument('--start',type=int,help='list the hops from this one on, the first being 0')
+    parser.add_argument('--count',type=int,help='list at most this many hops')
+    parser.add_argument('--last',type=int,metavar='N',help='list the last N hops')
+    add_view_argument(parser)
+
 
 
+def migrate_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser('migrate',help='moves the shipments of a place to the per-shipment state layout',
+                                   parents=[parent_parser])
+    parser.add_argument('placeName',type=str,help='the name of the place')
+    add_wait_argument(parser)
+
+def export_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser('export',help='writes every entry of the shipment namespace to a file',
+                                   parents=[parent_parser])
+    parser.add_argument('file',type=str,help='the file to write')
+    parser.add_argument('--format',choices=('ndjson', 'columnar'),default='ndjson',
+                        help='one JSON object per entry, or per page and kind with a list per field')
+    parser.add_argument('--concurrency',type=int,
+                        help='sub-prefixes read in parallel, 1 to page through the namespace in order')
+    parser.add_argument('--page-size',type=int,
+                        help='entries requested per page')
+    parser.add_argument('--resume',action='store_true',
+                        help='continue an interrupted export from its checkpoint')
+
+def import_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser('import',help='submits every add, remove and transfer of a CSV or NDJSON manifest',
+                                   description='Rows have the fields action, shipment, place, items and place_to; '
+                                   'items are written name:count;name:count in CSV, an object in NDJSON.',
+                                   parents=[parent_parser])
+    parser.add_argument('file',type=str,help='the manifest to import ("-" for stdin)')
+    parser.add_argument('--format',choices=('csv', 'ndjson'),
+                        help='the manifest format (default: from the file name, else csv)')
+    parser.add_argument('--batch-size',type=int,
+                        help='rows of one place posted together')
+    parser.add_argument('--concurrency',type=int,
+                        help='BatchLists posted in parallel')
+    add_wait_argument(parser)
+
+def loadgen_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser('loadgen',help='applies a synthetic workload and reports throughput and commit latency',
+                                   description='Places get keys made up for the run; operations on a shipment '
+                                   'depend on the ones before them.',
+                                   parents=[parent_parser])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url',type=str,
+                        help='the REST API to load (default {})'.format(DEFAULT_URL))
+    target.add_argument('--local',action='store_true',
+                        help='load an in-process stand-in of the validator instead')
+    parser.add_argument('--mode',choices=('open', 'closed'),
+                        help='send at --rate whatever the stack does, or keep --concurrency operations in flight '
+                        '(default open)')
+    parser.add_argument('--rate',type=float,help='operations per second in open mode')
+    parser.add_argument('--duration',type=float,metavar='SECONDS',help='how long to apply load')
+    parser.add_argument('--concurrency',type=int,
+                        help='operations in flight in closed mode, posting threads in open mode')
+    parser.add_argument('--places',type=int,help='places of the workload')
+    parser.add_argument('--shipments',type=int,help='shipment IDs of the workload')
+    parser.add_argument('--items',type=int,help='item names of the workload')
+    parser.add_argument('--mix',type=str,help='weights of the operations, e.g. add=5,remove=3,transfer=2')
+    parser.add_argument('--seed',type=int,help='random seed of the workload')
+    parser.add_argument('--timeout',type=float,metavar='SECONDS',
+                        help='time an operation may stay undecided before it counts as unknown')
+    parser.add_argument('--signing-workers',type=int,metavar='N',
+                        help='sign operations in N worker processes rather than in the posting threads')
+    parser.add_argument('--json',action='store_true',help='print the results as JSON')
+
+def subscribe_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser('subscribe',help='keeps a local view of the shipments up to date from validator events',
+                                   parents=[parent_parser])
+    parser.add_argument('--db',type=str,required=True,metavar='FILE',help='the SQLite file holding the view')
+    parser.add_argument('--validator',type=str,
+                        help='the validator endpoint to subscribe to (default tcp://validator:4004)')
+
+def daemon_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser('daemon',help='keeps keys and connections open and answers '
+                                   'add, remove, transfer, getcount and path for the other calls',
+                                   parents=[parent_parser])
+    parser.add_argument('--socket',type=str,metavar='PATH',
+                        help='the Unix socket to listen on (default $SHIPMENT_DAEMON_SOCKET, '
+                        'else ~/.sawtooth/shipment.sock)')
 
 def transfer_shipment_parser(subparsers, parent_parser):
     parser =  subparsers.add_parser('transfer',help='to transfer shipment of given ID from one place to other',
@@ -101,22 +213,55 @@ def transfer_shipment_parser(subparsers, parent_parser):
     parser.add_argument('shipmentID',type=str,help='id of the shipment to be transfered')
     parser.add_argument('placeFrom',type=str,help='Name of the start place')
     parser.add_argument('placeTo',type=str,help='Name of the Destination')
+    add_wait_argument(parser)
 
+def add_many_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser('add-many',help='adds items to many shipments of a place in one transaction',
+                                   description='Shipments are given as ID=ITEM:COUNT[,ITEM:COUNT...], '
+                                   'e.g. S1=apple:3,pear:2; every addition commits or none does.',
+                                   parents=[parent_parser])
+    parser.add_argument('placeName',type=str,help='the name of the place')
+    parser.add_argument('shipments',nargs='+',metavar='SHIPMENT',help='a shipment ID and the items to add to it')
+    add_wait_argument(parser)
+
+def transfer_many_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser('transfer-many',help='transfers many shipments of a place in one transaction',
+                                   description='Shipments go to the place given with --to, or as ID=PLACE; '
+                                   'every shipment moves or none does.',
+                                   parents=[parent_parser])
+    parser.add_argument('placeFrom',type=str,help='the name of the place holding the shipments')
+    parser.add_argument('shipments',nargs='+',metavar='SHIPMENT',
+                        help='a shipment ID, or ID=PLACE to send it to another place than --to')
+    parser.add_argument('--to',type=str,dest='placeTo',metavar='PLACE',
+                        help='the destination of the shipments given without one')
+    add_wait_argument(parser)
+
+
+class _VersionAction(argparse.Action):
+    '''Print the version, looking it up only when it is asked for.'''
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS,
+                 default=argparse.SUPPRESS, help=None):
+        super().__init__(option_strings=option_strings, dest=dest,
+                         default=default, nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from importlib import metadata
+
+        try:
+            version = metadata.version(DISTRIBUTION_NAME)
+        except metadata.PackageNotFoundError:
+            version = 'UNKNOWN'
+        parser.exit(message=(DISTRIBUTION_NAME + ' (Hyperledger Sawtooth) version {}\n')
+                    .format(version))
 
 def create_parent_parser(prog_name):
     '''Define the -V/--version command line options.'''
     parent_parser = argparse.ArgumentParser(prog=prog_name, add_help=False)
 
-    try:
-        version = pkg_resources.get_distribution(DISTRIBUTION_NAME).version
-    except pkg_resources.DistributionNotFound:
-        version = 'UNKNOWN'
-
     parent_parser.add_argument(
         '-V', '--version',
-        action='version',
-        version=(DISTRIBUTION_NAME + ' (Hyperledger Sawtooth) version {}')
-        .format(version),
+        action=_VersionAction,
         help='display version information')
 
     return parent_parser
@@ -137,109 +282,444 @@ def create_parser(prog_name):
     add_shipment_parser(subparsers, parent_parser)
     remove_items_shipment_parser(subparsers, parent_parser)
     transfer_shipment_parser(subparsers, parent_parser)
+    add_many_parser(subparsers, parent_parser)
+    transfer_many_parser(subparsers, parent_parser)
     item_count_parser(subparsers, parent_parser)
     shipment_path_parser(subparsers,parent_parser)
+    migrate_parser(subparsers, parent_parser)
+    export_parser(subparsers, parent_parser)
+    subscribe_parser(subparsers, parent_parser)
+    import_parser(subparsers, parent_parser)
+    loadgen_parser(subparsers, parent_parser)
+    daemon_parser(subparsers, parent_parser)
     return parser
 
+def _get_keyring():
+    from client.shipment_keys import get_keyring
+    return get_keyring()
+
 def _get_keyfile(placeName):
     '''Get the private key for a place.'''
-    home = os.path.expanduser("~")
-    key_dir = os.path.join(home, ".sawtooth", "keys")
-
-    return '{}/{}.priv'.format(key_dir, placeName)
+    return _get_keyring().private_key_file(placeName)
 
 def _get_pubkeyfile(placeName):
     '''Get the public key for a place.'''
-    home = os.path.expanduser("~")
-    key_dir = os.path.join(home, ".sawtooth", "keys")
-
-    return '{}/{}.pub'.format(key_dir, placeName)
+    return _get_keyring().public_key_file(placeName)
+
+def _get_public_key(placeName):
+    '''Read the public key of a place; enough for every query.'''
+    return _get_keyring().public_key(placeName)
+
+def _make_client(**kwargs):
+    '''Return a client, the one kept for the place in the daemon.
+
+       The daemon keeps its clients, so the operations of a place follow
+       the ones of earlier commands still in flight, and are released from
+       their dependency tracker as the validator decides them.
+    '''
+    from client.shipment_client import ShipmentClient
+    if _clients is None:
+        return ShipmentClient(baseUrl=DEFAULT_URL, **kwargs)
+    key = tuple(sorted(kwargs.items()))
+    if kwargs.get('keyFile') is not None:
+        from client.shipment_keys import public_key_hex
+        # A new key in the file makes a new client.
+        key += (public_key_hex(
+            _get_keyring().signer_from_file(kwargs['keyFile'])),)
+    with _clientsLock:
+        client = _clients.get(key)
+        if client is None:
+            client = ShipmentClient(baseUrl=DEFAULT_URL, **kwargs)
+            # Created now, rather than by concurrent commands.
+            client.tracker()
+            _clients[key] = client
+    return client
+
+def _report(client, args, response, operation, out=None):
+    '''Print the outcome of a submitted operation, waiting if asked to.'''
+    if args.wait is None:
+        print("{} operation submitted".format(operation), file=out)
+        return
+    status = client.wait_for_batches([response], timeout=args.wait)[0]
+    if status is None:
+        print("{} operation is still pending after {} seconds".format(
+            operation, args.wait), file=out)
+    elif status.status == 'COMMITTED':
+        print("{} operation committed".format(operation), file=out)
+    else:
+        messages = [txn.get('message', '') for txn in status.invalidTransactions]
+        raise Exception("{} operation {}: {}".format(
+            operation, status.status.lower(), '; '.join(messages)))
 
-def do_add(args):
+def do_add(args, out=None):
     '''Implements the "deposit" subcommand by calling the client class.'''
     keyfile = _get_keyfile(args.placeName)
 
-    client = ShipmentClient(baseUrl=DEFAULT_URL, keyFile=keyfile)
+    client = _make_client(keyFile=keyfile)
 
     response = client.add_item(args.shipmentID, args.N, args.items,args.placeName)
 
-    # print("Response: {}".format(response))
-    print("Add operation completed")
+    _report(client, args, response, "Add", out)
 
-def do_remove(args):
+def do_remove(args, out=None):
     '''Implements the "withdraw" subcommand by calling the client class.'''
     keyfile = _get_keyfile(args.placeName)
 
-    client = ShipmentClient(baseUrl=DEFAULT_URL, keyFile=keyfile)
+    client = _make_client(keyFile=keyfile)
 
     response = client.remove_item(args.shipmentID, args.N, args.items)
 
-    print("Remove operation completed")
-    # print("Response: {}".format(response))
-
-def do_getcount(args):
-    '''Implements the "balance" subcommand by calling the client class.'''
-    keyfile = _get_keyfile(args.placeName)
+    _report(client, args, response, "Remove", out)
 
-    client = ShipmentClient(baseUrl=DEFAULT_URL, keyFile=keyfile)
+def _open_view(path):
+    '''Open a view written by the subscribe subcommand.'''
+    from client.shipment_view import ShipmentView
 
-    data = client.get_data()
-    # ans = 0
-    # print(data[args.itemName])
-    # print(data,type(data))
+    if not os.path.exists(path):
+        raise Exception("No view at {}, start one with subscribe --db {}".format(path, path))
+    return ShipmentView(path)
 
-    ans = 0
-    for shipmentID,info in data.items():
-        for item,count in info.items():
-            if(item==args.itemName):
-                ans += count
-    print("No of items of type {} is {}".format(args.itemName,ans))
-
-def do_transfer(args):
+def do_getcount(args, out=None):
+    '''Implements the "balance" subcommand by calling the client class.'''
+    if args.view is not None:
+        _getcount_from_view(args, out)
+        return
+    if args.top is not None:
+        # With --top the only positional argument is the place, if any.
+        placeName = args.placeName or args.itemName
+        if args.placeName is not None or (placeName is None) != args.all:
+            raise Exception("Use getcount --top N PLACE or getcount --top N --all")
+        if args.all:
+            client = _make_client()
+        else:
+            client = _make_client(publicKey=_get_public_key(placeName))
+        for item, count in client.get_top_items(args.top, allPlaces=args.all):
+            print("{} {}".format(item, count), file=out)
+        return
+
+    if args.itemName is None or (args.placeName is None) != args.all:
+        raise Exception("Use getcount ITEM PLACE or getcount ITEM --all")
+    if args.all:
+        client = _make_client()
+        ans = client.get_item_count(args.itemName, allPlaces=True)
+    else:
+        client = _make_client(publicKey=_get_public_key(args.placeName))
+        ans = client.get_item_count(args.itemName)
+    print("No of items of type {} is {}".format(args.itemName,ans), file=out)
+
+def _getcount_from_view(args, out=None):
+    view = _open_view(args.view)
+    if args.top is not None:
+        placeName = args.placeName or args.itemName
+        if args.placeName is not None or (placeName is None) != args.all:
+            raise Exception("Use getcount --top N PLACE or getcount --top N --all")
+        publicKey = None if args.all else _get_public_key(placeName)
+        for item, count in view.get_top_items(args.top, publicKey):
+            print("{} {}".format(item, count), file=out)
+        return
+    if args.itemName is None or (args.placeName is None) != args.all:
+        raise Exception("Use getcount ITEM PLACE or getcount ITEM --all")
+    publicKey = None if args.all else _get_public_key(args.placeName)
+    ans = view.get_item_count(args.itemName, publicKey)
+    print("No of items of type {} is {}".format(args.itemName,ans), file=out)
+
+def do_transfer(args, out=None):
     '''Implements the "transfer" subcommand by calling the client class.'''
     keyfileFrom = _get_keyfile(args.placeFrom)
     keyfileTo = _get_pubkeyfile(args.placeTo)
-    clientFrom = ShipmentClient(baseUrl=DEFAULT_URL, keyFile=keyfileFrom)
+    clientFrom = _make_client(keyFile=keyfileFrom)
     response = clientFrom.transfer(args.shipmentID,args.placeTo,keyfileTo)
-    # print("Response: {}".format(response))
-    print("Transfer completed")
-
-def do_getpath(args):
+    _report(clientFrom, args, response, "Transfer", out)
+
+def _parse_shipment_items(value):
+    '''Parse "ID=name:count,name:count" into the ID and (name, count) pairs.'''
+    shipmentID, separator, entries = value.partition('=')
+    if not separator or not shipmentID:
+        raise Exception("Expected ID=ITEM:COUNT[,ITEM:COUNT...], got {}".format(value))
+    items = []
+    for entry in entries.split(','):
+        name, separator, count = entry.rpartition(':')
+        if not separator or not name:
+            raise Exception("Expected ITEM:COUNT for shipment {}, got {}".format(shipmentID, entry))
+        try:
+            items.append((name, int(count)))
+        except ValueError as err:
+            raise Exception('Invalid item count: {}'.format(err))
+    return shipmentID, items
+
+def do_add_many(args):
+    shipments = [_parse_shipment_items(value) for value in args.shipments]
+    client = _make_client(keyFile=_get_keyfile(args.placeName))
+    response = client.add_many(shipments, args.placeName)
+    _report(client, args, response, "Bulk add")
+
+def do_transfer_many(args):
+    transfers = []
+    for value in args.shipments:
+        shipmentID, _, placeTo = value.partition('=')
+        placeTo = placeTo or args.placeTo
+        if placeTo is None:
+            raise Exception("No destination for shipment {}, give --to PLACE or {}=PLACE"
+                            .format(shipmentID, shipmentID))
+        if placeTo == args.placeFrom:
+            raise Exception("Cannot transfer item to self: {}".format(placeTo))
+        transfers.append((shipmentID, placeTo, _get_pubkeyfile(placeTo)))
+    client = _make_client(keyFile=_get_keyfile(args.placeFrom))
+    response = client.transfer_many(transfers)
+    _report(client, args, response, "Bulk transfer")
+
+def do_getpath(args, out=None):
+    '''Implements the "path" subcommand.
+
+       Prints the whole path on one line, or with --start, --count or
+       --last the selected hops one per line, with their times.
+    '''
+    from client.shipment_state import hop_range
+
+    if args.last is not None:
+        if args.start is not None:
+            raise Exception("Use either --start or --last")
+        start, count = -args.last, args.last
+    else:
+        start, count = args.start or 0, args.count
+    paged = args.start is not None or args.count is not None or args.last is not None
+
+    if args.view is not None:
+        view = _open_view(args.view)
+        shipment = view.get_shipment(_get_public_key(args.placeName), args.shipmentID)
+        if shipment is None:
+            found = None
+        else:
+            names = shipment['path'].split('->')
+            begin, end = hop_range(start, count, len(names))
+            found = [(name, 0) for name in names[begin:end]], len(names)
+    else:
+        client = _make_client(publicKey=_get_public_key(args.placeName))
+        found = client.get_path(args.shipmentID, start, count)
+    if found is None:
+        print("Shipment is not found at the mentioned place", file=out)
+        return
+    hops, total = found
+    if not paged:
+        print("Path of the shipment {} is {}".format(
+            args.shipmentID, '->'.join(place for place, _ in hops)), file=out)
+        return
+    first = hop_range(start, count, total)[0]
+    for number, (place, timestamp) in enumerate(hops, first):
+        when = '-' if not timestamp else datetime.datetime.fromtimestamp(
+            timestamp, datetime.timezone.utc).isoformat()
+        print("{} {} {}".format(number, place, when), file=out)
+    print("{} of {} hops".format(len(hops), total), file=out)
+
+def do_migrate(args):
     keyfile = _get_keyfile(args.placeName)
-    client = ShipmentClient(baseUrl=DEFAULT_URL, keyFile=keyfile)
-    data = client.get_data()
-    # print(data)
-    if args.shipmentID in data:
-        print("Path of the shipment {} is {}".format(args.shipmentID, data[args.shipmentID]['path']))
+    client = _make_client(keyFile=keyfile)
+    response = client.migrate()
+    _report(client, args, response, "Migrate")
+
+def do_export(args):
+    from client.shipment_export import DEFAULT_CONCURRENCY
+    from client.shipment_export import DEFAULT_PAGE_SIZE
+    from client.shipment_export import StateExporter
+
+    concurrency = DEFAULT_CONCURRENCY if args.concurrency is None else args.concurrency
+    pageSize = DEFAULT_PAGE_SIZE if args.page_size is None else args.page_size
+    client = _make_client()
+    exporter = StateExporter(client, args.file, args.format, concurrency, pageSize)
+    entries = exporter.run(resume=args.resume)
+    print("Exported {} entries to {}".format(entries, args.file))
+
+def do_import(args):
+    from client.shipment_import import DEFAULT_BATCH_SIZE
+    from client.shipment_import import DEFAULT_CONCURRENCY
+    from client.shipment_import import ManifestImporter
+    from client.shipment_import import manifest_format
+    from client.shipment_import import read_manifest
+
+    batchSize = DEFAULT_BATCH_SIZE if args.batch_size is None else args.batch_size
+    concurrency = DEFAULT_CONCURRENCY if args.concurrency is None else args.concurrency
+    client = _make_client()
+    importer = ManifestImporter(client, batchSize=batchSize,
+                                concurrency=concurrency, wait=args.wait)
+
+    def on_failure(line, message):
+        print("\rline {}: {}".format(line, message), file=sys.stderr)
+
+    def on_progress(stats):
+        print("\r{} rows read, {} submitted, {} committed, {} failed, {:.1f} rows/s".format(
+            stats.rows, stats.submitted, stats.committed, stats.failed, stats.rate),
+            end='', file=sys.stderr, flush=True)
+
+    fmt = args.format or manifest_format(args.file)
+    if args.file == '-':
+        stats = importer.run(read_manifest(sys.stdin, fmt), on_progress, on_failure)
     else:
-        print("Shipment is not found at the mentioned place")
+        with open(args.file, newline='') as fd:
+            stats = importer.run(read_manifest(fd, fmt), on_progress, on_failure)
+    print(file=sys.stderr)
+    print("Imported {} rows in {:.1f} seconds ({:.1f} rows/s): {} submitted, {}{} failed".format(
+        stats.rows, stats.elapsed, stats.rate, stats.submitted,
+        "" if args.wait is None else "{} committed, ".format(stats.committed),
+        stats.failed))
+    if stats.failed:
+        sys.exit(1)
+
+def do_loadgen(args):
+    import json
+
+    from client import shipment_loadgen as loadgen
+    from client.shipment_client import ShipmentClient
+
+    def option(value, default):
+        return default if value is None else value
+
+    if args.local:
+        # The handler logs every operation it applies at debug level.
+        logging.getLogger('processor').setLevel(logging.WARNING)
+        client = ShipmentClient('local', session=loadgen.LocalRestApi(),
+                                pollInterval=loadgen.DEFAULT_POLL_INTERVAL)
+    else:
+        client = ShipmentClient(option(args.url, DEFAULT_URL),
+                                pollInterval=loadgen.DEFAULT_POLL_INTERVAL)
+    workload = loadgen.Workload(
+        option(args.places, loadgen.DEFAULT_PLACES),
+        option(args.shipments, loadgen.DEFAULT_SHIPMENTS),
+        option(args.items, loadgen.DEFAULT_ITEMS),
+        loadgen.parse_mix(option(args.mix, loadgen.DEFAULT_MIX)), args.seed)
+    mode = option(args.mode, loadgen.DEFAULT_MODE)
+    rate = option(args.rate, loadgen.DEFAULT_RATE)
+    duration = option(args.duration, loadgen.DEFAULT_DURATION)
+    generator = loadgen.LoadGenerator(
+        client, workload, mode=mode, rate=rate, duration=duration,
+        concurrency=option(args.concurrency, loadgen.DEFAULT_CONCURRENCY),
+        timeout=option(args.timeout, loadgen.DEFAULT_TIMEOUT),
+        signingWorkers=option(args.signing_workers, 0))
+
+    def on_progress(stats):
+        print("\r{:.0f}s: {} submitted, {} committed, {} rejected".format(
+            stats.elapsed, stats.submitted, stats.committed,
+            sum(stats.rejected.values())), end='', file=sys.stderr, flush=True)
+
+    summary = generator.run(None if args.json else on_progress).summary()
+    if args.json:
+        print(json.dumps(summary, indent=2, sort_keys=True))
+        return
+    print(file=sys.stderr)
+    print("mode:       {}{}, {:.0f} s".format(
+        mode, " at {:g} ops/s".format(rate) if mode == 'open' else "", duration))
+    print("submitted:  {submitted} ({submit_rate:.1f} ops/s), {errors} not posted, "
+          "{queue_full} queue full replies".format(**summary))
+    if summary['late']:
+        print("late:       {late} operations sent behind schedule, "
+              "the generator could not keep up".format(**summary))
+    print("committed:  {committed} ({tps:.1f} TPS)".format(**summary))
+    print("rejected:   {} ({})".format(summary['rejected'], ", ".join(
+        "{} {}".format(action, count)
+        for action, count in summary['rejected_by_action'].items())))
+    print("unknown:    {unknown}".format(**summary))
+    print("latency:    p50 {latency_p50_ms:.1f} ms, p90 {latency_p90_ms:.1f} ms, "
+          "p99 {latency_p99_ms:.1f} ms, max {latency_max_ms:.1f} ms".format(**summary))
+
+def do_subscribe(args):
+    from client.shipment_view import DEFAULT_VALIDATOR_URL
+    from client.shipment_view import EventSubscriber
+    from client.shipment_view import ShipmentView
+
+    client = _make_client()
+    view = ShipmentView(args.db)
+    try:
+        EventSubscriber(view, client, args.validator or DEFAULT_VALIDATOR_URL).run()
+    finally:
+        view.close()
 
 
-def main(prog_name=os.path.basename(sys.argv[0]), args=None):
-    '''Entry point function for the client CLI.'''
-    if args is None:
-        args = sys.argv[1:]
-    parser = create_parser(prog_name)
-    args = parser.parse_args(args)
-    verbose_level = 0
-    setup_loggers(verbose_level=verbose_level)
+def _make_daemon(socketPath=None):
+    '''Return a ShipmentDaemon running the forwarded commands.'''
+    global _clients
+    from client.shipment_daemon import ShipmentDaemon
+
+    # Pay for the imports once, before the first command comes in.
+    import client.shipment_client
+    import client.shipment_view
+
+    def run_command(request, out):
+        _run_command(argparse.Namespace(**request), out)
+
+    server = ShipmentDaemon(run_command, socketPath)
+    _clients = {}
+    return server
 
+def do_daemon(args):
+    server = _make_daemon(args.socket)
+    print("Listening on {}".format(server.socketPath))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def _forward(args):
+    '''Run a command in the daemon, returning False when none is running.'''
+    from client.shipment_daemon import forward
+
+    request = vars(args).copy()
+    if request.get('view') is not None:
+        # The daemon may run in another directory.
+        request['view'] = os.path.abspath(request['view'])
+    answer = forward(request)
+    if answer is None:
+        return False
+    sys.stdout.write(answer['output'])
+    if answer['error'] is not None:
+        raise Exception(answer['error'])
+    return True
+
+def _run_command(args, out=None):
     if args.command == 'add':
-        do_add(args)
+        do_add(args, out)
     elif args.command == 'remove':
-        do_remove(args)
+        do_remove(args, out)
     elif args.command == 'getcount':
-        do_getcount(args)
+        do_getcount(args, out)
     elif args.command == 'transfer':
         if args.placeFrom == args.placeTo:
             raise Exception("Cannot transfer item to self: {}"
                                         .format(args.placeFrom))
-        do_transfer(args)
+        do_transfer(args, out)
     elif args.command == 'path':
-        do_getpath(args)
+        do_getpath(args, out)
     else:
         raise Exception("Invalid command: {}".format(args.command))
 
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    '''Entry point function for the client CLI.'''
+    if args is None:
+        args = sys.argv[1:]
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+    verbose_level = 0
+    setup_loggers(verbose_level=verbose_level)
+
+    if args.command in FORWARDED_COMMANDS:
+        if not _forward(args):
+            _run_command(args)
+    elif args.command == 'add-many':
+        do_add_many(args)
+    elif args.command == 'transfer-many':
+        do_transfer_many(args)
+    elif args.command == 'migrate':
+        do_migrate(args)
+    elif args.command == 'export':
+        do_export(args)
+    elif args.command == 'subscribe':
+        do_subscribe(args)
+    elif args.command == 'import':
+        do_import(args)
+    elif args.command == 'loadgen':
+        do_loadgen(args)
+    elif args.command == 'daemon':
+        do_daemon(args)
+    else:
+        raise Exception("Invalid command: {}".format(args.command))
 
 def main_wrapper():
     try:
@@ -18,100 +18,492 @@ This ShipmentClient class interfaces with Sawtooth through the REST API.
 
 import hashlib
 import base64
-import random
+import heapq
+import json
 import requests
-import yaml
-import pickle
 
-from sawtooth_signing import create_context
-from sawtooth_signing import CryptoFactory
-from sawtooth_signing import ParseError
-from sawtooth_signing.secp256k1 import Secp256k1PrivateKey
-
-from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
-from sawtooth_sdk.protobuf.transaction_pb2 import Transaction
-from sawtooth_sdk.protobuf.batch_pb2 import BatchList
-from sawtooth_sdk.protobuf.batch_pb2 import BatchHeader
-from sawtooth_sdk.protobuf.batch_pb2 import Batch
+from client.shipment_dependencies import DependencyTracker
+from client.shipment_keys import get_keyring
+from client.shipment_keys import public_key_hex
+from client.shipment_payload import pair_items
+from client.shipment_state import PATH_CHUNK_HOPS
+from client.shipment_state import decode_record
+from client.shipment_state import hop_range
+from client.shipment_state import make_global_item_total_prefix
+from client.shipment_state import make_item_total_address
+from client.shipment_state import make_item_total_prefix
+from client.shipment_status import Backpressure
+from client.shipment_status import DEFAULT_POLL_INTERVAL
+from client.shipment_status import BatchStatusTracker
+from client.shipment_status import QueueFullError
+from client.shipment_status import parse_batch_ids
+from client.shipment_status import parse_batch_statuses
+from client.shipment_state import make_place_index_address
+from client.shipment_state import make_path_chunk_address
+from client.shipment_state import make_shipment_address
+from client.shipment_state import make_shipment_prefix
+from client.shipment_validation import check_remove
+from client.shipment_validation import check_transfer
 
 # The Transaction Family Name
 FAMILY_NAME = 'shipment'
 
+# Seconds to wait for the REST API before giving up on a request.
+DEFAULT_TIMEOUT = 30
+
+# Connections kept alive to the REST API by the shared session.
+DEFAULT_POOL_SIZE = 16
+
+# Attempts at submitting a BatchList while the validator queue is full.
+DEFAULT_MAX_RETRIES = 20
+
+# Expected shipment records kept for operations in flight.
+MAX_EXPECTED = 10000
+
+_session = None
+
+class StateNotFoundError(Exception):
+    '''Nothing is stored at the requested state address.'''
+
 def _hash(data):
     return hashlib.sha512(data).hexdigest()
 
+def _shared_session():
+    '''Return the process-wide pooled session, creating it on first use.'''
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=DEFAULT_POOL_SIZE,
+            pool_maxsize=DEFAULT_POOL_SIZE)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+def make_url(baseUrl, suffix):
+    if baseUrl.startswith("http://") or baseUrl.startswith("https://"):
+        return "{}/{}".format(baseUrl, suffix)
+    return "http://{}/{}".format(baseUrl, suffix)
+
+def load_signer(keyFile):
+    '''Return the secp256k1 signer of a hex private key file.'''
+    return get_keyring().signer_from_file(keyFile)
+
+def read_public_key(pubKeyFile):
+    return get_keyring().public_key_from_file(pubKeyFile)
+
+def decode_state_page(text):
+    '''Decode one page of a /state listing.
+
+       Returns the shipments on the page and the paging position of the
+       next page, or None on the last page.
+    '''
+    result = json.loads(text)
+    shipments = [decode_record(base64.b64decode(entry["data"]))
+                 for entry in result["data"]]
+    return shipments, result.get("paging", {}).get("next_position")
+
+def read_state_page(text):
+    '''Split one page of a /state listing without decoding the entries.
+
+       Returns the (address, bytes) pairs on the page, the paging position
+       of the next page, or None on the last page, and the head block id
+       the page was read at.
+    '''
+    result = json.loads(text)
+    entries = [(entry["address"], base64.b64decode(entry["data"]))
+               for entry in result["data"]]
+    return (entries, result.get("paging", {}).get("next_position"),
+            result.get("head"))
+
+def _added(expected, shipmentID, items):
+    '''Return the expectation once items are added to a shipment.'''
+    if expected is None:
+        return None
+    shipment, delta = expected
+    if delta is None:
+        shipment = {'id': shipmentID, 'items': {}} if shipment is None \
+            else dict(shipment, items=dict(shipment['items']))
+        counts = shipment['items']
+    else:
+        delta = counts = dict(delta)
+    for item, count in items:
+        counts[item] = counts.get(item, 0) + count
+    return shipment, delta
+
+def _removed(expected, items):
+    '''Return the expectation once items leave a shipment.'''
+    if expected is None:
+        return None
+    shipment, delta = expected
+    if delta is None:
+        if shipment is None:
+            # Rejected by the processor.
+            return None
+        shipment = dict(shipment, items=dict(shipment['items']))
+        counts = shipment['items']
+    else:
+        delta = counts = dict(delta)
+    for item, count in items:
+        counts[item] = counts.get(item, 0) - count
+    return shipment, delta
+
+def state_page_suffix(prefix, position=None, head=None, limit=None):
+    suffix = "state?address={}".format(prefix)
+    if head is not None:
+        suffix += "&head={}".format(head)
+    if position is not None:
+        suffix += "&start={}".format(position)
+    if limit is not None:
+        suffix += "&limit={}".format(limit)
+    return suffix
+
 class ShipmentClient(object):
     '''Client Shipment class.
 
     This supports deposit, withdraw, transfer, and balance functions.
     '''
 
-    def __init__(self, baseUrl, keyFile=None):
+    def __init__(self, baseUrl, keyFile=None, session=None,
+                 timeout=DEFAULT_TIMEOUT, cache=None, publicKey=None,
+                 dependencies=None, pollInterval=DEFAULT_POLL_INTERVAL):
         '''Initialize the client class.
 
            This is mainly getting the key pair and computing the address.
+           A client given only the publicKey of a place reads its state
+           but cannot submit.  Requests go through session, or through a
+           pooled session shared by every client of the process so
+           connections are kept alive.  State reads go through cache, a
+           StateCache, when one is given.  Operations depend on the
+           operations in flight on the same shipments, as tracked by
+           dependencies or by a DependencyTracker of this client, so they
+           may be submitted without waiting for the previous ones to
+           commit.  The status of every batch posted is polled every
+           pollInterval seconds, and its operations released from the
+           tracker once it is final.
         '''
 
         self._baseUrl = baseUrl
+        self._cache = cache
+        self._session = session if session is not None else _shared_session()
+        self._dependencies = dependencies if dependencies is not None else \
+            DependencyTracker()
+        self._timeout = timeout
+        self._pollInterval = pollInterval
+        self._backpressure = Backpressure()
+        self._maxRetries = DEFAULT_MAX_RETRIES
+        self._tracker = None
+        # Shipment address -> (transaction id, shipment, delta), see
+        # _expectation().
+        self._expected = {}
 
         if keyFile is None:
             self._signer = None
+            self._publicKey = publicKey
+        else:
+            self._signer = load_signer(keyFile)
+            self._publicKey = public_key_hex(self._signer)
+        if self._publicKey is None:
             return
 
-        try:
-            with open(keyFile) as fd:
-                privateKeyStr = fd.read().strip()
-        except OSError as err:
-            raise Exception('Failed to read private key {}: {}'.format(
-                keyFile, str(err)))
+        self._indexAddress = make_place_index_address(self._publicKey)
+        self._shipmentPrefix = make_shipment_prefix(self._publicKey)
 
-        try:
-            privateKey = Secp256k1PrivateKey.from_hex(privateKeyStr)
-        except ParseError as err:
-            raise Exception('Failed to load private key: {}'.format(str(err)))
-
-        self._signer = CryptoFactory(create_context('secp256k1')) \
-            .new_signer(privateKey)
+    @property
+    def backpressure(self):
+        '''The Backpressure pacing the submissions of this client.'''
+        return self._backpressure
 
-        self._publicKey = self._signer.get_public_key().as_hex()
-
-        self._address = _hash(FAMILY_NAME.encode('utf-8'))[0:6] + \
-            _hash(self._publicKey.encode('utf-8'))[0:64]
+    @property
+    def dependencies(self):
+        '''The DependencyTracker ordering the operations of this client.'''
+        return self._dependencies
 
     def add_item(self,shipmentID,N,items,placeName):
-        return self._wrap_and_send("add",shipmentID,N,items,placeName)
+        items = pair_items(N, items)
+        expected = self._expectation(shipmentID)
+        retValue = self._wrap_and_send("add", shipmentID, items, placeName)
+        self._expect(shipmentID, _added(expected, shipmentID, items))
+        return retValue
 
-    def remove_item(self,shipmentID,N,items):
+    def remove_item(self,shipmentID,N,items,validate=True):
+        '''Remove items from a shipment of this place.
+
+           Unless validate is False, the shipment is read first and
+           ValidationError raised, with nothing submitted, when the
+           processor would reject the removal.  While operations of this
+           client on the shipment are in flight, the shipment is checked
+           as they are expected to leave it, since state does not show
+           them yet; see _expectation().
+        '''
+        items = pair_items(N, items)
+        expected = self._expectation(shipmentID)
+        if validate and expected is not None:
+            check_remove(self._expected_shipment(shipmentID, expected),
+                         shipmentID, items)
         try:
-            retValue = self._wrap_and_send("remove",shipmentID,N,items)
+            retValue = self._wrap_and_send("remove", shipmentID, items)
         except Exception:
             raise Exception('Encountered an error during removal')
+        self._expect(shipmentID, _removed(expected, items))
         return retValue
 
-    def transfer(self, shipmentID, placeTo, placeToKey):
+    def transfer(self, shipmentID, placeTo, placeToKey, validate=True):
+        '''Move a shipment of this place to placeTo.
+
+           Validated like remove_item(), which also reads whether placeTo
+           already holds a shipment of the same ID.
+        '''
+        publicKeyStr = read_public_key(placeToKey)
+        expected = self._expectation(shipmentID)
+        if validate and expected is not None:
+            check_transfer(self._expected_shipment(shipmentID, expected),
+                           shipmentID, self._publicKey, publicKeyStr,
+                           self._shipment_at(publicKeyStr, shipmentID))
         try:
-            with open(placeToKey) as fd:
-                publicKeyStr = fd.read().strip()
             retValue = self._wrap_and_send("transfer",shipmentID,placeTo, publicKeyStr)
-        except OSError as err:
-            raise Exception('Failed to read public key {}: {}'.format(
-                placeToKey, str(err)))
         except Exception as err:
             raise Exception('Encountered an error during transfer', err)
+        # Gone from this place once the transfer applies.
+        self._expect(shipmentID, (None, None))
+        return retValue
+
+    def migrate(self):
+        '''Move the place from the single blob layout to per-shipment state.'''
+        return self._wrap_and_send("migrate")
+
+    def add_many(self, shipments, placeName):
+        '''Add items to many shipments of this place in one transaction.
+
+           shipments is a list of (shipmentID, items) pairs, items being
+           (name, count) pairs.  All the additions commit or none does.
+        '''
+        expected = [self._expectation(shipmentID)
+                    for shipmentID, _ in shipments]
+        retValue = self._wrap_and_send("add_many", shipments, placeName)
+        for (shipmentID, items), before in zip(shipments, expected):
+            self._expect(shipmentID, _added(before, shipmentID, items))
+        return retValue
+
+    def transfer_many(self, transfers, validate=True):
+        '''Move many shipments of this place in one transaction.
+
+           transfers is a list of (shipmentID, placeTo, placeToKey) tuples,
+           placeToKey being the public key file of placeTo as in
+           transfer().  Every shipment moves or none does; validated like
+           remove_item(), shipment by shipment.
+        '''
+        publicKeys = {}
+        for _, _, placeToKey in transfers:
+            if placeToKey not in publicKeys:
+                publicKeys[placeToKey] = read_public_key(placeToKey)
+        if validate:
+            for shipmentID, _, placeToKey in transfers:
+                expected = self._expectation(shipmentID)
+                if expected is not None:
+                    placeToPublicKey = publicKeys[placeToKey]
+                    check_transfer(
+                        self._expected_shipment(shipmentID, expected),
+                        shipmentID, self._publicKey, placeToPublicKey,
+                        self._shipment_at(placeToPublicKey, shipmentID))
+        retValue = self._wrap_and_send("transfer_many", [
+            (shipmentID, placeTo, publicKeys[placeToKey])
+            for shipmentID, placeTo, placeToKey in transfers])
+        for shipmentID, _, _ in transfers:
+            self._expect(shipmentID, (None, None))
         return retValue
 
     def get_data(self):
-        headers={}
-        suffix = "state/{}".format(self._address)
-        if self._baseUrl.startswith("http://"):
-            url = "{}/{}".format(self._baseUrl, suffix)
+        '''Return every shipment held by the place, keyed by shipment ID.'''
+        return {shipment['id']: shipment
+                for shipment in self.list_state(self._shipmentPrefix)}
+
+    def _expectation(self, shipmentID):
+        '''Return how the operations of this client in flight leave a
+           shipment, or None when that is not known.
+
+           The expectation is a (shipment, delta) pair.  With no delta,
+           shipment is the record the last operation leaves, None when
+           the place no longer holds it.  Otherwise the shipment is as
+           state holds it with the item counts of delta added, for adds
+           made without knowing the record: should state already show
+           them, the counts are too high, which never rejects a valid
+           operation.  Nothing in flight is (None, {}).  An expectation
+           holds while the operation that left it is the last one on the
+           shipment in the DependencyTracker, that is until it is
+           decided.
+        '''
+        address = make_shipment_address(self._publicKey, shipmentID)
+        writers = self._dependencies.dependencies([address])
+        expected = self._expected.get(address)
+        if expected is not None and writers == [expected[0]]:
+            return expected[1:]
+        self._expected.pop(address, None)
+        # An operation in flight whose outcome is not known, such as a
+        # migrate, leaves the check to the processor.
+        return None if writers else (None, {})
+
+    def _expected_shipment(self, shipmentID, expected):
+        '''Return the shipment as an expectation leaves it.'''
+        shipment, delta = expected
+        if delta is None:
+            return shipment
+        shipment = self.get_shipment(shipmentID)
+        if not delta:
+            return shipment
+        if shipment is None:
+            shipment = {'id': shipmentID, 'items': {}}
+        items = dict(shipment['items'])
+        for item, count in delta.items():
+            items[item] = items.get(item, 0) + count
+        return dict(shipment, items=items)
+
+    def _expect(self, shipmentID, expected):
+        '''Note the expectation left by the operation just sent.'''
+        address = make_shipment_address(self._publicKey, shipmentID)
+        writers = self._dependencies.dependencies([address])
+        self._expected.pop(address, None)
+        if expected is None or len(writers) != 1:
+            # Unknown, or the operation is decided already.
+            return
+        self._expected[address] = (writers[0],) + tuple(expected)
+        if len(self._expected) > MAX_EXPECTED:
+            oldest = next(iter(self._expected))
+            del self._expected[oldest]
+
+    def get_shipment(self, shipmentID):
+        '''Return one shipment of the place, or None if it does not hold it.'''
+        return self._shipment_at(self._publicKey, shipmentID)
+
+    def _shipment_at(self, publicKey, shipmentID):
+        '''Return one shipment of the place of publicKey, or None.'''
+        shipment = self.get_record(
+            make_shipment_address(publicKey, shipmentID))
+        if shipment is None or shipment['id'] != shipmentID:
+            return None
+        return shipment
+
+    def get_path(self, shipmentID, start=0, count=None):
+        '''Return part of the path of a shipment held by the place.
+
+           Returns the (place, time) hops from hop start on, at most count
+           of them, and the number of hops of the whole path, or None if
+           the place does not hold the shipment.  A negative start counts
+           from the end, so start=-N gives the last N hops.  Only the
+           chunks of the path holding those hops are read.  The time of
+           a hop is 0 when the client that made it did not give one.
+        '''
+        shipment = self.get_shipment(shipmentID)
+        if shipment is None:
+            return None
+        if 'path' in shipment:
+            names = shipment['path'].split('->')
+            begin, end = hop_range(start, count, len(names))
+            return [(name, 0) for name in names[begin:end]], len(names)
+        total = shipment['hops']
+        begin, end = hop_range(start, count, total)
+        hops = []
+        for chunk in range(begin // PATH_CHUNK_HOPS,
+                           (end + PATH_CHUNK_HOPS - 1) // PATH_CHUNK_HOPS):
+            record = self.get_record(make_path_chunk_address(
+                shipmentID, shipment['history'], chunk))
+            if record is None:
+                raise Exception('Chunk {} of the path of shipment {} is '
+                                'missing'.format(chunk, shipmentID))
+            first = chunk * PATH_CHUNK_HOPS
+            hops.extend(record['hops'][max(begin - first, 0):end - first])
+        return hops, total
+
+    def get_item_count(self, itemName, allPlaces=False):
+        '''Return the total of an item at this place, or at all places.'''
+        record = self.get_record(make_item_total_address(
+            None if allPlaces else self._publicKey, itemName))
+        if record is None:
+            return 0
+        return record['total']
+
+    def get_top_items(self, count, allPlaces=False):
+        '''Return the count largest (item, total) pairs, largest first.'''
+        if allPlaces:
+            prefix = make_global_item_total_prefix()
         else:
-            url = "http://{}/{}".format(self._baseUrl, suffix)
-        result = requests.get(url, headers=headers)
-        x = base64.b64decode(yaml.safe_load(result.text)["data"])
-        y = pickle.loads(x)
-        # print(y)
-        return y
+            prefix = make_item_total_prefix(self._publicKey)
+        return heapq.nlargest(
+            count,
+            ((record['item'], record['total'])
+             for record in self.list_state(prefix)),
+            key=lambda entry: entry[1])
+
+    def get_state(self, address, head=None):
+        '''Return the bytes stored at address, or None if it is empty.
+
+           The state is read at the given head block id, or at the current
+           chain head.
+        '''
+        suffix = "state/{}".format(address)
+        if head is not None:
+            suffix += "?head={}".format(head)
+        try:
+            text = self._send_to_restapi(suffix)
+        except StateNotFoundError:
+            return None
+        return base64.b64decode(json.loads(text)["data"])
+
+    def get_record(self, address):
+        '''Return the decoded record at address, or None if it is empty.'''
+        if self._cache is None:
+            data = self.get_state(address)
+            return None if data is None else decode_record(data)
+        head = self._cache.head(self.get_head)
+        found, record = self._cache.get(address, head)
+        if not found:
+            data = self.get_state(address, head)
+            record = None if data is None else decode_record(data)
+            self._cache.put(address, head, record)
+        return record
+
+    def list_state(self, prefix):
+        '''Yield the decoded records under an address prefix, page by page.'''
+        if self._cache is None:
+            yield from self._list_state(prefix)
+            return
+        head = self._cache.head(self.get_head)
+        key = ('list', prefix)
+        found, records = self._cache.get(key, head)
+        if not found:
+            records = list(self._list_state(prefix, head))
+            self._cache.put(key, head, records, max(1, len(records)))
+        yield from records
+
+    def _list_state(self, prefix, head=None):
+        suffix = state_page_suffix(prefix, head=head)
+        while suffix is not None:
+            records, position = decode_state_page(
+                self._send_to_restapi(suffix))
+            yield from records
+            suffix = None if position is None else \
+                state_page_suffix(prefix, position, head)
+
+    def get_state_page(self, prefix, position=None, head=None, limit=None):
+        '''Return one raw page of the entries under prefix.
+
+           See read_state_page() for the result; position is the paging
+           position returned with the previous page.
+        '''
+        return read_state_page(self._send_to_restapi(
+            state_page_suffix(prefix, position, head, limit)))
+
+    def get_head(self):
+        '''Return the id of the current chain head.'''
+        result = json.loads(self._send_to_restapi("blocks?limit=1"))
+        if result.get("head"):
+            return result["head"]
+        return result["data"][0]["header_signature"]
+
+    def get_head_block(self):
+        '''Return the id and number of the current chain head.'''
+        block = json.loads(self._send_to_restapi("blocks?limit=1"))["data"][0]
+        return block["header_signature"], int(block["header"]["block_num"])
 
     def _send_to_restapi(self,
                          suffix,
@@ -119,10 +511,7 @@ class ShipmentClient(object):
                          contentType=None):
         '''Send a REST command to the Validator via the REST API.'''
 
-        if self._baseUrl.startswith("http://"):
-            url = "{}/{}".format(self._baseUrl, suffix)
-        else:
-            url = "http://{}/{}".format(self._baseUrl, suffix)
+        url = make_url(self._baseUrl, suffix)
 
         headers = {}
 
@@ -131,15 +520,25 @@ class ShipmentClient(object):
 
         try:
             if data is not None:
-                # print(type(data))
-                result = requests.post(url, headers=headers, data=data)
+                result = self._session.post(url, headers=headers, data=data,
+                                            timeout=self._timeout)
             else:
-                result = requests.get(url, headers=headers)
+                result = self._session.get(url, headers=headers,
+                                           timeout=self._timeout)
+
+            if result.status_code == 429:
+                raise QueueFullError("Error 429: {}".format(result.reason))
+
+            if result.status_code == 404 and suffix.startswith("state/"):
+                raise StateNotFoundError("Error 404: {}".format(result.reason))
 
             if not result.ok:
                 raise Exception("Error {}: {}".format(
                     result.status_code, result.reason))
 
+        except (QueueFullError, StateNotFoundError):
+            raise
+
         except requests.ConnectionError as err:
             raise Exception(
                 'Failed to connect to {}: {}'.format(url, str(err)))
@@ -149,72 +548,99 @@ class ShipmentClient(object):
 
         return result.text
 
+    def batch(self, maxBatchesPerList=None):
+        '''Return a batch builder that uses this client's key as batcher.
+
+           Operations queued on the builder go out together through
+           send_batches(), e.g.
+
+               builder = client.batch()
+               builder.add_item("s1", [("apple", 3)], "Delhi")
+               builder.remove_item("s2", [("pear", 1)], signer=other)
+               client.send_batches(builder)
+        '''
+        # The protobuf modules are only loaded by clients that submit.
+        from client.shipment_batch import DEFAULT_MAX_BATCHES_PER_LIST
+        from client.shipment_batch import ShipmentBatchBuilder
+        if maxBatchesPerList is None:
+            maxBatchesPerList = DEFAULT_MAX_BATCHES_PER_LIST
+        return ShipmentBatchBuilder(self._signer, maxBatchesPerList,
+                                    self._dependencies)
+
+    def send_batches(self, builder):
+        '''POST every BatchList of the builder, returning the responses.
+
+           When the validator queue is full the BatchList is retried after
+           an adaptive delay shared by every submission of this client.
+        '''
+        batchLists = builder.build()
+        responses = []
+        for position, batchList in enumerate(batchLists):
+            try:
+                responses.append(
+                    self.post_batch_list(batchList.SerializeToString()))
+            except Exception:
+                # Later operations must not wait on what was not posted.
+                self._dependencies.forget(
+                    txn.header_signature
+                    for unsent in batchLists[position:]
+                    for batch in unsent.batches
+                    for txn in batch.transactions)
+                raise
+        return responses
+
+    def get_batch_statuses(self, batchIds):
+        '''Return the BatchStatus of each batch, in one request.'''
+        return parse_batch_statuses(self._send_to_restapi(
+            "batch_statuses", json.dumps(batchIds), 'application/json'))
+
+    def tracker(self):
+        '''Return the BatchStatusTracker polling on behalf of this client.'''
+        if self._tracker is None:
+            self._tracker = BatchStatusTracker(
+                self, pollInterval=self._pollInterval,
+                dependencies=self._dependencies)
+        return self._tracker
+
+    def wait_for_batches(self, responses, timeout=None):
+        '''Wait until the batches of the given responses are final.
+
+           Returns a BatchStatus per batch, or None for batches that were
+           still undecided after timeout seconds.
+        '''
+        tracker = self.tracker()
+        statuses = tracker.wait(tracker.track_responses(responses), timeout)
+        if self._cache is not None:
+            # The batches are in a new block: read at the new head.
+            self._cache.invalidate()
+        return statuses
+
+    def post_batch_list(self, data):
+        '''POST one serialized BatchList and return the response.
+
+           When the validator queue is full the BatchList is retried after
+           an adaptive delay shared by every submission of this client.
+           The batches posted are tracked from then on.
+        '''
+        for _ in range(self._maxRetries):
+            self._backpressure.wait()
+            try:
+                response = self._send_to_restapi(
+                    "batches", data, 'application/octet-stream')
+            except QueueFullError:
+                self._backpressure.on_queue_full()
+                continue
+            self._backpressure.on_accepted()
+            self.tracker().track(parse_batch_ids(response))
+            return response
+        raise QueueFullError('Validator queue still full after {} attempts'
+                             .format(self._maxRetries))
+
     def _wrap_and_send(self,action,*values):
-        '''Create a transaction, then wrap it in a batch.     
-                                                              
+        '''Create a transaction, then wrap it in a batch.
+
            Even single transactions must be wrapped into a batch.
-        ''' 
-
-        # Generate a csv utf-8 encoded string as payload
-        rawPayload = action
-        # print(rawPayload)
-        for val in values:
-            # print(val)
-            rawPayload = ",".join([rawPayload, str(val)])
-
-        # print(rawPayload,type(rawPayload))
-        k = rawPayload.split(",")
-        # print(k,len(k))
-        payload = rawPayload.encode()
-
-        # Construct the address where we'll store our state
-        address = self._address
-        inputAddressList = [address]
-        outputAddressList = [address]
-
-        if "transfer" == action:
-            toAddress = _hash(FAMILY_NAME.encode('utf-8'))[0:6] + \
-            _hash(values[2].encode('utf-8'))[0:64]
-            inputAddressList.append(toAddress)
-            outputAddressList.append(toAddress)
-
-        # Create a TransactionHeader
-        header = TransactionHeader(
-            signer_public_key=self._publicKey,
-            family_name=FAMILY_NAME,
-            family_version="1.0",
-            inputs=inputAddressList,
-            outputs=outputAddressList,
-            dependencies=[],
-            payload_sha512=_hash(payload),
-            batcher_public_key=self._publicKey,
-            nonce=random.random().hex().encode()
-        ).SerializeToString()
-
-        # Create a Transaction from the header and payload above
-        transaction = Transaction(header=header,payload=payload,
-                                  header_signature=self._signer.sign(header)
-        )
-
-        transactionList = [transaction]
-
-        # Create a BatchHeader from transactionList above
-        header = BatchHeader(
-            signer_public_key=self._publicKey,
-            transaction_ids=[txn.header_signature for txn in transactionList]
-        ).SerializeToString()
-
-        #Create Batch using the BatchHeader and transactionList above
-        batch = Batch(
-            header=header,
-            transactions=transactionList,
-            header_signature=self._signer.sign(header))
-
-        #Create a Batch List from Batch above
-        batch_list = BatchList(batches=[batch])
-
-        # Send batch_list to rest-api
-        return self._send_to_restapi(
-            "batches",
-            batch_list.SerializeToString(),
-            'application/octet-stream')
\ No newline at end of file
+        '''
+        builder = self.batch()
+        builder.append(None, action, *values)
+        return self.send_batches(builder)[0]
@@ -0,0 +1,154 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Long running process serving CLI commands over a Unix domain socket.
+
+Each CLI call otherwise starts from nothing: it imports the client,
+creates the crypto context, loads keys and opens a new connection to
+the REST API.  "shipment daemon" does that once and keeps it, as the
+keyring and the pooled session are shared by the whole process, and
+the regular commands forward to it whenever it is running:
+
+    shipment daemon &
+    shipment add S1 Delhi 1 apple 3      # answered by the daemon
+
+The protocol is one JSON object per line each way, so scripts may also
+talk to the socket directly.  A request holds the parsed arguments of a
+command, e.g. {"command": "path", "shipmentID": "S1", "placeName":
+"Delhi", "view": null}, and the answer is {"output": TEXT, "error":
+MESSAGE or null}.  Keys are read from the keyring of the user running
+the daemon, and the socket is only accessible to that user.
+
+The daemon keeps one ShipmentClient per place, so an operation depends
+on the operations of earlier commands on the same shipment still in
+flight, and each batch is released from the dependency tracker of its
+client once the validator commits or rejects it.
+'''
+
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+
+LOGGER = logging.getLogger(__name__)
+
+SOCKET_ENV = 'SHIPMENT_DAEMON_SOCKET'
+
+# Seconds a forwarded command may take, --wait included.
+DEFAULT_FORWARD_TIMEOUT = 600
+
+
+def default_socket_path():
+    '''Socket of the daemon: $SHIPMENT_DAEMON_SOCKET or
+       ~/.sawtooth/shipment.sock.'''
+    return os.environ.get(SOCKET_ENV) or os.path.join(
+        os.path.expanduser("~"), ".sawtooth", "shipment.sock")
+
+
+def forward(request, socketPath=None, timeout=DEFAULT_FORWARD_TIMEOUT):
+    '''Have the daemon run a command.
+
+       Returns the answer of the daemon as a dict, or None when no daemon
+       is listening on the socket.
+    '''
+    socketPath = socketPath or default_socket_path()
+    if not os.path.exists(socketPath):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socketPath)
+        except OSError:
+            # A socket file left behind by a daemon that is gone.
+            return None
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as reader:
+            line = reader.readline()
+    finally:
+        sock.close()
+    if not line:
+        raise Exception('The shipment daemon at {} closed the connection'
+                        .format(socketPath))
+    return json.loads(line.decode('utf-8'))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError as err:
+                answer = {'output': '', 'error': 'Invalid request: {}'
+                          .format(err)}
+            else:
+                answer = self.server.execute(request)
+            self.wfile.write(json.dumps(answer).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class ShipmentDaemon(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    '''Serve commands on a Unix socket, each request in its own thread.
+
+    runCommand(request, out) runs one command, writing what it prints to
+    out and raising an exception when it fails.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, runCommand, socketPath=None):
+        self._runCommand = runCommand
+        self.socketPath = socketPath or default_socket_path()
+        if forward_ping(self.socketPath):
+            raise Exception('A shipment daemon is already listening on {}'
+                            .format(self.socketPath))
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
+        os.makedirs(os.path.dirname(self.socketPath) or '.', exist_ok=True)
+        # The socket must never be accessible to other users, who could
+        # sign with our keys through it.
+        umask = os.umask(0o177)
+        try:
+            super().__init__(self.socketPath, _Handler)
+        finally:
+            os.umask(umask)
+
+    def execute(self, request):
+        out = io.StringIO()
+        try:
+            if request.get('command') == 'ping':
+                return {'output': '', 'error': None}
+            self._runCommand(request, out)
+        except Exception as err:
+            LOGGER.debug('Command %s failed: %s', request.get('command'), err)
+            return {'output': out.getvalue(), 'error': str(err)}
+        return {'output': out.getvalue(), 'error': None}
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.socketPath)
+        except FileNotFoundError:
+            pass
+
+
+def forward_ping(socketPath=None):
+    '''Return True when a daemon answers on the socket.'''
+    try:
+        return forward({'command': 'ping'}, socketPath, timeout=5) is not None
+    except Exception:
+        return False
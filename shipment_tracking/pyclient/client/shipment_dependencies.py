@@ -0,0 +1,155 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Transaction dependencies between operations in flight.
+
+The validator gives no ordering between batches posted separately, so a
+remove sent right after the add it relies on could run first.  Rather
+than waiting for each commit, a transaction names the transactions it
+must follow in its header dependencies, and the validator holds it back
+until they are in the chain.  DependencyTracker remembers, per ordering
+key, the last transaction submitted by a client, so every operation of
+the client follows its operations on the same keys submitted before
+it:
+
+    tracker = DependencyTracker()
+    builder = ShipmentBatchBuilder(signer, dependencies=tracker)
+    builder.add_item("S1", [("apple", 3)], "Delhi")
+    builder.remove_item("S1", [("apple", 1)])   # depends on the add
+
+Ordering keys are the addresses whose order matters to the outcome, see
+ordering_keys() in shipment_batch.py: a full address, or the prefix of
+every address of a kind at a place.  Operations with no key in common
+get no dependency on each other and can be scheduled in parallel.
+
+A transaction depending on an invalid one is never committed: a
+validator leaves its batch PENDING, and LocalRestApi in
+shipment_loadgen.py marks it INVALID right away.  Either way nothing
+should be chained after a batch that is final, so the status of
+batches is fed back with release() by the BatchStatusTracker of the
+client, after which no new transaction depends on them.  Batches still
+undecided at its timeout are released too.  Keys of transactions never
+released are forgotten, oldest first, past maxEntries.
+'''
+
+import collections
+import threading
+
+DEFAULT_MAX_ENTRIES = 100000
+
+# Length of the address prefix naming a kind of entry at one place.
+_PREFIX_LENGTH = 38
+
+
+class DependencyTracker(object):
+    '''Last in-flight transaction per ordering key. Thread safe.'''
+
+    def __init__(self, maxEntries=DEFAULT_MAX_ENTRIES):
+        self._maxEntries = maxEntries
+        self._lock = threading.Lock()
+        # Ordering key -> id of the last transaction on it.
+        self._writers = {}
+        # Prefix -> the keys recorded under it, including itself.
+        self._groups = collections.defaultdict(set)
+        # Transaction id -> its ordering keys, oldest transaction first.
+        self._transactions = collections.OrderedDict()
+        self._batches = collections.OrderedDict()
+
+    def __len__(self):
+        '''Number of transactions tracked.'''
+        with self._lock:
+            return len(self._transactions)
+
+    def dependencies(self, keys):
+        '''Return the ids of the tracked transactions sharing a key.'''
+        found = set()
+        with self._lock:
+            for key in keys:
+                if len(key) == _PREFIX_LENGTH:
+                    # Every key recorded under the prefix.
+                    candidates = self._groups.get(key, ())
+                else:
+                    candidates = (key, key[:_PREFIX_LENGTH])
+                for candidate in candidates:
+                    writer = self._writers.get(candidate)
+                    if writer is not None:
+                        found.add(writer)
+        return sorted(found)
+
+    def record(self, transactionId, keys):
+        '''Make transactionId the last transaction on each key.'''
+        with self._lock:
+            for key in keys:
+                if len(key) == _PREFIX_LENGTH:
+                    # The new transaction follows everything under the
+                    # prefix, so it alone needs to be followed from now.
+                    for covered in list(self._groups.get(key, ())):
+                        self._forget_key(covered)
+                else:
+                    self._forget_key(key)
+                self._writers[key] = transactionId
+                self._groups[key[:_PREFIX_LENGTH]].add(key)
+            self._transactions[transactionId] = list(keys)
+            while len(self._transactions) > self._maxEntries:
+                oldest = next(iter(self._transactions))
+                self._forget_transaction(oldest)
+
+    def add_batch(self, batchId, transactionIds):
+        '''Note the batch holding the transactions, for release().'''
+        with self._lock:
+            self._batches[batchId] = list(transactionIds)
+            while len(self._batches) > self._maxEntries:
+                self._batches.popitem(last=False)
+
+    def release(self, batchIds):
+        '''Stop depending on the transactions of batches that are final.'''
+        with self._lock:
+            for batchId in batchIds:
+                for transactionId in self._batches.pop(batchId, ()):
+                    self._forget_transaction(transactionId)
+
+    def rename(self, oldId, newId):
+        '''Give a recorded transaction another id, e.g. its signature once
+           it is signed.'''
+        with self._lock:
+            keys = self._transactions.pop(oldId, None)
+            if keys is None:
+                return
+            self._transactions[newId] = keys
+            for key in keys:
+                if self._writers.get(key) == oldId:
+                    self._writers[key] = newId
+
+    def forget(self, transactionIds):
+        '''Stop depending on transactions that never reached the
+           validator.'''
+        with self._lock:
+            for transactionId in transactionIds:
+                self._forget_transaction(transactionId)
+
+    def _forget_transaction(self, transactionId):
+        for key in self._transactions.pop(transactionId, ()):
+            if self._writers.get(key) == transactionId:
+                self._forget_key(key)
+
+    def _forget_key(self, key):
+        transactionId = self._writers.pop(key, None)
+        if transactionId is None:
+            return
+        prefix = key[:_PREFIX_LENGTH]
+        group = self._groups.get(prefix)
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self._groups[prefix]
+
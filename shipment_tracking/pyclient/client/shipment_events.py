@@ -0,0 +1,95 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Read side of the events emitted by the shipment transaction processor.
+
+The events are described in processor/shipment_events.py; the two
+modules must stay in sync.
+'''
+
+import struct
+
+EVENT_ADD = 'shipment/add'
+EVENT_REMOVE = 'shipment/remove'
+EVENT_TRANSFER = 'shipment/transfer'
+EVENT_ADD_MANY = 'shipment/add_many'
+EVENT_TRANSFER_MANY = 'shipment/transfer_many'
+
+EVENT_TYPES = (EVENT_ADD, EVENT_REMOVE, EVENT_TRANSFER, EVENT_ADD_MANY,
+               EVENT_TRANSFER_MANY)
+
+# Emitted by the validator for every block it commits.
+BLOCK_COMMIT = 'sawtooth/block-commit'
+
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+
+
+def _decode_string(data, offset):
+    (length,) = _U16.unpack_from(data, offset)
+    offset += _U16.size
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+def _decode_items(data, offset):
+    (count,) = _U32.unpack_from(data, offset)
+    offset += _U32.size
+    items = {}
+    for _ in range(count):
+        name, offset = _decode_string(data, offset)
+        (items[name],) = _U64.unpack_from(data, offset)
+        offset += _U64.size
+    return items, offset
+
+
+def decode_items(data):
+    '''Decode event data into a dict of item name to count.'''
+    return _decode_items(data, 0)[0]
+
+
+def decode_add_many(data):
+    '''Decode add_many event data into (shipmentId, items) pairs.'''
+    (count,) = _U32.unpack_from(data, 0)
+    offset = _U32.size
+    added = []
+    for _ in range(count):
+        shipmentId, offset = _decode_string(data, offset)
+        items, offset = _decode_items(data, offset)
+        added.append((shipmentId, items))
+    return added
+
+
+def decode_transfer_many(data):
+    '''Decode transfer_many event data into a list of dicts with the
+       shipment_id, to_key, place_to and hops of each shipment and its
+       items.
+    '''
+    (count,) = _U32.unpack_from(data, 0)
+    offset = _U32.size
+    moved = []
+    for _ in range(count):
+        shipmentId, offset = _decode_string(data, offset)
+        toKey, offset = _decode_string(data, offset)
+        placeTo, offset = _decode_string(data, offset)
+        (hops,) = _U32.unpack_from(data, offset)
+        items, offset = _decode_items(data, offset + _U32.size)
+        moved.append({'shipment_id': shipmentId, 'to_key': toKey,
+                      'place_to': placeTo, 'hops': str(hops),
+                      'items': items})
+    return moved
+
+
+def event_attributes(event):
+    '''Return the attributes of an Event protobuf as a dict.'''
+    return {attribute.key: attribute.value for attribute in event.attributes}
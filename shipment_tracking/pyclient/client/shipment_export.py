@@ -0,0 +1,270 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Bulk export of the shipment namespace.
+
+Pages through /state by address prefix, all at one head block so the
+snapshot is consistent, and writes every entry to a file as it arrives:
+
+    ndjson    one JSON object per entry: address, kind and record
+    columnar  one JSON object per page and kind, holding a list per
+              field (a row group), so columns load without parsing rows
+
+Memory stays constant: pages are written as soon as they are read and
+at most a few pages are in flight.  Progress is saved to FILE.checkpoint
+after every page, so an interrupted export resumes where it stopped.
+With concurrency above one the namespace is split into sub-prefixes
+that are paged through in parallel.
+'''
+
+import concurrent.futures
+import json
+import os
+import queue
+import threading
+
+from client.shipment_state import KIND_GLOBAL_ITEM_TOTAL
+from client.shipment_state import KIND_ITEM_TOTAL
+from client.shipment_state import KIND_PATH
+from client.shipment_state import KIND_PLACE_INDEX
+from client.shipment_state import KIND_SHIPMENT
+from client.shipment_state import NAMESPACE
+from client.shipment_state import decode_record
+
+FORMATS = ('ndjson', 'columnar')
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_CONCURRENCY = 4
+
+CHECKPOINT_VERSION = 1
+
+_KINDS = {
+    KIND_PLACE_INDEX: 'place_index',
+    KIND_SHIPMENT: 'shipment',
+    KIND_ITEM_TOTAL: 'item_total',
+    KIND_GLOBAL_ITEM_TOTAL: 'global_item_total',
+    KIND_PATH: 'path',
+}
+
+_HEX = '0123456789abcdef'
+
+
+def record_kind(address, data):
+    '''Name the kind of entry stored at address.'''
+    if data[:1] == b'\x80':
+        # Layout 1 place blobs are pickled; their addresses are plain
+        # hashes and may look like any kind.
+        return 'legacy_place'
+    return _KINDS.get(address[len(NAMESPACE):len(NAMESPACE) + 2], 'unknown')
+
+
+def iter_records(entries):
+    '''Lazily decode (address, bytes) pairs into (address, kind, record).'''
+    for address, data in entries:
+        yield address, record_kind(address, data), decode_record(data)
+
+
+def iter_namespace(client, head=None, pageSize=DEFAULT_PAGE_SIZE):
+    '''Yield (address, kind, record) for every entry of the namespace.'''
+    position = None
+    while True:
+        entries, position, head = client.get_state_page(
+            NAMESPACE, position, head, pageSize)
+        yield from iter_records(entries)
+        if position is None:
+            return
+
+
+def namespace_shards():
+    '''Split the namespace into sub-prefixes of similar size.
+
+    The shipment layout puts nearly every entry under the five kind
+    prefixes, which are split once more by the first digit of the place
+    part; the other two digit prefixes only hold layout 1 blobs.
+    '''
+    shards = []
+    for first in _HEX:
+        for second in _HEX:
+            if first + second in _KINDS:
+                shards.extend(NAMESPACE + first + second + third
+                              for third in _HEX)
+            else:
+                shards.append(NAMESPACE + first + second)
+    return shards
+
+
+class _Writer(object):
+
+    def __init__(self, fd, fmt):
+        self._fd = fd
+        self._write = self._write_ndjson if fmt == 'ndjson' \
+            else self._write_columnar
+
+    def write_page(self, entries):
+        self._write(entries)
+        self._fd.flush()
+        return self._fd.tell()
+
+    def _write_ndjson(self, entries):
+        self._fd.write(b''.join(
+            json.dumps({'address': address, 'kind': kind, 'record': record},
+                       sort_keys=True, default=str).encode('utf-8') + b'\n'
+            for address, kind, record in iter_records(entries)))
+
+    def _write_columnar(self, entries):
+        groups = {}
+        for address, kind, record in iter_records(entries):
+            columns = groups.setdefault(kind, {'address': []})
+            rows = len(columns['address'])
+            columns['address'].append(address)
+            for field, value in record.items():
+                # Fields missing from earlier rows are filled with None.
+                columns.setdefault(field, [None] * rows).append(value)
+            for values in columns.values():
+                if len(values) == rows:
+                    values.append(None)
+        self._fd.write(b''.join(
+            json.dumps({'kind': kind, 'rows': len(columns['address']),
+                        'columns': columns},
+                       sort_keys=True, default=str).encode('utf-8') + b'\n'
+            for kind, columns in sorted(groups.items())))
+
+
+class StateExporter(object):
+    '''Export the shipment namespace through a ShipmentClient.'''
+
+    def __init__(self, client, path, fmt='ndjson',
+                 concurrency=DEFAULT_CONCURRENCY,
+                 pageSize=DEFAULT_PAGE_SIZE):
+        if fmt not in FORMATS:
+            raise Exception('Unknown export format: {}'.format(fmt))
+        if concurrency < 1:
+            raise Exception('concurrency must be at least 1')
+        self._client = client
+        self._path = path
+        self._checkpointPath = path + '.checkpoint'
+        self._format = fmt
+        self._concurrency = concurrency
+        self._pageSize = pageSize
+        self.entries = 0
+
+    def run(self, resume=False, onPage=None):
+        '''Export every entry; onPage(entries so far) follows progress.
+
+           With resume, an export interrupted earlier continues from its
+           checkpoint at the same head block.
+        '''
+        checkpoint = self._load_checkpoint() if resume else None
+        if checkpoint is None:
+            shards = [NAMESPACE] if self._concurrency == 1 \
+                else namespace_shards()
+            checkpoint = {
+                'version': CHECKPOINT_VERSION,
+                'format': self._format,
+                'head': self._client.get_head(),
+                'offset': 0,
+                'entries': 0,
+                'shards': {shard: {'position': None, 'done': False}
+                           for shard in shards},
+            }
+            mode = 'wb'
+        else:
+            mode = 'r+b'
+        self.entries = checkpoint['entries']
+
+        with open(self._path, mode) as fd:
+            # Drop whatever was written after the last checkpoint.
+            fd.truncate(checkpoint['offset'])
+            fd.seek(checkpoint['offset'])
+            writer = _Writer(fd, checkpoint['format'])
+            for shard, entries, position in self._fetch(checkpoint):
+                offset = writer.write_page(entries)
+                self.entries += len(entries)
+                state = checkpoint['shards'][shard]
+                state['position'] = position
+                state['done'] = position is None
+                checkpoint['offset'] = offset
+                checkpoint['entries'] = self.entries
+                self._save_checkpoint(checkpoint)
+                if onPage is not None:
+                    onPage(self.entries)
+        os.remove(self._checkpointPath)
+        return self.entries
+
+    def _fetch(self, checkpoint):
+        '''Yield (shard, entries, next position) for every page left.'''
+        head = checkpoint['head']
+        pending = [(shard, state['position'])
+                   for shard, state in sorted(checkpoint['shards'].items())
+                   if not state['done']]
+        pages = queue.Queue(maxsize=2 * self._concurrency)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def page_through(shard, position):
+            try:
+                while True:
+                    entries, position, _ = self._client.get_state_page(
+                        shard, position, head, self._pageSize)
+                    if not put((shard, entries, position)) or \
+                            position is None:
+                        return
+            except BaseException as err:
+                put(err)
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._concurrency) as executor:
+            futures = [executor.submit(page_through, shard, position)
+                       for shard, position in pending]
+            try:
+                remaining = len(pending)
+                while remaining:
+                    item = pages.get()
+                    if isinstance(item, BaseException):
+                        raise item
+                    if item[2] is None:
+                        remaining -= 1
+                    yield item
+            finally:
+                stopped.set()
+                for future in futures:
+                    future.cancel()
+
+    def _load_checkpoint(self):
+        try:
+            with open(self._checkpointPath) as fd:
+                checkpoint = json.load(fd)
+        except FileNotFoundError:
+            return None
+        if checkpoint.get('version') != CHECKPOINT_VERSION:
+            raise Exception('Unsupported checkpoint {}'.format(
+                self._checkpointPath))
+        if checkpoint['format'] != self._format:
+            raise Exception('Checkpoint {} was written for the {} format'
+                            .format(self._checkpointPath,
+                                    checkpoint['format']))
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint):
+        temp = self._checkpointPath + '.tmp'
+        with open(temp, 'w') as fd:
+            json.dump(checkpoint, fd)
+        os.replace(temp, self._checkpointPath)
@@ -0,0 +1,389 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Bulk import of a shipment manifest.
+
+A manifest holds one operation per row, as CSV with a header line or as
+one JSON object per line:
+
+    action,shipment,place,items,place_to
+    add,S1,Delhi,apple:3;pear:2,
+    remove,S1,Delhi,apple:1,
+    transfer,S1,Delhi,,Mumbai
+
+    {"action": "add", "shipment": "S1", "place": "Delhi",
+     "items": {"apple": 3, "pear": 2}}
+
+place is the place signing the row, with its key from the keyring; a
+transfer moves the shipment from place to place_to.
+
+Rows are read one at a time and grouped by signing place into BatchLists
+of up to batchSize rows, each row in a batch of its own so a bad row
+fails alone.  BatchLists are posted by a bounded pool of threads.  A
+place has at most one BatchList in flight, so its rows reach the
+validator in file order, and a place receiving a transfer posts only
+after the BatchList holding the transfer, so its later rows about the
+shipment come after it.  Memory is bounded by the rows being grouped and
+in flight, whatever the size of the manifest.
+'''
+
+import collections
+import concurrent.futures
+import csv
+import json
+import threading
+import time
+
+from client.shipment_batch import ShipmentBatchBuilder
+from client.shipment_keys import get_keyring
+from client.shipment_status import COMMITTED
+from client.shipment_status import INVALID
+from client.shipment_status import parse_batch_ids
+
+FORMATS = ('csv', 'ndjson')
+
+ACTIONS = ('add', 'remove', 'transfer')
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+
+ManifestRow = collections.namedtuple(
+    'ManifestRow', ['line', 'action', 'shipmentID', 'placeName', 'items',
+                    'placeTo'])
+
+# A row that could not be read, yielded in place of the ManifestRow.
+RowFailure = collections.namedtuple('RowFailure', ['line', 'message'])
+
+
+def manifest_format(path):
+    '''Guess the format of a manifest from its file name.'''
+    if path.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return 'csv'
+
+
+def read_manifest(fd, fmt):
+    '''Lazily yield a ManifestRow, or a RowFailure, per row of a manifest
+       opened in text mode.'''
+    if fmt == 'csv':
+        reader = csv.DictReader(fd)
+        for fields in reader:
+            yield _make_row(reader.line_num, fields, _parse_csv_items)
+    elif fmt == 'ndjson':
+        for line, text in enumerate(fd, 1):
+            if not text.strip():
+                continue
+            try:
+                fields = json.loads(text)
+                if not isinstance(fields, dict):
+                    raise ValueError('expected a JSON object')
+            except ValueError as err:
+                yield RowFailure(line, 'Invalid JSON: {}'.format(err))
+                continue
+            yield _make_row(line, fields, _parse_json_items)
+    else:
+        raise Exception('Unknown manifest format: {}'.format(fmt))
+
+
+def _make_row(line, fields, parseItems):
+    try:
+        action = (fields.get('action') or '').strip().lower()
+        shipmentID = (fields.get('shipment') or '').strip()
+        placeName = (fields.get('place') or '').strip()
+        placeTo = (fields.get('place_to') or '').strip() or None
+        if action not in ACTIONS:
+            raise ValueError('unknown action "{}"'.format(action))
+        if not shipmentID or not placeName:
+            raise ValueError('shipment and place are required')
+        items = parseItems(fields.get('items'))
+        if action == 'transfer':
+            if placeTo is None or placeTo == placeName:
+                raise ValueError('a transfer needs a place_to other than '
+                                 'its place')
+        elif not items:
+            raise ValueError('no items to {}'.format(action))
+    except (TypeError, ValueError, AttributeError) as err:
+        return RowFailure(line, str(err))
+    return ManifestRow(line, action, shipmentID, placeName, items, placeTo)
+
+
+def _parse_csv_items(value):
+    '''Parse "name:count;name:count" into (name, count) pairs.'''
+    items = []
+    for entry in (value or '').split(';'):
+        if not entry.strip():
+            continue
+        name, _, count = entry.rpartition(':')
+        items.append(_item(name.strip(), count))
+    return items
+
+
+def _parse_json_items(value):
+    '''Parse a {name: count} object or a list of [name, count] pairs.'''
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        value = value.items()
+    return [_item(name, count) for name, count in value]
+
+
+def _item(name, count):
+    if not name:
+        raise ValueError('item without a name')
+    count = int(count)
+    if count < 0:
+        raise ValueError('negative count for item {}'.format(name))
+    return name, count
+
+
+class ImportStats(object):
+    '''Counters of an import, shared with the progress callback.'''
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rows = 0
+        self.submitted = 0
+        self.committed = 0
+        self.failed = 0
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        '''Rows submitted per second.'''
+        elapsed = self.elapsed
+        return self.submitted / elapsed if elapsed else 0.0
+
+
+class _Pending(object):
+    '''Rows of one place waiting to be posted as one BatchList.'''
+
+    def __init__(self, place):
+        self.place = place
+        self.lines = []
+        # Pending lists that must reach the validator first.
+        self.after = []
+        self.future = None
+        self._builder = None
+
+    @property
+    def builder(self):
+        if self._builder is None:
+            self._builder = ShipmentBatchBuilder(
+                self.place.signer(), self.place.batchSize,
+                self.place.dependencies)
+        return self._builder
+
+
+class _Place(object):
+
+    def __init__(self, name, keyring, batchSize, dependencies):
+        self.name = name
+        self.batchSize = batchSize
+        # The DependencyTracker of the client posting the rows.
+        self.dependencies = dependencies
+        self.publicKey = keyring.public_key(name)
+        self.pending = _Pending(self)
+        self.last = None
+        self._keyring = keyring
+
+    def signer(self):
+        # Places that only receive transfers need no private key.
+        return self._keyring.signer(self.name)
+
+
+class ManifestImporter(object):
+    '''Submit the rows of a manifest through a ShipmentClient.
+
+    With wait, rows are followed until the validator commits or rejects
+    them, for at most wait seconds after they were posted, and rejected
+    rows are reported as failures.  Each row lists the rows on the same
+    shipments posted before it, through the DependencyTracker of the
+    client, as dependencies of its transaction.
+    '''
+
+    def __init__(self, client, keyring=None, batchSize=DEFAULT_BATCH_SIZE,
+                 concurrency=DEFAULT_CONCURRENCY, wait=None):
+        if batchSize < 1:
+            raise Exception('batchSize must be at least 1')
+        if concurrency < 1:
+            raise Exception('concurrency must be at least 1')
+        self._client = client
+        self._keyring = keyring if keyring is not None else get_keyring()
+        self._batchSize = batchSize
+        self._concurrency = concurrency
+        self._wait = wait
+        self._lock = threading.Lock()
+        # Rows grouped but not posted, and BatchLists posted but not done.
+        self._unposted = 0
+        self._maxUnposted = 4 * concurrency * batchSize
+        self._slots = threading.BoundedSemaphore(2 * concurrency)
+        self._places = {}
+        self._executor = None
+        self._onFailure = None
+        self.stats = ImportStats()
+
+    def run(self, rows, onProgress=None, onFailure=None,
+            progressInterval=1.0):
+        '''Import every row and return the ImportStats.
+
+           onFailure(line, message) is called for every row that failed,
+           and onProgress(stats) every progressInterval seconds and once
+           more at the end.
+        '''
+        self._onFailure = onFailure
+        self.stats = ImportStats()
+        lastProgress = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._concurrency) as self._executor:
+            for row in rows:
+                self.stats.rows += 1
+                if isinstance(row, RowFailure):
+                    self._fail(row.line, row.message)
+                else:
+                    self._queue(row)
+                if onProgress is not None and \
+                        time.monotonic() - lastProgress >= progressInterval:
+                    onProgress(self.stats)
+                    lastProgress = time.monotonic()
+            for place in list(self._places.values()):
+                self._flush(place)
+            # Every slot back means every BatchList is done.
+            for _ in range(2 * self._concurrency):
+                self._slots.acquire()
+            for _ in range(2 * self._concurrency):
+                self._slots.release()
+        if onProgress is not None:
+            onProgress(self.stats)
+        return self.stats
+
+    def _queue(self, row):
+        try:
+            place = self._place(row.placeName)
+            if row.action == 'transfer':
+                destination = self._place(row.placeTo)
+                # The destination posts its next rows after this one.  Its
+                # earlier rows go first, so a list only ever waits on lists
+                # started before it and waits cannot go round in a cycle.
+                self._flush(destination)
+                place.pending.builder.transfer(
+                    row.shipmentID, row.placeTo, destination.publicKey)
+                destination.pending.after.append(place.pending)
+            elif row.action == 'add':
+                place.pending.builder.add_item(
+                    row.shipmentID, row.items, row.placeName)
+            else:
+                place.pending.builder.remove_item(row.shipmentID, row.items)
+        except Exception as err:
+            self._fail(row.line, str(err))
+            return
+        place.pending.lines.append(row.line)
+        self._unposted += 1
+        if len(place.pending.lines) >= self._batchSize:
+            self._flush(place)
+        elif self._unposted >= self._maxUnposted:
+            for other in list(self._places.values()):
+                self._flush(other)
+
+    def _place(self, name):
+        place = self._places.get(name)
+        if place is None:
+            place = _Place(name, self._keyring, self._batchSize,
+                           self._client.dependencies)
+            self._places[name] = place
+        return place
+
+    def _flush(self, place):
+        '''Post the rows grouped for a place, after the lists they wait on.'''
+        pending = place.pending
+        if not pending.lines:
+            return
+        place.pending = _Pending(place)
+        for other in pending.after:
+            if other.future is None:
+                self._flush(other.place)
+        after = [other.future for other in pending.after
+                 if other.future is not None]
+        if place.last is not None:
+            after.append(place.last)
+        self._unposted -= len(pending.lines)
+        self._slots.acquire()
+        pending.future = self._executor.submit(self._post, pending, after)
+        place.last = pending.future
+
+    def _post(self, pending, after):
+        '''Post one BatchList once the lists before it were accepted.
+
+           The future of this call resolves on acceptance, which is what
+           later lists wait for; the slot is given back once the rows are
+           done, which with wait is when the validator decided on them.
+        '''
+        concurrent.futures.wait(after)
+        try:
+            response = self._client.send_batches(pending.builder)[0]
+        except Exception as err:
+            for line in pending.lines:
+                self._fail(line, str(err))
+            self._slots.release()
+            return
+        with self._lock:
+            self.stats.submitted += len(pending.lines)
+        if self._wait is None:
+            self._slots.release()
+            return
+
+        try:
+            lines = dict(zip(parse_batch_ids(response), pending.lines))
+            # Rows still undecided wait seconds after they were posted
+            # are given up on.
+            futures = self._client.tracker().track(list(lines),
+                                                   timeout=self._wait)
+        except Exception as err:
+            for line in pending.lines:
+                self._fail(line, 'posted but not tracked: {}'.format(err))
+            self._slots.release()
+            return
+        if not futures:
+            self._slots.release()
+            return
+        remaining = [len(futures)]
+
+        def on_done(future):
+            batchStatus = future.result()
+            if batchStatus.status == COMMITTED:
+                with self._lock:
+                    self.stats.committed += 1
+            elif batchStatus.status == INVALID:
+                self._fail(lines[batchStatus.id], '; '.join(
+                    txn.get('message', '') or 'invalid transaction'
+                    for txn in batchStatus.invalidTransactions)
+                    or 'invalid batch')
+            else:
+                self._fail(lines[batchStatus.id], 'still pending after '
+                           '{} seconds'.format(self._wait))
+            with self._lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done:
+                self._slots.release()
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    def _fail(self, line, message):
+        with self._lock:
+            self.stats.failed += 1
+        if self._onFailure is not None:
+            self._onFailure(line, message)
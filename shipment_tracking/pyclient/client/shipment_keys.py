@@ -0,0 +1,128 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Process-wide cache of place keys and signers.
+
+Key files are read and parsed once and kept for as long as their
+modification time does not change.  Every signer of a keyring shares
+one secp256k1 context, created when the first private key is loaded, so
+commands that only read public keys never build it.
+'''
+
+import os
+import threading
+import weakref
+
+from sawtooth_signing import create_context
+from sawtooth_signing import CryptoFactory
+from sawtooth_signing import ParseError
+from sawtooth_signing.secp256k1 import Secp256k1PrivateKey
+
+_keyring = None
+_keyringLock = threading.Lock()
+
+_publicKeys = weakref.WeakKeyDictionary()
+
+
+def default_key_dir():
+    return os.path.join(os.path.expanduser("~"), ".sawtooth", "keys")
+
+
+class Keyring(object):
+    '''Lazily loaded signers and public keys, cached per key file.'''
+
+    def __init__(self, keyDir=None):
+        self._keyDir = keyDir if keyDir is not None else default_key_dir()
+        self._factory = None
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def private_key_file(self, placeName):
+        return os.path.join(self._keyDir, '{}.priv'.format(placeName))
+
+    def public_key_file(self, placeName):
+        return os.path.join(self._keyDir, '{}.pub'.format(placeName))
+
+    def signer(self, placeName):
+        '''Return the signer of a place.'''
+        return self.signer_from_file(self.private_key_file(placeName))
+
+    def public_key(self, placeName):
+        '''Return the hex public key of a place.'''
+        return self.public_key_from_file(self.public_key_file(placeName))
+
+    def signer_from_file(self, keyFile):
+        return self._get(keyFile, self._load_signer, 'private')
+
+    def public_key_from_file(self, pubKeyFile):
+        return self._get(pubKeyFile, _read_key, 'public')
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _get(self, path, loader, kind):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError as err:
+            raise Exception('Failed to read {} key {}: {}'.format(
+                kind, path, str(err)))
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            value = loader(path)
+        except OSError as err:
+            raise Exception('Failed to read {} key {}: {}'.format(
+                kind, path, str(err)))
+        with self._lock:
+            self._cache[path] = (mtime, value)
+        return value
+
+    def _load_signer(self, keyFile):
+        try:
+            privateKey = Secp256k1PrivateKey.from_hex(_read_key(keyFile))
+        except ParseError as err:
+            raise Exception('Failed to load private key: {}'.format(str(err)))
+        with self._lock:
+            if self._factory is None:
+                self._factory = CryptoFactory(create_context('secp256k1'))
+            factory = self._factory
+        signer = factory.new_signer(privateKey)
+        # Derive the public key now, so later calls reuse it.
+        public_key_hex(signer)
+        return signer
+
+
+def _read_key(path):
+    with open(path) as fd:
+        return fd.read().strip()
+
+
+def public_key_hex(signer):
+    '''Return the hex public key of a signer, serializing it only once.'''
+    publicKey = _publicKeys.get(signer)
+    if publicKey is None:
+        publicKey = signer.get_public_key().as_hex()
+        _publicKeys[signer] = publicKey
+    return publicKey
+
+
+def get_keyring():
+    '''Return the keyring shared by the whole process.'''
+    global _keyring
+    with _keyringLock:
+        if _keyring is None:
+            _keyring = Keyring()
+        return _keyring
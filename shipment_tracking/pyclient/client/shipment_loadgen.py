@@ -0,0 +1,631 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Load generator for end-to-end throughput tests.
+
+The workload is synthetic: places with keys made up for the run, a pool
+of shipment IDs and a pool of item names.  Operations are drawn by the
+weights of the op mix and kept valid against a model of the shipments,
+which assumes every operation commits, so rejections point at the
+stack rather than at the workload.  Operations on a shipment depend on
+the ones before them, as with ShipmentClient.
+
+Two ways of applying load:
+
+    open    operations are sent at the target rate whatever the stack
+            does; latency counts from the time an operation was due, so
+            a stack falling behind shows in the percentiles
+    closed  concurrency workers each send an operation and wait for it
+            to commit or be rejected before sending the next one
+
+Runs go against a REST API, e.g. the docker-compose stack started from
+sawtooth-default.yaml with a shipment-tp connected to its validator:
+
+    shipment loadgen --url http://localhost:8008 --rate 200 --duration 60
+
+or against LocalRestApi, an in-process stand-in applying batches with
+the transaction handler, which needs the processor package:
+
+    shipment loadgen --local --mode closed --concurrency 16
+
+At high rates signing takes most of the generator's time; with
+--signing-workers N operations are signed by N processes, see
+shipment_signing.py.
+
+Commit latency is measured when the status poll sees the batch final,
+so it includes up to one poll interval.
+'''
+
+import base64
+import collections
+import concurrent.futures
+import functools
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+from sawtooth_signing import create_context
+from sawtooth_signing import CryptoFactory
+
+from client.shipment_batch import ShipmentBatchBuilder
+from client.shipment_keys import public_key_hex
+from client.shipment_signing import SigningPipeline
+from client.shipment_status import COMMITTED
+from client.shipment_status import INVALID
+from client.shipment_status import parse_batch_ids
+
+LOGGER = logging.getLogger(__name__)
+
+MODES = ('open', 'closed')
+ACTIONS = ('add', 'remove', 'transfer')
+
+DEFAULT_MODE = 'open'
+DEFAULT_RATE = 100.0
+DEFAULT_DURATION = 10.0
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PLACES = 10
+DEFAULT_SHIPMENTS = 1000
+DEFAULT_ITEMS = 20
+DEFAULT_MIX = 'add=5,remove=3,transfer=2'
+# Seconds an operation may stay undecided before it counts as unknown.
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_POLL_INTERVAL = 0.05
+
+LoadOperation = collections.namedtuple(
+    'LoadOperation', ['action', 'place', 'values'])
+
+
+def parse_mix(text):
+    '''Parse "add=5,remove=3,transfer=2" into a dict of action weights.'''
+    mix = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        action, _, weight = part.partition('=')
+        action = action.strip()
+        if action not in ACTIONS:
+            raise Exception('Unknown action in the op mix: {}'.format(action))
+        try:
+            mix[action] = float(weight)
+        except ValueError:
+            raise Exception('Invalid weight for {}: {}'.format(action, weight))
+        if mix[action] < 0:
+            raise Exception('Negative weight for {}'.format(action))
+    if not sum(mix.values()):
+        raise Exception('The op mix needs a positive weight')
+    return mix
+
+
+class _LoadPlace(object):
+
+    def __init__(self, name, signer, privateKey):
+        self.name = name
+        self.signer = signer
+        self.publicKey = public_key_hex(signer)
+        self.privateKey = privateKey
+
+
+class Workload(object):
+    '''Draws operations on places, shipments and items.
+
+    Shipments are created by adds and chosen uniformly among those that
+    exist; removes take items the model holds and transfers move a
+    shipment to another place.  Not thread safe.
+    '''
+
+    def __init__(self, places=DEFAULT_PLACES, shipments=DEFAULT_SHIPMENTS,
+                 items=DEFAULT_ITEMS, mix=None, seed=None):
+        if places < 2:
+            raise Exception('A workload needs at least 2 places')
+        if shipments < 1 or items < 1:
+            raise Exception('A workload needs shipments and items')
+        self._rng = random.Random(seed)
+        self._actions, self._weights = zip(*sorted(
+            (mix or parse_mix(DEFAULT_MIX)).items()))
+        factory = CryptoFactory(create_context('secp256k1'))
+        self.places = []
+        for number in range(places):
+            privateKey = factory.context.new_random_private_key()
+            self.places.append(_LoadPlace(
+                'loadgen-{}'.format(number), factory.new_signer(privateKey),
+                privateKey.as_hex()))
+        self._items = ['item-{}'.format(number) for number in range(items)]
+        self._shipmentCount = shipments
+        # Shipment ID -> [holding place, {item: count}], and the IDs
+        # created, for uniform choice.
+        self._model = {}
+        self._created = []
+
+    def next(self):
+        '''Return the next LoadOperation.'''
+        rng = self._rng
+        action = rng.choices(self._actions, self._weights)[0]
+        if action != 'add' and not self._created:
+            action = 'add'
+        if action == 'add':
+            return self._add()
+        shipmentID = rng.choice(self._created)
+        place, items = self._model[shipmentID]
+        if action == 'remove':
+            held = [item for item, count in items.items() if count]
+            if not held:
+                return self._add(shipmentID)
+            item = rng.choice(held)
+            count = rng.randint(1, items[item])
+            items[item] -= count
+            return LoadOperation('remove', place, (shipmentID,
+                                                   [(item, count)]))
+        destination = rng.choice([other for other in self.places
+                                  if other is not place])
+        self._model[shipmentID][0] = destination
+        return LoadOperation('transfer', place, (
+            shipmentID, destination.name, destination.publicKey))
+
+    def _add(self, shipmentID=None):
+        rng = self._rng
+        if shipmentID is None:
+            shipmentID = 'LG{}'.format(rng.randrange(self._shipmentCount))
+        entry = self._model.get(shipmentID)
+        if entry is None:
+            entry = [rng.choice(self.places), {}]
+            self._model[shipmentID] = entry
+            self._created.append(shipmentID)
+        place, held = entry
+        kinds = rng.randint(1, min(3, len(self._items)))
+        items = [(item, rng.randint(1, 20))
+                 for item in rng.sample(self._items, kinds)]
+        for item, count in items:
+            held[item] = held.get(item, 0) + count
+        return LoadOperation('add', place, (shipmentID, items, place.name))
+
+
+class LoadStats(object):
+    '''Outcome of a load run.'''
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self.submitted = 0
+        self.committed = 0
+        self.rejected = collections.Counter()
+        self.unknown = 0
+        self.errors = 0
+        self.queueFull = 0
+        # Open loop: operations sent more than one interval after they
+        # were due, a sign the generator itself could not keep up.
+        self.late = 0
+        self.latencies = []
+        self.lastCommit = None
+
+    @property
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started
+
+    def summary(self):
+        '''Return the figures of the run as a dict.'''
+        committedIn = (self.lastCommit or self.started) - self.started
+        latencies = sorted(self.latencies)
+        summary = {
+            'elapsed': self.elapsed,
+            'submitted': self.submitted,
+            'submit_rate': self.submitted / self.elapsed
+            if self.elapsed else 0.0,
+            'committed': self.committed,
+            'tps': self.committed / committedIn if committedIn else 0.0,
+            'rejected': sum(self.rejected.values()),
+            'rejected_by_action': {action: self.rejected[action]
+                                   for action in ACTIONS},
+            'unknown': self.unknown,
+            'errors': self.errors,
+            'queue_full': self.queueFull,
+            'late': self.late,
+        }
+        for name, percent in (('p50', 50), ('p90', 90), ('p99', 99)):
+            summary['latency_{}_ms'.format(name)] = \
+                _percentile(latencies, percent) * 1000
+        summary['latency_max_ms'] = latencies[-1] * 1000 if latencies else 0.0
+        return summary
+
+
+def _percentile(ordered, percent):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
+
+
+class LoadGenerator(object):
+    '''Submit a Workload through a ShipmentClient and measure the outcome.
+
+    In open mode operations are due every 1/rate seconds and posted by a
+    pool of concurrency threads; in closed mode rate is not used.
+    Operations are signed in the order they are drawn, so dependencies
+    follow the workload, using the DependencyTracker of the client, and
+    their status is followed by the BatchStatusTracker of the client.
+    With signingWorkers, operations are signed and posted by a
+    SigningPipeline of that many processes instead of the threads sending
+    them.
+    '''
+
+    def __init__(self, client, workload, mode=DEFAULT_MODE,
+                 rate=DEFAULT_RATE, duration=DEFAULT_DURATION,
+                 concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 signingWorkers=0):
+        if mode not in MODES:
+            raise Exception('Unknown mode: {}'.format(mode))
+        if mode == 'open' and not rate > 0:
+            raise Exception('The open mode needs a positive rate')
+        if concurrency < 1:
+            raise Exception('concurrency must be at least 1')
+        self._client = client
+        self._workload = workload
+        self._mode = mode
+        self._rate = rate
+        self._duration = duration
+        self._concurrency = concurrency
+        self._signingWorkers = signingWorkers
+        self._pipeline = None
+        self._timeout = timeout
+        self._signLock = threading.Lock()
+        self._lock = threading.Lock()
+        self._outstanding = set()
+        self.stats = LoadStats()
+
+    def run(self, onProgress=None, progressInterval=1.0):
+        '''Apply load for the duration, wait for the operations still in
+           flight and return the LoadStats.
+
+           onProgress(stats) is called every progressInterval seconds.
+        '''
+        self.stats = LoadStats()
+        queueFull = self._client.backpressure.rejections
+        stop = threading.Event()
+        reporter = None
+        if onProgress is not None:
+            def report():
+                while not stop.wait(progressInterval):
+                    onProgress(self.stats)
+            reporter = threading.Thread(target=report, daemon=True)
+            reporter.start()
+        if self._signingWorkers:
+            self._pipeline = SigningPipeline(
+                self._client,
+                [place.privateKey for place in self._workload.places],
+                workers=self._signingWorkers)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._concurrency) as executor:
+                deadline = self.stats.started + self._duration
+                if self._mode == 'open':
+                    self._run_open(executor, deadline)
+                else:
+                    for worker in [executor.submit(self._run_closed, deadline)
+                                   for _ in range(self._concurrency)]:
+                        worker.result()
+            if self._pipeline is not None:
+                self._pipeline.close()
+            with self._lock:
+                outstanding = list(self._outstanding)
+            concurrent.futures.wait(outstanding)
+        finally:
+            if self._pipeline is not None:
+                self._pipeline.close()
+                self._pipeline = None
+            stop.set()
+            if reporter is not None:
+                reporter.join()
+        self.stats.finished = time.monotonic()
+        self.stats.queueFull = \
+            self._client.backpressure.rejections - queueFull
+        return self.stats
+
+    def _run_open(self, executor, deadline):
+        interval = 1.0 / self._rate
+        due = self.stats.started
+        while due < deadline:
+            now = time.monotonic()
+            if due > now:
+                time.sleep(due - now)
+            elif now - due > interval:
+                self.stats.late += 1
+            if self._pipeline is not None:
+                action, posted = self._append_next()
+                posted.add_done_callback(
+                    functools.partial(self._on_posted, action, due))
+            else:
+                executor.submit(self._post, *self._sign_next(), due)
+            due += interval
+
+    def _run_closed(self, deadline):
+        while time.monotonic() < deadline:
+            due = time.monotonic()
+            if self._pipeline is not None:
+                action, posted = self._append_next()
+                concurrent.futures.wait([posted])
+                future = self._on_posted(action, due, posted)
+            else:
+                action, builder = self._sign_next()
+                future = self._post(action, builder, due)
+            if future is not None:
+                future.result()
+
+    def _append_next(self):
+        with self._signLock:
+            operation = self._workload.next()
+            posted = self._pipeline.append(
+                operation.place.publicKey, operation.action,
+                *operation.values)
+        return operation.action, posted
+
+    def _sign_next(self):
+        with self._signLock:
+            operation = self._workload.next()
+            builder = ShipmentBatchBuilder(
+                operation.place.signer, 1, self._client.dependencies)
+            builder.append(None, operation.action, *operation.values)
+        return operation.action, builder
+
+    def _post(self, action, builder, due):
+        '''Post one operation and return the future of its status, or
+           None when it could not be posted.'''
+        try:
+            response = self._client.send_batches(builder)[0]
+        except Exception as err:
+            return self._on_error(action, err)
+        return self._watch(action, due, parse_batch_ids(response)[0])
+
+    def _on_posted(self, action, due, posted):
+        '''Watch an operation posted by the signing pipeline.'''
+        try:
+            batchId = posted.result()
+        except Exception as err:
+            return self._on_error(action, err)
+        return self._watch(action, due, batchId)
+
+    def _on_error(self, action, err):
+        LOGGER.debug('Could not post a %s: %s', action, err)
+        with self._lock:
+            self.stats.errors += 1
+        return None
+
+    def _watch(self, action, due, batchId):
+        future = self._client.tracker().track(
+            [batchId], timeout=self._timeout)[0]
+        with self._lock:
+            self.stats.submitted += 1
+            self._outstanding.add(future)
+        future.add_done_callback(
+            functools.partial(self._on_final, action, due))
+        return future
+
+    def _on_final(self, action, due, future):
+        batchStatus = future.result()
+        now = time.monotonic()
+        with self._lock:
+            self._outstanding.discard(future)
+            if batchStatus.status == COMMITTED:
+                self.stats.committed += 1
+                self.stats.latencies.append(now - due)
+                self.stats.lastCommit = now
+            elif batchStatus.status == INVALID:
+                self.stats.rejected[action] += 1
+            else:
+                self.stats.unknown += 1
+
+
+class _Response(object):
+
+    def __init__(self, status_code, text, reason='OK'):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = reason
+        self.text = text
+
+
+class _Overlay(object):
+    '''Writes of one batch on top of a store, kept until the batch is
+       applied as a whole.'''
+
+    def __init__(self, store):
+        self._store = store
+        self.writes = {}
+
+    def get(self, address):
+        if address in self.writes:
+            return self.writes[address]
+        return self._store.get(address)
+
+    def commit(self, writes):
+        self.writes.update(writes)
+
+
+def _load_processor():
+    '''Import the processor package, from the checkout next to the client
+       when it is not installed.'''
+    if importlib.util.find_spec('processor') is None:
+        checkout = os.path.join(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))), 'pyprocessor')
+        if not os.path.isdir(os.path.join(checkout, 'processor')):
+            raise Exception('The local stand-in needs the shipment '
+                            'processor package on the Python path')
+        sys.path.append(checkout)
+    from processor.local_context import DictStore
+    from processor.local_context import LocalValidator
+    from processor.shipment_state import NAMESPACE
+    from processor.shipment_tp import ShipmentTransactionHandler
+    return DictStore, LocalValidator, ShipmentTransactionHandler(NAMESPACE)
+
+
+class LocalRestApi(object):
+    '''Session stand-in serving the REST API from an in-process validator.
+
+    Each BatchList is applied by the transaction handler when it is
+    posted, in a block of its own.  A batch is applied as a whole or not
+    at all, and one depending on a transaction not applied yet waits
+    until it is.  Batches depending on an invalid transaction are marked
+    INVALID as soon as it is rejected; a validator never commits them
+    either, but reports them PENDING, so a client waiting on them stops
+    at its timeout and counts them UNKNOWN.
+    Thread safe.
+    '''
+
+    PAGE_SIZE = 100
+
+    def __init__(self):
+        # The protobuf modules are only needed by a stand-in.
+        from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+        from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+        self._BatchList = BatchList
+        self._TransactionHeader = TransactionHeader
+        DictStore, LocalValidator, handler = _load_processor()
+        self._LocalValidator = LocalValidator
+        self._handler = handler
+        self._store = DictStore()
+        self._lock = threading.Lock()
+        self._blockNum = 0
+        # Batch id -> (status, invalid transactions).
+        self._statuses = {}
+        # Transaction id -> True when committed, False when invalid.
+        self._transactions = {}
+        # Batches waiting for the transactions they depend on.
+        self._waiting = []
+
+    def get(self, url, headers=None, timeout=None):
+        path, query = self._split(url)
+        with self._lock:
+            if path.startswith('state/'):
+                data = self._store.get(path[len('state/'):])
+                if data is None:
+                    return _Response(404, '', 'Not Found')
+                return self._json({'data': _b64(data), 'head': self._head()})
+            if path == 'state':
+                return self._state_page(query)
+            if path == 'blocks':
+                return self._json({'data': [{
+                    'header_signature': self._head(),
+                    'header': {'block_num': str(self._blockNum)}}],
+                    'head': self._head()})
+            if path == 'batch_statuses':
+                return self._batch_statuses(
+                    query.get('id', [''])[0].split(','))
+        return _Response(404, '', 'Not Found')
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        path, _ = self._split(url)
+        if path == 'batch_statuses':
+            with self._lock:
+                return self._batch_statuses(json.loads(data))
+        if path != 'batches':
+            return _Response(404, '', 'Not Found')
+        batchList = self._BatchList()
+        batchList.ParseFromString(data)
+        with self._lock:
+            self._blockNum += 1
+            for batch in batchList.batches:
+                self._statuses[batch.header_signature] = ('PENDING', [])
+                self._waiting.append(batch)
+            self._apply_ready()
+        return self._json({'link': 'http://local/batch_statuses?id={}'.format(
+            ','.join(batch.header_signature for batch in batchList.batches))},
+            202)
+
+    def _apply_ready(self):
+        progress = True
+        while progress:
+            progress = False
+            for batch in list(self._waiting):
+                dependencies = [
+                    dependency for txn in batch.transactions
+                    for dependency in self._header(txn).dependencies]
+                if any(self._transactions.get(dependency) is False
+                       for dependency in dependencies):
+                    self._waiting.remove(batch)
+                    self._reject(batch, 'depends on an invalid transaction')
+                    progress = True
+                elif all(self._transactions.get(dependency)
+                         for dependency in dependencies):
+                    self._waiting.remove(batch)
+                    self._apply(batch)
+                    progress = True
+
+    def _apply(self, batch):
+        overlay = _Overlay(self._store)
+        validator = self._LocalValidator(self._handler, overlay)
+        for txn in batch.transactions:
+            try:
+                validator.apply(txn)
+            except Exception as err:
+                self._reject(batch, str(err), txn.header_signature)
+                return
+        self._store.commit(overlay.writes)
+        for txn in batch.transactions:
+            self._transactions[txn.header_signature] = True
+        self._statuses[batch.header_signature] = ('COMMITTED', [])
+
+    def _reject(self, batch, message, transactionId=None):
+        for txn in batch.transactions:
+            self._transactions[txn.header_signature] = False
+        self._statuses[batch.header_signature] = ('INVALID', [{
+            'id': transactionId or batch.transactions[0].header_signature,
+            'message': message}])
+
+    def _header(self, txn):
+        header = self._TransactionHeader()
+        header.ParseFromString(txn.header)
+        return header
+
+    def _batch_statuses(self, batchIds):
+        data = []
+        for batchId in batchIds:
+            status, invalid = self._statuses.get(batchId, ('UNKNOWN', []))
+            data.append({'id': batchId, 'status': status,
+                         'invalid_transactions': invalid})
+        return self._json({'data': data})
+
+    def _state_page(self, query):
+        prefix = query.get('address', [''])[0]
+        start = int(query.get('start', ['0'])[0])
+        limit = int(query.get('limit', [self.PAGE_SIZE])[0])
+        matching = sorted(address for address, _ in self._store.items()
+                          if address.startswith(prefix))
+        page = matching[start:start + limit]
+        body = {'data': [{'address': address,
+                          'data': _b64(self._store.get(address))}
+                         for address in page],
+                'paging': {}, 'head': self._head()}
+        if start + limit < len(matching):
+            body['paging']['next_position'] = str(start + limit)
+        return self._json(body)
+
+    def _head(self):
+        return 'local-{}'.format(self._blockNum)
+
+    @staticmethod
+    def _split(url):
+        parsed = urllib.parse.urlparse(url)
+        return parsed.path.lstrip('/'), urllib.parse.parse_qs(parsed.query)
+
+    @staticmethod
+    def _json(body, status=200):
+        return _Response(status, json.dumps(body))
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
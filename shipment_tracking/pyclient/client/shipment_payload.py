@@ -0,0 +1,150 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Encoder for the binary shipment payload.
+
+The format is described in processor/shipment_payload.py; the two
+modules must stay in sync.
+'''
+
+import struct
+import time
+
+PAYLOAD_VERSION = 1
+
+ACTION_ADD = 1
+ACTION_REMOVE = 2
+ACTION_TRANSFER = 3
+ACTION_MIGRATE = 4
+ACTION_ADD_MANY = 5
+ACTION_TRANSFER_MANY = 6
+
+_HEADER = struct.Struct('>BB')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+
+
+def _pack_str(parts, value):
+    data = value.encode('utf-8')
+    if len(data) > 0xffff:
+        raise Exception('Value too long for payload: {}'.format(value[:32]))
+    parts.append(_U16.pack(len(data)))
+    parts.append(data)
+
+
+def _pack_items(parts, items):
+    if len(items) > 0xffff:
+        raise Exception('Too many items in one payload: {}'.format(len(items)))
+    parts.append(_U16.pack(len(items)))
+    for name, count in items:
+        if not 0 <= count <= 0xffffffff:
+            raise Exception('Invalid count {} for item {}'.format(count, name))
+        _pack_str(parts, name)
+        parts.append(_U32.pack(count))
+
+
+def _pack_count(parts, count, what):
+    if not 0 < count <= 0xffff:
+        raise Exception('Between 1 and {} {} fit in one payload, got {}'
+                        .format(0xffff, what, count))
+    parts.append(_U16.pack(count))
+
+
+def _check_unique(shipmentIDs):
+    seen = set()
+    for shipmentID in shipmentIDs:
+        if shipmentID in seen:
+            raise Exception('Shipment {} is listed twice'.format(shipmentID))
+        seen.add(shipmentID)
+
+
+def pair_items(N, items):
+    '''Turn the CLI form [name, count, name, count, ...] into pairs.'''
+    N = int(N)
+    if len(items) != 2 * N:
+        raise Exception('Expected {} item names and counts, got {} values'
+                        .format(N, len(items)))
+    try:
+        return [(items[x], int(items[x+1])) for x in range(0, 2*N, 2)]
+    except ValueError as err:
+        raise Exception('Invalid item count: {}'.format(err))
+
+
+def _pack_time(parts, timestamp):
+    '''Append the time of a hop, now unless given.'''
+    parts.append(_U64.pack(int(time.time() if timestamp is None
+                               else timestamp)))
+
+
+def encode_add(shipmentID, items, placeName, timestamp=None):
+    parts = [_HEADER.pack(PAYLOAD_VERSION, ACTION_ADD)]
+    _pack_str(parts, shipmentID)
+    _pack_str(parts, placeName)
+    _pack_items(parts, items)
+    _pack_time(parts, timestamp)
+    return b''.join(parts)
+
+
+def encode_remove(shipmentID, items):
+    parts = [_HEADER.pack(PAYLOAD_VERSION, ACTION_REMOVE)]
+    _pack_str(parts, shipmentID)
+    _pack_items(parts, items)
+    return b''.join(parts)
+
+
+def encode_transfer(shipmentID, placeTo, placeToKey, timestamp=None):
+    parts = [_HEADER.pack(PAYLOAD_VERSION, ACTION_TRANSFER)]
+    _pack_str(parts, shipmentID)
+    _pack_str(parts, placeTo)
+    _pack_str(parts, placeToKey)
+    _pack_time(parts, timestamp)
+    return b''.join(parts)
+
+
+def encode_migrate():
+    return _HEADER.pack(PAYLOAD_VERSION, ACTION_MIGRATE)
+
+
+def encode_add_many(shipments, placeName, timestamp=None):
+    '''Encode an add of items to each of shipments, a list of
+       (shipment ID, items) pairs.'''
+    _check_unique(shipmentID for shipmentID, _ in shipments)
+    parts = [_HEADER.pack(PAYLOAD_VERSION, ACTION_ADD_MANY)]
+    _pack_str(parts, placeName)
+    _pack_count(parts, len(shipments), 'shipments')
+    for shipmentID, items in shipments:
+        _pack_str(parts, shipmentID)
+        _pack_items(parts, items)
+    _pack_time(parts, timestamp)
+    return b''.join(parts)
+
+
+def encode_transfer_many(transfers, timestamp=None):
+    '''Encode the transfer of many shipments, transfers being a list of
+       (shipment ID, place to, public key of place to) tuples.'''
+    _check_unique(shipmentID for shipmentID, _, _ in transfers)
+    destinations = {}
+    for _, placeTo, placeToKey in transfers:
+        destinations.setdefault((placeTo, placeToKey), len(destinations))
+    parts = [_HEADER.pack(PAYLOAD_VERSION, ACTION_TRANSFER_MANY)]
+    _pack_count(parts, len(destinations), 'destinations')
+    for placeTo, placeToKey in destinations:
+        _pack_str(parts, placeTo)
+        _pack_str(parts, placeToKey)
+    _pack_count(parts, len(transfers), 'shipments')
+    for shipmentID, placeTo, placeToKey in transfers:
+        _pack_str(parts, shipmentID)
+        parts.append(_U16.pack(destinations[(placeTo, placeToKey)]))
+    _pack_time(parts, timestamp)
+    return b''.join(parts)
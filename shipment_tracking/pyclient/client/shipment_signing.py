@@ -0,0 +1,387 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Transaction signing across worker processes.
+
+Serializing headers, hashing payloads and signing take most of the time
+a client spends on an operation, and hold the GIL, so a single process
+signs no faster than one core allows.  SigningPipeline hands operations
+to a pool of processes, each loaded once with the signers of the run,
+and posts the signed batches in the order the operations were appended:
+
+    with SigningPipeline(client, [keyHex1, keyHex2]) as pipeline:
+        batchId = pipeline.add_item(publicKey1, "S1", [("apple", 3)],
+                                    "Delhi")
+        pipeline.remove_item(publicKey1, "S1", [("apple", 1)])
+    print(batchId.result())
+
+Operations are signed in chunks, to pay the cost of reaching a worker
+once for many signatures.  A chunk is sent to the pool as soon as a
+worker is idle, or once it is full.  Operations are chained with
+transaction dependencies as ShipmentBatchBuilder does; an operation
+following one signed in the same chunk gets its id from the worker,
+and a chunk following operations of an earlier chunk still being
+signed waits for that chunk before it is sent, while chunks with no
+such dependency are signed in parallel.  Signed chunks wait for their
+turn in a bounded queue, which holds back append() when the submitter
+falls behind.
+
+An operation that cannot be signed fails its Future, as do the
+operations following it.
+'''
+
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+
+from sawtooth_signing import create_context
+from sawtooth_signing import CryptoFactory
+from sawtooth_signing.secp256k1 import Secp256k1PrivateKey
+
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+
+from client.shipment_batch import DEFAULT_MAX_BATCHES_PER_LIST
+from client.shipment_batch import make_batch
+from client.shipment_batch import make_transaction
+from client.shipment_batch import ordering_keys
+from client.shipment_keys import public_key_hex
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 32
+# Chunks signed or being signed ahead of the submitter.
+DEFAULT_QUEUE_SIZE = 64
+
+# Signers of a worker process, by public key.
+_signers = {}
+
+_STOP = object()
+
+
+def _load_signers(privateKeys):
+    factory = CryptoFactory(create_context('secp256k1'))
+    for privateKey in privateKeys:
+        signer = factory.new_signer(Secp256k1PrivateKey.from_hex(privateKey))
+        _signers[public_key_hex(signer)] = signer
+
+
+def _sign_chunk(operations):
+    '''Sign operations into one batch each, in the worker.
+
+       Each operation is (signer public key, batcher public key, action,
+       values, dependencies), where a dependency is a transaction id, the
+       position of an earlier operation of the chunk, or None for an
+       operation that could not be signed.  Returns (transaction id,
+       batch id, batch) per operation, the batch serialized as a BatchList
+       of its own, or (None, None, error message) for an operation that
+       could not be signed.
+    '''
+    signed = []
+    for publicKey, batcherKey, action, values, dependencies in operations:
+        try:
+            transactionIds = []
+            for dependency in dependencies:
+                if isinstance(dependency, int):
+                    dependency = signed[dependency][0]
+                if dependency is None:
+                    raise Exception('Follows an operation that could not '
+                                    'be signed')
+                transactionIds.append(dependency)
+            transaction = make_transaction(
+                _signers[publicKey], batcherKey, action, *values,
+                dependencies=transactionIds)
+            batch = make_batch(_signers[batcherKey], [transaction])
+        except Exception as err:
+            signed.append((None, None, str(err)))
+            continue
+        signed.append((transaction.header_signature, batch.header_signature,
+                       BatchList(batches=[batch]).SerializeToString()))
+    return signed
+
+
+class _Chunk(object):
+
+    def __init__(self):
+        self.operations = []
+        self.provisionalIds = []
+        self.futures = []
+        # Earlier chunks holding dependencies of this one.
+        self.after = set()
+        # Future of the signed operations, once sent to the pool.
+        self.signing = None
+        # Set once sent to the pool, by the waiter for a chunk with
+        # dependencies.
+        self.dispatched = threading.Event()
+
+
+class SigningPipeline(object):
+    '''Sign operations in worker processes and post them in order.
+
+    privateKeys are the hex private keys of every place signing through
+    the pipeline.  Each operation becomes its own batch, signed by the
+    key of batcherPublicKey when given or else by the operation's signer.
+    append() returns a Future of the id of the operation's batch, set
+    once the BatchList carrying it is accepted by the REST API.
+    Dependencies are recorded in dependencies, or else in the
+    DependencyTracker of the client, which releases them as the batches
+    are decided.  Thread safe.
+    '''
+
+    def __init__(self, client, privateKeys, batcherPublicKey=None,
+                 workers=None, chunkSize=DEFAULT_CHUNK_SIZE,
+                 queueSize=DEFAULT_QUEUE_SIZE,
+                 maxBatchesPerList=DEFAULT_MAX_BATCHES_PER_LIST,
+                 dependencies=None):
+        if chunkSize < 1 or queueSize < 1 or maxBatchesPerList < 1:
+            raise Exception(
+                'chunkSize, queueSize and maxBatchesPerList must be at '
+                'least 1')
+        context = create_context('secp256k1')
+        self._publicKeys = set(
+            context.get_public_key(
+                Secp256k1PrivateKey.from_hex(privateKey)).as_hex()
+            for privateKey in privateKeys)
+        if batcherPublicKey is not None and \
+                batcherPublicKey not in self._publicKeys:
+            raise Exception('No private key for the batcher')
+        self._client = client
+        self._batcherPublicKey = batcherPublicKey
+        self._workers = workers or os.cpu_count() or 1
+        self._chunkSize = chunkSize
+        self._maxBatchesPerList = maxBatchesPerList
+        self._dependencies = dependencies if dependencies is not None else \
+            client.dependencies
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_load_signers, initargs=(list(privateKeys),))
+        # Sends the chunks that wait on others, one at a time in order.
+        self._waiter = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._queue = queue.Queue(queueSize)
+        self._appendLock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        # Provisional id -> (chunk, position) of operations not signed.
+        self._unsigned = {}
+        self._chunk = None
+        self._inFlight = 0
+        self._closed = False
+        # Set when a worker becomes idle, for operations waiting on one.
+        self._idle = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop,
+                                         name='shipment-flusher',
+                                         daemon=True)
+        self._submitter = threading.Thread(target=self._submit_loop,
+                                           name='shipment-submitter',
+                                           daemon=True)
+        self._flusher.start()
+        self._submitter.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_item(self, signerPublicKey, shipmentID, items, placeName):
+        return self.append(signerPublicKey, "add", shipmentID, items,
+                           placeName)
+
+    def remove_item(self, signerPublicKey, shipmentID, items):
+        return self.append(signerPublicKey, "remove", shipmentID, items)
+
+    def transfer(self, signerPublicKey, shipmentID, placeTo,
+                 placeToPublicKey):
+        return self.append(signerPublicKey, "transfer", shipmentID, placeTo,
+                           placeToPublicKey)
+
+    def append(self, signerPublicKey, action, *values):
+        '''Queue one operation for signing and return the Future of its
+           batch id.'''
+        publicKey = signerPublicKey or self._batcherPublicKey
+        if publicKey not in self._publicKeys:
+            raise Exception('No private key for {}'.format(publicKey))
+        keys = ordering_keys(action, publicKey, *values)
+        future = concurrent.futures.Future()
+        with self._appendLock:
+            if self._closed:
+                raise Exception('The signing pipeline is closed')
+            if self._chunk is None:
+                self._chunk = _Chunk()
+            chunk = self._chunk
+            provisionalId = 'unsigned-{}'.format(next(self._counter))
+            dependencies = []
+            with self._lock:
+                for dependency in self._dependencies.dependencies(keys):
+                    owner = self._unsigned.get(dependency)
+                    if owner is None:
+                        dependencies.append(dependency)
+                    elif owner[0] is chunk:
+                        dependencies.append(owner[1])
+                    else:
+                        chunk.after.add(owner[0])
+                        dependencies.append(owner)
+                self._dependencies.record(provisionalId, keys)
+                self._unsigned[provisionalId] = \
+                    (chunk, len(chunk.operations))
+            chunk.operations.append(
+                (publicKey, self._batcherPublicKey or publicKey, action,
+                 values, dependencies))
+            chunk.provisionalIds.append(provisionalId)
+            chunk.futures.append(future)
+            if self._has_idle_worker() or \
+                    len(chunk.operations) >= self._chunkSize:
+                self._send_chunk()
+        return future
+
+    def flush(self):
+        '''Send the operations appended so far to the pool.'''
+        with self._appendLock:
+            if self._chunk is not None:
+                self._send_chunk()
+
+    def close(self):
+        '''Sign and post everything appended, then stop the workers.'''
+        with self._appendLock:
+            if self._closed:
+                return
+            if self._chunk is not None:
+                self._send_chunk()
+            self._closed = True
+            self._queue.put(_STOP)
+        self._idle.set()
+        self._flusher.join()
+        self._submitter.join()
+        self._waiter.shutdown()
+        self._pool.shutdown()
+
+    def _send_chunk(self):
+        chunk, self._chunk = self._chunk, None
+        with self._lock:
+            self._inFlight += 1
+        if all(earlier.dispatched.is_set() and earlier.signing.done()
+               for earlier in chunk.after):
+            self._dispatch(chunk)
+        else:
+            self._waiter.submit(self._dispatch, chunk)
+        # Blocks while the submitter is queueSize chunks behind.
+        self._queue.put(chunk)
+
+    def _dispatch(self, chunk):
+        operations = [
+            operation[:4] + ([self._resolve(dependency)
+                              for dependency in operation[4]],)
+            for operation in chunk.operations]
+        try:
+            chunk.signing = self._pool.submit(_sign_chunk, operations)
+        except Exception as err:
+            chunk.signing = concurrent.futures.Future()
+            chunk.signing.set_exception(err)
+        chunk.signing.add_done_callback(self._on_signed)
+        chunk.dispatched.set()
+
+    def _has_idle_worker(self):
+        with self._lock:
+            return self._inFlight < self._workers
+
+    def _on_signed(self, _):
+        with self._lock:
+            self._inFlight -= 1
+        self._idle.set()
+
+    def _flush_loop(self):
+        # Sends the open chunk once a worker is idle, so operations do
+        # not wait for a full chunk while nothing else is appended.
+        while True:
+            self._idle.wait()
+            self._idle.clear()
+            with self._appendLock:
+                if self._closed:
+                    return
+                if self._chunk is not None and self._has_idle_worker():
+                    self._send_chunk()
+
+    @staticmethod
+    def _resolve(dependency):
+        if not isinstance(dependency, tuple):
+            return dependency
+        earlier, position = dependency
+        earlier.dispatched.wait()
+        try:
+            return earlier.signing.result()[position][0]
+        except Exception:
+            return None
+
+    def _submit_loop(self):
+        ready = []
+        while True:
+            chunk = self._queue.get()
+            if chunk is _STOP:
+                self._post(ready)
+                return
+            chunk.dispatched.wait()
+            try:
+                signed = chunk.signing.result()
+            except Exception as err:
+                LOGGER.warning('Could not sign %s operations: %s',
+                               len(chunk.operations), err)
+                self._drop(chunk.provisionalIds)
+                for future in chunk.futures:
+                    future.set_exception(err)
+                continue
+            with self._lock:
+                for provisionalId, future, operation in zip(
+                        chunk.provisionalIds, chunk.futures, signed):
+                    transactionId, batchId, data = operation
+                    del self._unsigned[provisionalId]
+                    if transactionId is None:
+                        self._dependencies.forget([provisionalId])
+                        future.set_exception(Exception(data))
+                        continue
+                    self._dependencies.rename(provisionalId, transactionId)
+                    self._dependencies.add_batch(batchId, [transactionId])
+                    ready.append((operation, future))
+            while len(ready) >= self._maxBatchesPerList:
+                self._post(ready[:self._maxBatchesPerList])
+                ready = ready[self._maxBatchesPerList:]
+            if self._queue.empty():
+                self._post(ready)
+                ready = []
+
+    def _drop(self, provisionalIds):
+        with self._lock:
+            self._dependencies.forget(provisionalIds)
+            for provisionalId in provisionalIds:
+                self._unsigned.pop(provisionalId, None)
+
+    def _post(self, ready):
+        if not ready:
+            return
+        # Serialized messages concatenate into their merge, so the
+        # BatchLists of one batch each join into one BatchList.
+        data = b''.join(operation[2] for operation, _ in ready)
+        try:
+            self._client.post_batch_list(data)
+        except Exception as err:
+            # Later operations must not wait on what was not posted.
+            self._dependencies.forget(
+                [operation[0] for operation, _ in ready])
+            for _, future in ready:
+                future.set_exception(err)
+            return
+        for operation, future in ready:
+            future.set_result(operation[1])
@@ -0,0 +1,368 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Read side of the shipment state layout and record encoding.
+
+The layout and encoding are described in processor/shipment_state.py;
+the two modules must stay in sync.  Pickled entries written by earlier
+releases are decoded without allowing any globals, so data read from the
+REST API can never execute code.
+'''
+
+import functools
+import hashlib
+import io
+import pickle
+import struct
+
+FAMILY_NAME = 'shipment'
+
+KIND_PLACE_INDEX = '00'
+KIND_SHIPMENT = '01'
+KIND_ITEM_TOTAL = '02'
+KIND_GLOBAL_ITEM_TOTAL = '03'
+KIND_PATH = '04'
+
+# Hops per path chunk.
+PATH_CHUNK_HOPS = 64
+
+
+def _hash(data):
+    '''Compute the SHA-512 hash and return the result as hex characters.'''
+    return hashlib.sha512(data).hexdigest()
+
+
+NAMESPACE = _hash(FAMILY_NAME.encode('utf-8'))[0:6]
+
+
+# Derived addresses are reused by every operation of a place.
+@functools.lru_cache(maxsize=4096)
+def _place_part(public_key):
+    return _hash(public_key.encode('utf-8'))[0:30]
+
+
+def make_place_part(public_key):
+    '''The part of every layout 2 address of a place that names the place.'''
+    return _place_part(public_key)
+
+
+def address_place_part(address):
+    '''Return the place part of a layout 2 address.'''
+    return address[len(NAMESPACE) + 2:len(NAMESPACE) + 32]
+
+
+def make_legacy_address(public_key):
+    '''Address of the layout 1 place state (one blob for every shipment).'''
+    return NAMESPACE + _hash(public_key.encode('utf-8'))[0:64]
+
+
+def make_place_index_address(public_key):
+    '''Address of the index listing the shipments held by a place.'''
+    return NAMESPACE + KIND_PLACE_INDEX + _place_part(public_key) + '0' * 32
+
+
+def make_shipment_prefix(public_key):
+    '''Address prefix shared by every shipment held by a place.'''
+    return NAMESPACE + KIND_SHIPMENT + _place_part(public_key)
+
+
+def make_shipment_address(public_key, shipment_id):
+    '''Address of a single shipment held by a place.'''
+    return make_shipment_prefix(public_key) + \
+        _hash(shipment_id.encode('utf-8'))[0:32]
+
+
+def make_item_total_prefix(public_key):
+    '''Address prefix shared by every item total of a place.'''
+    return NAMESPACE + KIND_ITEM_TOTAL + _place_part(public_key)
+
+
+def make_item_total_address(public_key, item):
+    '''Address of the total of one item at a place, or across all places
+    when public_key is None.'''
+    if public_key is None:
+        prefix = make_global_item_total_prefix()
+    else:
+        prefix = make_item_total_prefix(public_key)
+    return prefix + _hash(item.encode('utf-8'))[0:32]
+
+
+def make_global_item_total_prefix():
+    '''Address prefix shared by every item total across all places.'''
+    return NAMESPACE + KIND_GLOBAL_ITEM_TOTAL + '0' * 30
+
+
+def make_path_prefix(shipment_id):
+    '''Address prefix shared by the paths of every shipment with an ID.'''
+    return NAMESPACE + KIND_PATH + _hash(shipment_id.encode('utf-8'))[0:30]
+
+
+def make_path_root_address(shipment_id):
+    '''Address of the count of paths started for a shipment ID.'''
+    return make_path_prefix(shipment_id) + '0' * 32
+
+
+def make_path_chunk_address(shipment_id, history, chunk):
+    '''Address of one chunk of the path of a shipment.'''
+    return make_path_prefix(shipment_id) + \
+        '{:016x}{:016x}'.format(history, chunk)
+
+
+def hop_range(start, count, total):
+    '''Return the (begin, end) numbers of count hops from hop start of a
+       path of total hops, a negative start counting from the end.'''
+    begin = max(total + start, 0) if start < 0 else min(start, total)
+    end = total if count is None else min(begin + max(count, 0), total)
+    return begin, end
+
+
+def path_chunk_position(address):
+    '''Return the (history, chunk) numbers of a path address; history 0
+    is the root entry of the shipment ID.'''
+    leaf = address[len(NAMESPACE) + 32:]
+    return int(leaf[:16], 16), int(leaf[16:], 16)
+
+
+STATE_VERSION = 1
+
+RECORD_PLACE_INDEX = 0
+RECORD_SHIPMENT = 1
+RECORD_ITEM_TOTAL = 2
+RECORD_PATH_ROOT = 3
+RECORD_PATH_CHUNK = 4
+RECORD_ROUTED_SHIPMENT = 5
+
+_HEADER = struct.Struct('>BB')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+_PATH_REF = struct.Struct('>II')
+_HOP = struct.Struct('>HQ')
+
+
+class _TableView(object):
+    '''Read-only view of an encoded table inside a record.'''
+
+    __slots__ = ('_buf', '_offsets', '_values', '_heap', '_count')
+
+    def __init__(self, buf, offset):
+        (self._count,) = _U32.unpack_from(buf, offset)
+        self._buf = buf
+        self._offsets = offset + 4
+        self._values = self._offsets + 4 * self._count
+        self._heap = self._values + 8 * self._count
+        if self._heap > len(buf):
+            raise ValueError('Truncated state table')
+
+    def __len__(self):
+        return self._count
+
+    def _key(self, position):
+        (start,) = _U32.unpack_from(self._buf, self._offsets + 4 * position)
+        if position + 1 < self._count:
+            (end,) = _U32.unpack_from(
+                self._buf, self._offsets + 4 * position + 4)
+            end -= 1
+        else:
+            end = len(self._buf) - self._heap
+        return self._buf[self._heap + start:self._heap + end]
+
+    def get(self, key, default=None):
+        '''Binary search for key, touching only the keys on the way.'''
+        target = key.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            found = self._key(middle).tobytes()
+            if found == target:
+                return _U64.unpack_from(
+                    self._buf, self._values + 8 * middle)[0]
+            if found < target:
+                low = middle + 1
+            else:
+                high = middle
+        return default
+
+    def keys(self):
+        if not self._count:
+            return []
+        return str(self._buf[self._heap:], 'utf-8').split('\x00')
+
+    def to_dict(self):
+        values = struct.unpack_from(
+            '>{}Q'.format(self._count), self._buf, self._values)
+        return dict(zip(self.keys(), values))
+
+
+class ShipmentView(object):
+    '''Zero-copy view of an encoded shipment.'''
+
+    __slots__ = ('id', 'path', 'items')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.id = str(buf[offset:offset + length], 'utf-8')
+        offset += length
+        (length,) = _U32.unpack_from(buf, offset)
+        offset += 4
+        self.path = str(buf[offset:offset + length], 'utf-8')
+        self.items = _TableView(buf, offset + length)
+
+    def count(self, item):
+        return self.items.get(item, 0)
+
+    def to_dict(self):
+        return {'id': self.id, 'path': self.path,
+                'items': self.items.to_dict()}
+
+
+class RoutedShipmentView(object):
+    '''Zero-copy view of an encoded shipment whose path is in chunks.'''
+
+    __slots__ = ('id', 'history', 'hops', 'items')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.id = str(buf[offset:offset + length], 'utf-8')
+        offset += length
+        self.history, self.hops = _PATH_REF.unpack_from(buf, offset)
+        self.items = _TableView(buf, offset + _PATH_REF.size)
+
+    def count(self, item):
+        return self.items.get(item, 0)
+
+    def to_dict(self):
+        return {'id': self.id, 'history': self.history, 'hops': self.hops,
+                'items': self.items.to_dict()}
+
+
+class PathRootView(object):
+    '''View of the count of paths started for a shipment ID.'''
+
+    __slots__ = ('id', 'histories')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.id = str(buf[offset:offset + length], 'utf-8')
+        (self.histories,) = _U32.unpack_from(buf, offset + length)
+
+    def to_dict(self):
+        return {'id': self.id, 'histories': self.histories}
+
+
+class PathChunkView(object):
+    '''View of one chunk of a path.'''
+
+    __slots__ = ('id', '_buf', '_hops', '_count', '_names')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.id = str(buf[offset:offset + length], 'utf-8')
+        offset += length
+        (self._count,) = _U16.unpack_from(buf, offset)
+        self._buf = buf
+        self._hops = offset + 2
+        self._names = self._hops + _HOP.size * self._count
+        if self._names > len(buf):
+            raise ValueError('Truncated path chunk')
+
+    def __len__(self):
+        return self._count
+
+    def hops(self):
+        '''Return the (place, time) hops of the chunk, in order.'''
+        names = str(self._buf[self._names:], 'utf-8').split('\x00')
+        return [(names[number], time) for number, time in
+                _HOP.iter_unpack(self._buf[self._hops:self._names])]
+
+    def to_dict(self):
+        return {'id': self.id, 'hops': self.hops()}
+
+
+class PlaceIndexView(object):
+    '''Zero-copy view of an encoded place index.'''
+
+    __slots__ = ('place', 'shipments')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.place = str(buf[offset:offset + length], 'utf-8')
+        self.shipments = _TableView(buf, offset + length)
+
+    def __contains__(self, shipment_id):
+        return self.shipments.get(shipment_id) is not None
+
+    def to_dict(self):
+        return {'place': self.place, 'shipments': self.shipments.keys()}
+
+
+class ItemTotalView(object):
+    '''View of an encoded item total.'''
+
+    __slots__ = ('item', 'total')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.item = str(buf[offset:offset + length], 'utf-8')
+        (self.total,) = _U64.unpack_from(buf, offset + length)
+
+    def to_dict(self):
+        return {'item': self.item, 'total': self.total}
+
+
+_VIEWS = {
+    RECORD_SHIPMENT: ShipmentView,
+    RECORD_PLACE_INDEX: PlaceIndexView,
+    RECORD_ITEM_TOTAL: ItemTotalView,
+    RECORD_PATH_ROOT: PathRootView,
+    RECORD_PATH_CHUNK: PathChunkView,
+    RECORD_ROUTED_SHIPMENT: RoutedShipmentView,
+}
+
+
+class _NoGlobalsUnpickler(pickle.Unpickler):
+    '''Unpickler for migrating old state: plain containers only.'''
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(
+            'Refusing to load {}.{} from state'.format(module, name))
+
+
+def view_record(data):
+    '''Return a view over an encoded entry without decoding it.'''
+    buf = memoryview(data)
+    version, kind = _HEADER.unpack_from(buf, 0)
+    if version != STATE_VERSION or kind not in _VIEWS:
+        raise ValueError(
+            'Unsupported state record {}/{}'.format(version, kind))
+    return _VIEWS[kind](buf)
+
+
+def decode_record(data):
+    '''Decode a state entry into a dict.
+
+    Entries still pickled by earlier releases are accepted so state can be
+    migrated in place; they are rewritten in the canonical encoding the
+    next time they change.
+    '''
+    if data[:1] == b'\x80':
+        value = _NoGlobalsUnpickler(io.BytesIO(data)).load()
+        value.pop('version', None)
+        return value
+    return view_record(data).to_dict()
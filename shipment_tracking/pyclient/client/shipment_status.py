@@ -0,0 +1,207 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Commit tracking and backpressure for submitted batches.
+
+The REST API accepts a batch long before the validator commits it.  The
+BatchStatusTracker polls /batch_statuses for many batch IDs per request
+and resolves one future per batch once it is COMMITTED or INVALID, while
+Backpressure slows submission down whenever the validator queue is full.
+'''
+
+import collections
+import concurrent.futures
+import json
+import threading
+import time
+import urllib.parse
+
+COMMITTED = 'COMMITTED'
+INVALID = 'INVALID'
+PENDING = 'PENDING'
+UNKNOWN = 'UNKNOWN'
+
+FINAL_STATUSES = (COMMITTED, INVALID)
+
+DEFAULT_POLL_INTERVAL = 0.25
+DEFAULT_MAX_IDS_PER_REQUEST = 100
+DEFAULT_TRACK_TIMEOUT = 300
+
+BatchStatus = collections.namedtuple(
+    'BatchStatus', ['id', 'status', 'invalidTransactions'])
+
+
+class QueueFullError(Exception):
+    '''The REST API answered 429: the validator queue is full.'''
+
+
+def parse_batch_ids(responseText):
+    '''Return the batch IDs named by the link of a POST /batches response.'''
+    link = json.loads(responseText)['link']
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(link).query)
+    return [batchId for ids in query.get('id', [])
+            for batchId in ids.split(',') if batchId]
+
+
+def parse_batch_statuses(responseText):
+    '''Decode a /batch_statuses response into BatchStatus tuples.'''
+    return [BatchStatus(entry['id'], entry['status'],
+                        entry.get('invalid_transactions', []))
+            for entry in json.loads(responseText)['data']]
+
+
+class Backpressure(object):
+    '''Adaptive delay between submissions.
+
+    Every QUEUE_FULL reply doubles the delay, up to maxDelay, and every
+    accepted submission shrinks it again, so callers settle at the
+    highest rate the validator sustains.
+    '''
+
+    def __init__(self, initialDelay=0.05, maxDelay=5.0, recovery=0.8):
+        self._initialDelay = initialDelay
+        self._maxDelay = maxDelay
+        self._recovery = recovery
+        self._lock = threading.Lock()
+        self.delay = 0.0
+        self.rejections = 0
+
+    def on_queue_full(self):
+        with self._lock:
+            self.rejections += 1
+            self.delay = min(self._maxDelay,
+                             max(self._initialDelay, self.delay * 2))
+
+    def on_accepted(self):
+        with self._lock:
+            self.delay *= self._recovery
+            if self.delay < self._initialDelay / 10:
+                self.delay = 0.0
+
+    def wait(self):
+        if self.delay:
+            time.sleep(self.delay)
+
+
+class BatchStatusTracker(object):
+    '''Resolve a future per batch once the validator has decided on it.
+
+    Futures resolve to a BatchStatus with status COMMITTED or INVALID, or
+    UNKNOWN if the batch is still not final after timeout seconds.
+    onUpdate, when given to track(), is also called with every PENDING
+    status seen along the way.  Given dependencies, a DependencyTracker,
+    each batch is released from it as its future resolves, so no later
+    transaction depends on a batch that is decided or given up on.
+    Polling happens on a background thread that exits when nothing is
+    left to track.
+    '''
+
+    def __init__(self, client, pollInterval=DEFAULT_POLL_INTERVAL,
+                 maxIdsPerRequest=DEFAULT_MAX_IDS_PER_REQUEST,
+                 timeout=DEFAULT_TRACK_TIMEOUT, dependencies=None):
+        self._client = client
+        self._pollInterval = pollInterval
+        self._maxIdsPerRequest = maxIdsPerRequest
+        self._timeout = timeout
+        self._dependencies = dependencies
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+
+    def track(self, batchIds, onUpdate=None, timeout=None):
+        '''Start tracking batchIds and return their futures in order.
+
+           The futures resolve to UNKNOWN after timeout seconds, or the
+           timeout of the tracker; a batch already tracked takes the new
+           deadline.
+        '''
+        deadline = time.monotonic() + \
+            (self._timeout if timeout is None else timeout)
+        futures = []
+        with self._lock:
+            for batchId in batchIds:
+                entry = self._pending.get(batchId)
+                if entry is None:
+                    entry = [concurrent.futures.Future(), deadline, []]
+                    self._pending[batchId] = entry
+                elif timeout is not None:
+                    entry[1] = deadline
+                if onUpdate is not None:
+                    entry[2].append(onUpdate)
+                futures.append(entry[0])
+            if self._thread is None and self._pending:
+                self._thread = threading.Thread(
+                    target=self._run, name='batch-status', daemon=True)
+                self._thread.start()
+        return futures
+
+    def track_responses(self, responses, onUpdate=None, timeout=None):
+        '''Track every batch named by the given POST /batches responses.'''
+        return self.track(
+            [batchId for response in responses
+             for batchId in parse_batch_ids(response)],
+            onUpdate, timeout)
+
+    def wait(self, futures, timeout=None):
+        '''Block until the futures resolve and return their statuses.'''
+        done, _ = concurrent.futures.wait(futures, timeout)
+        return [future.result() if future in done
+                else None for future in futures]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                batchIds = list(self._pending)
+                if not batchIds:
+                    self._thread = None
+                    return
+            for start in range(0, len(batchIds), self._maxIdsPerRequest):
+                chunk = batchIds[start:start + self._maxIdsPerRequest]
+                try:
+                    statuses = self._client.get_batch_statuses(chunk)
+                except Exception:
+                    # Transient REST errors: try again on the next round.
+                    continue
+                self._update(statuses)
+            self._expire()
+            time.sleep(self._pollInterval)
+
+    def _update(self, statuses):
+        for batchStatus in statuses:
+            with self._lock:
+                entry = self._pending.get(batchStatus.id)
+                if entry is not None and \
+                        batchStatus.status in FINAL_STATUSES:
+                    del self._pending[batchStatus.id]
+            if entry is None:
+                continue
+            for onUpdate in entry[2]:
+                onUpdate(batchStatus)
+            if batchStatus.status in FINAL_STATUSES:
+                self._resolve(entry, batchStatus)
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [(batchId, entry)
+                       for batchId, entry in self._pending.items()
+                       if entry[1] < now]
+            for batchId, _ in expired:
+                del self._pending[batchId]
+        for batchId, entry in expired:
+            self._resolve(entry, BatchStatus(batchId, UNKNOWN, []))
+
+    def _resolve(self, entry, batchStatus):
+        if self._dependencies is not None:
+            self._dependencies.release([batchStatus.id])
+        entry[0].set_result(batchStatus)
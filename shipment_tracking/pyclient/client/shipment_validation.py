@@ -0,0 +1,78 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Local check of the rules the transaction processor enforces.
+
+The rules are described in processor/shipment_validation.py; the two
+modules must stay in sync.  Checking them before signing saves a round
+through consensus for an operation that would only be rejected.  The
+state checked may be stale, so passing does not guarantee the validator
+accepts the operation.
+'''
+
+REASON_NOT_FOUND = 'shipment_not_found'
+REASON_LOW_BALANCE = 'insufficient_items'
+REASON_SELF_TRANSFER = 'transfer_to_self'
+REASON_AT_DESTINATION = 'shipment_at_destination'
+
+
+class ValidationError(Exception):
+    '''The operation would be rejected by the transaction processor.'''
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+def requested_counts(items):
+    '''Sum the counts of (name, count) pairs per item name.'''
+    counts = {}
+    for item, count in items:
+        counts[item] = counts.get(item, 0) + count
+    return counts
+
+
+def check_remove(shipment, shipmentID, items):
+    '''Raise ValidationError unless the items can leave the shipment.'''
+    if shipment is None:
+        raise ValidationError(
+            'Shipment {} not found'.format(shipmentID), REASON_NOT_FOUND)
+    for item, count in requested_counts(items).items():
+        if item not in shipment['items']:
+            raise ValidationError(
+                'Shipment {} does not hold item {}'.format(shipmentID, item),
+                REASON_NOT_FOUND)
+        held = shipment['items'][item]
+        if held < count:
+            raise ValidationError(
+                'Shipment {} holds {} of item {}, cannot remove {}'.format(
+                    shipmentID, held, item, count), REASON_LOW_BALANCE)
+
+
+def check_transfer(shipment, shipmentID, fromKey, toKey, arrived):
+    '''Raise ValidationError unless the place holds the shipment and
+    sends it to another place, which holds no shipment of the same ID.
+
+    arrived is the shipment of that ID the destination holds, if any.
+    '''
+    if shipment is None:
+        raise ValidationError(
+            'Shipment {} not found'.format(shipmentID), REASON_NOT_FOUND)
+    if toKey == fromKey:
+        raise ValidationError(
+            'Shipment {} is already at the destination'.format(shipmentID),
+            REASON_SELF_TRANSFER)
+    if arrived is not None:
+        raise ValidationError(
+            'The destination already holds a shipment {}'.format(shipmentID),
+            REASON_AT_DESTINATION)
@@ -0,0 +1,587 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Local materialized view of the shipment namespace, kept up to date from
+the events of the shipment transaction processor.
+
+The view is a SQLite database, in memory or in a file, that answers the
+queries of the CLI without a request to the REST API:
+
+    view = ShipmentView('shipments.db')
+    EventSubscriber(view, client).run()       # in a thread or process
+    view.get_item_count('apple', publicKey)
+
+It starts from a snapshot of state at the chain head.  Every block
+committed after that is applied in one SQLite transaction together with
+its id, so a restarted subscriber asks the validator for the blocks
+after the last one it applied.  Each change is journaled with the value
+it replaced for the last JOURNAL_DEPTH blocks: a fork that replaces
+applied blocks is rolled back to the common block, and a deeper one
+rebuilds the view from a new snapshot.
+'''
+
+import contextlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+import zmq
+
+from sawtooth_sdk.protobuf.client_event_pb2 import \
+    ClientEventsSubscribeRequest
+from sawtooth_sdk.protobuf.client_event_pb2 import \
+    ClientEventsSubscribeResponse
+from sawtooth_sdk.protobuf.client_event_pb2 import \
+    ClientEventsUnsubscribeRequest
+from sawtooth_sdk.protobuf.events_pb2 import EventList
+from sawtooth_sdk.protobuf.events_pb2 import EventSubscription
+from sawtooth_sdk.protobuf.network_pb2 import PingResponse
+from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+from client.shipment_events import BLOCK_COMMIT
+from client.shipment_events import EVENT_ADD
+from client.shipment_events import EVENT_ADD_MANY
+from client.shipment_events import EVENT_REMOVE
+from client.shipment_events import EVENT_TRANSFER
+from client.shipment_events import EVENT_TRANSFER_MANY
+from client.shipment_events import EVENT_TYPES
+from client.shipment_events import decode_add_many
+from client.shipment_events import decode_items
+from client.shipment_events import decode_transfer_many
+from client.shipment_events import event_attributes
+from client.shipment_export import DEFAULT_PAGE_SIZE
+from client.shipment_export import iter_namespace
+from client.shipment_state import address_place_part
+from client.shipment_state import make_place_part
+from client.shipment_state import path_chunk_position
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_VALIDATOR_URL = 'tcp://validator:4004'
+
+# Blocks that can be rolled back when the chain forks.
+JOURNAL_DEPTH = 100
+
+# Seconds to wait for the validator to answer a request.
+DEFAULT_TIMEOUT = 10
+
+# Seconds without any block before subscribing again, in case the
+# validator dropped the connection without the socket noticing.
+DEFAULT_IDLE_TIMEOUT = 60
+
+MIN_RETRY_DELAY = 1
+MAX_RETRY_DELAY = 30
+
+# Item totals across all places are kept under this place part.
+_ALL_PLACES = ''
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS places (
+    place TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS shipments (
+    place TEXT, id TEXT, path TEXT NOT NULL, PRIMARY KEY (place, id));
+CREATE INDEX IF NOT EXISTS shipments_by_id ON shipments (id);
+CREATE TABLE IF NOT EXISTS items (
+    place TEXT, id TEXT, item TEXT, count INTEGER NOT NULL,
+    PRIMARY KEY (place, id, item));
+CREATE TABLE IF NOT EXISTS totals (
+    place TEXT, item TEXT, total INTEGER NOT NULL,
+    PRIMARY KEY (place, item));
+CREATE TABLE IF NOT EXISTS blocks (
+    num INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, previous TEXT);
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, block INTEGER NOT NULL,
+    change TEXT NOT NULL);
+'''
+
+
+class _Table(object):
+    '''SQL of a table holding one value per key.'''
+
+    def __init__(self, name, keys, column):
+        where = ' AND '.join('{} = ?'.format(key) for key in keys)
+        self.select = 'SELECT {} FROM {} WHERE {}'.format(column, name, where)
+        self.delete = 'DELETE FROM {} WHERE {}'.format(name, where)
+        self.upsert = 'INSERT OR REPLACE INTO {} ({}, {}) VALUES ({})'.format(
+            name, ', '.join(keys), column, ', '.join('?' * (len(keys) + 1)))
+
+
+_TABLES = {
+    'places': _Table('places', ('place',), 'name'),
+    'shipments': _Table('shipments', ('place', 'id'), 'path'),
+    'items': _Table('items', ('place', 'id', 'item'), 'count'),
+    'totals': _Table('totals', ('place', 'item'), 'total'),
+}
+
+
+class ShipmentView(object):
+    '''SQLite view of shipments, their items and paths, and item totals.
+
+    Places are passed as public keys, as to ShipmentClient, and stored as
+    the place part of their addresses.  The view may be shared between
+    threads.
+    '''
+
+    def __init__(self, path=':memory:'):
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._lock = threading.RLock()
+        if path != ':memory:':
+            # Readers in other processes are not blocked by the subscriber.
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+        self._block = None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def head(self):
+        '''Return (block id, block number) of the last block applied, or
+           None before the view was loaded.'''
+        with self._lock:
+            return self._db.execute(
+                'SELECT id, num FROM blocks ORDER BY num DESC LIMIT 1'
+            ).fetchone()
+
+    def recent_block_ids(self):
+        '''Return the ids of the blocks that can be rolled back to, newest
+           first.'''
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                'SELECT id FROM blocks ORDER BY num DESC')]
+
+    def load_snapshot(self, records, blockId, blockNum):
+        '''Replace the view with state at a block.
+
+           records are (address, kind, record) entries of the namespace, as
+           yielded by iter_namespace().  Layout 1 place blobs are left out,
+           as they are by the queries of ShipmentClient; their shipments
+           appear once the place is migrated.  Paths kept in chunks are
+           joined back into the path column.
+        '''
+        # (shipment ID, history) -> [(place, hops)] and {chunk: hops}
+        routed = {}
+        chunks = {}
+        with self._transaction() as db:
+            for table in tuple(_TABLES) + ('blocks', 'journal'):
+                db.execute('DELETE FROM {}'.format(table))
+            for address, kind, record in records:
+                if kind == 'shipment':
+                    place = address_place_part(address)
+                    if 'path' in record:
+                        path = record['path']
+                    else:
+                        path = ''
+                        routed.setdefault(
+                            (record['id'], record['history']), []).append(
+                                (place, record['hops']))
+                    db.execute(_TABLES['shipments'].upsert,
+                               (place, record['id'], path))
+                    db.executemany(
+                        _TABLES['items'].upsert,
+                        ((place, record['id'], item, count)
+                         for item, count in record['items'].items()))
+                elif kind == 'place_index':
+                    db.execute(_TABLES['places'].upsert,
+                               (address_place_part(address), record['place']))
+                elif kind == 'item_total':
+                    db.execute(_TABLES['totals'].upsert,
+                               (address_place_part(address), record['item'],
+                                record['total']))
+                elif kind == 'global_item_total':
+                    db.execute(_TABLES['totals'].upsert,
+                               (_ALL_PLACES, record['item'], record['total']))
+                elif kind == 'path' and 'hops' in record:
+                    history, chunk = path_chunk_position(address)
+                    chunks.setdefault((record['id'], history), {})[chunk] = \
+                        [place for place, _ in record['hops']]
+            for key, holders in routed.items():
+                names = [name for _, hops in
+                         sorted(chunks.get(key, {}).items()) for name in hops]
+                for place, hops in holders:
+                    db.execute(_TABLES['shipments'].upsert,
+                               (place, key[0], '->'.join(names[:hops])))
+            db.execute('INSERT INTO blocks (num, id, previous) '
+                       'VALUES (?, ?, NULL)', (blockNum, blockId))
+
+    def apply_block(self, blockId, blockNum, previousId, events):
+        '''Apply the shipment events of a committed block.
+
+           A block that does not follow the last one applied rolls the view
+           back to its previous block first.  Returns False, changing
+           nothing, when that block is not known: the view must then be
+           loaded again.
+        '''
+        with self._transaction() as db:
+            if self._rollback_to(db, blockId):
+                # Seen before, from a subscription catching up.
+                return True
+            tip = db.execute('SELECT id FROM blocks ORDER BY num DESC LIMIT 1'
+                             ).fetchone()
+            if tip is None or tip[0] != previousId:
+                if not self._rollback_to(db, previousId):
+                    return False
+                LOGGER.info('Chain fork: rolled the view back to block %s',
+                            previousId)
+            db.execute('INSERT INTO blocks (num, id, previous) '
+                       'VALUES (?, ?, ?)', (blockNum, blockId, previousId))
+            self._block = blockNum
+            for event in events:
+                self._apply_event(db, event)
+            db.execute('DELETE FROM journal WHERE block <= ?',
+                       (blockNum - JOURNAL_DEPTH,))
+            db.execute('DELETE FROM blocks WHERE num <= ?',
+                       (blockNum - JOURNAL_DEPTH,))
+        return True
+
+    def _rollback_to(self, db, blockId):
+        '''Undo every block after blockId; False if it is not known.'''
+        row = db.execute('SELECT num FROM blocks WHERE id = ?',
+                         (blockId,)).fetchone()
+        if row is None:
+            return False
+        changes = db.execute(
+            'SELECT change FROM journal WHERE block > ? ORDER BY seq DESC',
+            (row[0],)).fetchall()
+        for (change,) in changes:
+            table, key, value = json.loads(change)
+            self._store(db, table, key, value)
+        db.execute('DELETE FROM journal WHERE block > ?', (row[0],))
+        db.execute('DELETE FROM blocks WHERE num > ?', (row[0],))
+        return True
+
+    def _apply_event(self, db, event):
+        attributes = event_attributes(event)
+        if event.event_type == EVENT_ADD_MANY:
+            for shipmentId, items in decode_add_many(event.data):
+                self._on_add(db, dict(attributes, shipment_id=shipmentId),
+                             items)
+            return
+        if event.event_type == EVENT_TRANSFER_MANY:
+            for moved in decode_transfer_many(event.data):
+                items = moved.pop('items')
+                self._on_transfer(db, dict(attributes, **moved), items)
+            return
+        items = decode_items(event.data)
+        if event.event_type == EVENT_ADD:
+            self._on_add(db, attributes, items)
+        elif event.event_type == EVENT_REMOVE:
+            self._on_remove(db, attributes, items)
+        elif event.event_type == EVENT_TRANSFER:
+            self._on_transfer(db, attributes, items)
+
+    def _on_add(self, db, attributes, items):
+        place = make_place_part(attributes['place_key'])
+        shipmentId = attributes['shipment_id']
+        path = attributes.get('path')
+        if path is None:
+            if self._get(db, 'shipments', (place, shipmentId)) is None:
+                self._write(db, 'shipments', (place, shipmentId),
+                            attributes['place'])
+                self._name_place(db, place, attributes['place'])
+            for item, count in items.items():
+                self._adjust(db, 'items', (place, shipmentId, item), count)
+                self._adjust_totals(db, place, item, count)
+            return
+        # A shipment brought over by migrate: its items replace any held.
+        self._name_place(db, place, path.split('->')[-1])
+        self._write(db, 'shipments', (place, shipmentId), path)
+        held = self._shipment_items(db, place, shipmentId)
+        for item in set(held) | set(items):
+            self._write(db, 'items', (place, shipmentId, item),
+                        items.get(item))
+            self._adjust_totals(db, place, item,
+                                items.get(item, 0) - held.get(item, 0))
+
+    def _on_remove(self, db, attributes, items):
+        place = make_place_part(attributes['place_key'])
+        shipmentId = attributes['shipment_id']
+        for item, count in items.items():
+            self._adjust(db, 'items', (place, shipmentId, item), -count)
+            self._adjust_totals(db, place, item, -count)
+
+    def _on_transfer(self, db, attributes, items):
+        shipmentId = attributes['shipment_id']
+        placeFrom = make_place_part(attributes['from_key'])
+        placeTo = make_place_part(attributes['to_key'])
+        path = attributes.get('path')
+        if path is None:
+            # Events carry the new hop only, the path grows here.
+            held = self._get(db, 'shipments', (placeFrom, shipmentId))
+            path = attributes['place_to'] if held is None else \
+                held + '->' + attributes['place_to']
+        self._write(db, 'shipments', (placeFrom, shipmentId), None)
+        for item in self._shipment_items(db, placeFrom, shipmentId):
+            self._write(db, 'items', (placeFrom, shipmentId, item), None)
+        self._write(db, 'shipments', (placeTo, shipmentId), path)
+        self._name_place(db, placeTo, attributes['place_to'])
+        held = self._shipment_items(db, placeTo, shipmentId)
+        for item in set(held) | set(items):
+            self._write(db, 'items', (placeTo, shipmentId, item),
+                        items.get(item))
+        # Totals only move between the places, as in the processor.
+        for item, count in items.items():
+            self._adjust(db, 'totals', (placeFrom, item), -count, True)
+            self._adjust(db, 'totals', (placeTo, item), count, True)
+
+    def _name_place(self, db, place, name):
+        if self._get(db, 'places', (place,)) is None:
+            self._write(db, 'places', (place,), name)
+
+    def _shipment_items(self, db, place, shipmentId):
+        return dict(db.execute(
+            'SELECT item, count FROM items WHERE place = ? AND id = ?',
+            (place, shipmentId)))
+
+    def _adjust_totals(self, db, place, item, delta):
+        self._adjust(db, 'totals', (place, item), delta, True)
+        self._adjust(db, 'totals', (_ALL_PLACES, item), delta, True)
+
+    def _adjust(self, db, table, key, delta, dropZero=False):
+        if not delta:
+            return
+        value = (self._get(db, table, key) or 0) + delta
+        self._write(db, table, key, None if dropZero and value == 0 else value)
+
+    def _get(self, db, table, key):
+        row = db.execute(_TABLES[table].select, key).fetchone()
+        return None if row is None else row[0]
+
+    def _write(self, db, table, key, value):
+        '''Set the value at key, or delete it for None, journaling the
+           value it replaces.'''
+        old = self._get(db, table, key)
+        if old == value:
+            return
+        db.execute('INSERT INTO journal (block, change) VALUES (?, ?)',
+                   (self._block, json.dumps([table, list(key), old])))
+        self._store(db, table, key, value)
+
+    def _store(self, db, table, key, value):
+        if value is None:
+            db.execute(_TABLES[table].delete, key)
+        else:
+            db.execute(_TABLES[table].upsert, tuple(key) + (value,))
+
+    def get_item_count(self, itemName, publicKey=None):
+        '''Return the total of an item at a place, or at all places.'''
+        place = _ALL_PLACES if publicKey is None else \
+            make_place_part(publicKey)
+        with self._lock:
+            return self._get(self._db, 'totals', (place, itemName)) or 0
+
+    def get_top_items(self, count, publicKey=None):
+        '''Return the count largest (item, total) pairs, largest first.'''
+        place = _ALL_PLACES if publicKey is None else \
+            make_place_part(publicKey)
+        with self._lock:
+            return self._db.execute(
+                'SELECT item, total FROM totals WHERE place = ? '
+                'ORDER BY total DESC LIMIT ?', (place, count)).fetchall()
+
+    def get_shipment(self, publicKey, shipmentId):
+        '''Return a shipment held by a place, or None.'''
+        place = make_place_part(publicKey)
+        with self._lock:
+            path = self._get(self._db, 'shipments', (place, shipmentId))
+            if path is None:
+                return None
+            return {'id': shipmentId, 'path': path,
+                    'items': self._shipment_items(self._db, place, shipmentId)}
+
+    def get_data(self, publicKey):
+        '''Return every shipment held by a place, keyed by shipment ID.'''
+        place = make_place_part(publicKey)
+        with self._lock:
+            data = {shipmentId: {'id': shipmentId, 'path': path, 'items': {}}
+                    for shipmentId, path in self._db.execute(
+                        'SELECT id, path FROM shipments WHERE place = ?',
+                        (place,))}
+            for shipmentId, item, count in self._db.execute(
+                    'SELECT id, item, count FROM items WHERE place = ?',
+                    (place,)):
+                data[shipmentId]['items'][item] = count
+        return data
+
+    def find_shipment(self, shipmentId):
+        '''Return (place name, path) of every place holding a shipment.'''
+        with self._lock:
+            return self._db.execute(
+                'SELECT places.name, shipments.path FROM shipments '
+                'LEFT JOIN places ON places.place = shipments.place '
+                'WHERE shipments.id = ?', (shipmentId,)).fetchall()
+
+
+def bootstrap(view, client, pageSize=DEFAULT_PAGE_SIZE):
+    '''Load the view from a snapshot of state at the chain head.'''
+    blockId, blockNum = client.get_head_block()
+    LOGGER.info('Loading the view from state at block %d (%s)',
+                blockNum, blockId)
+    view.load_snapshot(iter_namespace(client, blockId, pageSize),
+                       blockId, blockNum)
+
+
+class _ConnectionLost(Exception):
+    pass
+
+
+class EventSubscriber(object):
+    '''Keep a ShipmentView up to date with the events of the validator.
+
+    The view is loaded through client, a ShipmentClient, when it is empty
+    or when the chain moved on too far from it.
+    '''
+
+    def __init__(self, view, client, url=DEFAULT_VALIDATOR_URL,
+                 timeout=DEFAULT_TIMEOUT, idleTimeout=DEFAULT_IDLE_TIMEOUT,
+                 pageSize=DEFAULT_PAGE_SIZE):
+        self._view = view
+        self._client = client
+        self._url = url
+        self._timeout = timeout
+        self._idleTimeout = idleTimeout
+        self._pageSize = pageSize
+        self._context = zmq.Context.instance()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        '''Follow the chain until stop() is called, reconnecting after
+           errors.'''
+        delay = MIN_RETRY_DELAY
+        while not self._stopped.is_set():
+            try:
+                if self._view.head() is None:
+                    bootstrap(self._view, self._client, self._pageSize)
+                self._follow()
+                delay = MIN_RETRY_DELAY
+            except (zmq.ZMQError, _ConnectionLost) as err:
+                LOGGER.warning('Lost the validator at %s (%s), subscribing '
+                               'again in %ds', self._url, err, delay)
+                self._stopped.wait(delay)
+                delay = min(MAX_RETRY_DELAY, delay * 2)
+
+    def _follow(self):
+        '''Subscribe and apply blocks until stopped, idle or out of sync.'''
+        socket = self._context.socket(zmq.DEALER)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(self._url)
+        try:
+            if not self._subscribe(socket):
+                bootstrap(self._view, self._client, self._pageSize)
+                return
+            idleSince = time.monotonic()
+            while not self._stopped.is_set():
+                if not socket.poll(500):
+                    if time.monotonic() - idleSince > self._idleTimeout:
+                        return
+                    continue
+                message = Message()
+                message.ParseFromString(socket.recv())
+                if message.message_type == Message.PING_REQUEST:
+                    self._send(socket, Message.PING_RESPONSE, PingResponse(),
+                               message.correlation_id)
+                elif message.message_type == Message.CLIENT_EVENTS:
+                    idleSince = time.monotonic()
+                    if not self._on_events(message.content):
+                        LOGGER.warning('The chain forked further back than '
+                                       'the view keeps, loading it again')
+                        bootstrap(self._view, self._client, self._pageSize)
+                        return
+            self._send(socket, Message.CLIENT_EVENTS_UNSUBSCRIBE_REQUEST,
+                       ClientEventsUnsubscribeRequest())
+        finally:
+            socket.close()
+
+    def _subscribe(self, socket):
+        '''Subscribe from the last block applied; False if the validator
+           knows none of the blocks of the view.'''
+        request = ClientEventsSubscribeRequest(
+            subscriptions=[EventSubscription(event_type=eventType)
+                           for eventType in (BLOCK_COMMIT,) + EVENT_TYPES],
+            last_known_block_ids=self._view.recent_block_ids())
+        correlationId = self._send(
+            socket, Message.CLIENT_EVENTS_SUBSCRIBE_REQUEST, request)
+        response = ClientEventsSubscribeResponse()
+        response.ParseFromString(self._receive(
+            socket, Message.CLIENT_EVENTS_SUBSCRIBE_RESPONSE, correlationId))
+        if response.status == ClientEventsSubscribeResponse.UNKNOWN_BLOCK:
+            LOGGER.warning('The validator knows none of the blocks of the '
+                           'view, loading it again')
+            return False
+        if response.status != ClientEventsSubscribeResponse.OK:
+            raise Exception('Subscription refused: {}'.format(
+                response.response_message))
+        LOGGER.info('Subscribed to %s after block %s', self._url,
+                    self._view.head()[0])
+        return True
+
+    def _send(self, socket, messageType, content, correlationId=None):
+        if correlationId is None:
+            correlationId = uuid.uuid4().hex
+        socket.send(Message(
+            message_type=messageType, correlation_id=correlationId,
+            content=content.SerializeToString()).SerializeToString())
+        return correlationId
+
+    def _receive(self, socket, messageType, correlationId):
+        deadline = time.monotonic() + self._timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not socket.poll(remaining * 1000):
+                raise _ConnectionLost('no answer in {}s'.format(self._timeout))
+            message = Message()
+            message.ParseFromString(socket.recv())
+            if message.message_type == messageType and \
+                    message.correlation_id == correlationId:
+                return message.content
+            if message.message_type == Message.PING_REQUEST:
+                self._send(socket, Message.PING_RESPONSE, PingResponse(),
+                           message.correlation_id)
+
+    def _on_events(self, content):
+        events = EventList()
+        events.ParseFromString(content)
+        commit = None
+        changes = []
+        for event in events.events:
+            if event.event_type == BLOCK_COMMIT:
+                commit = event_attributes(event)
+            else:
+                changes.append(event)
+        if commit is None:
+            return True
+        blockNum = int(commit['block_num'])
+        if not self._view.apply_block(commit['block_id'], blockNum,
+                                      commit['previous_block_id'], changes):
+            return False
+        LOGGER.info('Applied block %d with %d shipment events',
+                    blockNum, len(changes))
+        return True
@@ -0,0 +1,151 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_signing import create_context
+
+from client.shipment_async_client import AsyncShipmentClient
+from client.shipment_client import StateNotFoundError
+from client.shipment_client import make_url
+from client.shipment_loadgen import LocalRestApi
+from client.shipment_status import COMMITTED
+from client.shipment_status import INVALID
+from client.shipment_validation import REASON_AT_DESTINATION
+from client.shipment_validation import REASON_LOW_BALANCE
+from client.shipment_validation import REASON_NOT_FOUND
+from client.shipment_validation import ValidationError
+
+
+class _LocalAsyncClient(AsyncShipmentClient):
+    '''AsyncShipmentClient sending its requests to a LocalRestApi.'''
+
+    def __init__(self, session, keyFile):
+        super().__init__('local', keyFile)
+        self.session = session
+
+    async def _send_to_restapi(self, suffix, data=None, contentType=None):
+        url = make_url('local', suffix)
+        if data is not None:
+            result = self.session.post(url, data=data)
+        else:
+            result = self.session.get(url)
+        if result.status_code == 404 and suffix.startswith("state/"):
+            raise StateNotFoundError("Error 404: {}".format(result.reason))
+        if not result.ok:
+            raise Exception("Error {}: {}".format(
+                result.status_code, result.reason))
+        return result.text
+
+
+class TestAsyncClient(unittest.TestCase):
+
+    def setUp(self):
+        keyDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, keyDir)
+        context = create_context('secp256k1')
+        for name in ('delhi', 'mumbai'):
+            privateKey = context.new_random_private_key()
+            with open(os.path.join(keyDir, name + '.priv'), 'w') as fd:
+                fd.write(privateKey.as_hex())
+            with open(os.path.join(keyDir, name + '.pub'), 'w') as fd:
+                fd.write(context.get_public_key(privateKey).as_hex())
+        self.keyDir = keyDir
+        self.mumbaiKey = os.path.join(keyDir, 'mumbai.pub')
+        self.session = LocalRestApi()
+
+    def run_with(self, name, test):
+        '''Run test(client) with a client of the place name.'''
+        async def run():
+            async with _LocalAsyncClient(
+                    self.session,
+                    os.path.join(self.keyDir, name + '.priv')) as client:
+                return await test(client)
+        return asyncio.run(run())
+
+    async def settle(self, client, *operations):
+        responses = await asyncio.gather(*operations)
+        statuses = await client.wait_for_batches(responses, 5, 0.01)
+        return [batchStatus.status for batchStatus in statuses]
+
+    def assert_rejected(self, reason, operation):
+        with self.assertRaises(ValidationError) as caught:
+            self.run_with('delhi', operation)
+        self.assertEqual(caught.exception.reason, reason)
+
+    def test_concurrent_operations(self):
+        async def test(client):
+            self.assertEqual(await self.settle(client, *(
+                client.add_item('S{}'.format(number), '1', ['apple', '1'],
+                                'Delhi') for number in range(20))),
+                             [COMMITTED] * 20)
+            return await client.get_data()
+        data = self.run_with('delhi', test)
+        self.assertEqual(len(data), 20)
+        self.assertEqual(data['S7']['items'], {'apple': 1})
+
+    def test_remove_is_validated(self):
+        async def add(client):
+            await self.settle(client, client.add_item(
+                'S1', '1', ['apple', '3'], 'Delhi'))
+        self.run_with('delhi', add)
+        self.assert_rejected(REASON_LOW_BALANCE, lambda client:
+                             client.remove_item('S1', '1', ['apple', '4']))
+        self.assert_rejected(REASON_NOT_FOUND, lambda client:
+                             client.remove_item('S2', '1', ['apple', '1']))
+
+        async def unchecked(client):
+            return await self.settle(client, client.remove_item(
+                'S1', '1', ['apple', '4'], validate=False))
+        self.assertEqual(self.run_with('delhi', unchecked), [INVALID])
+
+    def test_in_flight_is_left_to_the_processor(self):
+        async def test(client):
+            await client.add_item('S1', '1', ['apple', '3'], 'Delhi')
+            # Not checked while the add is in flight.
+            return await self.settle(
+                client, client.remove_item('S1', '1', ['apple', '4']))
+        self.assertEqual(self.run_with('delhi', test), [INVALID])
+
+    def test_transfers_are_validated(self):
+        async def add(client):
+            await self.settle(client, client.add_item(
+                'S1', '1', ['apple', '3'], 'Delhi'), client.add_item(
+                    'S2', '1', ['pear', '1'], 'Delhi'))
+        self.run_with('delhi', add)
+
+        async def held(client):
+            await self.settle(client, client.add_item(
+                'S2', '1', ['pear', '2'], 'Mumbai'))
+        self.run_with('mumbai', held)
+
+        self.assert_rejected(REASON_NOT_FOUND, lambda client:
+                             client.transfer('S3', 'Mumbai', self.mumbaiKey))
+        self.assert_rejected(REASON_AT_DESTINATION, lambda client:
+                             client.transfer('S2', 'Mumbai', self.mumbaiKey))
+        self.assert_rejected(REASON_AT_DESTINATION, lambda client:
+                             client.transfer_many(
+                                 [('S1', 'Mumbai', self.mumbaiKey),
+                                  ('S2', 'Mumbai', self.mumbaiKey)]))
+
+        async def move(client):
+            return await self.settle(client, client.transfer_many(
+                [('S1', 'Mumbai', self.mumbaiKey)]))
+        self.assertEqual(self.run_with('delhi', move), [COMMITTED])
+        self.assertEqual(
+            self.run_with('mumbai', lambda client: client.get_shipment('S1'))
+            ['items'], {'apple': 3})
@@ -0,0 +1,97 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from client.shipment_cache import StateCache
+
+
+class _Chain(object):
+    '''Stand-in for the head lookup, counting the requests.'''
+
+    def __init__(self, head='h1'):
+        self.head = head
+        self.requests = 0
+
+    def __call__(self):
+        self.requests += 1
+        return self.head
+
+
+class TestStateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.chain = _Chain()
+        self.cache = StateCache(maxEntries=3, headTtl=3600)
+
+    def test_hit_and_miss(self):
+        head = self.cache.head(self.chain)
+        self.assertEqual(self.cache.get('a', head), (False, None))
+        self.cache.put('a', head, {'total': 1})
+        self.assertEqual(self.cache.get('a', head), (True, {'total': 1}))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_head_checked_once_per_ttl(self):
+        for _ in range(3):
+            self.cache.head(self.chain)
+        self.assertEqual(self.chain.requests, 1)
+
+    def test_invalidate_checks_the_head_again(self):
+        head = self.cache.head(self.chain)
+        self.cache.put('a', head, 1)
+        self.cache.invalidate()
+        # Same head: the entries are still good.
+        self.assertEqual(self.cache.head(self.chain), 'h1')
+        self.assertEqual(self.chain.requests, 2)
+        self.assertEqual(self.cache.get('a', 'h1'), (True, 1))
+
+    def test_new_head_drops_entries(self):
+        self.cache.put('a', self.cache.head(self.chain), 1)
+        self.chain.head = 'h2'
+        self.cache.invalidate()
+        head = self.cache.head(self.chain)
+        self.assertEqual(head, 'h2')
+        self.assertEqual(self.cache.get('a', head), (False, None))
+        self.assertEqual(self.cache.get('a', 'h1'), (False, None))
+
+    def test_entries_of_old_heads_are_not_kept(self):
+        self.cache.head(self.chain)
+        self.cache.put('a', 'h0', 1)
+        self.assertEqual(self.cache.get('a', 'h0'), (False, None))
+
+    def test_expired_ttl(self):
+        cache = StateCache(headTtl=0)
+        cache.head(self.chain)
+        cache.head(self.chain)
+        self.assertEqual(self.chain.requests, 2)
+
+    def test_eviction_by_weight(self):
+        head = self.cache.head(self.chain)
+        self.cache.put('a', head, 1)
+        self.cache.put('b', head, 2)
+        self.cache.get('a', head)
+        self.cache.put('list', head, [3, 4], weight=2)
+        # 'b' was the least recently used.
+        self.assertEqual(self.cache.get('b', head), (False, None))
+        self.assertEqual(self.cache.get('a', head), (True, 1))
+        self.assertEqual(self.cache.get('list', head), (True, [3, 4]))
+        # Too heavy to cache at all.
+        self.cache.put('big', head, [0] * 4, weight=4)
+        self.assertEqual(self.cache.get('big', head), (False, None))
+
+    def test_clear(self):
+        self.cache.put('a', self.cache.head(self.chain), 1)
+        self.cache.clear()
+        self.assertEqual(self.cache.get('a', 'h1'), (False, None))
+        self.cache.head(self.chain)
+        self.assertEqual(self.chain.requests, 2)
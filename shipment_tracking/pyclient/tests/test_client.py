@@ -0,0 +1,154 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_signing import create_context
+
+from client.shipment_client import ShipmentClient
+from client.shipment_loadgen import LocalRestApi
+from client.shipment_validation import REASON_AT_DESTINATION
+from client.shipment_validation import REASON_LOW_BALANCE
+from client.shipment_validation import REASON_NOT_FOUND
+from client.shipment_validation import ValidationError
+
+
+class _HeldRestApi(LocalRestApi):
+    '''LocalRestApi applying the batches posted only once let go.'''
+
+    def __init__(self):
+        super().__init__()
+        self.held = True
+
+    def let_go(self):
+        with self._lock:
+            self.held = False
+            self._apply_ready()
+
+    def _apply_ready(self):
+        if not self.held:
+            super()._apply_ready()
+
+
+class TestInFlightValidation(unittest.TestCase):
+
+    def setUp(self):
+        keyDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, keyDir)
+        context = create_context('secp256k1')
+        for name in ('delhi', 'mumbai'):
+            privateKey = context.new_random_private_key()
+            with open(os.path.join(keyDir, name + '.priv'), 'w') as fd:
+                fd.write(privateKey.as_hex())
+            with open(os.path.join(keyDir, name + '.pub'), 'w') as fd:
+                fd.write(context.get_public_key(privateKey).as_hex())
+        self.keyDir = keyDir
+        self.mumbaiKey = os.path.join(keyDir, 'mumbai.pub')
+        self.session = _HeldRestApi()
+        self.client = ShipmentClient(
+            'local', os.path.join(keyDir, 'delhi.priv'),
+            session=self.session, pollInterval=0.01)
+
+    def assert_rejected(self, reason, operation, *args):
+        with self.assertRaises(ValidationError) as caught:
+            operation(*args)
+        self.assertEqual(caught.exception.reason, reason)
+
+    def settle(self, responses):
+        self.session.let_go()
+        self.client.wait_for_batches(responses, 5)
+
+    def test_remove_follows_the_operations_in_flight(self):
+        responses = [
+            self.client.add_item('S1', '1', ['apple', '3'], 'Delhi'),
+            self.client.remove_item('S1', '1', ['apple', '2'])]
+        self.assert_rejected(REASON_LOW_BALANCE, self.client.remove_item,
+                             'S1', '1', ['apple', '2'])
+        self.assertIsNone(self.client.get_shipment('S1'))
+        self.settle(responses)
+        self.assertEqual(self.client.get_shipment('S1')['items'],
+                         {'apple': 1})
+        self.assert_rejected(REASON_LOW_BALANCE, self.client.remove_item,
+                             'S1', '1', ['apple', '2'])
+
+    def test_add_to_a_shipment_in_state(self):
+        self.settle([self.client.add_item('S1', '1', ['apple', '1'],
+                                          'Delhi')])
+        self.session.held = True
+        responses = [self.client.add_item('S1', '1', ['apple', '2'],
+                                          'Delhi')]
+        responses.append(self.client.remove_item('S1', '1', ['apple', '3']))
+        self.assert_rejected(REASON_LOW_BALANCE, self.client.remove_item,
+                             'S1', '1', ['apple', '1'])
+        self.settle(responses)
+        self.assertEqual(self.client.get_shipment('S1')['items'],
+                         {'apple': 0})
+
+    def test_transfer_in_flight(self):
+        self.settle([self.client.add_item('S1', '1', ['apple', '1'],
+                                          'Delhi')])
+        self.session.held = True
+        responses = [self.client.transfer('S1', 'Mumbai', self.mumbaiKey)]
+        # State still shows the shipment at this place.
+        self.assertIsNotNone(self.client.get_shipment('S1'))
+        self.assert_rejected(REASON_NOT_FOUND, self.client.remove_item,
+                             'S1', '1', ['apple', '1'])
+        self.assert_rejected(REASON_NOT_FOUND, self.client.transfer,
+                             'S1', 'Mumbai', self.mumbaiKey)
+        self.settle(responses)
+        self.assertIsNone(self.client.get_shipment('S1'))
+
+    def test_transfer_to_a_holder(self):
+        mumbai = ShipmentClient(
+            'local', os.path.join(self.keyDir, 'mumbai.priv'),
+            session=self.session, pollInterval=0.01)
+        responses = [
+            self.client.add_many(
+                [('S1', [('apple', 1)]), ('S2', [('pear', 2)])], 'Delhi'),
+            mumbai.add_item('S2', '1', ['pear', '1'], 'Mumbai')]
+        self.settle(responses)
+        self.assert_rejected(REASON_AT_DESTINATION, self.client.transfer,
+                             'S2', 'Mumbai', self.mumbaiKey)
+        self.assert_rejected(REASON_AT_DESTINATION,
+                             self.client.transfer_many,
+                             [('S1', 'Mumbai', self.mumbaiKey),
+                              ('S2', 'Mumbai', self.mumbaiKey)])
+        self.settle([self.client.transfer('S1', 'Mumbai', self.mumbaiKey)])
+        self.assertEqual(mumbai.get_shipment('S1')['items'], {'apple': 1})
+
+    def test_bulk_operations_in_flight(self):
+        responses = [self.client.add_many(
+            [('S1', [('apple', 1)]), ('S2', [('pear', 2)])], 'Delhi')]
+        responses.append(self.client.transfer_many(
+            [('S1', 'Mumbai', self.mumbaiKey)]))
+        self.assert_rejected(REASON_NOT_FOUND, self.client.remove_item,
+                             'S1', '1', ['apple', '1'])
+        responses.append(self.client.remove_item('S2', '1', ['pear', '2']))
+        self.settle(responses)
+        self.assertIsNone(self.client.get_shipment('S1'))
+        self.assertEqual(self.client.get_shipment('S2')['items'],
+                         {'pear': 0})
+
+    def test_rejected_operation_is_forgotten(self):
+        self.settle([self.client.add_item('S1', '1', ['apple', '1'],
+                                          'Delhi')])
+        self.session.held = True
+        # Not validated, and more than the shipment holds.
+        responses = [self.client.remove_item('S1', '1', ['apple', '5'],
+                                             validate=False)]
+        self.settle(responses)
+        # Checked against state again once the removal is rejected.
+        self.client.remove_item('S1', '1', ['apple', '1'])
@@ -0,0 +1,107 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from client import shipment_payload as payload
+from processor.shipment_payload import ShipmentPayload
+
+KEY_A = '02' + 'a' * 64
+KEY_B = '03' + 'b' * 64
+
+
+class TestClientPayload(unittest.TestCase):
+    '''The client encoder against the processor decoder.'''
+
+    def test_add(self):
+        decoded = ShipmentPayload.from_bytes(payload.encode_add(
+            'S1', [('apple', 3), ('pear', 0xffffffff)], 'Delhi', 1700000000))
+        self.assertEqual(decoded.action, 'add')
+        self.assertEqual(decoded.shipment_id, 'S1')
+        self.assertEqual(decoded.place, 'Delhi')
+        self.assertEqual(decoded.items, [('apple', 3), ('pear', 0xffffffff)])
+        self.assertEqual(decoded.timestamp, 1700000000)
+
+    def test_add_is_timed_now_by_default(self):
+        decoded = ShipmentPayload.from_bytes(
+            payload.encode_add('S1', [('apple', 3)], 'Delhi'))
+        self.assertGreater(decoded.timestamp, 1700000000)
+
+    def test_remove(self):
+        decoded = ShipmentPayload.from_bytes(
+            payload.encode_remove('S1', [('apple', 1)]))
+        self.assertEqual((decoded.action, decoded.shipment_id, decoded.items),
+                         ('remove', 'S1', [('apple', 1)]))
+
+    def test_transfer(self):
+        decoded = ShipmentPayload.from_bytes(
+            payload.encode_transfer('S1', 'Mumbai', KEY_B, 5))
+        self.assertEqual((decoded.action, decoded.shipment_id,
+                          decoded.place_to, decoded.to_key, decoded.timestamp),
+                         ('transfer', 'S1', 'Mumbai', KEY_B, 5))
+
+    def test_migrate(self):
+        self.assertEqual(
+            ShipmentPayload.from_bytes(payload.encode_migrate()).action,
+            'migrate')
+
+    def test_add_many(self):
+        shipments = [('S1', [('apple', 1)]), ('S2', [('pear', 2)])]
+        decoded = ShipmentPayload.from_bytes(
+            payload.encode_add_many(shipments, 'Delhi', 7))
+        self.assertEqual((decoded.action, decoded.place, decoded.shipments),
+                         ('add_many', 'Delhi', shipments))
+
+    def test_transfer_many(self):
+        transfers = [('S1', 'Mumbai', KEY_A), ('S2', 'Pune', KEY_B),
+                     ('S3', 'Mumbai', KEY_A)]
+        decoded = ShipmentPayload.from_bytes(
+            payload.encode_transfer_many(transfers, 7))
+        self.assertEqual((decoded.action, decoded.transfers),
+                         ('transfer_many', transfers))
+
+    def test_pair_items(self):
+        self.assertEqual(payload.pair_items('2', ['apple', '3', 'pear', '1']),
+                         [('apple', 3), ('pear', 1)])
+
+
+class TestClientPayloadRejects(unittest.TestCase):
+
+    def test_count_out_of_range(self):
+        for count in (-1, 2**32):
+            with self.assertRaises(Exception):
+                payload.encode_remove('S1', [('apple', count)])
+
+    def test_value_too_long(self):
+        with self.assertRaises(Exception):
+            payload.encode_remove('S' * 0x10000, [])
+
+    def test_bulk_without_shipments(self):
+        with self.assertRaises(Exception):
+            payload.encode_add_many([], 'Delhi')
+        with self.assertRaises(Exception):
+            payload.encode_transfer_many([])
+
+    def test_bulk_with_duplicates(self):
+        with self.assertRaises(Exception):
+            payload.encode_add_many(
+                [('S1', [('apple', 1)]), ('S1', [('pear', 1)])], 'Delhi')
+        with self.assertRaises(Exception):
+            payload.encode_transfer_many(
+                [('S1', 'Mumbai', KEY_A), ('S1', 'Pune', KEY_B)])
+
+    def test_pair_items_mismatch(self):
+        with self.assertRaises(Exception):
+            payload.pair_items('2', ['apple', '3'])
+        with self.assertRaises(Exception):
+            payload.pair_items('1', ['apple', 'three'])
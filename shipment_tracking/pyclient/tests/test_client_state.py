@@ -0,0 +1,59 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from client import shipment_state as client_state
+from processor import shipment_state as processor_state
+
+KEY = '02' + 'a' * 64
+
+
+class TestClientState(unittest.TestCase):
+    '''The client decoder and addresses against the processor.'''
+
+    def assert_decodes(self, data):
+        self.assertEqual(client_state.decode_record(data),
+                         processor_state.decode_record(data))
+
+    def test_records(self):
+        self.assert_decodes(processor_state.encode_shipment(
+            {'id': 'S1', 'path': 'Farm->Delhi', 'items': {'apple': 3}}))
+        self.assert_decodes(processor_state.encode_shipment(
+            {'id': 'S1', 'history': 1, 'hops': 2,
+             'items': {'apple': 3, 'äpfel': 1}}))
+        self.assert_decodes(processor_state.encode_place_index(
+            {'place': 'Delhi', 'shipments': ['S1', 'S2']}))
+        self.assert_decodes(processor_state.encode_item_total('apple', 9))
+        self.assert_decodes(processor_state.encode_path_root('S1', 2))
+        self.assert_decodes(processor_state.encode_path_chunk(
+            {'id': 'S1', 'hops': [('Farm', 0), ('Delhi', 1700000000)]}))
+
+    def test_addresses(self):
+        for name in ('make_legacy_address', 'make_place_index_address',
+                     'make_shipment_prefix', 'make_item_total_prefix'):
+            self.assertEqual(getattr(client_state, name)(KEY),
+                             getattr(processor_state, name)(KEY))
+        self.assertEqual(client_state.make_shipment_address(KEY, 'S1'),
+                         processor_state.make_shipment_address(KEY, 'S1'))
+        for key in (KEY, None):
+            self.assertEqual(
+                client_state.make_item_total_address(key, 'apple'),
+                processor_state.make_item_total_address(key, 'apple'))
+        self.assertEqual(client_state.make_path_chunk_address('S1', 2, 3),
+                         processor_state.make_path_chunk_address('S1', 2, 3))
+
+    def test_hop_range(self):
+        self.assertEqual(client_state.hop_range(0, None, 5), (0, 5))
+        self.assertEqual(client_state.hop_range(-2, None, 5), (3, 5))
+        self.assertEqual(client_state.hop_range(1, 2, 5), (1, 3))
@@ -0,0 +1,53 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from client.shipment_validation import REASON_AT_DESTINATION
+from client.shipment_validation import REASON_LOW_BALANCE
+from client.shipment_validation import REASON_NOT_FOUND
+from client.shipment_validation import REASON_SELF_TRANSFER
+from client.shipment_validation import ValidationError
+from client.shipment_validation import check_remove
+from client.shipment_validation import check_transfer
+
+KEY_A = '02' + 'a' * 64
+KEY_B = '03' + 'b' * 64
+
+SHIPMENT = {'id': 'S1', 'history': 1, 'hops': 1, 'items': {'apple': 3}}
+
+
+class TestClientValidation(unittest.TestCase):
+
+    def assert_reason(self, reason, check, *args):
+        with self.assertRaises(ValidationError) as caught:
+            check(*args)
+        self.assertEqual(caught.exception.reason, reason)
+
+    def test_remove(self):
+        check_remove(SHIPMENT, 'S1', [('apple', 2), ('apple', 1)])
+        self.assert_reason(REASON_NOT_FOUND, check_remove,
+                           None, 'S1', [('apple', 1)])
+        self.assert_reason(REASON_LOW_BALANCE, check_remove,
+                           SHIPMENT, 'S1', [('apple', 2), ('apple', 2)])
+        self.assert_reason(REASON_NOT_FOUND, check_remove,
+                           SHIPMENT, 'S1', [('pear', 0)])
+
+    def test_transfer(self):
+        check_transfer(SHIPMENT, 'S1', KEY_A, KEY_B, None)
+        self.assert_reason(REASON_NOT_FOUND, check_transfer,
+                           None, 'S1', KEY_A, KEY_B, None)
+        self.assert_reason(REASON_SELF_TRANSFER, check_transfer,
+                           SHIPMENT, 'S1', KEY_A, KEY_A, None)
+        self.assert_reason(REASON_AT_DESTINATION, check_transfer,
+                           SHIPMENT, 'S1', KEY_A, KEY_B, SHIPMENT)
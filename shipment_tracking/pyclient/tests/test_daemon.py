@@ -0,0 +1,97 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from sawtooth_signing import create_context
+
+from client import shipment_cli
+from client.shipment_daemon import forward
+from client.shipment_keys import Keyring
+from client.shipment_loadgen import LocalRestApi
+
+
+class _RejectingRestApi(LocalRestApi):
+    '''LocalRestApi rejecting the next batch, as a validator would one
+       made invalid by a change it did not know about.'''
+
+    def __init__(self):
+        super().__init__()
+        self.rejectNext = False
+
+    def _apply(self, batch):
+        if self.rejectNext:
+            self.rejectNext = False
+            self._reject(batch, 'rejected by the validator')
+            return
+        super()._apply(batch)
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempDir)
+        context = create_context('secp256k1')
+        privateKey = context.new_random_private_key()
+        with open(os.path.join(tempDir, 'Delhi.priv'), 'w') as fd:
+            fd.write(privateKey.as_hex())
+        with open(os.path.join(tempDir, 'Delhi.pub'), 'w') as fd:
+            fd.write(context.get_public_key(privateKey).as_hex())
+        self.session = _RejectingRestApi()
+        for patch in (
+                mock.patch.object(shipment_cli, '_get_keyring',
+                                  return_value=Keyring(tempDir)),
+                mock.patch('client.shipment_client._shared_session',
+                           return_value=self.session)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.socketPath = os.path.join(tempDir, 'shipment.sock')
+        server = shipment_cli._make_daemon(self.socketPath)
+        self.addCleanup(setattr, shipment_cli, '_clients', None)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.parser = shipment_cli.create_parser('shipment')
+
+    def run_command(self, *args):
+        return forward(vars(self.parser.parse_args(args)), self.socketPath)
+
+    def test_rejected_operation_is_not_depended_on(self):
+        answer = self.run_command('add', 'S1', 'Delhi', '1', 'apple', '3',
+                                  '--wait', '5')
+        self.assertEqual(answer, {'output': 'Add operation committed\n',
+                                  'error': None})
+        self.session.rejectNext = True
+        answer = self.run_command('remove', 'S1', 'Delhi', '1', 'apple',
+                                  '1', '--wait', '5')
+        self.assertEqual(answer['error'],
+                         'Remove operation invalid: rejected by the validator')
+        answer = self.run_command('remove', 'S1', 'Delhi', '1', 'apple',
+                                  '2', '--wait', '5')
+        self.assertEqual(answer, {'output': 'Remove operation committed\n',
+                                  'error': None})
+        self.assertEqual(self.run_command('getcount', 'apple', 'Delhi'),
+                         {'output': 'No of items of type apple is 1\n',
+                          'error': None})
+
+    def test_one_client_per_place(self):
+        keyFile = shipment_cli._get_keyfile('Delhi')
+        self.assertIs(shipment_cli._make_client(keyFile=keyFile),
+                      shipment_cli._make_client(keyFile=keyFile))
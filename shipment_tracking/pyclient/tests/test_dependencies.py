@@ -0,0 +1,88 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from client.shipment_dependencies import DependencyTracker
+from client.shipment_state import make_item_total_address
+from client.shipment_state import make_item_total_prefix
+from client.shipment_state import make_shipment_address
+
+KEY = '02' + 'a' * 64
+
+S1 = make_shipment_address(KEY, 'S1')
+S2 = make_shipment_address(KEY, 'S2')
+APPLE = make_item_total_address(KEY, 'apple')
+TOTALS = make_item_total_prefix(KEY)
+
+
+class TestDependencyTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = DependencyTracker()
+
+    def test_follows_the_last_writer(self):
+        self.assertEqual(self.tracker.dependencies([S1]), [])
+        self.tracker.record('t1', [S1])
+        self.tracker.record('t2', [S1])
+        self.tracker.record('t3', [S2])
+        self.assertEqual(self.tracker.dependencies([S1]), ['t2'])
+        self.assertEqual(self.tracker.dependencies([S1, S2]), ['t2', 't3'])
+
+    def test_prefix_covers_its_keys(self):
+        self.tracker.record('t1', [APPLE])
+        self.assertEqual(self.tracker.dependencies([TOTALS]), ['t1'])
+        # A transaction on the prefix follows every key under it.
+        self.tracker.record('t2', [TOTALS])
+        self.assertEqual(self.tracker.dependencies([APPLE]), ['t2'])
+        self.assertEqual(len(self.tracker), 2)
+
+    def test_release(self):
+        self.tracker.record('t1', [S1])
+        self.tracker.record('t2', [S2])
+        self.tracker.add_batch('b1', ['t1'])
+        self.tracker.add_batch('b2', ['t2'])
+        self.tracker.release(['b1', 'unknown'])
+        self.assertEqual(self.tracker.dependencies([S1]), [])
+        self.assertEqual(self.tracker.dependencies([S2]), ['t2'])
+        self.assertEqual(len(self.tracker), 1)
+
+    def test_release_keeps_later_writers(self):
+        self.tracker.record('t1', [S1])
+        self.tracker.add_batch('b1', ['t1'])
+        self.tracker.record('t2', [S1])
+        self.tracker.release(['b1'])
+        self.assertEqual(self.tracker.dependencies([S1]), ['t2'])
+
+    def test_forget(self):
+        self.tracker.record('t1', [S1, APPLE])
+        self.tracker.forget(['t1'])
+        self.assertEqual(self.tracker.dependencies([S1, TOTALS]), [])
+        self.assertEqual(len(self.tracker), 0)
+
+    def test_rename(self):
+        self.tracker.record('provisional', [S1])
+        self.tracker.rename('provisional', 't1')
+        self.assertEqual(self.tracker.dependencies([S1]), ['t1'])
+        self.tracker.add_batch('b1', ['t1'])
+        self.tracker.release(['b1'])
+        self.assertEqual(self.tracker.dependencies([S1]), [])
+
+    def test_max_entries(self):
+        tracker = DependencyTracker(maxEntries=2)
+        tracker.record('t1', [S1])
+        tracker.record('t2', [S2])
+        tracker.record('t3', [APPLE])
+        self.assertEqual(len(tracker), 2)
+        self.assertEqual(tracker.dependencies([S1]), [])
+        self.assertEqual(tracker.dependencies([S2, APPLE]), ['t2', 't3'])
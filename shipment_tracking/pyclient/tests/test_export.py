@@ -0,0 +1,112 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_signing import create_context
+
+from client.shipment_client import ShipmentClient
+from client.shipment_export import StateExporter
+from client.shipment_loadgen import LocalRestApi
+
+
+class _FailingClient(object):
+    '''Client whose state pages fail once pages of them were read.'''
+
+    def __init__(self, client, pages):
+        self._client = client
+        self._pages = pages
+
+    def get_head(self):
+        return self._client.get_head()
+
+    def get_state_page(self, *args):
+        if self._pages == 0:
+            raise Exception('connection lost')
+        self._pages -= 1
+        return self._client.get_state_page(*args)
+
+
+class TestStateExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempDir)
+        keyFile = os.path.join(self.tempDir, 'delhi.priv')
+        with open(keyFile, 'w') as fd:
+            fd.write(create_context('secp256k1').new_random_private_key()
+                     .as_hex())
+        self.session = LocalRestApi()
+        self.client = ShipmentClient('local', keyFile, session=self.session)
+        self.client.add_many(
+            [('S{}'.format(number), [('apple', number + 1)])
+             for number in range(10)], 'Delhi')
+        self.addresses = sorted(
+            address for address, _ in self.session._store.items())
+        self.path = os.path.join(self.tempDir, 'export')
+
+    def read_ndjson(self):
+        with open(self.path) as fd:
+            return [json.loads(line) for line in fd]
+
+    def test_ndjson(self):
+        for concurrency in (1, 4):
+            exporter = StateExporter(self.client, self.path,
+                                     concurrency=concurrency, pageSize=3)
+            self.assertEqual(exporter.run(), len(self.addresses))
+            rows = self.read_ndjson()
+            self.assertEqual(sorted(row['address'] for row in rows),
+                             self.addresses)
+            shipments = {row['record']['id']: row['record']['items']
+                         for row in rows if row['kind'] == 'shipment'}
+            self.assertEqual(shipments['S3'], {'apple': 4})
+            self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+    def test_columnar(self):
+        StateExporter(self.client, self.path, fmt='columnar',
+                      pageSize=4).run()
+        with open(self.path) as fd:
+            groups = [json.loads(line) for line in fd]
+        self.assertEqual(sum(group['rows'] for group in groups),
+                         len(self.addresses))
+        for group in groups:
+            for values in group['columns'].values():
+                self.assertEqual(len(values), group['rows'])
+
+    def test_resume(self):
+        exporter = StateExporter(_FailingClient(self.client, 2), self.path,
+                                 concurrency=1, pageSize=3)
+        with self.assertRaisesRegex(Exception, 'connection lost'):
+            exporter.run()
+        with open(self.path + '.checkpoint') as fd:
+            self.assertEqual(json.load(fd)['entries'], 6)
+
+        # Resumed at the checkpoint; nothing is exported twice.
+        exporter = StateExporter(self.client, self.path, concurrency=1,
+                                 pageSize=3)
+        self.assertEqual(exporter.run(resume=True), len(self.addresses))
+        self.assertEqual(sorted(row['address'] for row in self.read_ndjson()),
+                         self.addresses)
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+    def test_resume_in_another_format(self):
+        with self.assertRaises(Exception):
+            StateExporter(_FailingClient(self.client, 1), self.path,
+                          concurrency=1, pageSize=3).run()
+        with self.assertRaisesRegex(Exception, 'ndjson format'):
+            StateExporter(self.client, self.path, fmt='columnar',
+                          concurrency=1).run(resume=True)
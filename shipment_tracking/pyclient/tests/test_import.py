@@ -0,0 +1,138 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_signing import create_context
+
+from client.shipment_client import ShipmentClient
+from client.shipment_import import ManifestImporter
+from client.shipment_import import ManifestRow
+from client.shipment_import import RowFailure
+from client.shipment_import import read_manifest
+from client.shipment_keys import Keyring
+from client.shipment_loadgen import LocalRestApi
+
+
+class _RecordingRestApi(LocalRestApi):
+    '''LocalRestApi noting the dependencies of every transaction applied,
+       in the order applied.'''
+
+    def __init__(self):
+        super().__init__()
+        self.applied = []
+
+    def _apply(self, batch):
+        for txn in batch.transactions:
+            self.applied.append((txn.header_signature,
+                                 list(self._header(txn).dependencies)))
+        super()._apply(batch)
+
+
+class TestReadManifest(unittest.TestCase):
+
+    def test_csv(self):
+        rows = list(read_manifest(io.StringIO(
+            'action,shipment,place,items,place_to\n'
+            'add,S1,Delhi,apple:3;pear:2,\n'
+            'transfer,S1,Delhi,,Mumbai\n'
+            'remove,S1,Delhi,,\n'
+            'add,S1,Delhi,apple:-1,\n'), 'csv'))
+        self.assertEqual(rows[:2], [
+            ManifestRow(2, 'add', 'S1', 'Delhi',
+                        [('apple', 3), ('pear', 2)], None),
+            ManifestRow(3, 'transfer', 'S1', 'Delhi', [], 'Mumbai')])
+        self.assertEqual([type(row) for row in rows[2:]],
+                         [RowFailure, RowFailure])
+        self.assertEqual([row.line for row in rows[2:]], [4, 5])
+
+    def test_ndjson(self):
+        rows = list(read_manifest(io.StringIO(
+            '{"action": "add", "shipment": "S1", "place": "Delhi",'
+            ' "items": {"apple": 3}}\n'
+            '\n'
+            '{"action": "remove", "shipment": "S1", "place": "Delhi",'
+            ' "items": [["apple", 1]]}\n'
+            'not json\n'
+            '{"action": "transfer", "shipment": "S1", "place": "Delhi",'
+            ' "place_to": "Delhi"}\n'), 'ndjson'))
+        self.assertEqual(rows[:2], [
+            ManifestRow(1, 'add', 'S1', 'Delhi', [('apple', 3)], None),
+            ManifestRow(3, 'remove', 'S1', 'Delhi', [('apple', 1)], None)])
+        self.assertEqual([(type(row), row.line) for row in rows[2:]],
+                         [(RowFailure, 4), (RowFailure, 5)])
+
+
+class TestManifestImporter(unittest.TestCase):
+
+    def setUp(self):
+        self.keyDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.keyDir)
+        context = create_context('secp256k1')
+        for name in ('Delhi', 'Mumbai'):
+            privateKey = context.new_random_private_key()
+            with open(os.path.join(self.keyDir, name + '.priv'), 'w') as fd:
+                fd.write(privateKey.as_hex())
+            with open(os.path.join(self.keyDir, name + '.pub'), 'w') as fd:
+                fd.write(context.get_public_key(privateKey).as_hex())
+        self.session = _RecordingRestApi()
+        self.client = self.place_client('Delhi')
+
+    def place_client(self, name):
+        return ShipmentClient(
+            'local', os.path.join(self.keyDir, name + '.priv'),
+            session=self.session, pollInterval=0.01)
+
+    def run_import(self, text, **kwargs):
+        failures = []
+        importer = ManifestImporter(self.client, Keyring(self.keyDir),
+                                    **kwargs)
+        stats = importer.run(read_manifest(io.StringIO(text), 'csv'),
+                             onFailure=lambda line, message:
+                             failures.append(line))
+        return stats, failures
+
+    def test_import(self):
+        stats, failures = self.run_import(
+            'action,shipment,place,items,place_to\n'
+            'add,S1,Delhi,apple:3,\n'
+            'remove,S1,Delhi,apple:1,\n'
+            'frobnicate,S1,Delhi,,\n'
+            'transfer,S1,Delhi,,Mumbai\n'
+            'remove,S1,Delhi,apple:1,\n'
+            'add,S1,Mumbai,pear:1,\n', batchSize=2, wait=5)
+        self.assertEqual((stats.rows, stats.submitted, stats.committed,
+                          stats.failed), (6, 5, 4, 2))
+        # The unknown action, and the removal after the shipment left.
+        self.assertEqual(sorted(failures), [4, 6])
+        self.assertIsNone(self.client.get_shipment('S1'))
+        self.assertEqual(self.place_client('Mumbai').get_shipment('S1')
+                         ['items'], {'apple': 2, 'pear': 1})
+
+    def test_rows_depend_on_earlier_rows(self):
+        self.run_import(
+            'action,shipment,place,items,place_to\n'
+            'add,S1,Delhi,apple:3,\n'
+            'remove,S1,Delhi,apple:1,\n'
+            'add,S2,Delhi,pear:1,\n', batchSize=3, wait=5)
+        (add, addDeps), (_, removeDeps), (_, otherDeps) = \
+            self.session.applied
+        self.assertEqual(addDeps, [])
+        self.assertEqual(removeDeps, [add])
+        self.assertEqual(otherDeps, [])
+        # Released once decided.
+        self.assertEqual(len(self.client.dependencies), 0)
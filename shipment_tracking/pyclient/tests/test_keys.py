@@ -0,0 +1,50 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_signing import create_context
+
+from client.shipment_keys import Keyring
+from client.shipment_keys import public_key_hex
+
+
+class TestKeyring(unittest.TestCase):
+
+    def setUp(self):
+        self.keyDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.keyDir)
+        context = create_context('secp256k1')
+        privateKey = context.new_random_private_key()
+        self.publicKey = context.get_public_key(privateKey).as_hex()
+        with open(os.path.join(self.keyDir, 'delhi.priv'), 'w') as fd:
+            fd.write(privateKey.as_hex())
+        with open(os.path.join(self.keyDir, 'delhi.pub'), 'w') as fd:
+            fd.write(self.publicKey)
+        self.keyring = Keyring(self.keyDir)
+
+    def test_public_keys_need_no_crypto_context(self):
+        self.assertEqual(self.keyring.public_key('delhi'), self.publicKey)
+        self.assertIsNone(self.keyring._factory)
+
+    def test_signer(self):
+        signer = self.keyring.signer('delhi')
+        self.assertEqual(public_key_hex(signer), self.publicKey)
+        self.assertIs(self.keyring.signer('delhi'), signer)
+
+    def test_missing_key(self):
+        with self.assertRaisesRegex(Exception, 'Failed to read private key'):
+            self.keyring.signer('mumbai')
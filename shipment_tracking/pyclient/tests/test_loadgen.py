@@ -0,0 +1,115 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_signing import create_context
+
+from client.shipment_batch import ShipmentBatchBuilder
+from client.shipment_client import ShipmentClient
+from client.shipment_loadgen import LoadGenerator
+from client.shipment_loadgen import LocalRestApi
+from client.shipment_loadgen import Workload
+from client.shipment_loadgen import parse_mix
+from client.shipment_status import COMMITTED
+from client.shipment_status import INVALID
+
+
+class TestWorkload(unittest.TestCase):
+
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix('add=5, remove=3,transfer=0'),
+                         {'add': 5.0, 'remove': 3.0, 'transfer': 0.0})
+        for text in ('burn=1', 'add=x', 'add=-1', 'add=0', ''):
+            with self.assertRaises(Exception):
+                parse_mix(text)
+
+    def test_seeded(self):
+        def draw(workload):
+            return [(operation.action, operation.values[0])
+                    for operation in (workload.next() for _ in range(200))]
+        self.assertEqual(draw(Workload(places=3, shipments=20, seed=7)),
+                         draw(Workload(places=3, shipments=20, seed=7)))
+
+    def test_operations_stay_valid(self):
+        workload = Workload(places=3, shipments=10, items=4,
+                            mix={'add': 1, 'remove': 2, 'transfer': 2},
+                            seed=1)
+        client = ShipmentClient('local', session=LocalRestApi())
+        responses = []
+        for _ in range(200):
+            operation = workload.next()
+            builder = ShipmentBatchBuilder(operation.place.signer, 1,
+                                           client.dependencies)
+            builder.append(None, operation.action, *operation.values)
+            responses.extend(client.send_batches(builder))
+        self.assertEqual(
+            {batchStatus.status
+             for batchStatus in client.wait_for_batches(responses, 5)},
+            {COMMITTED})
+
+
+class TestLoadGenerator(unittest.TestCase):
+
+    def run_load(self, **kwargs):
+        client = ShipmentClient('local', session=LocalRestApi(),
+                                pollInterval=0.01)
+        return LoadGenerator(client, Workload(places=3, shipments=20,
+                                              seed=3),
+                             duration=0.3, timeout=5, **kwargs).run()
+
+    def assert_all_committed(self, stats):
+        summary = stats.summary()
+        self.assertGreater(summary['submitted'], 0)
+        self.assertEqual(summary['committed'], summary['submitted'])
+        self.assertEqual((summary['rejected'], summary['unknown'],
+                          summary['errors']), (0, 0, 0))
+        self.assertGreater(summary['latency_max_ms'], 0)
+
+    def test_closed(self):
+        self.assert_all_committed(self.run_load(mode='closed',
+                                                concurrency=2))
+
+    def test_open(self):
+        self.assert_all_committed(self.run_load(mode='open', rate=200))
+
+
+class TestLocalRestApi(unittest.TestCase):
+
+    def setUp(self):
+        keyDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, keyDir)
+        keyFile = os.path.join(keyDir, 'delhi.priv')
+        with open(keyFile, 'w') as fd:
+            fd.write(create_context('secp256k1').new_random_private_key()
+                     .as_hex())
+        self.client = ShipmentClient('local', keyFile,
+                                     session=LocalRestApi(),
+                                     pollInterval=0.01)
+
+    def test_dependents_of_a_rejected_batch(self):
+        builder = self.client.batch()
+        builder.remove_item('S1', [('apple', 1)])
+        builder.add_item('S1', [('apple', 1)], 'Delhi')
+        builder.add_item('S2', [('apple', 1)], 'Delhi')
+        statuses = self.client.wait_for_batches(
+            self.client.send_batches(builder), 5)
+        self.assertEqual([batchStatus.status for batchStatus in statuses],
+                         [INVALID, INVALID, COMMITTED])
+        self.assertEqual(
+            statuses[1].invalidTransactions[0]['message'],
+            'depends on an invalid transaction')
+        self.assertIsNone(self.client.get_shipment('S1'))
@@ -0,0 +1,111 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_signing import create_context
+
+from client.shipment_client import ShipmentClient
+from client.shipment_loadgen import LocalRestApi
+from client.shipment_signing import SigningPipeline
+from client.shipment_status import COMMITTED
+
+
+class _UnreachableClient(ShipmentClient):
+    '''ShipmentClient whose BatchLists are never accepted.'''
+
+    def post_batch_list(self, data):
+        raise Exception('connection refused')
+
+
+class TestSigningPipeline(unittest.TestCase):
+
+    def setUp(self):
+        keyDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, keyDir)
+        context = create_context('secp256k1')
+        self.privateKeys = {}
+        self.publicKeys = {}
+        for name in ('delhi', 'mumbai'):
+            privateKey = context.new_random_private_key()
+            with open(os.path.join(keyDir, name + '.priv'), 'w') as fd:
+                fd.write(privateKey.as_hex())
+            self.privateKeys[name] = privateKey.as_hex()
+            self.publicKeys[name] = \
+                context.get_public_key(privateKey).as_hex()
+        self.keyDir = keyDir
+        self.session = LocalRestApi()
+        self.client = self.place_client('delhi')
+
+    def place_client(self, name, clientClass=ShipmentClient):
+        return clientClass('local', os.path.join(self.keyDir, name + '.priv'),
+                           session=self.session, pollInterval=0.01)
+
+    def pipeline(self, client, **kwargs):
+        return SigningPipeline(client, list(self.privateKeys.values()),
+                               workers=2, **kwargs)
+
+    def test_signed_in_order(self):
+        delhi, mumbai = self.publicKeys['delhi'], self.publicKeys['mumbai']
+        # Chunks of two: the remove and the transfer follow operations
+        # signed in an earlier chunk.
+        with self.pipeline(self.client, chunkSize=2,
+                           maxBatchesPerList=3) as pipeline:
+            futures = [
+                pipeline.add_item(delhi, 'S1', [('apple', 3)], 'Delhi'),
+                pipeline.add_item(mumbai, 'S2', [('pear', 1)], 'Mumbai'),
+                pipeline.remove_item(delhi, 'S1', [('apple', 1)]),
+                pipeline.transfer(delhi, 'S1', 'Mumbai', mumbai),
+                pipeline.remove_item(mumbai, 'S1', [('apple', 1)])]
+        batchIds = [future.result(5) for future in futures]
+        tracker = self.client.tracker()
+        self.assertEqual(
+            [batchStatus.status for batchStatus in
+             tracker.wait(tracker.track(batchIds), 5)],
+            [COMMITTED] * 5)
+        self.assertIsNone(self.client.get_shipment('S1'))
+        self.assertEqual(
+            self.place_client('mumbai').get_shipment('S1')['items'],
+            {'apple': 1})
+        self.assertEqual(len(self.client.dependencies), 0)
+
+    def test_unknown_keys(self):
+        unknown = create_context('secp256k1').get_public_key(
+            create_context('secp256k1').new_random_private_key()).as_hex()
+        with self.assertRaises(Exception):
+            self.pipeline(self.client, batcherPublicKey=unknown)
+        with self.assertRaises(Exception):
+            self.pipeline(self.client, chunkSize=0)
+        pipeline = self.pipeline(self.client)
+        with self.assertRaisesRegex(Exception, 'No private key'):
+            pipeline.add_item(unknown, 'S1', [('apple', 1)], 'Delhi')
+        pipeline.close()
+        with self.assertRaisesRegex(Exception, 'closed'):
+            pipeline.add_item(self.publicKeys['delhi'], 'S1',
+                              [('apple', 1)], 'Delhi')
+
+    def test_posting_fails(self):
+        client = self.place_client('delhi', _UnreachableClient)
+        delhi = self.publicKeys['delhi']
+        with self.pipeline(client) as pipeline:
+            futures = [
+                pipeline.add_item(delhi, 'S1', [('apple', 3)], 'Delhi'),
+                pipeline.remove_item(delhi, 'S1', [('apple', 1)])]
+        for future in futures:
+            with self.assertRaisesRegex(Exception, 'connection refused'):
+                future.result(5)
+        # Nothing waits on operations that were never posted.
+        self.assertEqual(len(client.dependencies), 0)
@@ -0,0 +1,138 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_signing import create_context
+
+from client.shipment_async_client import AsyncShipmentClient
+from client.shipment_client import ShipmentClient
+from client.shipment_dependencies import DependencyTracker
+from client.shipment_loadgen import LocalRestApi
+from client.shipment_state import make_shipment_address
+from client.shipment_status import COMMITTED
+from client.shipment_status import INVALID
+from client.shipment_status import PENDING
+from client.shipment_status import UNKNOWN
+from client.shipment_status import BatchStatus
+from client.shipment_status import BatchStatusTracker
+
+KEY = '02' + 'a' * 64
+S1 = make_shipment_address(KEY, 'S1')
+S2 = make_shipment_address(KEY, 'S2')
+
+
+class _Statuses(object):
+    '''Stand-in for a client answering /batch_statuses from a dict.'''
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    def get_batch_statuses(self, batchIds):
+        return [BatchStatus(batchId, self.statuses.get(batchId, PENDING), [])
+                for batchId in batchIds]
+
+
+class TestBatchStatusTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.dependencies = DependencyTracker()
+        self.dependencies.record('t1', [S1])
+        self.dependencies.record('t2', [S2])
+        self.dependencies.add_batch('b1', ['t1'])
+        self.dependencies.add_batch('b2', ['t2'])
+
+    def test_final_batches_are_released(self):
+        tracker = BatchStatusTracker(
+            _Statuses({'b1': INVALID, 'b2': COMMITTED}), pollInterval=0.01,
+            dependencies=self.dependencies)
+        statuses = tracker.wait(tracker.track(['b1', 'b2']), 5)
+        self.assertEqual([batchStatus.status for batchStatus in statuses],
+                         [INVALID, COMMITTED])
+        self.assertEqual(self.dependencies.dependencies([S1, S2]), [])
+
+    def test_expired_batches_are_released(self):
+        tracker = BatchStatusTracker(
+            _Statuses({}), pollInterval=0.01, timeout=60,
+            dependencies=self.dependencies)
+        futures = tracker.track(['b1'])
+        # Tracked again with a shorter timeout.
+        tracker.track(['b1'], timeout=0)
+        self.assertEqual(tracker.wait(futures, 5)[0].status, UNKNOWN)
+        self.assertEqual(self.dependencies.dependencies([S1, S2]), ['t2'])
+
+
+class TestAsyncClientRelease(unittest.TestCase):
+
+    def test_final_batches_are_released(self):
+        dependencies = DependencyTracker()
+        dependencies.record('t1', [S1])
+        dependencies.record('t2', [S2])
+        dependencies.add_batch('b1', ['t1'])
+        dependencies.add_batch('b2', ['t2'])
+        statuses = _Statuses({'b2': COMMITTED})
+
+        async def get_batch_statuses(batchIds):
+            return statuses.get_batch_statuses(batchIds)
+
+        async def run():
+            client = AsyncShipmentClient('local', dependencies=dependencies)
+            client.get_batch_statuses = get_batch_statuses
+            client._watch(['b1', 'b2'])
+            await asyncio.sleep(0.05)
+            self.assertEqual(dependencies.dependencies([S1, S2]), ['t1'])
+            statuses.statuses['b1'] = INVALID
+            await client._releaser
+            await client.close()
+
+        asyncio.run(run())
+        self.assertEqual(dependencies.dependencies([S1, S2]), [])
+
+
+class TestClientRelease(unittest.TestCase):
+
+    def setUp(self):
+        keyDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, keyDir)
+        self.keyFile = os.path.join(keyDir, 'delhi.priv')
+        with open(self.keyFile, 'w') as fd:
+            fd.write(create_context('secp256k1').new_random_private_key()
+                     .as_hex())
+        self.session = LocalRestApi()
+
+    def client(self):
+        return ShipmentClient('local', self.keyFile, session=self.session,
+                              pollInterval=0.01)
+
+    def test_trackers_are_per_client(self):
+        self.assertIsNot(self.client().dependencies,
+                         self.client().dependencies)
+
+    def test_decided_batches_are_released(self):
+        client = self.client()
+        responses = [
+            client.add_item('S1', '1', ['apple', '3'], 'Delhi'),
+            # Rejected: more apples than the shipment holds.
+            client.remove_item('S1', '1', ['apple', '5'], validate=False)]
+        self.assertEqual(
+            [batchStatus.status
+             for batchStatus in client.wait_for_batches(responses, 5)],
+            [COMMITTED, INVALID])
+        self.assertEqual(len(client.dependencies), 0)
+        # Not chained after the rejected removal.
+        client.remove_item('S1', '1', ['apple', '1'])
+        self.assertEqual(client.get_shipment('S1')['items'], {'apple': 2})
@@ -0,0 +1,87 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from sawtooth_sdk.protobuf.events_pb2 import Event
+
+from client.shipment_events import decode_add_many
+from client.shipment_events import decode_transfer_many
+from client.shipment_view import ShipmentView
+from processor import shipment_events as events
+
+KEY_A = '02' + 'a' * 64
+KEY_B = '03' + 'b' * 64
+
+
+class _Context(object):
+    '''Stand-in for a context, keeping the events sent.'''
+
+    def __init__(self):
+        self.events = []
+
+    def add_event(self, event_type, attributes=None, data=None):
+        self.events.append(Event(
+            event_type=event_type,
+            attributes=[Event.Attribute(key=key, value=value)
+                        for key, value in attributes],
+            data=data))
+
+
+class TestBulkEvents(unittest.TestCase):
+    '''The client decoders and the view against the processor events.'''
+
+    def setUp(self):
+        self.context = _Context()
+        self.view = ShipmentView()
+        self.view.load_snapshot([], 'b0', 0)
+
+    def apply(self, blockNum):
+        self.assertTrue(self.view.apply_block(
+            'b{}'.format(blockNum), blockNum, 'b{}'.format(blockNum - 1),
+            self.context.events))
+        self.context.events = []
+
+    def test_add_many(self):
+        added = [('S1', {'apple': 2}), ('Sé', {'äpfel': 1, 'pear': 4})]
+        events.emit_add_many(self.context, KEY_A, 'Delhi', added)
+        self.assertEqual(len(self.context.events), 1)
+        self.assertEqual(decode_add_many(self.context.events[0].data), added)
+        self.apply(1)
+        self.assertEqual(self.view.get_shipment(KEY_A, 'Sé'),
+                         {'id': 'Sé', 'path': 'Delhi',
+                          'items': {'äpfel': 1, 'pear': 4}})
+        self.assertEqual(self.view.get_item_count('apple', KEY_A), 2)
+        self.assertEqual(self.view.get_item_count('pear'), 4)
+
+    def test_transfer_many(self):
+        events.emit_add_many(self.context, KEY_A, 'Delhi',
+                             [('S1', {'apple': 2}), ('S2', {'pear': 1})])
+        self.apply(1)
+        moved = [({'id': 'S1', 'hops': 2, 'items': {'apple': 2}},
+                  KEY_B, 'Mumbai'),
+                 ({'id': 'S2', 'hops': 2, 'items': {'pear': 1}},
+                  KEY_B, 'Mumbai')]
+        events.emit_transfer_many(self.context, KEY_A, moved)
+        self.assertEqual(len(self.context.events), 1)
+        self.assertEqual(
+            decode_transfer_many(self.context.events[0].data)[0],
+            {'shipment_id': 'S1', 'to_key': KEY_B, 'place_to': 'Mumbai',
+             'hops': '2', 'items': {'apple': 2}})
+        self.apply(2)
+        self.assertEqual(self.view.get_data(KEY_A), {})
+        self.assertEqual(self.view.get_shipment(KEY_B, 'S1')['path'],
+                         'Delhi->Mumbai')
+        self.assertEqual(self.view.get_item_count('apple', KEY_A), 0)
+        self.assertEqual(self.view.get_item_count('pear', KEY_B), 1)
+        self.assertEqual(self.view.get_item_count('apple'), 2)
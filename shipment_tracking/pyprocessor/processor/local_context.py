@@ -0,0 +1,181 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+In-process stand-in for the validator side of a transaction context.
+
+LocalValidator applies transactions to a handler the way the validator
+does, without any network: reads and writes are checked against the
+declared inputs and outputs, and the writes of a transaction only reach
+the store when apply() returns without raising.  State lives in a dict,
+or in a dbm file for stores that should survive the process.
+'''
+
+import dbm
+
+from sawtooth_sdk.processor.exceptions import AuthorizationException
+from sawtooth_sdk.protobuf.events_pb2 import Event
+from sawtooth_sdk.protobuf.processor_pb2 import TpProcessRequest
+from sawtooth_sdk.protobuf.state_context_pb2 import TpStateEntry
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+_DELETED = object()
+
+
+class DictStore(object):
+    '''State store backed by a dict of address to bytes.'''
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, address):
+        return self._data.get(address)
+
+    def commit(self, writes):
+        for address, data in writes.items():
+            if data is _DELETED:
+                self._data.pop(address, None)
+            else:
+                self._data[address] = data
+
+    def items(self):
+        return self._data.items()
+
+    def close(self):
+        pass
+
+
+class DbmStore(object):
+    '''State store backed by an on-disk dbm database.'''
+
+    def __init__(self, path):
+        self._db = dbm.open(path, 'c')
+
+    def get(self, address):
+        return self._db.get(address.encode())
+
+    def commit(self, writes):
+        for address, data in writes.items():
+            key = address.encode()
+            if data is _DELETED:
+                if key in self._db:
+                    del self._db[key]
+            else:
+                self._db[key] = data
+
+    def items(self):
+        for key in self._db.keys():
+            yield key.decode(), self._db[key]
+
+    def close(self):
+        self._db.close()
+
+
+class LocalContext(object):
+    '''Context of one transaction, with the interface of the SDK Context.'''
+
+    def __init__(self, store, inputs, outputs):
+        self._store = store
+        self._inputs = tuple(inputs)
+        self._outputs = tuple(outputs)
+        self.writes = {}
+        self.events = []
+        self.receipt_data = []
+        self.round_trips = 0
+
+    def get_state(self, addresses, timeout=None):
+        self.round_trips += 1
+        _check(addresses, self._inputs, 'get')
+        entries = []
+        for address in addresses:
+            data = self.writes.get(address)
+            if data is None:
+                data = self._store.get(address)
+            if data is not None and data is not _DELETED and len(data):
+                entries.append(TpStateEntry(address=address, data=data))
+        return entries
+
+    def set_state(self, entries, timeout=None):
+        self.round_trips += 1
+        _check(entries, self._outputs, 'set')
+        self.writes.update(entries)
+        return list(entries)
+
+    def delete_state(self, addresses, timeout=None):
+        self.round_trips += 1
+        _check(addresses, self._outputs, 'delete')
+        deleted = []
+        for address in addresses:
+            data = self.writes.get(address)
+            if data is None:
+                data = self._store.get(address)
+            if data is not None and data is not _DELETED:
+                deleted.append(address)
+            self.writes[address] = _DELETED
+        return deleted
+
+    def add_event(self, event_type, attributes=None, data=None, timeout=None):
+        self.round_trips += 1
+        self.events.append(Event(
+            event_type=event_type,
+            attributes=[Event.Attribute(key=key, value=value)
+                        for key, value in (attributes or [])],
+            data=data or b''))
+
+    def add_receipt_data(self, data, timeout=None):
+        self.receipt_data.append(data)
+
+
+def _check(addresses, allowed, action):
+    for address in addresses:
+        if not address.startswith(allowed):
+            raise AuthorizationException(
+                'Tried to {} unauthorized address: {}'.format(action, address))
+
+
+class LocalValidator(object):
+    '''Apply transactions to a handler against a local store.'''
+
+    def __init__(self, handler, store=None):
+        self._handler = handler
+        self.store = store if store is not None else DictStore()
+        # State requests made by the handler over every transaction.
+        self.round_trips = 0
+
+    def apply(self, transaction):
+        '''Apply a signed Transaction message; return its context.
+
+        Exceptions raised by the handler propagate after the writes of the
+        transaction have been dropped.
+        '''
+        header = TransactionHeader()
+        header.ParseFromString(transaction.header)
+        request = TpProcessRequest(
+            header=header,
+            payload=transaction.payload,
+            signature=transaction.header_signature)
+        context = LocalContext(self.store, header.inputs, header.outputs)
+        try:
+            self._handler.apply(request, context)
+        finally:
+            self.round_trips += context.round_trips
+        self.store.commit(context.writes)
+        return context
+
+    def state_size(self):
+        '''Return the number of entries and bytes held in state.'''
+        entries = 0
+        size = 0
+        for _, data in self.store.items():
+            entries += 1
+            size += len(data)
+        return entries, size
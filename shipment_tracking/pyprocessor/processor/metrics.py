@@ -0,0 +1,200 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Metrics of the shipment transaction processor.
+
+Counters, gauges and histograms are kept in memory and rendered in the
+Prometheus text format, either served over HTTP or dumped to a file at
+an interval.  When metrics are disabled the handler is given
+NULL_METRICS, whose methods do nothing.
+
+Labels are passed as tuples of (name, value) pairs, built once by the
+caller, so recording a value costs one dict lookup.
+'''
+
+import bisect
+import http.server
+import os
+import threading
+
+TRANSACTIONS = 'shipment_transactions_total'
+REJECTIONS = 'shipment_rejections_total'
+STAGE_SECONDS = 'shipment_stage_seconds'
+RECORD_BYTES = 'shipment_state_record_bytes'
+BYTES_WRITTEN = 'shipment_state_bytes_written_total'
+ROUND_TRIPS = 'shipment_state_round_trips_total'
+
+_HELP = {
+    TRANSACTIONS: ('counter', 'Transactions applied, by operation.'),
+    REJECTIONS: ('counter', 'Transactions rejected, by reason.'),
+    STAGE_SECONDS: ('histogram', 'Time spent per stage of apply().'),
+    RECORD_BYTES: ('gauge', 'Size of the last state entry written, by kind.'),
+    BYTES_WRITTEN: ('counter', 'Bytes of state written, by kind.'),
+    ROUND_TRIPS: ('counter', 'Requests to the validator for state and '
+                  'events, by operation.'),
+}
+
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+DEFAULT_DUMP_INTERVAL = 10
+
+
+def labels(**pairs):
+    '''Return the label tuple of the given names and values.'''
+    return tuple(sorted(pairs.items()))
+
+
+class Metrics(object):
+    '''In-memory metric registry, safe to update from several threads.'''
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, label=(), value=1):
+        key = (name, label)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, label=()):
+        with self._lock:
+            self._gauges[(name, label)] = value
+
+    def observe(self, name, value, label=()):
+        key = (name, label)
+        position = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = [[0] * (len(self._buckets) + 1), 0.0, 0]
+                self._histograms[key] = histogram
+            histogram[0][position] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self):
+        '''Return every metric in the Prometheus text format.'''
+        with self._lock:
+            samples = [(name, label, value)
+                       for (name, label), value in self._counters.items()]
+            samples += [(name, label, value)
+                        for (name, label), value in self._gauges.items()]
+            histograms = [(name, label, list(counts), total, count)
+                          for (name, label), (counts, total, count)
+                          in self._histograms.items()]
+
+        lines = []
+        families = {}
+        for name, label, value in samples:
+            families.setdefault(name, []).append(
+                _sample(name, label, value))
+        for name, label, counts, total, count in histograms:
+            family = families.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket in zip(self._buckets, counts):
+                cumulative += bucket
+                family.append(_sample(name + '_bucket',
+                                      label + (('le', repr(bound)),),
+                                      cumulative))
+            family.append(_sample(name + '_bucket', label + (('le', '+Inf'),),
+                                  count))
+            family.append(_sample(name + '_sum', label, total))
+            family.append(_sample(name + '_count', label, count))
+        for name in sorted(families):
+            kind, text = _HELP.get(name, ('untyped', name))
+            lines.append('# HELP {} {}'.format(name, text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            lines.extend(families[name])
+        return '\n'.join(lines) + '\n'
+
+
+class NullMetrics(Metrics):
+    '''Metrics that are never recorded.'''
+
+    enabled = False
+
+    def __init__(self):
+        super(NullMetrics, self).__init__(buckets=())
+
+    def inc(self, name, label=(), value=1):
+        pass
+
+    def set(self, name, value, label=()):
+        pass
+
+    def observe(self, name, value, label=()):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def _sample(name, label, value):
+    if not label:
+        return '{} {}'.format(name, value)
+    return '{}{{{}}} {}'.format(name, ','.join(
+        '{}="{}"'.format(key, str(text).replace('\\', '\\\\')
+                         .replace('"', '\\"'))
+        for key, text in label), value)
+
+
+def serve_http(metrics, port, host=''):
+    '''Serve the metrics at http://host:port/metrics on a daemon thread.'''
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http',
+                     daemon=True).start()
+    return server
+
+
+def dump_to_file(metrics, path):
+    '''Write the metrics to path, replacing the previous dump atomically.'''
+    temp = '{}.tmp'.format(path)
+    with open(temp, 'w') as fd:
+        fd.write(metrics.render())
+    os.replace(temp, path)
+
+
+def dump_periodically(metrics, path, interval=DEFAULT_DUMP_INTERVAL):
+    '''Dump the metrics to path every interval seconds on a daemon thread.'''
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            dump_to_file(metrics, path)
+
+    threading.Thread(target=run, name='metrics-dump', daemon=True).start()
+    return stopped
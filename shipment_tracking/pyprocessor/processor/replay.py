@@ -0,0 +1,355 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Replay signed shipment transactions through the handler, without a
+validator, and report how fast they were applied.
+
+Transactions are read from a stream of serialized BatchLists, each
+preceded by its length as a big-endian u32, or generated on the fly
+from a synthetic workload of places and shipments:
+
+    shipment-replay --generate 10000 --record workload.bin
+    shipment-replay workload.bin --store /tmp/shipment-state
+'''
+
+import argparse
+import hashlib
+import random
+import struct
+import sys
+import time
+import traceback
+
+from sawtooth_sdk.processor.exceptions import AuthorizationException
+from sawtooth_sdk.processor.exceptions import InternalError
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+from sawtooth_sdk.protobuf.batch_pb2 import Batch
+from sawtooth_sdk.protobuf.batch_pb2 import BatchHeader
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+from sawtooth_sdk.protobuf.transaction_pb2 import Transaction
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+from sawtooth_signing import create_context
+from sawtooth_signing import CryptoFactory
+
+from processor.local_context import DbmStore
+from processor.local_context import DictStore
+from processor.local_context import LocalValidator
+from processor.metrics import Metrics
+from processor.metrics import NULL_METRICS
+from processor.metrics import dump_to_file
+from processor.shipment_payload import ShipmentPayload
+from processor.shipment_state import FAMILY_NAME
+from processor.shipment_state import NAMESPACE
+from processor.shipment_state import make_item_total_address
+from processor.shipment_state import make_item_total_prefix
+from processor.shipment_state import make_path_prefix
+from processor.shipment_state import make_place_index_address
+from processor.shipment_state import make_shipment_address
+from processor.shipment_tp import ShipmentTransactionHandler
+
+FAMILY_VERSION = '1.0'
+
+BATCHES_PER_LIST = 100
+
+_LENGTH = struct.Struct('>I')
+
+ITEM_NAMES = ['apple', 'banana', 'cherry', 'grape', 'lemon', 'mango',
+              'orange', 'peach', 'pear', 'plum']
+
+
+def read_batch_lists(stream):
+    '''Yield the BatchLists of a length-prefixed stream.'''
+    while True:
+        prefix = stream.read(_LENGTH.size)
+        if not prefix:
+            return
+        if len(prefix) != _LENGTH.size:
+            raise Exception('Truncated replay stream')
+        (length,) = _LENGTH.unpack(prefix)
+        data = stream.read(length)
+        if len(data) != length:
+            raise Exception('Truncated replay stream')
+        batchList = BatchList()
+        batchList.ParseFromString(data)
+        yield batchList
+
+
+def write_batch_lists(stream, batchLists):
+    for batchList in batchLists:
+        data = batchList.SerializeToString()
+        stream.write(_LENGTH.pack(len(data)))
+        stream.write(data)
+
+
+def operation_addresses(payload, public_key):
+    '''Return the addresses a transaction declares, as the client does.'''
+    if payload.action == 'add':
+        return [make_place_index_address(public_key),
+                make_shipment_address(public_key, payload.shipment_id),
+                make_path_prefix(payload.shipment_id)] + \
+            _item_total_addresses(public_key, payload.items)
+    if payload.action == 'remove':
+        return [make_shipment_address(public_key, payload.shipment_id)] + \
+            _item_total_addresses(public_key, payload.items)
+    if payload.action == 'transfer':
+        return [make_place_index_address(public_key),
+                make_shipment_address(public_key, payload.shipment_id),
+                make_item_total_prefix(public_key),
+                make_place_index_address(payload.to_key),
+                make_shipment_address(payload.to_key, payload.shipment_id),
+                make_item_total_prefix(payload.to_key),
+                make_path_prefix(payload.shipment_id)]
+    if payload.action == 'add_many':
+        addresses = [make_place_index_address(public_key)]
+        for shipment_id, _ in payload.shipments:
+            addresses.append(make_shipment_address(public_key, shipment_id))
+            addresses.append(make_path_prefix(shipment_id))
+        return addresses + _item_total_addresses(
+            public_key, [item for _, items in payload.shipments
+                         for item in items])
+    if payload.action == 'transfer_many':
+        addresses = [make_place_index_address(public_key),
+                     make_item_total_prefix(public_key)]
+        for to_key in dict.fromkeys(
+                to_key for _, _, to_key in payload.transfers):
+            addresses.append(make_place_index_address(to_key))
+            addresses.append(make_item_total_prefix(to_key))
+        for shipment_id, _, to_key in payload.transfers:
+            addresses.append(make_shipment_address(public_key, shipment_id))
+            addresses.append(make_shipment_address(to_key, shipment_id))
+            addresses.append(make_path_prefix(shipment_id))
+        return addresses
+    return [NAMESPACE]
+
+
+def _item_total_addresses(public_key, items):
+    names = sorted(set(item for item, _ in items))
+    return [make_item_total_address(public_key, item) for item in names] + \
+        [make_item_total_address(None, item) for item in names]
+
+
+def make_transaction(signer, public_key, payload):
+    data = payload.to_bytes()
+    addresses = operation_addresses(payload, public_key)
+    header = TransactionHeader(
+        signer_public_key=public_key,
+        family_name=FAMILY_NAME,
+        family_version=FAMILY_VERSION,
+        inputs=addresses,
+        outputs=addresses,
+        dependencies=[],
+        payload_sha512=hashlib.sha512(data).hexdigest(),
+        batcher_public_key=public_key,
+        nonce=random.random().hex()
+    ).SerializeToString()
+    return Transaction(header=header, payload=data,
+                       header_signature=signer.sign(header))
+
+
+def _make_batch(signer, public_key, transaction):
+    header = BatchHeader(
+        signer_public_key=public_key,
+        transaction_ids=[transaction.header_signature]
+    ).SerializeToString()
+    return Batch(header=header, transactions=[transaction],
+                 header_signature=signer.sign(header))
+
+
+def generate_workload(count, places, shipments, seed=None):
+    '''Return BatchLists holding count valid transactions.
+
+       Shipments are first created at random places, then items are added,
+       removed and shipments transferred between places, in the proportions
+       60/25/15.  A model of the expected state keeps every transaction
+       valid.
+    '''
+    rng = random.Random(seed)
+    factory = CryptoFactory(create_context('secp256k1'))
+    signers = [factory.new_signer(factory.context.new_random_private_key())
+               for _ in range(places)]
+    keys = [signer.get_public_key().as_hex() for signer in signers]
+
+    holders = {}
+    contents = {}
+    batches = []
+    for number in range(count):
+        if number < shipments or not holders:
+            shipment_id = 'S{}'.format(number)
+            place = rng.randrange(places)
+            holders[shipment_id] = place
+            contents[shipment_id] = {}
+            payload = ShipmentPayload(
+                'add', shipment_id=shipment_id, place='P{}'.format(place),
+                items=_random_items(rng, contents[shipment_id]))
+        else:
+            shipment_id = rng.choice(list(holders))
+            place = holders[shipment_id]
+            stock = contents[shipment_id]
+            draw = rng.random()
+            if draw < 0.15 and places > 1:
+                to = rng.choice([other for other in range(places)
+                                 if other != place])
+                holders[shipment_id] = to
+                payload = ShipmentPayload(
+                    'transfer', shipment_id=shipment_id,
+                    place_to='P{}'.format(to), to_key=keys[to])
+            elif draw < 0.40 and any(stock.values()):
+                item = rng.choice([name for name, held in stock.items()
+                                   if held])
+                amount = rng.randint(1, stock[item])
+                stock[item] -= amount
+                payload = ShipmentPayload(
+                    'remove', shipment_id=shipment_id, items=[(item, amount)])
+            else:
+                payload = ShipmentPayload(
+                    'add', shipment_id=shipment_id, place='P{}'.format(place),
+                    items=_random_items(rng, stock))
+        transaction = make_transaction(signers[place], keys[place], payload)
+        batches.append(_make_batch(signers[place], keys[place], transaction))
+
+    return [BatchList(batches=batches[start:start + BATCHES_PER_LIST])
+            for start in range(0, len(batches), BATCHES_PER_LIST)]
+
+
+def _random_items(rng, stock):
+    items = [(name, rng.randint(1, 100))
+             for name in rng.sample(ITEM_NAMES, rng.randint(1, 3))]
+    for name, amount in items:
+        stock[name] = stock.get(name, 0) + amount
+    return items
+
+
+def replay(validator, batchLists):
+    '''Apply every transaction and return the run statistics.'''
+    latencies = []
+    invalid = 0
+    failed = 0
+    clock = time.perf_counter
+    started = clock()
+    for batchList in batchLists:
+        for batch in batchList.batches:
+            for transaction in batch.transactions:
+                before = clock()
+                try:
+                    validator.apply(transaction)
+                except InvalidTransaction:
+                    invalid += 1
+                except (InternalError, AuthorizationException):
+                    failed += 1
+                latencies.append(clock() - before)
+    elapsed = clock() - started
+    entries, size = validator.state_size()
+    return {
+        'transactions': len(latencies),
+        'invalid': invalid,
+        'failed': failed,
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'round_trips': validator.round_trips / len(latencies)
+        if latencies else 0.0,
+        'state_entries': entries,
+        'state_bytes': size,
+    }
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Replays shipment transactions through the transaction '
+        'handler against local state and reports throughput and latency.')
+    parser.add_argument(
+        'file', nargs='?',
+        help='stream of length-prefixed BatchLists to replay ("-" for stdin)')
+    parser.add_argument(
+        '--generate', type=int, metavar='COUNT',
+        help='generate a synthetic workload of COUNT transactions')
+    parser.add_argument(
+        '--places', type=int, default=10,
+        help='places of the generated workload')
+    parser.add_argument(
+        '--shipments', type=int, default=1000,
+        help='shipments created by the generated workload')
+    parser.add_argument(
+        '--seed', type=int,
+        help='random seed of the generated workload')
+    parser.add_argument(
+        '--record', metavar='FILE',
+        help='also write the generated workload to FILE')
+    parser.add_argument(
+        '--store', metavar='PATH',
+        help='keep state in a dbm database at PATH instead of in memory')
+    parser.add_argument(
+        '--metrics-file', metavar='FILE',
+        help='write the handler metrics to FILE after the run')
+    return parser
+
+
+def main(prog_name='shipment-replay', args=None):
+    '''Entry-point function for the shipment replay harness.'''
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+    try:
+        if args.generate is not None:
+            if args.places < 1:
+                raise Exception('--places must be at least 1')
+            batchLists = generate_workload(
+                args.generate, args.places, args.shipments, args.seed)
+            if args.record:
+                with open(args.record, 'wb') as fd:
+                    write_batch_lists(fd, batchLists)
+        elif args.file == '-':
+            batchLists = list(read_batch_lists(sys.stdin.buffer))
+        elif args.file:
+            with open(args.file, 'rb') as fd:
+                batchLists = list(read_batch_lists(fd))
+        else:
+            raise Exception('Give a file to replay or --generate COUNT')
+
+        metrics = Metrics() if args.metrics_file else NULL_METRICS
+        store = DbmStore(args.store) if args.store else DictStore()
+        try:
+            validator = LocalValidator(
+                ShipmentTransactionHandler(NAMESPACE, metrics), store)
+            stats = replay(validator, batchLists)
+        finally:
+            store.close()
+        if args.metrics_file:
+            dump_to_file(metrics, args.metrics_file)
+
+        print('transactions: {transactions} ({invalid} invalid, '
+              '{failed} failed)'.format(**stats))
+        print('elapsed:      {seconds:.3f} s'.format(**stats))
+        print('throughput:   {throughput:.1f} txn/s'.format(**stats))
+        print('apply p50:    {p50_ms:.3f} ms'.format(**stats))
+        print('apply p99:    {p99_ms:.3f} ms'.format(**stats))
+        print('round trips:  {round_trips:.2f} per transaction'.format(
+            **stats))
+        print('state:        {state_entries} entries, '
+              '{state_bytes} bytes'.format(**stats))
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as err:
+        raise err
+    except BaseException as err:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
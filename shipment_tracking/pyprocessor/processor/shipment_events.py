@@ -0,0 +1,131 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Events emitted by the shipment transaction processor.
+
+Every change to a shipment is announced with a Sawtooth event, so
+subscribers can follow state without reading it:
+
+    shipment/add       shipment_id, place_key and place; or shipment_id,
+                       place_key and path for a shipment brought over by
+                       migrate, whose items replace any held before
+    shipment/remove    shipment_id, place_key
+    shipment/transfer  shipment_id, from_key, to_key, place_to and hops,
+                       the length of the path with place_to
+
+The data of an event holds the items it concerns: items added or
+removed, or every item of a transferred shipment.  It is a u32 count of
+(u16-prefixed UTF-8 name, u64 count) pairs.
+
+The bulk operations announce all their shipments in one event:
+
+    shipment/add_many       place_key, place and count, the number of
+                            shipments
+    shipment/transfer_many  from_key and count
+
+Their data is a u32 count of entries, one per shipment.  An add_many
+entry is the u16-prefixed shipment_id followed by the items added; a
+transfer_many entry is the u16-prefixed shipment_id, to_key and
+place_to, the u32 hops and the items of the shipment.
+
+Events are sent through the add_event() of a ShipmentState, or of a
+context; each one is a request to the validator.
+'''
+
+import struct
+
+EVENT_ADD = 'shipment/add'
+EVENT_REMOVE = 'shipment/remove'
+EVENT_TRANSFER = 'shipment/transfer'
+EVENT_ADD_MANY = 'shipment/add_many'
+EVENT_TRANSFER_MANY = 'shipment/transfer_many'
+
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+
+
+def _encode_string(value):
+    data = value.encode('utf-8')
+    return _U16.pack(len(data)) + data
+
+
+def encode_items(items):
+    '''Encode a dict of item name to count as event data.'''
+    parts = [_U32.pack(len(items))]
+    for name, count in sorted(items.items()):
+        parts.append(_encode_string(name))
+        parts.append(_U64.pack(count))
+    return b''.join(parts)
+
+
+def emit_add(context, public_key, shipment_id, items, place=None, path=None):
+    '''Announce items added to a shipment, or a migrated shipment.'''
+    attributes = [('shipment_id', shipment_id), ('place_key', public_key)]
+    if path is not None:
+        attributes.append(('path', path))
+    else:
+        attributes.append(('place', place))
+    context.add_event(EVENT_ADD, attributes, encode_items(items))
+
+
+def emit_remove(context, public_key, shipment_id, items):
+    '''Announce items removed from a shipment, as positive counts.'''
+    context.add_event(
+        EVENT_REMOVE,
+        [('shipment_id', shipment_id), ('place_key', public_key)],
+        encode_items(items))
+
+
+def emit_transfer(context, shipment, from_key, to_key, place_to):
+    '''Announce a shipment, as it now is, moved to another place.'''
+    context.add_event(
+        EVENT_TRANSFER,
+        [('shipment_id', shipment['id']), ('from_key', from_key),
+         ('to_key', to_key), ('place_to', place_to),
+         ('hops', str(shipment['hops']))],
+        encode_items(shipment['items']))
+
+
+def emit_add_many(context, public_key, place, added):
+    '''Announce items added to many shipments of a place.
+
+       added is a list of (shipment_id, {item: count}) pairs.
+    '''
+    parts = [_U32.pack(len(added))]
+    for shipment_id, items in added:
+        parts.append(_encode_string(shipment_id))
+        parts.append(encode_items(items))
+    context.add_event(
+        EVENT_ADD_MANY,
+        [('place_key', public_key), ('place', place),
+         ('count', str(len(added)))],
+        b''.join(parts))
+
+
+def emit_transfer_many(context, from_key, moved):
+    '''Announce many shipments, as they now are, moved from a place.
+
+       moved is a list of (shipment, to_key, place_to) tuples.
+    '''
+    parts = [_U32.pack(len(moved))]
+    for shipment, to_key, place_to in moved:
+        parts.append(_encode_string(shipment['id']))
+        parts.append(_encode_string(to_key))
+        parts.append(_encode_string(place_to))
+        parts.append(_U32.pack(shipment['hops']))
+        parts.append(encode_items(shipment['items']))
+    context.add_event(
+        EVENT_TRANSFER_MANY,
+        [('from_key', from_key), ('count', str(len(moved)))],
+        b''.join(parts))
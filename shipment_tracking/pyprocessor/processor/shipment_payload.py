@@ -0,0 +1,327 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Payload codec for the shipment transaction family.
+
+A payload is a version byte and an action byte followed by the fields of
+that action.  Strings are a big-endian u16 length and UTF-8 bytes, item
+lists are a u16 count of (string name, u32 count) pairs:
+
+    add            shipment_id, place, items [, time]
+    remove         shipment_id, items
+    transfer       shipment_id, place_to, to_key [, time]
+    migrate        (no fields)
+    add_many       place, u16 count of (shipment_id, items) [, time]
+    transfer_many  u16 count of (place_to, to_key) destinations,
+                   u16 count of (shipment_id, u16 destination) [, time]
+
+time is an optional u64, the seconds since the epoch at which the client
+made the operation; it is recorded with the hop an add or transfer adds
+to the path of a shipment.  The bulk operations apply add or transfer
+to many shipments in one transaction, each listed once; a destination
+of transfer_many is the position of a (place_to, to_key) pair in its
+list of destinations, so a shared destination is written once.
+
+Payloads produced by older clients are comma separated text and are still
+accepted; they always start with a printable character, while the binary
+format starts with the version byte.  They decode with legacy set, as
+those clients declare only the layout 1 address of their place: the
+handler applies them to the layout 1 state, which migrate moves over
+once every client of the place is upgraded.
+'''
+
+import struct
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+PAYLOAD_VERSION = 1
+
+ACTION_ADD = 1
+ACTION_REMOVE = 2
+ACTION_TRANSFER = 3
+ACTION_MIGRATE = 4
+ACTION_ADD_MANY = 5
+ACTION_TRANSFER_MANY = 6
+
+ACTIONS = {
+    ACTION_ADD: 'add',
+    ACTION_REMOVE: 'remove',
+    ACTION_TRANSFER: 'transfer',
+    ACTION_MIGRATE: 'migrate',
+    ACTION_ADD_MANY: 'add_many',
+    ACTION_TRANSFER_MANY: 'transfer_many',
+}
+
+# Actions whose payload may end with a time.
+_TIMED = (ACTION_ADD, ACTION_TRANSFER, ACTION_ADD_MANY, ACTION_TRANSFER_MANY)
+
+_CODES = {action: code for code, action in ACTIONS.items()}
+
+_HEADER = struct.Struct('>BB')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+
+
+class ShipmentPayload(object):
+    '''Decoded shipment payload.
+
+    items is a list of (name, count) tuples; fields an action does not
+    carry, or that were left out, are None.  shipments, for add_many, is
+    a list of (shipment_id, items) tuples and transfers, for
+    transfer_many, a list of (shipment_id, place_to, to_key) tuples.
+    legacy is set on payloads decoded from the comma separated text of
+    older clients.
+    '''
+
+    __slots__ = ('action', 'shipment_id', 'place', 'items',
+                 'place_to', 'to_key', 'timestamp', 'shipments',
+                 'transfers', 'legacy')
+
+    def __init__(self, action, shipment_id=None, place=None, items=None,
+                 place_to=None, to_key=None, timestamp=None,
+                 shipments=None, transfers=None, legacy=False):
+        self.action = action
+        self.shipment_id = shipment_id
+        self.place = place
+        self.items = items
+        self.place_to = place_to
+        self.to_key = to_key
+        self.timestamp = timestamp
+        self.shipments = shipments
+        self.transfers = transfers
+        self.legacy = legacy
+
+    def to_bytes(self):
+        '''Encode the payload in the binary format.'''
+        code = _CODES.get(self.action)
+        if code is None:
+            raise InvalidTransaction('Unknown action {}'.format(self.action))
+        parts = [_HEADER.pack(PAYLOAD_VERSION, code)]
+        if code == ACTION_ADD:
+            _write_str(parts, self.shipment_id)
+            _write_str(parts, self.place)
+            _write_items(parts, self.items)
+        elif code == ACTION_REMOVE:
+            _write_str(parts, self.shipment_id)
+            _write_items(parts, self.items)
+        elif code == ACTION_TRANSFER:
+            _write_str(parts, self.shipment_id)
+            _write_str(parts, self.place_to)
+            _write_str(parts, self.to_key)
+        elif code == ACTION_ADD_MANY:
+            _write_str(parts, self.place)
+            parts.append(_U16.pack(len(self.shipments)))
+            for shipment_id, items in self.shipments:
+                _write_str(parts, shipment_id)
+                _write_items(parts, items)
+        elif code == ACTION_TRANSFER_MANY:
+            destinations = {}
+            for _, place_to, to_key in self.transfers:
+                destinations.setdefault((place_to, to_key), len(destinations))
+            parts.append(_U16.pack(len(destinations)))
+            for place_to, to_key in destinations:
+                _write_str(parts, place_to)
+                _write_str(parts, to_key)
+            parts.append(_U16.pack(len(self.transfers)))
+            for shipment_id, place_to, to_key in self.transfers:
+                _write_str(parts, shipment_id)
+                parts.append(_U16.pack(destinations[(place_to, to_key)]))
+        if code in _TIMED and self.timestamp is not None:
+            parts.append(_U64.pack(self.timestamp))
+        return b''.join(parts)
+
+    @staticmethod
+    def from_bytes(payload):
+        if not payload:
+            raise InvalidTransaction('Empty payload')
+        if payload[0] >= 0x20:
+            decoded = _from_legacy(payload)
+        else:
+            try:
+                decoded = _from_binary(bytes(payload))
+            except (struct.error, UnicodeDecodeError) as err:
+                raise InvalidTransaction(
+                    'Malformed payload: {}'.format(err))
+        # Paths store place names joined by NUL.
+        places = [decoded.place, decoded.place_to]
+        if decoded.transfers is not None:
+            places.extend(place_to for _, place_to, _ in decoded.transfers)
+        for place in places:
+            if place is not None and '\x00' in place:
+                raise InvalidTransaction('Place names may not contain NUL')
+        return decoded
+
+
+def _write_str(parts, value):
+    data = value.encode('utf-8')
+    parts.append(_U16.pack(len(data)))
+    parts.append(data)
+
+
+def _write_items(parts, items):
+    parts.append(_U16.pack(len(items)))
+    for name, count in items:
+        _write_str(parts, name)
+        parts.append(_U32.pack(count))
+
+
+def _read_str(data, offset):
+    (length,) = _U16.unpack_from(data, offset)
+    offset += 2
+    end = offset + length
+    if end > len(data):
+        raise struct.error('string runs past the end of the payload')
+    return data[offset:end].decode('utf-8'), end
+
+
+def _read_items(data, offset):
+    unpack_u16 = _U16.unpack_from
+    unpack_u32 = _U32.unpack_from
+    (count,) = unpack_u16(data, offset)
+    offset += 2
+    items = []
+    for _ in range(count):
+        (length,) = unpack_u16(data, offset)
+        offset += 2
+        end = offset + length
+        # The count behind the name also bounds-checks the name.
+        (amount,) = unpack_u32(data, end)
+        name = data[offset:end].decode('utf-8')
+        if '\x00' in name:
+            raise InvalidTransaction('Item names may not contain NUL')
+        items.append((name, amount))
+        offset = end + 4
+    return items, offset
+
+
+def _from_binary(data):
+    version, code = _HEADER.unpack_from(data, 0)
+    if version != PAYLOAD_VERSION:
+        raise InvalidTransaction(
+            'Unsupported payload version {}'.format(version))
+    action = ACTIONS.get(code)
+    if action is None:
+        raise InvalidTransaction('Unknown action {}'.format(code))
+
+    offset = _HEADER.size
+    payload = ShipmentPayload(action)
+    if code == ACTION_ADD:
+        payload.shipment_id, offset = _read_str(data, offset)
+        payload.place, offset = _read_str(data, offset)
+        payload.items, offset = _read_items(data, offset)
+    elif code == ACTION_REMOVE:
+        payload.shipment_id, offset = _read_str(data, offset)
+        payload.items, offset = _read_items(data, offset)
+    elif code == ACTION_TRANSFER:
+        payload.shipment_id, offset = _read_str(data, offset)
+        payload.place_to, offset = _read_str(data, offset)
+        payload.to_key, offset = _read_str(data, offset)
+    elif code == ACTION_ADD_MANY:
+        payload.place, offset = _read_str(data, offset)
+        (count,) = _U16.unpack_from(data, offset)
+        offset += 2
+        payload.shipments = []
+        for _ in range(count):
+            shipment_id, offset = _read_str(data, offset)
+            items, offset = _read_items(data, offset)
+            payload.shipments.append((shipment_id, items))
+    elif code == ACTION_TRANSFER_MANY:
+        (count,) = _U16.unpack_from(data, offset)
+        offset += 2
+        destinations = []
+        for _ in range(count):
+            place_to, offset = _read_str(data, offset)
+            to_key, offset = _read_str(data, offset)
+            destinations.append((place_to, to_key))
+        (count,) = _U16.unpack_from(data, offset)
+        offset += 2
+        payload.transfers = []
+        for _ in range(count):
+            shipment_id, offset = _read_str(data, offset)
+            (destination,) = _U16.unpack_from(data, offset)
+            offset += 2
+            if destination >= len(destinations):
+                raise InvalidTransaction(
+                    'Unknown destination {}'.format(destination))
+            payload.transfers.append(
+                (shipment_id,) + destinations[destination])
+    if code in _TIMED and offset < len(data):
+        (payload.timestamp,) = _U64.unpack_from(data, offset)
+        offset += _U64.size
+
+    if code == ACTION_ADD_MANY:
+        shipment_ids = [shipment_id for shipment_id, _ in payload.shipments]
+    elif code == ACTION_TRANSFER_MANY:
+        shipment_ids = [shipment_id for shipment_id, _, _ in
+                        payload.transfers]
+    else:
+        shipment_ids = [payload.shipment_id]
+    if code in (ACTION_ADD_MANY, ACTION_TRANSFER_MANY):
+        if not shipment_ids:
+            raise InvalidTransaction('No shipments in {}'.format(action))
+        if len(set(shipment_ids)) != len(shipment_ids):
+            raise InvalidTransaction(
+                'A shipment is listed twice in {}'.format(action))
+    for shipment_id in shipment_ids:
+        if shipment_id is not None and '\x00' in shipment_id:
+            raise InvalidTransaction('Shipment IDs may not contain NUL')
+
+    if offset != len(data):
+        raise InvalidTransaction('Trailing bytes after payload')
+    return payload
+
+
+def _legacy_items(payload_list, N):
+    # Items were sent as str() of a flat list, e.g. "['apple', '3']".
+    items = []
+    names = [payload_list[3][2:-1]]
+    for i in range(1, 2*N-1):
+        names.append(payload_list[i+3][2:-1])
+    names.append(payload_list[3+2*N-1][2:-2])
+    for x in range(0, 2*N, 2):
+        count = int(names[x+1])
+        # Counts are u32 in the binary format and in state.
+        if not 0 <= count <= 0xffffffff:
+            raise InvalidTransaction(
+                'Invalid count {} for item {}'.format(count, names[x]))
+        items.append((names[x], count))
+    return items
+
+
+def _from_legacy(payload):
+    '''Decode the comma separated payload of pre-codec clients.'''
+    try:
+        payload_list = payload.decode().split(",")
+        operation = payload_list[0]
+        if operation == "add":
+            N = int(payload_list[2])
+            return ShipmentPayload(
+                operation, shipment_id=payload_list[1],
+                items=_legacy_items(payload_list, N),
+                place=payload_list[2*N+3], legacy=True)
+        if operation == "remove":
+            N = int(payload_list[2])
+            return ShipmentPayload(
+                operation, shipment_id=payload_list[1],
+                items=_legacy_items(payload_list, N), legacy=True)
+        if operation == "transfer":
+            if len(payload_list) != 4:
+                raise InvalidTransaction('Malformed transfer payload')
+            return ShipmentPayload(
+                operation, shipment_id=payload_list[1],
+                place_to=payload_list[2], to_key=payload_list[3],
+                legacy=True)
+    except (IndexError, ValueError) as err:
+        raise InvalidTransaction('Malformed payload: {}'.format(err))
+    raise InvalidTransaction('Unknown operation {}'.format(operation))
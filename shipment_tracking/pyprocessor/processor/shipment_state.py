@@ -0,0 +1,768 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+State layout for the shipment transaction family.
+
+Each shipment is stored at its own address, next to a small index per
+place, so a transaction only reads and writes the entries it changes:
+
+    namespace (6) | kind (2) | place (30) | leaf (32)
+
+The place part is derived from the public key of the place and the leaf
+part from the shipment ID.  All shipments of one place therefore share
+the prefix returned by make_shipment_prefix().
+
+Running totals per item name are kept next to the shipments, once per
+place and once across all places (with an all-zero place part), so item
+counts are answered without scanning shipments.
+
+The path of a shipment is kept apart from it, as an append-only list of
+hops in chunks of PATH_CHUNK_HOPS, so a transfer writes one hop whatever
+the length of the path, and a part of the path is read without the
+rest.  Paths are stored per shipment ID rather than per place, as a
+shipment keeps its path when it moves:
+
+    namespace (6) | 04 | shipment (30) | history (16) | chunk (16)
+
+Two shipments given the same ID at different places each get their own
+history number, handed out by a root entry with history and chunk 0.
+Shipments written before paths were split out still carry their path as
+a string; it moves to chunks on their next transfer.
+'''
+
+import hashlib
+import io
+import itertools
+import pickle
+import struct
+import time
+
+from sawtooth_sdk.processor.exceptions import InternalError
+
+from processor.metrics import BYTES_WRITTEN
+from processor.metrics import NULL_METRICS
+from processor.metrics import RECORD_BYTES
+from processor.metrics import STAGE_SECONDS
+from processor.metrics import labels
+
+FAMILY_NAME = "shipment"
+
+# Version of the state layout described above.  Layout 1 was a single
+# pickled dict per place, stored at make_legacy_address().
+LAYOUT_VERSION = 2
+
+KIND_PLACE_INDEX = '00'
+KIND_SHIPMENT = '01'
+KIND_ITEM_TOTAL = '02'
+KIND_GLOBAL_ITEM_TOTAL = '03'
+KIND_PATH = '04'
+
+# Hops per path chunk: bounds the size of the entry a transfer rewrites.
+PATH_CHUNK_HOPS = 64
+
+
+def _hash(data):
+    '''Compute the SHA-512 hash and return the result as hex characters.'''
+    return hashlib.sha512(data).hexdigest()
+
+
+NAMESPACE = _hash(FAMILY_NAME.encode('utf-8'))[0:6]
+
+ADDRESS_LENGTH = 70
+
+
+def _place_part(public_key):
+    return _hash(public_key.encode('utf-8'))[0:30]
+
+
+def make_legacy_address(public_key):
+    '''Address of the layout 1 place state (one blob for every shipment).'''
+    return NAMESPACE + _hash(public_key.encode('utf-8'))[0:64]
+
+
+def make_place_index_address(public_key):
+    '''Address of the index listing the shipments held by a place.'''
+    return NAMESPACE + KIND_PLACE_INDEX + _place_part(public_key) + '0' * 32
+
+
+def make_shipment_prefix(public_key):
+    '''Address prefix shared by every shipment held by a place.'''
+    return NAMESPACE + KIND_SHIPMENT + _place_part(public_key)
+
+
+def make_shipment_address(public_key, shipment_id):
+    '''Address of a single shipment held by a place.'''
+    return make_shipment_prefix(public_key) + \
+        _hash(shipment_id.encode('utf-8'))[0:32]
+
+
+def make_item_total_prefix(public_key):
+    '''Address prefix shared by every item total of a place.'''
+    return NAMESPACE + KIND_ITEM_TOTAL + _place_part(public_key)
+
+
+def make_item_total_address(public_key, item):
+    '''Address of the total of one item at a place, or across all places
+    when public_key is None.'''
+    if public_key is None:
+        prefix = make_global_item_total_prefix()
+    else:
+        prefix = make_item_total_prefix(public_key)
+    return prefix + _hash(item.encode('utf-8'))[0:32]
+
+
+def make_global_item_total_prefix():
+    '''Address prefix shared by every item total across all places.'''
+    return NAMESPACE + KIND_GLOBAL_ITEM_TOTAL + '0' * 30
+
+
+def make_path_prefix(shipment_id):
+    '''Address prefix shared by the paths of every shipment with an ID.'''
+    return NAMESPACE + KIND_PATH + _hash(shipment_id.encode('utf-8'))[0:30]
+
+
+def make_path_root_address(shipment_id):
+    '''Address of the count of paths started for a shipment ID.'''
+    return make_path_prefix(shipment_id) + '0' * 32
+
+
+def make_path_chunk_address(shipment_id, history, chunk):
+    '''Address of one chunk of the path of a shipment.'''
+    return make_path_prefix(shipment_id) + \
+        '{:016x}{:016x}'.format(history, chunk)
+
+
+def new_shipment(shipment_id, path):
+    '''A shipment carrying its path as a string, as written before paths
+    moved to their own entries.'''
+    return {'id': shipment_id, 'path': path, 'items': {}}
+
+
+def new_routed_shipment(shipment_id, history, hops):
+    '''A shipment whose path is stored in chunks, see ShipmentState.'''
+    return {'id': shipment_id, 'history': history, 'hops': hops,
+            'items': {}}
+
+
+def new_place_index(place_name):
+    return {'place': place_name, 'shipments': []}
+
+
+# Every state entry is encoded canonically, so all validators produce the
+# same bytes for the same value:
+#
+#     version (u8) | kind (u8) | kind specific fields
+#
+# Shipment:    id (u16 str) | path (u32 str) | item table
+# Routed shipment:
+#              id (u16 str) | history (u32) | hops (u32) | item table
+# Place index: place (u16 str) | shipment table (values unused)
+# Item total:  item (u16 str) | total (u64)
+# Path root:   id (u16 str) | histories (u32)
+# Path chunk:  id (u16 str) | count (u16) |
+#              hops (count x (place number (u16), time (u64))) |
+#              place names joined by NUL
+#
+# A path chunk names each place once, hops refer to it by its position,
+# and the time of a hop is the one given by the client, in seconds since
+# the epoch, or 0 when the client gave none.
+#
+# A table maps string keys to u64 values, sorted by key bytes:
+#
+#     count (u32) | key offsets (count x u32) | values (count x u64) |
+#     keys joined by NUL
+#
+# A single key is found by binary search over the offsets without
+# decoding the rest of the record, while a full decode is one split of
+# the key heap and one unpack of the values.  The table is always the
+# last field of a record, so its key heap runs to the end of the entry.
+
+STATE_VERSION = 1
+
+RECORD_PLACE_INDEX = 0
+RECORD_SHIPMENT = 1
+RECORD_ITEM_TOTAL = 2
+RECORD_PATH_ROOT = 3
+RECORD_PATH_CHUNK = 4
+RECORD_ROUTED_SHIPMENT = 5
+
+_HEADER = struct.Struct('>BB')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+_PATH_REF = struct.Struct('>II')
+_HOP = struct.Struct('>HQ')
+
+
+def _pack_table(parts, table):
+    '''Append the encoding of table, a dict of str keys to int values.'''
+    # Code point order is UTF-8 byte order, so the keys sort as str.
+    keys = sorted(table)
+    count = len(keys)
+    heap = '\x00'.join(keys).encode('utf-8')
+    if len(heap) == count - 1 + sum(map(len, keys)):
+        lengths = map(len, keys)
+    else:
+        lengths = (len(key.encode('utf-8')) for key in keys)
+    offsets = list(itertools.accumulate(
+        map((1).__add__, lengths), initial=0))[:count]
+    parts.append(struct.pack('>I{0}I{0}Q'.format(count), count,
+                             *offsets, *map(table.__getitem__, keys)))
+    parts.append(heap)
+
+
+def encode_shipment(shipment):
+    shipment_id = shipment['id'].encode('utf-8')
+    if 'path' in shipment:
+        path = shipment['path'].encode('utf-8')
+        parts = [_HEADER.pack(STATE_VERSION, RECORD_SHIPMENT),
+                 _U16.pack(len(shipment_id)), shipment_id,
+                 _U32.pack(len(path)), path]
+    else:
+        parts = [_HEADER.pack(STATE_VERSION, RECORD_ROUTED_SHIPMENT),
+                 _U16.pack(len(shipment_id)), shipment_id,
+                 _PATH_REF.pack(shipment['history'], shipment['hops'])]
+    _pack_table(parts, shipment['items'])
+    return b''.join(parts)
+
+
+def encode_place_index(index):
+    place = index['place'].encode('utf-8')
+    parts = [_HEADER.pack(STATE_VERSION, RECORD_PLACE_INDEX),
+             _U16.pack(len(place)), place]
+    _pack_table(parts, dict.fromkeys(index['shipments'], 0))
+    return b''.join(parts)
+
+
+def encode_item_total(item, total):
+    name = item.encode('utf-8')
+    return b''.join([_HEADER.pack(STATE_VERSION, RECORD_ITEM_TOTAL),
+                     _U16.pack(len(name)), name, _U64.pack(total)])
+
+
+def encode_path_root(shipment_id, histories):
+    name = shipment_id.encode('utf-8')
+    return b''.join([_HEADER.pack(STATE_VERSION, RECORD_PATH_ROOT),
+                     _U16.pack(len(name)), name, _U32.pack(histories)])
+
+
+def encode_path_chunk(chunk):
+    '''Encode {'id': shipment ID, 'hops': [(place, time), ...]}.'''
+    shipment_id = chunk['id'].encode('utf-8')
+    hops = chunk['hops']
+    numbers = {}
+    for place, _ in hops:
+        numbers.setdefault(place, len(numbers))
+    parts = [_HEADER.pack(STATE_VERSION, RECORD_PATH_CHUNK),
+             _U16.pack(len(shipment_id)), shipment_id,
+             _U16.pack(len(hops))]
+    parts.extend(_HOP.pack(numbers[place], time) for place, time in hops)
+    parts.append('\x00'.join(numbers).encode('utf-8'))
+    return b''.join(parts)
+
+
+class _TableView(object):
+    '''Read-only view of an encoded table inside a record.'''
+
+    __slots__ = ('_buf', '_offsets', '_values', '_heap', '_count')
+
+    def __init__(self, buf, offset):
+        (self._count,) = _U32.unpack_from(buf, offset)
+        self._buf = buf
+        self._offsets = offset + 4
+        self._values = self._offsets + 4 * self._count
+        self._heap = self._values + 8 * self._count
+        if self._heap > len(buf):
+            raise ValueError('Truncated state table')
+
+    def __len__(self):
+        return self._count
+
+    def _key(self, position):
+        (start,) = _U32.unpack_from(self._buf, self._offsets + 4 * position)
+        if position + 1 < self._count:
+            (end,) = _U32.unpack_from(
+                self._buf, self._offsets + 4 * position + 4)
+            end -= 1
+        else:
+            end = len(self._buf) - self._heap
+        return self._buf[self._heap + start:self._heap + end]
+
+    def get(self, key, default=None):
+        '''Binary search for key, touching only the keys on the way.'''
+        target = key.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            found = self._key(middle).tobytes()
+            if found == target:
+                return _U64.unpack_from(
+                    self._buf, self._values + 8 * middle)[0]
+            if found < target:
+                low = middle + 1
+            else:
+                high = middle
+        return default
+
+    def keys(self):
+        if not self._count:
+            return []
+        return str(self._buf[self._heap:], 'utf-8').split('\x00')
+
+    def to_dict(self):
+        values = struct.unpack_from(
+            '>{}Q'.format(self._count), self._buf, self._values)
+        return dict(zip(self.keys(), values))
+
+
+class ShipmentView(object):
+    '''Zero-copy view of an encoded shipment.'''
+
+    __slots__ = ('id', 'path', 'items')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.id = str(buf[offset:offset + length], 'utf-8')
+        offset += length
+        (length,) = _U32.unpack_from(buf, offset)
+        offset += 4
+        self.path = str(buf[offset:offset + length], 'utf-8')
+        self.items = _TableView(buf, offset + length)
+
+    def count(self, item):
+        return self.items.get(item, 0)
+
+    def to_dict(self):
+        return {'id': self.id, 'path': self.path,
+                'items': self.items.to_dict()}
+
+
+class RoutedShipmentView(object):
+    '''Zero-copy view of an encoded shipment whose path is in chunks.'''
+
+    __slots__ = ('id', 'history', 'hops', 'items')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.id = str(buf[offset:offset + length], 'utf-8')
+        offset += length
+        self.history, self.hops = _PATH_REF.unpack_from(buf, offset)
+        self.items = _TableView(buf, offset + _PATH_REF.size)
+
+    def count(self, item):
+        return self.items.get(item, 0)
+
+    def to_dict(self):
+        return {'id': self.id, 'history': self.history, 'hops': self.hops,
+                'items': self.items.to_dict()}
+
+
+class PathRootView(object):
+    '''View of the count of paths started for a shipment ID.'''
+
+    __slots__ = ('id', 'histories')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.id = str(buf[offset:offset + length], 'utf-8')
+        (self.histories,) = _U32.unpack_from(buf, offset + length)
+
+    def to_dict(self):
+        return {'id': self.id, 'histories': self.histories}
+
+
+class PathChunkView(object):
+    '''View of one chunk of a path.'''
+
+    __slots__ = ('id', '_buf', '_hops', '_count', '_names')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.id = str(buf[offset:offset + length], 'utf-8')
+        offset += length
+        (self._count,) = _U16.unpack_from(buf, offset)
+        self._buf = buf
+        self._hops = offset + 2
+        self._names = self._hops + _HOP.size * self._count
+        if self._names > len(buf):
+            raise ValueError('Truncated path chunk')
+
+    def __len__(self):
+        return self._count
+
+    def hops(self):
+        '''Return the (place, time) hops of the chunk, in order.'''
+        names = str(self._buf[self._names:], 'utf-8').split('\x00')
+        return [(names[number], time) for number, time in
+                _HOP.iter_unpack(self._buf[self._hops:self._names])]
+
+    def to_dict(self):
+        return {'id': self.id, 'hops': self.hops()}
+
+
+class PlaceIndexView(object):
+    '''Zero-copy view of an encoded place index.'''
+
+    __slots__ = ('place', 'shipments')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.place = str(buf[offset:offset + length], 'utf-8')
+        self.shipments = _TableView(buf, offset + length)
+
+    def __contains__(self, shipment_id):
+        return self.shipments.get(shipment_id) is not None
+
+    def to_dict(self):
+        return {'place': self.place, 'shipments': self.shipments.keys()}
+
+
+class ItemTotalView(object):
+    '''View of an encoded item total.'''
+
+    __slots__ = ('item', 'total')
+
+    def __init__(self, buf, offset=_HEADER.size):
+        (length,) = _U16.unpack_from(buf, offset)
+        offset += 2
+        self.item = str(buf[offset:offset + length], 'utf-8')
+        (self.total,) = _U64.unpack_from(buf, offset + length)
+
+    def to_dict(self):
+        return {'item': self.item, 'total': self.total}
+
+
+_VIEWS = {
+    RECORD_SHIPMENT: ShipmentView,
+    RECORD_PLACE_INDEX: PlaceIndexView,
+    RECORD_ITEM_TOTAL: ItemTotalView,
+    RECORD_PATH_ROOT: PathRootView,
+    RECORD_PATH_CHUNK: PathChunkView,
+    RECORD_ROUTED_SHIPMENT: RoutedShipmentView,
+}
+
+
+class _NoGlobalsUnpickler(pickle.Unpickler):
+    '''Unpickler for migrating old state: plain containers only.'''
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(
+            'Refusing to load {}.{} from state'.format(module, name))
+
+
+def view_record(data):
+    '''Return a view over an encoded entry without decoding it.'''
+    buf = memoryview(data)
+    version, kind = _HEADER.unpack_from(buf, 0)
+    if version != STATE_VERSION or kind not in _VIEWS:
+        raise ValueError(
+            'Unsupported state record {}/{}'.format(version, kind))
+    return _VIEWS[kind](buf)
+
+
+def decode_record(data):
+    '''Decode a state entry into a dict.
+
+    Entries still pickled by earlier releases are accepted so state can be
+    migrated in place; they are rewritten in the canonical encoding the
+    next time they change.
+    '''
+    if data[:1] == b'\x80':
+        value = _NoGlobalsUnpickler(io.BytesIO(data)).load()
+        value.pop('version', None)
+        return value
+    return view_record(data).to_dict()
+
+
+_STAGE_FETCH = labels(stage='state_fetch')
+_STAGE_DESERIALIZE = labels(stage='deserialize')
+_STAGE_SERIALIZE = labels(stage='serialize')
+_STAGE_SET = labels(stage='set_state')
+_STAGE_DELETE = labels(stage='delete_state')
+
+_KIND_SHIPMENT = labels(kind='shipment')
+_KIND_PLACE_INDEX = labels(kind='place_index')
+_KIND_ITEM_TOTAL = labels(kind='item_total')
+_KIND_PATH = labels(kind='path')
+_KIND_LEGACY = labels(kind='legacy')
+
+
+class ShipmentState(object):
+    '''Typed access to shipment state through a transaction context.
+
+    One instance is the unit of work of one transaction.  Each call to the
+    context is a round trip to the validator, so entries are read in as
+    few requests as possible, with prefetch(), and kept along with their
+    decoded values; writes and deletes are held until flush(), which sends
+    them in one request each.  Nothing reaches the context when the
+    transaction fails before flush().  Events go through add_event(), so
+    round_trips counts every request, events included.
+
+    Time spent fetching, decoding, encoding and writing entries is recorded
+    in metrics, if given.
+    '''
+
+    def __init__(self, context, metrics=NULL_METRICS):
+        self._context = context
+        self._metrics = metrics
+        # Address -> data of the entry as the transaction sees it, None
+        # when it is empty.
+        self._entries = {}
+        # Address -> decoded value, while the entry is unchanged.
+        self._values = {}
+        # Address -> data to write, or None to delete, until flush().
+        self._dirty = {}
+        self.round_trips = 0
+
+    def prefetch(self, addresses):
+        '''Read the entries not read yet in a single request.
+
+        Address prefixes are skipped, as only whole entries can be read.
+        '''
+        missing = [address for address in dict.fromkeys(addresses)
+                   if len(address) == ADDRESS_LENGTH and
+                   address not in self._entries]
+        if not missing:
+            return
+        started = time.perf_counter()
+        entries = self._context.get_state(missing)
+        self.round_trips += 1
+        self._metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                              _STAGE_FETCH)
+        found = {entry.address: entry.data for entry in entries}
+        for address in missing:
+            self._entries[address] = found.get(address) or None
+
+    def flush(self):
+        '''Send the writes and deletes of the transaction.'''
+        writes = {address: data for address, data in self._dirty.items()
+                  if data is not None}
+        deletes = [address for address, data in self._dirty.items()
+                   if data is None]
+        self._dirty = {}
+        metrics = self._metrics
+        if writes:
+            started = time.perf_counter()
+            addresses = self._context.set_state(writes)
+            self.round_trips += 1
+            metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                            _STAGE_SET)
+            if len(addresses) < len(writes):
+                raise InternalError("State Error")
+        if deletes:
+            started = time.perf_counter()
+            self._context.delete_state(deletes)
+            self.round_trips += 1
+            metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                            _STAGE_DELETE)
+
+    def add_event(self, event_type, attributes=None, data=None):
+        '''Emit an event of the transaction, in a request of its own.'''
+        self._context.add_event(event_type, attributes, data)
+        self.round_trips += 1
+
+    def get_shipment(self, public_key, shipment_id):
+        '''Return the shipment dict, or None if the place does not hold it.'''
+        shipment = self._get(make_shipment_address(public_key, shipment_id))
+        if shipment is None or shipment['id'] != shipment_id:
+            return None
+        return shipment
+
+    def get_item_count(self, public_key, shipment_id, item):
+        '''Return one item count, or None if the place does not hold it.'''
+        data = self._fetch(make_shipment_address(public_key, shipment_id))
+        if data is None:
+            return None
+        started = time.perf_counter()
+        if data[:1] == b'\x80':
+            shipment = decode_record(data)
+            count = None if shipment['id'] != shipment_id else \
+                shipment['items'].get(item, 0)
+        else:
+            shipment = view_record(data)
+            count = None if shipment.id != shipment_id else \
+                shipment.count(item)
+        self._metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                              _STAGE_DESERIALIZE)
+        return count
+
+    def set_shipment(self, public_key, shipment):
+        started = time.perf_counter()
+        data = encode_shipment(shipment)
+        self._metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                              _STAGE_SERIALIZE)
+        self._set(make_shipment_address(public_key, shipment['id']), data,
+                  _KIND_SHIPMENT)
+
+    def delete_shipment(self, public_key, shipment_id):
+        self._delete(make_shipment_address(public_key, shipment_id))
+
+    def get_place_index(self, public_key):
+        '''Return the place index dict, or None if the place is unknown.'''
+        return self._get(make_place_index_address(public_key))
+
+    def set_place_index(self, public_key, index):
+        started = time.perf_counter()
+        data = encode_place_index(index)
+        self._metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                              _STAGE_SERIALIZE)
+        self._set(make_place_index_address(public_key), data,
+                  _KIND_PLACE_INDEX)
+
+    def get_item_total(self, public_key, item):
+        '''Return the total of an item at a place, or across all places
+        when public_key is None.'''
+        data = self._fetch(make_item_total_address(public_key, item))
+        if data is None:
+            return 0
+        return view_record(data).total
+
+    def adjust_item_totals(self, public_key, deltas):
+        '''Add deltas, a dict of item to signed change, to the totals.
+
+        Totals that drop to zero are removed from state.
+        '''
+        for item, delta in deltas.items():
+            if not delta:
+                continue
+            address = make_item_total_address(public_key, item)
+            total = self.get_item_total(public_key, item) + delta
+            if total < 0:
+                raise InternalError(
+                    'Total of {} would become negative'.format(item))
+            if total == 0:
+                self._delete(address)
+            else:
+                self._set(address, encode_item_total(item, total),
+                          _KIND_ITEM_TOTAL)
+
+    def start_path(self, shipment_id, place, timestamp):
+        '''Start the path of a new shipment at place.
+
+        Returns the history number of the path, for new_routed_shipment().
+        '''
+        history = self._new_history(shipment_id)
+        self._set_path_chunk(shipment_id, history, 0, [(place, timestamp)])
+        return history
+
+    def append_hop(self, shipment, place, timestamp):
+        '''Add a hop to the path of a shipment, rewriting only the last
+        chunk, and count it in the shipment.
+
+        A shipment still carrying its path as a string has it moved to
+        chunks first.
+        '''
+        shipment_id = shipment['id']
+        if 'path' in shipment:
+            hops = [(name, 0) for name in shipment.pop('path').split('->')]
+            shipment['history'] = self._new_history(shipment_id)
+            shipment['hops'] = len(hops)
+            for start in range(0, len(hops), PATH_CHUNK_HOPS):
+                self._set_path_chunk(
+                    shipment_id, shipment['history'], start // PATH_CHUNK_HOPS,
+                    hops[start:start + PATH_CHUNK_HOPS])
+        history, position = shipment['history'], shipment['hops']
+        chunk, offset = divmod(position, PATH_CHUNK_HOPS)
+        hops = [] if offset == 0 else self.get_path_chunk(
+            shipment_id, history, chunk)
+        hops.append((place, timestamp))
+        self._set_path_chunk(shipment_id, history, chunk, hops)
+        shipment['hops'] = position + 1
+
+    def hop_addresses(self, shipment):
+        '''Return the addresses append_hop() reads for the shipment.'''
+        if 'path' in shipment:
+            return [make_path_root_address(shipment['id'])]
+        chunk, offset = divmod(shipment['hops'], PATH_CHUNK_HOPS)
+        if offset == 0:
+            return []
+        return [make_path_chunk_address(shipment['id'], shipment['history'],
+                                        chunk)]
+
+    def get_path_chunk(self, shipment_id, history, chunk):
+        '''Return the (place, time) hops of one chunk of a path.'''
+        record = self._get(make_path_chunk_address(shipment_id, history, chunk))
+        if record is None:
+            raise InternalError('Path chunk {} of shipment {} is missing'
+                                .format(chunk, shipment_id))
+        return record['hops']
+
+    def _new_history(self, shipment_id):
+        root = self._get(make_path_root_address(shipment_id))
+        history = 1 if root is None else root['histories'] + 1
+        self._set(make_path_root_address(shipment_id),
+                  encode_path_root(shipment_id, history), _KIND_PATH)
+        return history
+
+    def _set_path_chunk(self, shipment_id, history, chunk, hops):
+        started = time.perf_counter()
+        data = encode_path_chunk({'id': shipment_id, 'hops': hops})
+        self._metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                              _STAGE_SERIALIZE)
+        self._set(make_path_chunk_address(shipment_id, history, chunk),
+                  data, _KIND_PATH)
+
+    def get_legacy_place(self, public_key):
+        '''Return the layout 1 dict of a place, or None once migrated.'''
+        data = self._fetch(make_legacy_address(public_key))
+        if data is None:
+            return None
+        return _NoGlobalsUnpickler(io.BytesIO(data)).load()
+
+    def set_legacy_place(self, public_key, place):
+        '''Write the layout 1 dict of a place, for clients still
+        declaring only that address.'''
+        started = time.perf_counter()
+        data = pickle.dumps(place)
+        self._metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                              _STAGE_SERIALIZE)
+        self._set(make_legacy_address(public_key), data, _KIND_LEGACY)
+
+    def delete_legacy_place(self, public_key):
+        self._delete(make_legacy_address(public_key))
+
+    def _fetch(self, address):
+        if address not in self._entries:
+            self.prefetch([address])
+        return self._entries[address]
+
+    def _get(self, address):
+        if address in self._values:
+            return self._values[address]
+        data = self._fetch(address)
+        if data is None:
+            return None
+        started = time.perf_counter()
+        value = decode_record(data)
+        self._metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                              _STAGE_DESERIALIZE)
+        self._values[address] = value
+        return value
+
+    def _set(self, address, data, kind):
+        metrics = self._metrics
+        metrics.set(RECORD_BYTES, len(data), kind)
+        metrics.inc(BYTES_WRITTEN, kind, len(data))
+        self._entries[address] = data
+        self._values.pop(address, None)
+        self._dirty[address] = data
+
+    def _delete(self, address):
+        self._entries[address] = None
+        self._values.pop(address, None)
+        self._dirty[address] = None
@@ -14,38 +14,99 @@
 Transaction family class for shipment.
 '''
 
+import argparse
 import traceback
 import sys
-import hashlib
+import bisect
 import logging
-import pickle
+import time
 
 from sawtooth_sdk.processor.handler import TransactionHandler
 from sawtooth_sdk.processor.exceptions import InvalidTransaction
 from sawtooth_sdk.processor.exceptions import InternalError
 from sawtooth_sdk.processor.core import TransactionProcessor
 
+from processor.metrics import NULL_METRICS
+from processor.metrics import REJECTIONS
+from processor.metrics import ROUND_TRIPS
+from processor.metrics import STAGE_SECONDS
+from processor.metrics import TRANSACTIONS
+from processor.metrics import Metrics
+from processor.metrics import dump_periodically
+from processor.metrics import dump_to_file
+from processor.metrics import labels
+from processor.metrics import serve_http
+from processor.shipment_events import emit_add
+from processor.shipment_events import emit_add_many
+from processor.shipment_events import emit_remove
+from processor.shipment_events import emit_transfer
+from processor.shipment_events import emit_transfer_many
+from processor.shipment_payload import ACTIONS
+from processor.shipment_payload import ShipmentPayload
+from processor.shipment_state import NAMESPACE
+from processor.shipment_state import ShipmentState
+from processor.shipment_state import make_item_total_address
+from processor.shipment_state import make_legacy_address
+from processor.shipment_state import make_path_root_address
+from processor.shipment_state import make_shipment_address
+from processor.shipment_state import new_place_index
+from processor.shipment_state import new_routed_shipment
+from processor.shipment_state import new_shipment
+from processor.shipment_validation import REASON_AT_DESTINATION
+from processor.shipment_validation import REASON_LOW_BALANCE
+from processor.shipment_validation import REASON_NOT_FOUND
+from processor.shipment_validation import REASON_SELF_TRANSFER
+from processor.shipment_validation import ShipmentRejected
+from processor.shipment_validation import check_remove
+from processor.shipment_validation import check_transfer
+
 LOGGER = logging.getLogger(__name__)
 
 FAMILY_NAME = "shipment"
 
-def _hash(data):
-    '''Compute the SHA-512 hash and return the result as hex characters.'''
-    return hashlib.sha512(data).hexdigest()
+DEFAULT_URL = 'tcp://validator:4004'
+
+_OPERATIONS = {action: labels(operation=action)
+               for action in ACTIONS.values()}
+_UNKNOWN_OPERATION = labels(operation='unknown')
+
+_STAGE_DECODE = labels(stage='decode')
+_STAGE_APPLY = labels(stage='apply')
+
+_REASON_PAYLOAD = labels(reason='malformed_payload')
+_REASON_INVALID = labels(reason='invalid_transaction')
+_REASONS = {reason: labels(reason=reason)
+            for reason in (REASON_NOT_FOUND, REASON_LOW_BALANCE,
+                           REASON_SELF_TRANSFER, REASON_AT_DESTINATION)}
 
 # Prefix for simplewallet is the first six hex digits of SHA-512(TF name).
-sw_namespace = _hash(FAMILY_NAME.encode('utf-8'))[0:6]
+sw_namespace = NAMESPACE
+
+
+def _legacy_shipment(shipmentID, info):
+    '''Return the shipment dict of a layout 1 entry, or None.'''
+    if info is None:
+        return None
+    return {'id': shipmentID, 'path': info['path'],
+            'items': {item: count for item, count in info.items()
+                      if item != 'path'}}
+
 
 class ShipmentTransactionHandler(TransactionHandler):
-    '''                                                       
-    Transaction Processor class for the shipment transaction family.       
-                                                              
-    This with the validator using the accept/get/set functions.
-    It implements functions to deposit, withdraw, and transfer money.
+    '''Transaction Processor class for the shipment transaction family.
+
+    Talks to the validator through the context of each transaction.  A
+    place adds items to its shipments and removes them (add, remove),
+    transfers a shipment to another place (transfer), does either for many
+    shipments at once (add_many, transfer_many), and moves its layout 1
+    state to the current layout (migrate).  The add, remove and transfer
+    of clients from before the binary codec apply to the layout 1 state
+    instead; see _make_legacy().
     '''
 
-    def __init__(self, namespace_prefix):
+    def __init__(self, namespace_prefix, metrics=NULL_METRICS):
         self._namespace_prefix = namespace_prefix
+        self._metrics = metrics
 
     @property
     def family_name(self):
@@ -66,174 +127,419 @@ class ShipmentTransactionHandler(TransactionHandler):
            a single transaction for the simplewallet transaction family.   
         '''                                                   
         
+        metrics = self._metrics
+        started = time.perf_counter()
+
         # Get the payload and extract simplewallet-specific information.
         header = transaction.header
-        payload_list = transaction.payload.decode().split(",")
-        operation = payload_list[0]
-        # amount = payload_list[1]
+        try:
+            payload = ShipmentPayload.from_bytes(transaction.payload)
+        except InvalidTransaction:
+            metrics.inc(REJECTIONS, _REASON_PAYLOAD)
+            raise
+        operation = payload.action
+        metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                        _STAGE_DECODE)
+        metrics.inc(TRANSACTIONS,
+                    _OPERATIONS.get(operation, _UNKNOWN_OPERATION))
 
         # Get the public key sent from the client.
         from_key = header.signer_public_key
 
         # Perform the operation.
-        LOGGER.info("Operation = "+ operation)
-
-        if operation == "add":
-            # print(len(payload_list))
-            # for x in payload_list:
-            shipmentID = payload_list[1]
-            N = int(payload_list[2])
-            items = []
-            print((payload_list[3][2:-1]))
-            items.append(payload_list[3][2:-1])
-            for i in range(1,2*N-1):
-                items.append(payload_list[i+3][2:-1])
-            items.append(payload_list[3+2*N-1][2:-2])
-            print(items)
-            place= payload_list[2*N+3]
-            print(place,type(place))
-            # count = payload_list[2]
-            self._make_add(context, shipmentID, N,items,place,from_key)
-
-        elif operation == "remove":
-            shipmentID = payload_list[1]
-            N = int(payload_list[2])
-            items = []
-            print((payload_list[3][2:-1]))
-            items.append(payload_list[3][2:-1])
-            for i in range(1,2*N-1):
-                items.append(payload_list[i+3][2:-1])
-            items.append(payload_list[3+2*N-1][2:-2])
-            print(items)
-            self._make_remove(context, shipmentID, N,items, from_key)
-
-        elif operation == "transfer":
-            print(len(payload_list),"HOORAY")
-            if len(payload_list) == 4:
-                shipmentID = payload_list[1]
-                placeTo = payload_list[2]
-                to_key = payload_list[3]
-            self._make_transfer(context, shipmentID,placeTo, to_key, from_key)
+        LOGGER.debug("Operation = %s", operation)
+
+        # Every entry the transaction declared, read in one request.
+        state = ShipmentState(context, metrics)
+        inputs = tuple(header.inputs)
+        state.prefetch(list(inputs) + [
+            address for address in self._derived_inputs(payload)
+            if address.startswith(inputs)])
+        try:
+            if payload.legacy:
+                self._make_legacy(state, payload, from_key, header.outputs)
+
+            elif operation == "add":
+                self._make_add(state, payload.shipment_id, payload.items,
+                               payload.place, from_key, payload.timestamp)
+
+            elif operation == "remove":
+                self._make_remove(state, payload.shipment_id, payload.items,
+                                  from_key)
+
+            elif operation == "transfer":
+                self._make_transfer(state, payload.shipment_id,
+                                    payload.place_to, payload.to_key,
+                                    from_key, payload.timestamp)
+
+            elif operation == "migrate":
+                self._make_migrate(state, from_key)
+
+            elif operation == "add_many":
+                self._make_add_many(state, payload.shipments, payload.place,
+                                    from_key, payload.timestamp)
+
+            elif operation == "transfer_many":
+                self._make_transfer_many(state, payload.transfers, from_key,
+                                         payload.timestamp)
 
-        else:
-            LOGGER.info("Unhandled action. " +
-                "Operation should be deposit, withdraw or transfer")
-
-    def _make_add(self, context, shipmentID, N,items,place,from_key):
-        wallet_address = self._get_wallet_address(from_key)
-        LOGGER.info('Got the key {} and the wallet address {} '.format(
-            from_key, wallet_address))
-        current_state = context.get_state([wallet_address])
-        new_state = {}
-        if current_state == []:
-            LOGGER.info('No previous deposits, creating new deposit {} '
-                .format(from_key))
-            new_state[shipmentID]={}
-            new_state[shipmentID]['path']=place
-            N = int(N)
-            for x in range(0,2*N,2):
-                    new_state[shipmentID][items[x]]=int(items[x+1])
-        else:
-            new_state = pickle.loads(current_state[0].data)
-            if shipmentID in new_state:
-                for x in range(0,2*N,2):
-                    if items[x] in  new_state[shipmentID]:
-                        new_state[shipmentID][items[x]]+=int(items[x+1])
-                    else:
-                        new_state[shipmentID][items[x]]=int(items[x+1])
             else:
-                new_state[shipmentID]={}
-                new_state[shipmentID]['path']=place
-                for x in range(0,2*N,2):
-                    new_state[shipmentID][items[x]]=int(items[x+1])
-        print(new_state)
-        state_data = pickle.dumps(new_state)
-        addresses = context.set_state({wallet_address: state_data})
-
-        if len(addresses) < 1:
-            raise InternalError("State Error")
-
-    def _make_remove(self, context,shipmentID, N,items, from_key):
-        wallet_address = self._get_wallet_address(from_key)
-        LOGGER.info('Got the key {} and the wallet address {} '.format(
-            from_key, wallet_address))
-        current_state = context.get_state([wallet_address])
-        new_state = {}
-        
-        if current_state == []:
-            LOGGER.info('No user with the key {} '.format(from_key))
-            return
+                raise InvalidTransaction(
+                    'Unknown operation {}'.format(operation))
+            state.flush()
+        except ShipmentRejected as err:
+            LOGGER.info('%s rejected: %s', operation, err)
+            metrics.inc(REJECTIONS, _REASONS[err.reason])
+            raise
+        except InvalidTransaction:
+            metrics.inc(REJECTIONS, _REASON_INVALID)
+            raise
+        finally:
+            metrics.inc(ROUND_TRIPS,
+                        _OPERATIONS.get(operation, _UNKNOWN_OPERATION),
+                        state.round_trips)
+        metrics.observe(STAGE_SECONDS, time.perf_counter() - started,
+                        _STAGE_APPLY)
+
+    def _derived_inputs(self, payload):
+        '''Addresses an operation reads that its inputs only declare by
+           prefix, but that are known before reading state.'''
+        if payload.action == "add":
+            return [make_path_root_address(payload.shipment_id)]
+        if payload.action == "add_many":
+            return [make_path_root_address(shipment_id)
+                    for shipment_id, _ in payload.shipments]
+        return []
+
+    def _make_add(self, state, shipmentID, items, place, from_key,
+                  timestamp=None):
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('Got the key %s and the shipment address %s',
+                         from_key, make_shipment_address(from_key, shipmentID))
+        shipment = state.get_shipment(from_key, shipmentID)
+        if shipment is None:
+            LOGGER.debug('No previous deposits, creating new shipment %s',
+                         shipmentID)
+            history = state.start_path(shipmentID, place, timestamp or 0)
+            shipment = new_routed_shipment(shipmentID, history, 1)
+            self._index_insert(state, from_key, [shipmentID], place)
+        deltas = {}
+        for item, count in items:
+            shipment['items'][item] = shipment['items'].get(item, 0) + count
+            deltas[item] = deltas.get(item, 0) + count
+        LOGGER.debug('Shipment after add: %s', shipment)
+        state.set_shipment(from_key, shipment)
+        state.adjust_item_totals(from_key, deltas)
+        state.adjust_item_totals(None, deltas)
+        emit_add(state, from_key, shipmentID, deltas, place=place)
+
+    def _make_remove(self, state, shipmentID, items, from_key):
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('Got the key %s and the shipment address %s',
+                         from_key, make_shipment_address(from_key, shipmentID))
+        shipment = state.get_shipment(from_key, shipmentID)
+        check_remove(shipment, shipmentID, items)
+        deltas = {}
+        for item, count in items:
+            shipment['items'][item] -= count
+            deltas[item] = deltas.get(item, 0) - count
+        LOGGER.debug('Shipment after remove: %s', shipment)
+        state.set_shipment(from_key, shipment)
+        state.adjust_item_totals(from_key, deltas)
+        state.adjust_item_totals(None, deltas)
+        emit_remove(state, from_key, shipmentID,
+                    {item: -delta for item, delta in deltas.items()})
+
+    def _make_transfer(self, state, shipmentID, placeTo, to_key,
+                       from_key, timestamp=None):
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('Got the from key %s and the from shipment address %s',
+                         from_key, make_shipment_address(from_key, shipmentID))
+            LOGGER.debug('Got the to key %s and the to shipment address %s',
+                         to_key, make_shipment_address(to_key, shipmentID))
+        shipment = state.get_shipment(from_key, shipmentID)
+        check_transfer(shipment, shipmentID, from_key, to_key,
+                       state.get_shipment(to_key, shipmentID))
+        # The rest of what the transfer reads, now that the items and the
+        # path are known.
+        state.prefetch(state.hop_addresses(shipment) + [
+            make_item_total_address(key, item)
+            for key in (from_key, to_key) for item in shipment['items']])
+
+        state.append_hop(shipment, placeTo, timestamp or 0)
+        state.delete_shipment(from_key, shipmentID)
+        self._index_discard(state, from_key, [shipmentID])
+        state.set_shipment(to_key, shipment)
+        self._index_insert(state, to_key, [shipmentID], placeTo)
+        state.adjust_item_totals(
+            from_key, {item: -count for item, count in shipment['items'].items()})
+        state.adjust_item_totals(to_key, shipment['items'])
+        emit_transfer(state, shipment, from_key, to_key, placeTo)
+        LOGGER.debug('Shipment after transfer: %s', shipment)
+
+    def _make_add_many(self, state, shipments, place, from_key,
+                       timestamp=None):
+        '''Add items to many shipments of the place, as add does to one.
+
+           The place index and the item totals are read and written once
+           for all of them, and one event announces them all.
+        '''
+        created = []
+        deltas = {}
+        announced = []
+        for shipmentID, items in shipments:
+            shipment = state.get_shipment(from_key, shipmentID)
+            if shipment is None:
+                history = state.start_path(shipmentID, place, timestamp or 0)
+                shipment = new_routed_shipment(shipmentID, history, 1)
+                created.append(shipmentID)
+            added = {}
+            for item, count in items:
+                shipment['items'][item] = \
+                    shipment['items'].get(item, 0) + count
+                added[item] = added.get(item, 0) + count
+            for item, count in added.items():
+                deltas[item] = deltas.get(item, 0) + count
+            state.set_shipment(from_key, shipment)
+            announced.append((shipmentID, added))
+        LOGGER.debug('Added to %s shipments, %s of them new',
+                     len(shipments), len(created))
+        emit_add_many(state, from_key, place, announced)
+        self._index_insert(state, from_key, created, place)
+        state.adjust_item_totals(from_key, deltas)
+        state.adjust_item_totals(None, deltas)
+
+    def _make_transfer_many(self, state, transfers, from_key,
+                            timestamp=None):
+        '''Move many shipments of the place, each to its destination.
+
+           Every shipment must be held by the place or none is moved.  The
+           place indexes and the item totals are read and written once per
+           place, and each path chunk once.  One event announces them all.
+        '''
+        shipments = []
+        for shipmentID, _, to_key in transfers:
+            shipment = state.get_shipment(from_key, shipmentID)
+            check_transfer(shipment, shipmentID, from_key, to_key,
+                           state.get_shipment(to_key, shipmentID))
+            shipments.append(shipment)
+        # Item totals of the source for every item moved, and of each
+        # destination for the items it receives.
+        totals = set()
+        for shipment, (_, _, to_key) in zip(shipments, transfers):
+            for item in shipment['items']:
+                totals.add((from_key, item))
+                totals.add((to_key, item))
+        state.prefetch(
+            [address for shipment in shipments
+             for address in state.hop_addresses(shipment)] +
+            [make_item_total_address(key, item) for key, item in totals])
+
+        removed = {}
+        # Destination key -> [place name, shipment IDs, {item: count}]
+        arrivals = {}
+        for shipment, (shipmentID, placeTo, to_key) in zip(shipments,
+                                                           transfers):
+            state.append_hop(shipment, placeTo, timestamp or 0)
+            state.delete_shipment(from_key, shipmentID)
+            state.set_shipment(to_key, shipment)
+            arrival = arrivals.setdefault(to_key, [placeTo, [], {}])
+            arrival[1].append(shipmentID)
+            for item, count in shipment['items'].items():
+                removed[item] = removed.get(item, 0) - count
+                arrival[2][item] = arrival[2].get(item, 0) + count
+        LOGGER.debug('Moved %s shipments to %s places', len(shipments),
+                     len(arrivals))
+        emit_transfer_many(
+            state, from_key,
+            [(shipment, to_key, placeTo) for shipment, (_, placeTo, to_key)
+             in zip(shipments, transfers)])
+        self._index_discard(state, from_key,
+                            [shipmentID for shipmentID, _, _ in transfers])
+        state.adjust_item_totals(from_key, removed)
+        for to_key, (placeTo, shipmentIDs, items) in arrivals.items():
+            self._index_insert(state, to_key, shipmentIDs, placeTo)
+            state.adjust_item_totals(to_key, items)
+
+    def _make_legacy(self, state, payload, from_key, outputs):
+        '''Apply an add, remove or transfer of a client from before the
+           binary codec to the layout 1 state of its place.
+
+           Those clients declare only that address, so shipments stay in
+           the one blob per place, with their path as a string, until
+           migrate moves them over.  Operations are validated as in the
+           current layout, against the blob alone.  A transfer writes the
+           blob of the destination as well, which old clients did not
+           declare; one that does not is rejected.
+        '''
+        place = state.get_legacy_place(from_key) or {}
+        shipmentID = payload.shipment_id
+        info = place.get(shipmentID)
+        if payload.action == "add":
+            if info is None:
+                info = place[shipmentID] = {'path': payload.place}
+            for item, count in payload.items:
+                info[item] = info.get(item, 0) + count
+        elif payload.action == "remove":
+            check_remove(_legacy_shipment(shipmentID, info), shipmentID,
+                         payload.items)
+            for item, count in payload.items:
+                info[item] -= count
         else:
-            old_state = pickle.loads(current_state[0].data)
-            if shipmentID in old_state:
-                flag = True
-                for x in range(0,2*N,2):
-                    if(items[x] not in old_state[shipmentID] or  old_state[shipmentID][items[x]]<int(items[x+1])):
-                        flag = False
-                        break
-                if flag:
-                    for x in range(0,2*N,2):
-                        old_state[shipmentID][items[x]]-=int(items[x+1])
+            to_key = payload.to_key
+            if make_legacy_address(to_key) not in outputs:
+                raise InvalidTransaction(
+                    'Legacy transfer of shipment {} does not declare the '
+                    'destination: upgrade client'.format(shipmentID))
+            to_place = state.get_legacy_place(to_key) or {}
+            check_transfer(_legacy_shipment(shipmentID, info), shipmentID,
+                           from_key, to_key,
+                           _legacy_shipment(shipmentID,
+                                            to_place.get(shipmentID)))
+            del place[shipmentID]
+            info['path'] += '->' + payload.place_to
+            to_place[shipmentID] = info
+            state.set_legacy_place(to_key, to_place)
+        LOGGER.debug('Layout 1 shipment after %s: %s', payload.action, info)
+        state.set_legacy_place(from_key, place)
+
+    def _make_migrate(self, state, from_key):
+        '''Bring a place up to the current state layout.
+
+           A layout 1 place blob is split into one entry per shipment, then
+           the item totals of the place are rebuilt from its shipments and
+           the difference is applied to the totals across all places, so
+           running it again changes nothing.  Items of a shipment the
+           place already holds in the current layout, added to the blob
+           by a legacy client since an earlier migrate, are added to it.
+           A place with neither a blob nor an index is rejected rather
+           than committed without effect.
+        '''
+        index = state.get_place_index(from_key)
+        old_state = state.get_legacy_place(from_key)
+        if old_state is not None:
+            state.prefetch([make_shipment_address(from_key, shipmentID)
+                            for shipmentID in old_state])
+            for shipmentID, info in old_state.items():
+                path = info['path']
+                if index is None:
+                    # The last hop of any shipment it holds names the place.
+                    index = new_place_index(path.split("->")[-1])
+                items = _legacy_shipment(shipmentID, info)['items']
+                shipment = state.get_shipment(from_key, shipmentID)
+                if shipment is None:
+                    shipment = new_shipment(shipmentID, path)
+                    shipment['items'].update(items)
+                    emit_add(state, from_key, shipmentID, items, path=path)
                 else:
-                    LOGGER.info('Remove failed since one of the items mentioned has low balance than given')
-            
-            else:
-                LOGGER.info('Remove failed shipment ID not found')
-            new_state = old_state
-        print(new_state)
-        state_data = pickle.dumps(new_state)
-        addresses = context.set_state({wallet_address: state_data})
-
-        if len(addresses) < 1:
-            raise InternalError("State Error")
-
-    def _make_transfer(self, context, shipmentID, placeTo, to_key, from_key):
-        wallet_address = self._get_wallet_address(from_key)
-        wallet_to_address = self._get_wallet_address(to_key)
-        LOGGER.info('Got the from key {} and the from wallet address {} '.format(
-            from_key, wallet_address))
-        LOGGER.info('Got the to key {} and the to wallet address {} '.format(
-            to_key, wallet_to_address))
-        current_state = context.get_state([wallet_address])
-        current_state_to = context.get_state([wallet_to_address])
-        if current_state == []:
-            LOGGER.info('No user (debtor) with the key {} '.format(from_key))
+                    for item, count in items.items():
+                        shipment['items'][item] = \
+                            shipment['items'].get(item, 0) + count
+                    emit_add(state, from_key, shipmentID, items,
+                             place=path.split("->")[-1])
+                state.set_shipment(from_key, shipment)
+                if shipmentID not in index['shipments']:
+                    bisect.insort(index['shipments'], shipmentID)
+            if index is not None:
+                state.set_place_index(from_key, index)
+            state.delete_legacy_place(from_key)
+        if index is None:
+            raise InvalidTransaction(
+                'Nothing to migrate for the key {}'.format(from_key))
+
+        state.prefetch([make_shipment_address(from_key, shipmentID)
+                        for shipmentID in index['shipments']])
+        totals = {}
+        for shipmentID in index['shipments']:
+            shipment = state.get_shipment(from_key, shipmentID)
+            if shipment is None:
+                continue
+            for item, count in shipment['items'].items():
+                totals[item] = totals.get(item, 0) + count
+        state.prefetch([make_item_total_address(key, item)
+                        for key in (from_key, None) for item in totals])
+        deltas = {item: total - state.get_item_total(from_key, item)
+                  for item, total in totals.items()}
+        state.adjust_item_totals(from_key, deltas)
+        state.adjust_item_totals(None, deltas)
+
+    def _index_insert(self, state, public_key, shipmentIDs, place):
+        if not shipmentIDs:
             return
-        print(current_state,current_state_to)
-        new_state = pickle.loads(current_state[0].data)
-        new_state_to={}
-        if current_state_to != []:
-            new_state_to = pickle.loads(current_state_to[0].data)
-
-        if shipmentID in new_state:
-            tmp = new_state[shipmentID]
-            tmp['path']= tmp['path']+"->"+placeTo
-            new_state.pop(shipmentID)
-            new_state_to[shipmentID]=tmp
-        else:
-            LOGGER.info('Shipment ID is not present')
-        print(new_state)
-        print(new_state_to)
-        state_data = pickle.dumps(new_state)
-        context.set_state({wallet_address: state_data})
-        state_data_to = pickle.dumps(new_state_to)
-        context.set_state({wallet_to_address: state_data_to})
-
-    def _get_wallet_address(self, from_key):
-        return _hash(FAMILY_NAME.encode('utf-8'))[0:6] + _hash(from_key.encode('utf-8'))[0:64]
-
-def setup_loggers():
+        index = state.get_place_index(public_key)
+        if index is None:
+            index = new_place_index(place)
+        changed = False
+        for shipmentID in shipmentIDs:
+            position = bisect.bisect_left(index['shipments'], shipmentID)
+            if position == len(index['shipments']) or \
+                    index['shipments'][position] != shipmentID:
+                index['shipments'].insert(position, shipmentID)
+                changed = True
+        if changed:
+            state.set_place_index(public_key, index)
+
+    def _index_discard(self, state, public_key, shipmentIDs):
+        index = state.get_place_index(public_key)
+        if index is None:
+            return
+        changed = False
+        for shipmentID in shipmentIDs:
+            position = bisect.bisect_left(index['shipments'], shipmentID)
+            if position < len(index['shipments']) and \
+                    index['shipments'][position] == shipmentID:
+                del index['shipments'][position]
+                changed = True
+        if changed:
+            state.set_place_index(public_key, index)
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Starts a shipment transaction processor.')
+    parser.add_argument(
+        '-C', '--connect', default=DEFAULT_URL,
+        help='endpoint of the validator (default {})'.format(DEFAULT_URL))
+    parser.add_argument(
+        '-v', '--verbose', action='count', default=0,
+        help='enable more verbose output (-v info, -vv debug)')
+    parser.add_argument(
+        '--metrics-port', type=int,
+        help='serve Prometheus metrics on this port at /metrics')
+    parser.add_argument(
+        '--metrics-file',
+        help='periodically dump Prometheus metrics to this file')
+    return parser
+
+def setup_loggers(verbose_level=0):
     logging.basicConfig()
-    logging.getLogger().setLevel(logging.DEBUG)
+    if verbose_level == 0:
+        logging.getLogger().setLevel(logging.WARNING)
+    elif verbose_level == 1:
+        logging.getLogger().setLevel(logging.INFO)
+    else:
+        logging.getLogger().setLevel(logging.DEBUG)
 
-def main():
+def main(prog_name='shipment-tp', args=None):
     '''Entry-point function for the shipment transaction processor.'''
-    setup_loggers()
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+    setup_loggers(args.verbose)
+
+    metrics = NULL_METRICS
+    if args.metrics_port is not None or args.metrics_file:
+        metrics = Metrics()
     try:
+        if args.metrics_port is not None:
+            serve_http(metrics, args.metrics_port)
+        if args.metrics_file:
+            dump_periodically(metrics, args.metrics_file)
+
         # Register the transaction handler and start it.
-        processor = TransactionProcessor(url='tcp://validator:4004')
+        processor = TransactionProcessor(url=args.connect)
 
-        handler = ShipmentTransactionHandler(sw_namespace)
+        handler = ShipmentTransactionHandler(sw_namespace, metrics)
 
         processor.add_handler(handler)
 
@@ -245,4 +551,7 @@ def main():
         raise err
     except BaseException as err:
         traceback.print_exc(file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        if args.metrics_file:
+            dump_to_file(metrics, args.metrics_file)
@@ -0,0 +1,81 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Rules an operation must pass before it changes any state.
+
+A transaction breaking one is rejected as invalid rather than committed
+without effect.  The client checks the same rules before submitting, in
+client/shipment_validation.py; the two modules must stay in sync.
+'''
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+REASON_NOT_FOUND = 'shipment_not_found'
+REASON_LOW_BALANCE = 'insufficient_items'
+REASON_SELF_TRANSFER = 'transfer_to_self'
+REASON_AT_DESTINATION = 'shipment_at_destination'
+
+
+class ShipmentRejected(InvalidTransaction):
+    '''An operation the current state does not allow.
+
+    reason names the broken rule, for the rejection metrics.
+    '''
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+def requested_counts(items):
+    '''Sum the counts of (name, count) pairs per item name.'''
+    counts = {}
+    for item, count in items:
+        counts[item] = counts.get(item, 0) + count
+    return counts
+
+
+def check_remove(shipment, shipment_id, items):
+    '''Raise ShipmentRejected unless the items can leave the shipment.'''
+    if shipment is None:
+        raise ShipmentRejected(
+            'Shipment {} not found'.format(shipment_id), REASON_NOT_FOUND)
+    for item, count in requested_counts(items).items():
+        if item not in shipment['items']:
+            raise ShipmentRejected(
+                'Shipment {} does not hold item {}'.format(shipment_id, item),
+                REASON_NOT_FOUND)
+        held = shipment['items'][item]
+        if held < count:
+            raise ShipmentRejected(
+                'Shipment {} holds {} of item {}, cannot remove {}'.format(
+                    shipment_id, held, item, count), REASON_LOW_BALANCE)
+
+
+def check_transfer(shipment, shipment_id, from_key, to_key, arrived):
+    '''Raise ShipmentRejected unless the place holds the shipment and
+    sends it to another place, which holds no shipment of the same ID.
+
+    arrived is the shipment of that ID the destination holds, if any.
+    '''
+    if shipment is None:
+        raise ShipmentRejected(
+            'Shipment {} not found'.format(shipment_id), REASON_NOT_FOUND)
+    if to_key == from_key:
+        raise ShipmentRejected(
+            'Shipment {} is already at the destination'.format(shipment_id),
+            REASON_SELF_TRANSFER)
+    if arrived is not None:
+        raise ShipmentRejected(
+            'The destination already holds a shipment {}'.format(shipment_id),
+            REASON_AT_DESTINATION)
@@ -0,0 +1,291 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Supervisor running several shipment transaction processor workers.
+
+Each worker is a separate process with its own TransactionProcessor
+registered with the validator, which spreads transactions over the
+workers, so decoding and serialization use more than one core.  Workers
+that exit unexpectedly are restarted, backing off while they keep
+crashing, and SIGINT or SIGTERM shuts every worker down gracefully: it
+unregisters from the validator and finishes the transactions it holds.
+'''
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+
+from sawtooth_sdk.processor.core import TransactionProcessor
+from sawtooth_sdk.processor.handler import TransactionHandler
+
+from processor.metrics import NULL_METRICS
+from processor.metrics import Metrics
+from processor.metrics import dump_periodically
+from processor.metrics import dump_to_file
+from processor.metrics import serve_http
+from processor.shipment_tp import DEFAULT_URL
+from processor.shipment_tp import ShipmentTransactionHandler
+from processor.shipment_tp import setup_loggers
+from processor.shipment_tp import sw_namespace
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_REPORT_INTERVAL = 30
+DEFAULT_SHUTDOWN_TIMEOUT = 10
+
+# A worker that dies sooner than this after starting is crash looping.
+MIN_UPTIME = 5
+MIN_RESTART_DELAY = 1
+MAX_RESTART_DELAY = 30
+
+_POLL_INTERVAL = 0.5
+
+
+class _CountingHandler(TransactionHandler):
+    '''Handler wrapper counting the transactions a worker processed.'''
+
+    def __init__(self, handler, counter):
+        self._handler = handler
+        self._counter = counter
+
+    @property
+    def family_name(self):
+        return self._handler.family_name
+
+    @property
+    def family_versions(self):
+        return self._handler.family_versions
+
+    @property
+    def namespaces(self):
+        return self._handler.namespaces
+
+    def apply(self, transaction, context):
+        try:
+            self._handler.apply(transaction, context)
+        finally:
+            # Only this worker writes its counter, so no lock is needed.
+            self._counter.value += 1
+
+
+def _stop_on_sigterm(signum, frame):
+    # The SDK drains and unregisters on KeyboardInterrupt; only raise it
+    # once so a second signal does not cut that short.
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt()
+
+
+def run_worker(url, verbose, counter, metrics_port=None, metrics_file=None):
+    '''Body of a worker process.'''
+    # The supervisor turns Ctrl-C into SIGTERM for every worker.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _stop_on_sigterm)
+    setup_loggers(verbose)
+
+    metrics = NULL_METRICS
+    if metrics_port is not None or metrics_file:
+        metrics = Metrics()
+    if metrics_port is not None:
+        serve_http(metrics, metrics_port)
+    if metrics_file:
+        dump_periodically(metrics, metrics_file)
+
+    processor = TransactionProcessor(url=url)
+    try:
+        processor.add_handler(_CountingHandler(
+            ShipmentTransactionHandler(sw_namespace, metrics), counter))
+        processor.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processor.stop()
+        if metrics_file:
+            dump_to_file(metrics, metrics_file)
+
+
+class _Worker(object):
+
+    def __init__(self, number, counter):
+        self.number = number
+        self.counter = counter
+        self.process = None
+        self.started = 0.0
+        self.restart_at = 0.0
+        self.restart_delay = MIN_RESTART_DELAY
+        self.reported = 0
+        self.restarts = 0
+
+
+class Supervisor(object):
+    '''Start, watch and restart a fixed number of workers.'''
+
+    def __init__(self, workers, url=DEFAULT_URL, verbose=0,
+                 report_interval=DEFAULT_REPORT_INTERVAL,
+                 shutdown_timeout=DEFAULT_SHUTDOWN_TIMEOUT,
+                 metrics_port=None, metrics_file=None):
+        self._mp = multiprocessing.get_context('spawn')
+        self._url = url
+        self._verbose = verbose
+        self._report_interval = report_interval
+        self._shutdown_timeout = shutdown_timeout
+        self._metrics_port = metrics_port
+        self._metrics_file = metrics_file
+        self._stopping = False
+        self._workers = [_Worker(number, self._mp.RawValue('Q', 0))
+                         for number in range(workers)]
+
+    def stop(self, *args):
+        self._stopping = True
+
+    def run(self):
+        '''Run until stop() is called, then shut the workers down.'''
+        for worker in self._workers:
+            self._start(worker)
+        last_report = time.monotonic()
+        while not self._stopping:
+            time.sleep(_POLL_INTERVAL)
+            now = time.monotonic()
+            for worker in self._workers:
+                self._check(worker, now)
+            if self._report_interval and \
+                    now - last_report >= self._report_interval:
+                self._report(now - last_report)
+                last_report = now
+        self._shutdown()
+
+    def _start(self, worker):
+        # Each worker gets its own metrics endpoint and dump file.
+        port = None if self._metrics_port is None else \
+            self._metrics_port + worker.number
+        path = None if not self._metrics_file else \
+            '{}.{}'.format(self._metrics_file, worker.number)
+        worker.process = self._mp.Process(
+            target=run_worker, name='shipment-tp-{}'.format(worker.number),
+            args=(self._url, self._verbose, worker.counter, port, path))
+        worker.process.start()
+        worker.started = time.monotonic()
+        LOGGER.info('Started worker %d (pid %d)', worker.number,
+                    worker.process.pid)
+
+    def _check(self, worker, now):
+        if worker.process is not None:
+            if worker.process.is_alive():
+                return
+            uptime = now - worker.started
+            if uptime < MIN_UPTIME:
+                worker.restart_delay = min(MAX_RESTART_DELAY,
+                                           worker.restart_delay * 2)
+            else:
+                worker.restart_delay = MIN_RESTART_DELAY
+            LOGGER.warning('Worker %d (pid %d) exited with code %s after '
+                           '%.1fs, restarting in %ds', worker.number,
+                           worker.process.pid, worker.process.exitcode,
+                           uptime, worker.restart_delay)
+            worker.process = None
+            worker.restart_at = now + worker.restart_delay
+        if now >= worker.restart_at:
+            worker.restarts += 1
+            self._start(worker)
+
+    def _report(self, elapsed):
+        total = 0
+        for worker in self._workers:
+            count = worker.counter.value
+            rate = (count - worker.reported) / elapsed
+            worker.reported = count
+            total += rate
+            LOGGER.info('Worker %d (pid %s): %.1f txn/s, %d transactions, '
+                        '%d restarts', worker.number,
+                        worker.process.pid if worker.process else '-',
+                        rate, count, worker.restarts)
+        LOGGER.info('All workers: %.1f txn/s', total)
+
+    def _shutdown(self):
+        running = [worker.process for worker in self._workers
+                   if worker.process is not None and worker.process.is_alive()]
+        LOGGER.info('Stopping %d workers', len(running))
+        for process in running:
+            os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + self._shutdown_timeout
+        for process in running:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                LOGGER.warning('Worker pid %d did not stop, killing it',
+                               process.pid)
+                process.kill()
+                process.join()
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Starts several shipment transaction processor '
+        'workers and keeps them running.')
+    parser.add_argument(
+        '-C', '--connect', default=DEFAULT_URL,
+        help='endpoint of the validator (default {})'.format(DEFAULT_URL))
+    parser.add_argument(
+        '-w', '--workers', type=int, default=os.cpu_count() or 1,
+        help='number of worker processes (default: one per CPU)')
+    parser.add_argument(
+        '-v', '--verbose', action='count', default=0,
+        help='enable more verbose output (-v info, -vv debug)')
+    parser.add_argument(
+        '--report-interval', type=float, default=DEFAULT_REPORT_INTERVAL,
+        help='seconds between throughput reports, 0 to disable '
+        '(default {})'.format(DEFAULT_REPORT_INTERVAL))
+    parser.add_argument(
+        '--shutdown-timeout', type=float, default=DEFAULT_SHUTDOWN_TIMEOUT,
+        help='seconds workers get to finish on shutdown before being killed')
+    parser.add_argument(
+        '--metrics-port', type=int,
+        help='serve the metrics of worker N on this port plus N')
+    parser.add_argument(
+        '--metrics-file',
+        help='dump the metrics of worker N to this file with suffix .N')
+    return parser
+
+
+def main(prog_name='shipment-tp-supervisor', args=None):
+    '''Entry-point function for the shipment processor supervisor.'''
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+    setup_loggers(args.verbose)
+    # Worker starts, restarts and throughput are always reported.
+    if args.verbose == 0:
+        LOGGER.setLevel(logging.INFO)
+    if args.workers < 1:
+        print('Error: --workers must be at least 1', file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        supervisor = Supervisor(
+            args.workers, url=args.connect, verbose=args.verbose,
+            report_interval=args.report_interval,
+            shutdown_timeout=args.shutdown_timeout,
+            metrics_port=args.metrics_port,
+            metrics_file=args.metrics_file)
+        signal.signal(signal.SIGTERM, supervisor.stop)
+        signal.signal(signal.SIGINT, supervisor.stop)
+        supervisor.run()
+    except SystemExit as err:
+        raise err
+    except BaseException as err:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,438 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import hashlib
+import pickle
+import unittest
+
+from sawtooth_signing import create_context
+from sawtooth_signing import CryptoFactory
+from sawtooth_sdk.processor.exceptions import AuthorizationException
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+from sawtooth_sdk.protobuf.transaction_pb2 import Transaction
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+from processor.local_context import LocalValidator
+from processor.replay import FAMILY_VERSION
+from processor.replay import make_transaction
+from processor.shipment_events import EVENT_ADD
+from processor.shipment_events import EVENT_ADD_MANY
+from processor.shipment_events import EVENT_REMOVE
+from processor.shipment_events import EVENT_TRANSFER
+from processor.shipment_events import EVENT_TRANSFER_MANY
+from processor.shipment_payload import ShipmentPayload
+from processor.shipment_state import FAMILY_NAME
+from processor.shipment_state import NAMESPACE
+from processor.shipment_state import decode_record
+from processor.shipment_state import make_item_total_address
+from processor.shipment_state import make_legacy_address
+from processor.shipment_state import make_path_chunk_address
+from processor.shipment_state import make_place_index_address
+from processor.shipment_state import make_shipment_address
+from processor.shipment_tp import ShipmentTransactionHandler
+from processor.shipment_validation import REASON_AT_DESTINATION
+from processor.shipment_validation import REASON_LOW_BALANCE
+from processor.shipment_validation import REASON_NOT_FOUND
+from processor.shipment_validation import REASON_SELF_TRANSFER
+from processor.shipment_validation import ShipmentRejected
+
+_FACTORY = CryptoFactory(create_context('secp256k1'))
+
+
+class _Place(object):
+
+    def __init__(self):
+        self.signer = _FACTORY.new_signer(
+            _FACTORY.context.new_random_private_key())
+        self.key = self.signer.get_public_key().as_hex()
+
+
+class HandlerTestCase(unittest.TestCase):
+    '''Applies transactions of two places to an empty local store.'''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.delhi = _Place()
+        cls.mumbai = _Place()
+
+    def setUp(self):
+        self.validator = LocalValidator(ShipmentTransactionHandler(NAMESPACE))
+
+    def apply(self, sender, action, **fields):
+        '''Apply one operation signed by sender, a _Place, and return its
+           context.'''
+        return self.validator.apply(make_transaction(
+            sender.signer, sender.key, ShipmentPayload(action, **fields)))
+
+    def apply_raw(self, sender, data, addresses):
+        '''Apply a payload given as bytes, declaring addresses.'''
+        header = TransactionHeader(
+            signer_public_key=sender.key,
+            family_name=FAMILY_NAME,
+            family_version=FAMILY_VERSION,
+            inputs=addresses,
+            outputs=addresses,
+            payload_sha512=hashlib.sha512(data).hexdigest(),
+            batcher_public_key=sender.key,
+            nonce='0').SerializeToString()
+        return self.validator.apply(Transaction(
+            header=header, payload=data,
+            header_signature=sender.signer.sign(header)))
+
+    def record(self, address):
+        data = self.validator.store.get(address)
+        return None if data is None else decode_record(data)
+
+    def shipment(self, place, shipment_id):
+        return self.record(make_shipment_address(place.key, shipment_id))
+
+    def total(self, place, item):
+        record = self.record(make_item_total_address(
+            None if place is None else place.key, item))
+        return 0 if record is None else record['total']
+
+    def index(self, place):
+        record = self.record(make_place_index_address(place.key))
+        return None if record is None else record['shipments']
+
+    def hops(self, shipment):
+        return self.record(make_path_chunk_address(
+            shipment['id'], shipment['history'], 0))['hops']
+
+    def assert_rejected(self, reason, sender, action, **fields):
+        before = dict(self.validator.store.items())
+        with self.assertRaises(ShipmentRejected) as caught:
+            self.apply(sender, action, **fields)
+        self.assertEqual(caught.exception.reason, reason)
+        self.assertEqual(dict(self.validator.store.items()), before)
+
+    def add(self, sender, shipment_id, items, place_name='Delhi'):
+        return self.apply(sender, 'add', shipment_id=shipment_id,
+                          place=place_name, items=items,
+                          timestamp=1700000000)
+
+
+class TestAdd(HandlerTestCase):
+
+    def test_new_shipment(self):
+        context = self.add(self.delhi, 'S1', [('apple', 3), ('pear', 1)])
+        shipment = self.shipment(self.delhi, 'S1')
+        self.assertEqual(shipment['items'], {'apple': 3, 'pear': 1})
+        self.assertEqual(shipment['hops'], 1)
+        self.assertEqual(self.hops(shipment), [('Delhi', 1700000000)])
+        self.assertEqual(self.index(self.delhi), ['S1'])
+        self.assertEqual(self.total(self.delhi, 'apple'), 3)
+        self.assertEqual(self.total(None, 'apple'), 3)
+        self.assertEqual([event.event_type for event in context.events],
+                         [EVENT_ADD])
+
+    def test_existing_shipment(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        self.add(self.delhi, 'S1', [('apple', 2), ('apple', 1)])
+        self.assertEqual(self.shipment(self.delhi, 'S1')['items'],
+                         {'apple': 6})
+        self.assertEqual(self.shipment(self.delhi, 'S1')['hops'], 1)
+        self.assertEqual(self.total(self.delhi, 'apple'), 6)
+
+    def test_totals_across_places(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        self.add(self.mumbai, 'S2', [('apple', 4)], 'Mumbai')
+        self.assertEqual(self.total(self.delhi, 'apple'), 3)
+        self.assertEqual(self.total(self.mumbai, 'apple'), 4)
+        self.assertEqual(self.total(None, 'apple'), 7)
+
+
+class TestRemove(HandlerTestCase):
+
+    def test_remove(self):
+        self.add(self.delhi, 'S1', [('apple', 3), ('pear', 1)])
+        context = self.apply(self.delhi, 'remove', shipment_id='S1',
+                             items=[('apple', 2), ('pear', 1)])
+        self.assertEqual(self.shipment(self.delhi, 'S1')['items'],
+                         {'apple': 1, 'pear': 0})
+        self.assertEqual(self.total(self.delhi, 'apple'), 1)
+        # Totals dropping to zero leave state.
+        self.assertIsNone(self.record(
+            make_item_total_address(self.delhi.key, 'pear')))
+        self.assertEqual([event.event_type for event in context.events],
+                         [EVENT_REMOVE])
+
+    def test_not_found(self):
+        self.assert_rejected(REASON_NOT_FOUND, self.delhi, 'remove',
+                             shipment_id='S1', items=[('apple', 1)])
+
+    def test_low_balance(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        self.assert_rejected(REASON_LOW_BALANCE, self.delhi, 'remove',
+                             shipment_id='S1', items=[('apple', 4)])
+
+    def test_low_balance_over_repeated_items(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        self.assert_rejected(REASON_LOW_BALANCE, self.delhi, 'remove',
+                             shipment_id='S1',
+                             items=[('apple', 2), ('apple', 2)])
+
+    def test_item_not_held(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        self.assert_rejected(REASON_NOT_FOUND, self.delhi, 'remove',
+                             shipment_id='S1', items=[('pear', 0)])
+        self.assertEqual(self.shipment(self.delhi, 'S1')['items'],
+                         {'apple': 3})
+
+
+class TestTransfer(HandlerTestCase):
+
+    def test_transfer(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        context = self.apply(self.delhi, 'transfer', shipment_id='S1',
+                             place_to='Mumbai', to_key=self.mumbai.key,
+                             timestamp=1700000100)
+        self.assertIsNone(self.shipment(self.delhi, 'S1'))
+        shipment = self.shipment(self.mumbai, 'S1')
+        self.assertEqual(shipment['items'], {'apple': 3})
+        self.assertEqual(self.hops(shipment), [('Delhi', 1700000000),
+                                               ('Mumbai', 1700000100)])
+        self.assertEqual(self.index(self.delhi), [])
+        self.assertEqual(self.index(self.mumbai), ['S1'])
+        self.assertEqual(self.total(self.delhi, 'apple'), 0)
+        self.assertEqual(self.total(self.mumbai, 'apple'), 3)
+        self.assertEqual(self.total(None, 'apple'), 3)
+        self.assertEqual([event.event_type for event in context.events],
+                         [EVENT_TRANSFER])
+
+    def test_not_found(self):
+        self.assert_rejected(REASON_NOT_FOUND, self.delhi, 'transfer',
+                             shipment_id='S1', place_to='Mumbai',
+                             to_key=self.mumbai.key)
+
+    def test_to_self(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        self.assert_rejected(REASON_SELF_TRANSFER, self.delhi, 'transfer',
+                             shipment_id='S1', place_to='Delhi',
+                             to_key=self.delhi.key)
+
+    def test_moved_away(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        self.apply(self.delhi, 'transfer', shipment_id='S1',
+                   place_to='Mumbai', to_key=self.mumbai.key)
+        self.assert_rejected(REASON_NOT_FOUND, self.delhi, 'transfer',
+                             shipment_id='S1', place_to='Mumbai',
+                             to_key=self.mumbai.key)
+
+    def test_destination_holds_shipment(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        self.add(self.mumbai, 'S1', [('pear', 2)], 'Mumbai')
+        self.assert_rejected(REASON_AT_DESTINATION, self.delhi, 'transfer',
+                             shipment_id='S1', place_to='Mumbai',
+                             to_key=self.mumbai.key)
+
+
+class TestMigrate(HandlerTestCase):
+
+    def test_migrate(self):
+        self.validator.store.commit({
+            make_legacy_address(self.delhi.key): pickle.dumps({
+                'S1': {'path': 'Farm->Delhi', 'apple': 3},
+                'S2': {'path': 'Delhi', 'apple': 1, 'pear': 2}})})
+        self.apply(self.delhi, 'migrate')
+        self.assertIsNone(self.validator.store.get(
+            make_legacy_address(self.delhi.key)))
+        self.assertEqual(self.shipment(self.delhi, 'S1'),
+                         {'id': 'S1', 'path': 'Farm->Delhi',
+                          'items': {'apple': 3}})
+        self.assertEqual(self.index(self.delhi), ['S1', 'S2'])
+        self.assertEqual(self.total(self.delhi, 'apple'), 4)
+        self.assertEqual(self.total(None, 'pear'), 2)
+
+        # Running it again changes nothing.
+        before = dict(self.validator.store.items())
+        self.apply(self.delhi, 'migrate')
+        self.assertEqual(dict(self.validator.store.items()), before)
+
+    def test_nothing_to_migrate(self):
+        with self.assertRaises(InvalidTransaction):
+            self.apply(self.delhi, 'migrate')
+        self.assertEqual(dict(self.validator.store.items()), {})
+
+
+class TestBulk(HandlerTestCase):
+
+    def test_add_many(self):
+        self.add(self.delhi, 'S1', [('apple', 1)])
+        context = self.apply(
+            self.delhi, 'add_many', place='Delhi', shipments=[
+                ('S1', [('apple', 2)]), ('S2', [('apple', 1), ('pear', 4)])])
+        self.assertEqual(self.shipment(self.delhi, 'S1')['items'],
+                         {'apple': 3})
+        self.assertEqual(self.shipment(self.delhi, 'S2')['items'],
+                         {'apple': 1, 'pear': 4})
+        self.assertEqual(self.index(self.delhi), ['S1', 'S2'])
+        self.assertEqual(self.total(self.delhi, 'apple'), 4)
+        self.assertEqual(self.total(None, 'pear'), 4)
+        self.assertEqual([event.event_type for event in context.events],
+                         [EVENT_ADD_MANY])
+
+    def test_transfer_many(self):
+        third = _Place()
+        self.apply(self.delhi, 'add_many', place='Delhi', shipments=[
+            ('S1', [('apple', 1)]), ('S2', [('apple', 2)]),
+            ('S3', [('pear', 3)])])
+        context = self.apply(self.delhi, 'transfer_many', transfers=[
+            ('S1', 'Mumbai', self.mumbai.key), ('S2', 'Pune', third.key),
+            ('S3', 'Mumbai', self.mumbai.key)])
+        self.assertEqual(self.index(self.delhi), [])
+        self.assertEqual(self.index(self.mumbai), ['S1', 'S3'])
+        self.assertEqual(self.index(third), ['S2'])
+        self.assertEqual(self.total(self.delhi, 'apple'), 0)
+        self.assertEqual(self.total(self.mumbai, 'apple'), 1)
+        self.assertEqual(self.total(third, 'apple'), 2)
+        self.assertEqual(self.total(None, 'apple'), 3)
+        self.assertEqual(self.shipment(self.mumbai, 'S3')['hops'], 2)
+        self.assertEqual([event.event_type for event in context.events],
+                         [EVENT_TRANSFER_MANY])
+
+    def test_transfer_many_is_all_or_nothing(self):
+        self.add(self.delhi, 'S1', [('apple', 1)])
+        self.assert_rejected(REASON_NOT_FOUND, self.delhi, 'transfer_many',
+                             transfers=[('S1', 'Mumbai', self.mumbai.key),
+                                        ('S2', 'Mumbai', self.mumbai.key)])
+
+    def test_transfer_many_to_self(self):
+        self.apply(self.delhi, 'add_many', place='Delhi', shipments=[
+            ('S1', [('apple', 1)]), ('S2', [('apple', 2)])])
+        self.assert_rejected(REASON_SELF_TRANSFER, self.delhi,
+                             'transfer_many',
+                             transfers=[('S1', 'Mumbai', self.mumbai.key),
+                                        ('S2', 'Delhi', self.delhi.key)])
+
+    def test_transfer_many_to_holder(self):
+        self.apply(self.delhi, 'add_many', place='Delhi', shipments=[
+            ('S1', [('apple', 1)]), ('S2', [('apple', 2)])])
+        self.add(self.mumbai, 'S2', [('pear', 2)], 'Mumbai')
+        self.assert_rejected(REASON_AT_DESTINATION, self.delhi,
+                             'transfer_many',
+                             transfers=[('S1', 'Mumbai', self.mumbai.key),
+                                        ('S2', 'Mumbai', self.mumbai.key)])
+
+
+class TestLegacyPayload(HandlerTestCase):
+    '''Payloads of clients from before the binary codec, declaring the
+       layout 1 address of their place as those clients did.'''
+
+    def apply_legacy(self, sender, data, *others):
+        return self.apply_raw(sender, data, [
+            make_legacy_address(place.key) for place in (sender,) + others])
+
+    def legacy_place(self, place):
+        data = self.validator.store.get(make_legacy_address(place.key))
+        return None if data is None else pickle.loads(data)
+
+    def test_add_and_remove(self):
+        self.apply_legacy(self.delhi,
+                          b"add,S1,2,['apple', '3', 'pear', '1'],Farm")
+        self.apply_legacy(self.delhi, b"add,S1,1,['apple', '2'],Delhi")
+        self.apply_legacy(self.delhi, b"remove,S1,1,['pear', '1']")
+        self.assertEqual(self.legacy_place(self.delhi),
+                         {'S1': {'path': 'Farm', 'apple': 5, 'pear': 0}})
+        self.assertIsNone(self.index(self.delhi))
+
+    def test_remove_rejected(self):
+        self.apply_legacy(self.delhi, b"add,S1,1,['apple', '3'],Farm")
+        before = dict(self.validator.store.items())
+        for data, reason in (
+                (b"remove,S1,1,['apple', '4']", REASON_LOW_BALANCE),
+                (b"remove,S1,1,['pear', '0']", REASON_NOT_FOUND),
+                (b"remove,S2,1,['apple', '1']", REASON_NOT_FOUND)):
+            with self.assertRaises(ShipmentRejected) as caught:
+                self.apply_legacy(self.delhi, data)
+            self.assertEqual(caught.exception.reason, reason)
+        self.assertEqual(dict(self.validator.store.items()), before)
+
+    def test_transfer(self):
+        transfer = b"transfer,S1,Mumbai," + self.mumbai.key.encode()
+        self.apply_legacy(self.delhi, b"add,S1,1,['apple', '3'],Farm")
+        before = dict(self.validator.store.items())
+        with self.assertRaisesRegex(InvalidTransaction, 'upgrade client'):
+            self.apply_legacy(self.delhi, transfer)
+        self.assertEqual(dict(self.validator.store.items()), before)
+
+        self.apply_legacy(self.delhi, transfer, self.mumbai)
+        self.assertEqual(self.legacy_place(self.delhi), {})
+        self.assertEqual(self.legacy_place(self.mumbai),
+                         {'S1': {'path': 'Farm->Mumbai', 'apple': 3}})
+
+        self.apply_legacy(self.delhi, b"add,S1,1,['pear', '1'],Farm")
+        with self.assertRaises(ShipmentRejected) as caught:
+            self.apply_legacy(self.delhi, transfer, self.mumbai)
+        self.assertEqual(caught.exception.reason, REASON_AT_DESTINATION)
+
+    def test_migrate_merges_later_adds(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        self.apply_legacy(self.delhi, b"add,S1,1,['apple', '2'],Delhi")
+        self.apply_legacy(self.delhi, b"add,S2,1,['pear', '1'],Delhi")
+        self.apply(self.delhi, 'migrate')
+        self.assertIsNone(self.legacy_place(self.delhi))
+        self.assertEqual(self.shipment(self.delhi, 'S1')['items'],
+                         {'apple': 5})
+        self.assertEqual(self.shipment(self.delhi, 'S2')['items'],
+                         {'pear': 1})
+        self.assertEqual(self.index(self.delhi), ['S1', 'S2'])
+        self.assertEqual(self.total(self.delhi, 'apple'), 5)
+        self.assertEqual(self.total(None, 'pear'), 1)
+
+    def test_unknown_operation(self):
+        before = dict(self.validator.store.items())
+        for data in (b'destroy,S1', b'migrate'):
+            with self.assertRaises(InvalidTransaction):
+                self.apply_legacy(self.delhi, data)
+        self.assertEqual(dict(self.validator.store.items()), before)
+
+    def test_counts_out_of_range(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        before = dict(self.validator.store.items())
+        for data in (b"remove,S1,1,['apple', '-5']",
+                     b"add,S1,1,['apple', '-50'],Delhi",
+                     b"add,S1,1,['apple', '99999999999999999999999'],Delhi"):
+            with self.assertRaises(InvalidTransaction):
+                self.apply_raw(self.delhi, data, [NAMESPACE])
+        self.assertEqual(dict(self.validator.store.items()), before)
+
+
+class TestRoundTrips(HandlerTestCase):
+
+    def test_events_are_counted(self):
+        context = self.add(self.delhi, 'S1', [('apple', 3)])
+        # One read, one write and the event.
+        self.assertEqual(context.round_trips, 3)
+        context = self.apply(self.delhi, 'remove', shipment_id='S1',
+                             items=[('apple', 1)])
+        self.assertEqual(context.round_trips, 3)
+        self.assertEqual(self.validator.round_trips, 6)
+
+
+class TestAuthorization(HandlerTestCase):
+
+    def test_undeclared_address(self):
+        self.add(self.delhi, 'S1', [('apple', 3)])
+        payload = ShipmentPayload('remove', shipment_id='S1',
+                                  items=[('apple', 1)])
+        # The item totals are left out.
+        with self.assertRaises(AuthorizationException):
+            self.apply_raw(self.delhi, payload.to_bytes(), [
+                make_shipment_address(self.delhi.key, 'S1')])
+        self.assertEqual(self.shipment(self.delhi, 'S1')['items'],
+                         {'apple': 3})
+
+    def test_malformed_payload(self):
+        with self.assertRaises(InvalidTransaction):
+            self.apply(self.delhi, 'remove', shipment_id='S\x001', items=[])
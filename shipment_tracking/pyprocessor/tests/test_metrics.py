@@ -0,0 +1,148 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+
+from sawtooth_signing import create_context
+from sawtooth_signing import CryptoFactory
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from processor.local_context import LocalValidator
+from processor.metrics import NULL_METRICS
+from processor.metrics import REJECTIONS
+from processor.metrics import ROUND_TRIPS
+from processor.metrics import STAGE_SECONDS
+from processor.metrics import TRANSACTIONS
+from processor.metrics import Metrics
+from processor.metrics import dump_to_file
+from processor.metrics import labels
+from processor.metrics import serve_http
+from processor.replay import make_transaction
+from processor.shipment_payload import ShipmentPayload
+from processor.shipment_state import NAMESPACE
+from processor.shipment_tp import ShipmentTransactionHandler
+from processor.shipment_validation import REASON_LOW_BALANCE
+
+
+def _samples(text):
+    '''Return the samples of a Prometheus text dump, by name and labels.'''
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_labels(self):
+        self.assertEqual(labels(stage='apply', operation='add'),
+                         (('operation', 'add'), ('stage', 'apply')))
+
+    def test_render(self):
+        metrics = Metrics(buckets=(0.1, 1))
+        metrics.inc(TRANSACTIONS, labels(operation='add'))
+        metrics.inc(TRANSACTIONS, labels(operation='add'), 2)
+        metrics.set('queue_depth', 7)
+        for value in (0.05, 0.5, 5):
+            metrics.observe(STAGE_SECONDS, value, labels(stage='apply'))
+        text = metrics.render()
+        self.assertIn('# TYPE shipment_transactions_total counter\n', text)
+        self.assertIn('# TYPE queue_depth untyped\n', text)
+        self.assertEqual(_samples(text), {
+            'shipment_transactions_total{operation="add"}': 3,
+            'queue_depth': 7,
+            'shipment_stage_seconds_bucket{stage="apply",le="0.1"}': 1,
+            'shipment_stage_seconds_bucket{stage="apply",le="1"}': 2,
+            'shipment_stage_seconds_bucket{stage="apply",le="+Inf"}': 3,
+            'shipment_stage_seconds_sum{stage="apply"}': 5.55,
+            'shipment_stage_seconds_count{stage="apply"}': 3})
+
+    def test_label_values_are_escaped(self):
+        metrics = Metrics()
+        metrics.inc(REJECTIONS, labels(reason='a "b" \\c'))
+        self.assertIn('{reason="a \\"b\\" \\\\c"} 1', metrics.render())
+
+    def test_null_metrics(self):
+        NULL_METRICS.inc(TRANSACTIONS)
+        NULL_METRICS.set('queue_depth', 1)
+        NULL_METRICS.observe(STAGE_SECONDS, 1)
+        self.assertFalse(NULL_METRICS.enabled)
+        self.assertEqual(NULL_METRICS.render(), '\n')
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.inc(TRANSACTIONS, labels(operation='add'))
+
+    def test_dump_to_file(self):
+        tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempDir)
+        path = os.path.join(tempDir, 'metrics.prom')
+        dump_to_file(self.metrics, path)
+        self.metrics.inc(TRANSACTIONS, labels(operation='add'))
+        dump_to_file(self.metrics, path)
+        with open(path) as fd:
+            self.assertEqual(fd.read(), self.metrics.render())
+        self.assertEqual(os.listdir(tempDir), ['metrics.prom'])
+
+    def test_serve_http(self):
+        server = serve_http(self.metrics, 0, host='127.0.0.1')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+        with urllib.request.urlopen(url + '/metrics') as response:
+            self.assertEqual(response.read().decode('utf-8'),
+                             self.metrics.render())
+        with self.assertRaises(urllib.error.HTTPError) as caught:
+            urllib.request.urlopen(url + '/other')
+        caught.exception.close()
+        self.assertEqual(caught.exception.code, 404)
+
+
+class TestHandlerMetrics(unittest.TestCase):
+
+    def test_recorded_per_operation(self):
+        metrics = Metrics()
+        validator = LocalValidator(
+            ShipmentTransactionHandler(NAMESPACE, metrics))
+        factory = CryptoFactory(create_context('secp256k1'))
+        signer = factory.new_signer(factory.context.new_random_private_key())
+        key = signer.get_public_key().as_hex()
+        validator.apply(make_transaction(signer, key, ShipmentPayload(
+            'add', shipment_id='S1', place='Delhi', items=[('apple', 3)])))
+        with self.assertRaises(InvalidTransaction):
+            validator.apply(make_transaction(signer, key, ShipmentPayload(
+                'remove', shipment_id='S1', items=[('apple', 4)])))
+
+        samples = _samples(metrics.render())
+        self.assertEqual(samples[TRANSACTIONS + '{operation="add"}'], 1)
+        self.assertEqual(samples[TRANSACTIONS + '{operation="remove"}'], 1)
+        self.assertEqual(samples['{}{{reason="{}"}}'.format(
+            REJECTIONS, REASON_LOW_BALANCE)], 1)
+        self.assertEqual(samples[ROUND_TRIPS + '{operation="add"}'],
+                         validator.round_trips - 1)
+        # The rejected remove still read its shipment.
+        self.assertEqual(samples[ROUND_TRIPS + '{operation="remove"}'], 1)
+        self.assertEqual(samples[STAGE_SECONDS +
+                                 '_count{stage="decode"}'], 2)
+        self.assertEqual(samples[STAGE_SECONDS +
+                                 '_count{stage="apply"}'], 1)
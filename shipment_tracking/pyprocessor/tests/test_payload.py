@@ -0,0 +1,177 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import struct
+import unittest
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from processor.shipment_payload import ShipmentPayload
+
+KEY_A = '02' + 'a' * 64
+KEY_B = '03' + 'b' * 64
+
+
+def _fields(payload):
+    return {name: getattr(payload, name) for name in ShipmentPayload.__slots__}
+
+
+class TestPayloadRoundTrip(unittest.TestCase):
+
+    def assert_round_trip(self, payload):
+        decoded = ShipmentPayload.from_bytes(payload.to_bytes())
+        self.assertEqual(_fields(payload), _fields(decoded))
+
+    def test_add(self):
+        self.assert_round_trip(ShipmentPayload(
+            'add', shipment_id='S1', place='Delhi',
+            items=[('apple', 3), ('pear', 0xffffffff)], timestamp=1700000000))
+
+    def test_add_without_time(self):
+        self.assert_round_trip(ShipmentPayload(
+            'add', shipment_id='S1', place='Delhi', items=[('apple', 3)]))
+
+    def test_remove(self):
+        self.assert_round_trip(ShipmentPayload(
+            'remove', shipment_id='S1', items=[('apple', 1), ('kiwi', 2)]))
+
+    def test_transfer(self):
+        self.assert_round_trip(ShipmentPayload(
+            'transfer', shipment_id='S1', place_to='Mumbai', to_key=KEY_B,
+            timestamp=1700000001))
+
+    def test_migrate(self):
+        self.assert_round_trip(ShipmentPayload('migrate'))
+
+    def test_add_many(self):
+        self.assert_round_trip(ShipmentPayload(
+            'add_many', place='Delhi', timestamp=5,
+            shipments=[('S1', [('apple', 1)]), ('S2', [('pear', 2)])]))
+
+    def test_transfer_many_shares_destinations(self):
+        payload = ShipmentPayload('transfer_many', transfers=[
+            ('S1', 'Mumbai', KEY_A), ('S2', 'Pune', KEY_B),
+            ('S3', 'Mumbai', KEY_A)])
+        self.assert_round_trip(payload)
+        # Two destinations, each written once.
+        self.assertEqual(payload.to_bytes().count(KEY_A.encode()), 1)
+
+    def test_unicode(self):
+        self.assert_round_trip(ShipmentPayload(
+            'add', shipment_id='Sé', place='Köln',
+            items=[('äpfel', 1)]))
+
+
+class TestLegacyPayload(unittest.TestCase):
+
+    def assert_decoded(self, data, expected):
+        decoded = ShipmentPayload.from_bytes(data)
+        self.assertTrue(decoded.legacy)
+        expected.legacy = True
+        self.assertEqual(_fields(decoded), _fields(expected))
+
+    def test_add(self):
+        self.assert_decoded(
+            b"add,S1,2,['apple', '3', 'pear', '4294967295'],Delhi",
+            ShipmentPayload('add', shipment_id='S1', place='Delhi',
+                            items=[('apple', 3), ('pear', 0xffffffff)]))
+
+    def test_remove(self):
+        self.assert_decoded(
+            b"remove,S1,1,['apple', '1']",
+            ShipmentPayload('remove', shipment_id='S1',
+                            items=[('apple', 1)]))
+
+    def test_transfer(self):
+        self.assert_decoded(
+            'transfer,S1,Mumbai,{}'.format(KEY_B).encode(),
+            ShipmentPayload('transfer', shipment_id='S1',
+                            place_to='Mumbai', to_key=KEY_B))
+
+
+class TestPayloadRejects(unittest.TestCase):
+
+    def assert_rejected(self, data):
+        with self.assertRaises(InvalidTransaction):
+            ShipmentPayload.from_bytes(data)
+
+    def test_empty(self):
+        self.assert_rejected(b'')
+
+    def test_unsupported_version(self):
+        self.assert_rejected(b'\x02\x02\x00\x02S1\x00\x00')
+
+    def test_unknown_action(self):
+        self.assert_rejected(b'\x01\x09')
+
+    def test_unknown_legacy_operation(self):
+        self.assert_rejected(b'destroy,S1')
+
+    def test_malformed_legacy(self):
+        self.assert_rejected(b"add,S1,2,['apple', '1'],Delhi")
+        self.assert_rejected(b"remove,S1,1,['apple', 'one']")
+        self.assert_rejected(b'transfer,S1,Mumbai')
+        self.assert_rejected(b"remove,S1,1,['apple', '-1']")
+        self.assert_rejected(b"remove,S1,1,['apple', '4294967296']")
+
+    def test_unknown_action_on_encode(self):
+        with self.assertRaises(InvalidTransaction):
+            ShipmentPayload('destroy').to_bytes()
+
+    def test_truncated(self):
+        data = ShipmentPayload('remove', shipment_id='S1',
+                               items=[('apple', 1)]).to_bytes()
+        for end in range(2, len(data)):
+            self.assert_rejected(data[:end])
+
+    def test_string_past_the_end(self):
+        self.assert_rejected(b'\x01\x02' + struct.pack('>H', 50) + b'S1')
+
+    def test_trailing_bytes(self):
+        self.assert_rejected(ShipmentPayload(
+            'remove', shipment_id='S1', items=[]).to_bytes() + b'\x00')
+
+    def test_nul_in_names(self):
+        for payload in (
+                ShipmentPayload('add', shipment_id='S\x001', place='Delhi',
+                                items=[]),
+                ShipmentPayload('add', shipment_id='S1', place='De\x00lhi',
+                                items=[]),
+                ShipmentPayload('add', shipment_id='S1', place='Delhi',
+                                items=[('ap\x00ple', 1)]),
+                ShipmentPayload('transfer', shipment_id='S1',
+                                place_to='Mum\x00bai', to_key=KEY_B),
+                ShipmentPayload('transfer_many',
+                                transfers=[('S1', 'Mum\x00bai', KEY_B)])):
+            self.assert_rejected(payload.to_bytes())
+
+    def test_bulk_without_shipments(self):
+        self.assert_rejected(ShipmentPayload(
+            'add_many', place='Delhi', shipments=[]).to_bytes())
+        self.assert_rejected(ShipmentPayload(
+            'transfer_many', transfers=[]).to_bytes())
+
+    def test_bulk_with_duplicates(self):
+        self.assert_rejected(ShipmentPayload(
+            'add_many', place='Delhi',
+            shipments=[('S1', [('apple', 1)]),
+                       ('S1', [('pear', 1)])]).to_bytes())
+        self.assert_rejected(ShipmentPayload('transfer_many', transfers=[
+            ('S1', 'Mumbai', KEY_A), ('S1', 'Pune', KEY_B)]).to_bytes())
+
+    def test_unknown_destination(self):
+        data = bytearray(ShipmentPayload(
+            'transfer_many', transfers=[('S1', 'Mumbai', KEY_A)]).to_bytes())
+        # The destination index is the last u16.
+        data[-2:] = struct.pack('>H', 1)
+        self.assert_rejected(bytes(data))
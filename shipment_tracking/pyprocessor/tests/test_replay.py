@@ -0,0 +1,130 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_sdk.processor.exceptions import AuthorizationException
+
+from processor.local_context import DbmStore
+from processor.local_context import DictStore
+from processor.local_context import LocalContext
+from processor.local_context import LocalValidator
+from processor.replay import BATCHES_PER_LIST
+from processor.replay import generate_workload
+from processor.replay import main
+from processor.replay import read_batch_lists
+from processor.replay import replay
+from processor.replay import write_batch_lists
+from processor.shipment_state import NAMESPACE
+from processor.shipment_tp import ShipmentTransactionHandler
+
+_A = NAMESPACE + 'a' * 64
+_B = NAMESPACE + 'b' * 64
+
+
+class TestLocalContext(unittest.TestCase):
+
+    def setUp(self):
+        self.store = DictStore()
+        self.store.commit({_A: b'stored'})
+        self.context = LocalContext(self.store, [NAMESPACE], [_B])
+
+    def test_reads_its_own_writes(self):
+        self.context.set_state({_B: b'written'})
+        self.assertEqual(
+            [(entry.address, entry.data)
+             for entry in self.context.get_state([_A, _B])],
+            [(_A, b'stored'), (_B, b'written')])
+        # Nothing reaches the store before the transaction is committed.
+        self.assertIsNone(self.store.get(_B))
+        self.assertEqual(self.context.round_trips, 2)
+
+    def test_delete(self):
+        context = LocalContext(self.store, [NAMESPACE], [NAMESPACE])
+        self.assertEqual(context.delete_state([_A, _B]), [_A])
+        self.assertEqual(context.get_state([_A]), [])
+        self.store.commit(context.writes)
+        self.assertEqual(list(self.store.items()), [])
+
+    def test_undeclared_addresses(self):
+        with self.assertRaises(AuthorizationException):
+            self.context.set_state({_A: b'written'})
+        with self.assertRaises(AuthorizationException):
+            self.context.delete_state([_A])
+        context = LocalContext(self.store, [_B], [_B])
+        with self.assertRaises(AuthorizationException):
+            context.get_state([_A])
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempDir)
+
+    def test_generated_workload_is_valid(self):
+        batchLists = generate_workload(250, 3, 20, seed=1)
+        self.assertEqual([len(batchList.batches) for batchList in batchLists],
+                         [BATCHES_PER_LIST, BATCHES_PER_LIST, 50])
+        validator = LocalValidator(ShipmentTransactionHandler(NAMESPACE))
+        stats = replay(validator, batchLists)
+        self.assertEqual((stats['transactions'], stats['invalid'],
+                          stats['failed']), (250, 0, 0))
+        self.assertGreater(stats['state_entries'], 20)
+        self.assertGreater(stats['round_trips'], 0)
+
+    def test_stores_agree(self):
+        batchLists = generate_workload(100, 2, 10, seed=2)
+        memory = LocalValidator(ShipmentTransactionHandler(NAMESPACE))
+        replay(memory, batchLists)
+        store = DbmStore(os.path.join(self.tempDir, 'state'))
+        try:
+            replay(LocalValidator(ShipmentTransactionHandler(NAMESPACE),
+                                  store), batchLists)
+            self.assertEqual(dict(store.items()), dict(memory.store.items()))
+        finally:
+            store.close()
+
+    def test_stream(self):
+        batchLists = generate_workload(120, 2, 10, seed=3)
+        stream = io.BytesIO()
+        write_batch_lists(stream, batchLists)
+        data = stream.getvalue()
+        self.assertEqual(list(read_batch_lists(io.BytesIO(data))),
+                         batchLists)
+        for end in (2, len(data) - 1):
+            with self.assertRaisesRegex(Exception, 'Truncated'):
+                list(read_batch_lists(io.BytesIO(data[:end])))
+
+    def test_record_and_replay(self):
+        path = os.path.join(self.tempDir, 'workload.bin')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(args=['--generate', '50', '--places', '2', '--shipments',
+                       '5', '--seed', '4', '--record', path])
+            main(args=[path])
+        self.assertEqual(
+            [line for line in output.getvalue().splitlines()
+             if line.startswith('transactions:')],
+            ['transactions: 50 (0 invalid, 0 failed)'] * 2)
+
+    def test_nothing_to_replay(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit) as caught:
+                main(args=[])
+        self.assertEqual(caught.exception.code, 1)
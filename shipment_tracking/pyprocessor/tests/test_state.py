@@ -0,0 +1,88 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import pickle
+import unittest
+
+from processor.shipment_state import decode_record
+from processor.shipment_state import encode_item_total
+from processor.shipment_state import encode_path_chunk
+from processor.shipment_state import encode_path_root
+from processor.shipment_state import encode_place_index
+from processor.shipment_state import encode_shipment
+from processor.shipment_state import view_record
+
+
+class TestStateRecords(unittest.TestCase):
+
+    def test_shipment(self):
+        shipment = {'id': 'S1', 'path': 'Farm->Delhi',
+                    'items': {'pear': 2, 'apple': 3, 'äpfel': 1}}
+        data = encode_shipment(shipment)
+        self.assertEqual(decode_record(data), shipment)
+        self.assertEqual(view_record(data).count('apple'), 3)
+        self.assertEqual(view_record(data).count('kiwi'), 0)
+
+    def test_routed_shipment(self):
+        shipment = {'id': 'S1', 'history': 2, 'hops': 70,
+                    'items': {'apple': 2**64 - 1}}
+        self.assertEqual(decode_record(encode_shipment(shipment)), shipment)
+
+    def test_empty_shipment(self):
+        shipment = {'id': 'S1', 'history': 1, 'hops': 1, 'items': {}}
+        self.assertEqual(decode_record(encode_shipment(shipment)), shipment)
+
+    def test_encoding_is_canonical(self):
+        first = {'id': 'S1', 'path': 'Delhi', 'items': {'a': 1, 'b': 2}}
+        second = {'id': 'S1', 'path': 'Delhi', 'items': {'b': 2, 'a': 1}}
+        self.assertEqual(encode_shipment(first), encode_shipment(second))
+
+    def test_place_index(self):
+        index = {'place': 'Delhi', 'shipments': ['S1', 'S2', 'S10']}
+        data = encode_place_index(index)
+        self.assertEqual(decode_record(data)['shipments'],
+                         sorted(index['shipments']))
+        self.assertIn('S2', view_record(data))
+        self.assertNotIn('S3', view_record(data))
+
+    def test_item_total(self):
+        self.assertEqual(decode_record(encode_item_total('apple', 12)),
+                         {'item': 'apple', 'total': 12})
+
+    def test_path_root(self):
+        self.assertEqual(decode_record(encode_path_root('S1', 3)),
+                         {'id': 'S1', 'histories': 3})
+
+    def test_path_chunk(self):
+        chunk = {'id': 'S1', 'hops': [('Farm', 0), ('Delhi', 1700000000),
+                                      ('Farm', 1700000100)]}
+        data = encode_path_chunk(chunk)
+        self.assertEqual(decode_record(data), chunk)
+        self.assertEqual(len(view_record(data)), 3)
+        # Each place name is stored once.
+        self.assertEqual(data.count(b'Farm'), 1)
+
+    def test_pickled_entries_still_decode(self):
+        shipment = {'id': 'S1', 'path': 'Delhi', 'items': {'apple': 1}}
+        data = pickle.dumps(dict(shipment, version=1))
+        self.assertEqual(decode_record(data), shipment)
+
+    def test_pickled_objects_are_refused(self):
+        with self.assertRaises(pickle.UnpicklingError):
+            decode_record(pickle.dumps({'id': unittest.TestCase}))
+
+    def test_unknown_record(self):
+        with self.assertRaises(ValueError):
+            view_record(b'\x01\x63')
+        with self.assertRaises(ValueError):
+            view_record(b'\x02\x01')
@@ -0,0 +1,126 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import signal
+import time
+import unittest
+
+from sawtooth_signing import create_context
+from sawtooth_signing import CryptoFactory
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from processor.local_context import LocalValidator
+from processor.replay import make_transaction
+from processor.shipment_payload import ShipmentPayload
+from processor.shipment_state import NAMESPACE
+from processor.shipment_tp import ShipmentTransactionHandler
+from processor.supervisor import MAX_RESTART_DELAY
+from processor.supervisor import MIN_RESTART_DELAY
+from processor.supervisor import MIN_UPTIME
+from processor.supervisor import Supervisor
+from processor.supervisor import _CountingHandler
+from processor.supervisor import _stop_on_sigterm
+from processor.supervisor import main
+
+
+class _ExitedProcess(object):
+    '''Stands in for a worker process that has exited.'''
+
+    pid = 1
+    exitcode = 1
+
+    def is_alive(self):
+        return False
+
+
+class TestCountingHandler(unittest.TestCase):
+
+    def test_counts_every_transaction(self):
+        supervisor = Supervisor(1)
+        counter = supervisor._workers[0].counter
+        validator = LocalValidator(_CountingHandler(
+            ShipmentTransactionHandler(NAMESPACE), counter))
+        factory = CryptoFactory(create_context('secp256k1'))
+        signer = factory.new_signer(factory.context.new_random_private_key())
+        key = signer.get_public_key().as_hex()
+        validator.apply(make_transaction(signer, key, ShipmentPayload(
+            'add', shipment_id='S1', place='Delhi', items=[('apple', 3)])))
+        with self.assertRaises(InvalidTransaction):
+            validator.apply(make_transaction(signer, key, ShipmentPayload(
+                'remove', shipment_id='S1', items=[('apple', 4)])))
+        # Rejected transactions were processed all the same.
+        self.assertEqual(counter.value, 2)
+
+
+class TestRestart(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = Supervisor(1)
+        self.worker = self.supervisor._workers[0]
+        self.started = []
+
+        def start(worker):
+            self.started.append(worker.number)
+            worker.process = _ExitedProcess()
+        self.supervisor._start = start
+
+    def crash(self, uptime, now=100.0):
+        '''Have the worker exit uptime seconds after starting at now.'''
+        self.worker.process = _ExitedProcess()
+        self.worker.started = now - uptime
+        self.supervisor._check(self.worker, now)
+        return self.worker.restart_at - now
+
+    def test_backs_off_while_crash_looping(self):
+        delays = [self.crash(0.1) for _ in range(8)]
+        self.assertEqual(delays[:3], [MIN_RESTART_DELAY * 2,
+                                      MIN_RESTART_DELAY * 4,
+                                      MIN_RESTART_DELAY * 8])
+        self.assertEqual(delays[-1], MAX_RESTART_DELAY)
+        # Restarted on a later check once the delay passed, not before.
+        self.assertEqual(self.started, [])
+        self.supervisor._check(self.worker, self.worker.restart_at)
+        self.assertEqual((self.started, self.worker.restarts), ([0], 1))
+
+    def test_backoff_resets_after_running_a_while(self):
+        self.crash(0.1)
+        self.crash(0.1)
+        self.assertEqual(self.crash(MIN_UPTIME + 1), MIN_RESTART_DELAY)
+
+
+class TestShutdown(unittest.TestCase):
+
+    def test_workers_are_stopped(self):
+        supervisor = Supervisor(2, shutdown_timeout=5)
+        for worker in supervisor._workers:
+            worker.process = supervisor._mp.Process(target=time.sleep,
+                                                    args=(60,))
+            worker.process.start()
+        started = time.monotonic()
+        supervisor._shutdown()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual([worker.process.exitcode
+                          for worker in supervisor._workers],
+                         [-signal.SIGTERM] * 2)
+
+    def test_sigterm_interrupts_once(self):
+        self.addCleanup(signal.signal, signal.SIGTERM,
+                        signal.getsignal(signal.SIGTERM))
+        with self.assertRaises(KeyboardInterrupt):
+            _stop_on_sigterm(signal.SIGTERM, None)
+        self.assertEqual(signal.getsignal(signal.SIGTERM), signal.SIG_IGN)
+
+    def test_at_least_one_worker(self):
+        with self.assertRaises(SystemExit) as caught:
+            main(args=['--workers', '0'])
+        self.assertEqual(caught.exception.code, 1)